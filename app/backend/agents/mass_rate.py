@@ -0,0 +1,177 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.backend import metrics
+from app.backend.agents.rate import RateAgent
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.store import Store
+
+
+class MassRater:
+    """
+    Rates many (ad, personality) pairs through a single shared pool of
+    RateAgent workers. All requests share the same pool, so max_concurrency
+    bounds the number of in-flight LLM calls across the whole server rather
+    than per request.
+    """
+
+    def __init__(self, agent: RateAgent, store: Store, max_concurrency: int = 16):
+        """
+        Initialize the rater.
+
+        Args:
+            agent: The agent used to produce each rating
+            store: Store the ratings are saved to
+            max_concurrency: Maximum number of concurrent agent calls
+        """
+        self.__agent = agent
+        self.__store = store
+        self.max_concurrency = max_concurrency
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="mass_rate"
+        )
+
+    def plan(
+        self, ad_ids: List[str], personality_ids: List[str]
+    ) -> Tuple[List[Tuple[str, str]], int]:
+        """
+        Build the (ad, personality) pairs still needing a rating out of the
+        cross product of ads and personalities.
+
+        Args:
+            ad_ids: IDs of the ads to rate
+            personality_ids: IDs of the personalities to rate them with
+
+        Returns:
+            The pairs to rate and the number of pairs skipped because they
+            already have a rating
+        """
+        ad_ids = list(dict.fromkeys(ad_ids))
+        personality_ids = list(dict.fromkeys(personality_ids))
+
+        rated = self.__store.rating.get_rated_pairs(ad_ids, personality_ids)
+        pairs = [
+            (ad_id, personality_id)
+            for ad_id in ad_ids
+            for personality_id in personality_ids
+            if (ad_id, personality_id) not in rated
+        ]
+        return pairs, len(rated)
+
+    def __rate(self, ad: Ad, personality: Personality) -> Dict[str, Any]:
+        start = time.perf_counter()
+        outcome = "error"
+        metrics.RATE_IN_FLIGHT.inc()
+        try:
+            rating = self.__agent(personality=personality, ad=ad)
+            rating_id = self.__store.rating.create(rating)
+            if not rating_id:
+                raise ValueError("Failed to save rating")
+            outcome = "ok"
+            return rating.to_dict()
+        finally:
+            metrics.RATE_IN_FLIGHT.dec()
+            metrics.RATE_PERSONA_SECONDS.labels(outcome).observe(
+                time.perf_counter() - start
+            )
+
+    def rate(
+        self,
+        pairs: List[Tuple[str, str]],
+        personalities: Optional[Dict[str, Personality]] = None,
+        ads: Optional[Dict[str, Ad]] = None,
+        window: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Rate every pair, saving each rating as soon as it is produced.
+        Results are yielded in completion order. Every ad and personality
+        is read once up front, in one query each, and the loaded objects
+        are handed to the agents.
+
+        Args:
+            pairs: (ad_id, personality_id) pairs to rate
+            personalities: Personalities the caller already loaded, keyed
+                by ID; any others are loaded here
+            ads: Ads the caller already loaded, keyed by ID; any others are
+                loaded here
+            window: If given, pairs are submitted in order with at most
+                this many in flight, so a consumer that stops early only
+                pays for the pairs already started
+
+        Returns:
+            Iterator of result dictionaries with the ad and personality IDs
+            and either the saved "rating" or an "error"
+        """
+        personalities = dict(personalities or {})
+        ads = dict(ads or {})
+
+        personalities.update(
+            self.__store.personality.get_many(
+                list({pid for _, pid in pairs if pid not in personalities})
+            )
+        )
+        ads.update(
+            self.__store.ad.get_many(
+                list({aid for aid, _ in pairs if aid not in ads})
+            )
+        )
+
+        queue = []
+        missing = []
+        for ad_id, personality_id in pairs:
+            if ad_id not in ads:
+                missing.append((ad_id, personality_id, f"Ad {ad_id} not found"))
+            elif personality_id not in personalities:
+                missing.append((
+                    ad_id,
+                    personality_id,
+                    f"Personality {personality_id} not found",
+                ))
+            else:
+                queue.append((ad_id, personality_id))
+
+        for ad_id, personality_id, error in missing:
+            yield {"ad": ad_id, "personality": personality_id, "error": error}
+
+        if queue:
+            metrics.RATE_SWARM_WIDTH.observe(len(queue))
+
+        queue = iter(queue)
+        futures = {}
+
+        def submit(count: int):
+            for ad_id, personality_id in queue:
+                # Each rating runs in a copy of the caller's context, so what
+                # it sets there, like the pool's read-your-writes routing,
+                # doesn't stay with the worker thread for later requests
+                future = self.__executor.submit(
+                    contextvars.copy_context().run,
+                    self.__rate,
+                    ads[ad_id],
+                    personalities[personality_id],
+                )
+                futures[future] = (ad_id, personality_id)
+                count -= 1
+                if count <= 0:
+                    break
+
+        submit(window or len(pairs))
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ad_id, personality_id = futures.pop(future)
+                    submit(1)
+                    result = {"ad": ad_id, "personality": personality_id}
+                    try:
+                        result["rating"] = future.result()
+                    except Exception as e:
+                        result["error"] = str(e)
+                    yield result
+        finally:
+            # If the consumer goes away, don't spend calls nobody will see
+            for future in futures:
+                future.cancel()
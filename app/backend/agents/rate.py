@@ -3,69 +3,114 @@ from arkaine.utils.templater import PromptLoader
 from arkaine.utils.parser import Parser, Label
 from arkaine.llms.llm import LLM, Prompt
 from arkaine.tools.context import Context
-from typing import Optional, Any
-from app.backend.models.rating import Rating
+from threading import Lock
+from typing import Optional, Any, Dict, Union
+import json
+from app.backend import emotions
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS, Rating
 from app.backend.store import Store
 from arkaine.flow import ParallelList
 
 
+class ParseStats:
+    """
+    Thread safe counters of how RateAgent outputs parsed, per output mode.
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, mode: str, outcome: str):
+        """
+        Record a parse outcome for a mode; one of "parsed", "fallback"
+        (structured output failed but the text parser succeeded) or
+        "failed".
+        """
+        with self.__lock:
+            counts = self.__counts.setdefault(
+                mode, {"parsed": 0, "fallback": 0, "failed": 0}
+            )
+            counts[outcome] += 1
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the counts and parse failure rate of each mode. Fallbacks
+        count as failures of the structured output.
+        """
+        with self.__lock:
+            report = {}
+            for mode, counts in self.__counts.items():
+                calls = sum(counts.values())
+                failures = counts["fallback"] + counts["failed"]
+                report[mode] = {
+                    "calls": calls,
+                    **counts,
+                    "failure_rate": failures / calls if calls else 0.0,
+                }
+            return report
 
 
 class RateAgent(Agent):
 
-    EMOTIONS = [
-        # Happy emotions
-        "Happy", "Joyful", "Excited", "Interested", "Proud", "Accepted", "Powerful",
-        "Peaceful", "Intimate", "Loving", "Hopeful", "Playful", "Inspired", "Open",
-        "Confident", "Important", "Fulfilled", "Respected", "Courageous", "Provocative",
-        "Sensitive", "Energetic", "Liberated", "Ecstatic", "Eager", "Awe", "Astonished",
-        "Perplexed", "Dismayed", "Shocked", "Terrified", "Frightened", "Worried",
-        "Overwhelmed", "Inadequate", "Inferior", "Worthless", "Insignificant",
-        "Alienated", "Disrespected", "Ridiculed", "Embarrassed", "Devastated",
-        "Resentful", "Jealous", "Violated",
-
-        # Fearful emotions
-        "Fear", "Scared", "Anxious", "Insecure", "Submissive", "Hurt", "Humiliated",
-        "Threatened",
-
-        # Angry emotions
-        "Anger", "Mad", "Hateful", "Aggressive", "Frustrated", "Hostile", "Enraged",
-        "Furious", "Violent", "Irritated", "Infuriated", "Provoked", "Withdrawn",
-        "Suspicious", "Skeptical", "Sarcastic", "Judgmental",
-
-        # Disgusted emotions
-        "Disgust", "Critical", "Distant", "Disappointed", "Awful", "Loathing",
-        "Repugnant", "Revolted", "Revulsion", "Detestable", "Aversion",
-
-        # Sad emotions
-        "Sad", "Lonely", "Bored", "Depressed", "Despair", "Abandoned", "Ignored",
-        "Victimized", "Powerless", "Vulnerable", "Inferior", "Empty", "Isolated",
-        "Apathetic", "Indifferent",
-
-        # Guilt/Shame related emotions
-        "Guilty", "Remorseful", "Ashamed", "Hesitant", "Avoidance",
-
-        # Surprise related emotions
-        "Surprise", "Startled", "Confused", "Amazed", "Excited" # Excited is also under happy, context matters
-    ]
-
-    EFFECTIVENESS = [
-        "Not Relevant",
-        "Low Fit",
-        "Neutral/Okay",
-        "Good Fit",
-        "Strong Match"
-    ]
-
-    def __init__(self, llm: LLM, store: Store):
-        
+    # Canonical emotion names; ids, groups and synonyms live in
+    # app.backend.emotions
+    EMOTIONS = emotions.NAMES
+
+    EFFECTIVENESS = EFFECTIVENESS
+
+    # "text" parses the labeled lines of the rate prompt; "json" asks the
+    # LLM for output constrained to RESPONSE_SCHEMA and falls back to the
+    # text parser if that still fails to decode.
+    OUTPUT_MODES = ["text", "json"]
+
+    RESPONSE_SCHEMA = {
+        "type": "object",
+        "properties": {
+            "thought": {"type": "string"},
+            "emotional_response": {"type": "string"},
+            "emotions": {
+                "type": "array",
+                "items": {
+                    "type": "string",
+                    "enum": EMOTIONS,
+                },
+                "max_items": 5,
+            },
+            "effectiveness": {"type": "string", "enum": EFFECTIVENESS},
+        },
+        "required": [
+            "thought",
+            "emotional_response",
+            "emotions",
+            "effectiveness",
+        ],
+    }
+
+    parse_stats = ParseStats()
+
+    def __init__(self, llm: LLM, store: Store, output_mode: str = "text"):
+        if output_mode not in self.OUTPUT_MODES:
+            raise ValueError(
+                f"Unknown output mode {output_mode}, must be one of "
+                f"{', '.join(self.OUTPUT_MODES)}"
+            )
+
         self.__store = store
+        self.output_mode = output_mode
+        # Recorded on every rating, so ratings from different models or
+        # output modes can be told apart
+        self.model_version = f"{llm.name}/{output_mode}"
 
+        # Every label is required, so output without them fails to parse
+        # rather than making an empty rating
         self.parser = Parser([
-            Label("thought", data_type="str"),
-            Label("emotionalresponse", data_type="str"),
-            Label("emotions", data_type="str"),
-            Label("effectiveness", data_type="str"),
+            Label("thought", data_type="str", required=True),
+            Label("emotionalresponse", data_type="str", required=True),
+            Label("emotions", data_type="str", required=True),
+            Label("effectiveness", data_type="str", required=True),
         ])
 
         super().__init__(
@@ -74,13 +119,13 @@ class RateAgent(Agent):
             args=[
                 Argument(
                     "personality",
-                    description="The personality to rate the ad for.",
+                    description="The personality (or its ID) to rate the ad for.",
                     required=True,
                     type=str
                 ),
                 Argument(
                     name="ad",
-                    description="The ad to rate.",
+                    description="The ad (or its ID) to rate.",
                     required=True,
                     type=str
                 )
@@ -88,40 +133,38 @@ class RateAgent(Agent):
             llm=llm
         )
 
-    def prepare_prompt(self, context: Context, personality: str, ad: str) -> Prompt:
-        context.x["personality"] = personality
-        context.x["ad"] = ad
-
-        prompt = PromptLoader.load_prompt("rate")
-
-        persona = self.__store.personality.get(personality)
-        if not persona:
-            raise ValueError(f"Personality {personality} not found")
-
-        ad_obj = self.__store.ad.get(ad)
-        if not ad_obj:
-            raise ValueError(f"Ad {ad} not found")
-
-        personality_str = f"{persona.name}:\n"
-        personality_str += f"\t - Age: {persona.age}\n"
-        personality_str += f"\t - Gender: {persona.gender}\n"
-        personality_str += f"\t - Location: {persona.location}\n"
-        personality_str += f"\t - Education Level: {persona.education_level}\n"
-        personality_str += f"\t - Marital Status: {persona.marital_status}\n"
-        personality_str += f"\t - Children: {persona.children}\n"
-        personality_str += f"\t - Occupation: {persona.occupation}\n"
-        personality_str += f"\t - Job Title: {persona.job_title}\n"
-        personality_str += f"\t - Industry: {persona.industry}\n"
-        personality_str += f"\t - Income: {persona.income}\n"
-        personality_str += f"\t - Seniority Level: {persona.seniority_level}\n"
-        personality_str += f"\t - Personality Traits: {', '.join(persona.personality_traits)}\n"
-        personality_str += f"\t - Values: {', '.join(persona.values)}\n"
-        personality_str += f"\t - Attitudes: {', '.join(persona.attitudes)}\n"
-        personality_str += f"\t - Interests: {', '.join(persona.interests)}\n"
-        personality_str += f"\t - Lifestyle: {', '.join(persona.lifestyle)}\n"
-        personality_str += f"\t - Habits: {', '.join(persona.habits)}\n"
-        personality_str += f"\t - Frustrations: {', '.join(persona.frustrations)}\n"
-        personality_str += f"\t - Summary: {persona.summary}\n"
+    def prepare_prompt(
+        self,
+        context: Context,
+        personality: Union[str, Personality],
+        ad: Union[str, Ad],
+    ) -> Prompt:
+        if self.output_mode == "json":
+            prompt = PromptLoader.load_prompt("rate_json")
+            context.x["response_schema"] = self.RESPONSE_SCHEMA
+        else:
+            prompt = PromptLoader.load_prompt("rate")
+
+        # Callers that already loaded the personality or ad can pass the
+        # object instead of its ID to skip the lookup
+        if isinstance(personality, Personality):
+            persona = personality
+        else:
+            persona = self.__store.personality.get(personality)
+            if not persona:
+                raise ValueError(f"Personality {personality} not found")
+
+        if isinstance(ad, Ad):
+            ad_obj = ad
+        else:
+            ad_obj = self.__store.ad.get(ad)
+            if not ad_obj:
+                raise ValueError(f"Ad {ad} not found")
+
+        context.x["personality"] = str(persona.id)
+        context.x["ad"] = str(ad_obj.id)
+
+        personality_str = persona.profile()
 
         context.x["ad_filepath"] = ad_obj.image
 
@@ -131,22 +174,60 @@ class RateAgent(Agent):
         })
 
     def extract_result(self, context: Context, output: str) -> Optional[Any]:
+        if self.output_mode == "json":
+            try:
+                rating = self.__extract_json(context, output)
+                self.parse_stats.record(self.output_mode, "parsed")
+                return rating
+            except (ValueError, KeyError, TypeError):
+                # Fall back to the text parser below
+                pass
+
+        try:
+            rating = self.__extract_text(context, output)
+        except ValueError:
+            self.parse_stats.record(self.output_mode, "failed")
+            raise
+
+        if self.output_mode == "json":
+            self.parse_stats.record(self.output_mode, "fallback")
+        else:
+            self.parse_stats.record(self.output_mode, "parsed")
+        return rating
+
+    def __extract_json(self, context: Context, output: str) -> Rating:
+        values = json.loads(output)
+
+        if values["effectiveness"] not in self.EFFECTIVENESS:
+            raise ValueError(f"Unknown effectiveness {values['effectiveness']}")
+
+        return Rating(
+            personality=context.x["personality"],
+            ad=context.x["ad"],
+            thought=values["thought"],
+            emotional_response=values["emotional_response"],
+            emotions=emotions.names(
+                emotions.normalize_all(values["emotions"])
+            ),
+            effectiveness=values["effectiveness"],
+            model_version=self.model_version,
+        )
+
+    def __extract_text(self, context: Context, output: str) -> Rating:
         values, errors = self.parser.parse(output)
         if errors:
             raise ValueError(errors)
         
-        # Try and split apart the emotions as a list. It should
-        # be comma separated
-        emotions = values["emotions"].split(",")
-        
-        # Filter out non matching
-        emotions = [e.lower().strip() for e in emotions if e.lower().strip() in self.EMOTIONS]
+        # The emotions should be comma separated; map each onto the
+        # taxonomy, dropping any that aren't recognized
+        emotion_ids = emotions.normalize_all(values["emotions"])
 
         return Rating(
             personality=context.x["personality"],
             ad=context.x["ad"],
             thought=values["thought"],
             emotional_response=values["emotionalresponse"],
-            emotions=emotions,
-            effectiveness=values["effectiveness"]
+            emotions=emotions.names(emotion_ids),
+            effectiveness=values["effectiveness"],
+            model_version=self.model_version,
         )
@@ -0,0 +1,757 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.backend import emotions, metrics
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS
+from app.backend.segments import SEGMENT_FIELDS, parse_segment
+from app.backend.store.db import Pool, Transaction
+from app.backend.store.rating_store import RatingStore
+
+
+# Bands numeric personality attributes are grouped into, as the lower edge
+# of each band after the first
+BANDS = {
+    "age": [18, 25, 35, 45, 55, 65],
+    "income": [25000, 50000, 75000, 100000, 150000, 250000],
+    "children": [1, 2, 3],
+}
+
+_TEXT_FIELDS = [f for f, kind in SEGMENT_FIELDS.items() if kind == "text"]
+_RANGE_FIELDS = [f for f, kind in SEGMENT_FIELDS.items() if kind == "range"]
+_ARRAY_FIELDS = [f for f, kind in SEGMENT_FIELDS.items() if kind == "array"]
+
+# Personality attributes results can be grouped by
+GROUP_FIELDS = _TEXT_FIELDS + list(BANDS)
+
+# Rows whose updated_at is within this much of the newest row already
+# loaded are read again on refresh, so rows committed late by long running
+# transactions aren't missed
+_OVERLAP = timedelta(seconds=60)
+
+
+def _band_labels(edges: List[float]) -> List[str]:
+    labels = [f"<{edges[0]:g}"]
+    for low, high in zip(edges, edges[1:]):
+        labels.append(f"{low:g}-{high - 1:g}")
+    labels.append(f"{edges[-1]:g}+")
+    return labels
+
+
+def band_label(field: str, value: Optional[float]) -> Optional[str]:
+    """The label of the band a numeric attribute value falls in."""
+    if value is None:
+        return None
+    edges = BANDS[field]
+    return _band_labels(edges)[int(np.digitize(value, edges))]
+
+
+def group_label(personality: Personality, field: str) -> Optional[str]:
+    """The group a personality falls in by one of the GROUP_FIELDS."""
+    value = getattr(personality, field, None)
+    return band_label(field, value) if field in BANDS else value
+
+
+def _latest(current, rows: List[Dict[str, Any]]):
+    """The newest of a watermark and the updated_at of some rows."""
+    times = [row["updated_at"] for row in rows if row.get("updated_at")]
+    if current is not None:
+        times.append(current)
+    return max(times, default=None)
+
+
+class _Snapshot:
+    """
+    Column arrays of every rating and personality at one point in time.
+    Refreshes build a new snapshot rather than changing one in place, so
+    queries can run against a snapshot without holding the lock.
+    """
+
+    def __init__(self):
+        # Personality columns, one entry per personality
+        self.personality_index: Dict[str, int] = {}
+        self.numbers = {f: np.empty(0, dtype=np.float64) for f in _RANGE_FIELDS}
+        self.codes = {f: np.empty(0, dtype=np.int32) for f in _TEXT_FIELDS}
+        self.vocabularies: Dict[str, Dict[Optional[str], int]] = {
+            f: {None: 0} for f in _TEXT_FIELDS
+        }
+        self.lists: Dict[str, List[List[str]]] = {f: [] for f in _ARRAY_FIELDS}
+
+        # Rating columns, one entry per rating. The personality of a rating
+        # not (yet) loaded is -1, which indexes the False sentinel appended
+        # to personality masks.
+        self.rating_index: Dict[str, int] = {}
+        self.ad_index: Dict[str, int] = {}
+        self.ad: np.ndarray = np.empty(0, dtype=np.int32)
+        self.personality: np.ndarray = np.empty(0, dtype=np.int32)
+        self.level: np.ndarray = np.empty(0, dtype=np.int8)
+        self.groups: np.ndarray = np.empty(0, dtype=np.int32)
+        # Emotion ids of each rating, zero padded to the widest rating
+        self.emotions: np.ndarray = np.zeros((0, 1), dtype=np.int16)
+
+        # Ratings whose personality wasn't loaded yet, by rating index
+        self.unlinked: Dict[int, str] = {}
+
+        self.personalities_updated = None
+        self.ratings_updated = None
+
+    def copy(self) -> "_Snapshot":
+        snapshot = _Snapshot()
+        snapshot.personality_index = dict(self.personality_index)
+        snapshot.numbers = {f: a.copy() for f, a in self.numbers.items()}
+        snapshot.codes = {f: a.copy() for f, a in self.codes.items()}
+        snapshot.vocabularies = {
+            f: dict(v) for f, v in self.vocabularies.items()
+        }
+        snapshot.lists = {f: list(v) for f, v in self.lists.items()}
+        snapshot.rating_index = dict(self.rating_index)
+        snapshot.ad_index = dict(self.ad_index)
+        snapshot.ad = self.ad.copy()
+        snapshot.personality = self.personality.copy()
+        snapshot.level = self.level.copy()
+        snapshot.groups = self.groups.copy()
+        snapshot.emotions = self.emotions.copy()
+        snapshot.unlinked = dict(self.unlinked)
+        snapshot.personalities_updated = self.personalities_updated
+        snapshot.ratings_updated = self.ratings_updated
+        return snapshot
+
+    def add_personalities(self, rows: List[Dict[str, Any]]):
+        """Add new personalities and overwrite changed ones."""
+        new = [r for r in rows if str(r["id"]) not in self.personality_index]
+        start = len(self.personality_index)
+        for offset, row in enumerate(new):
+            self.personality_index[str(row["id"])] = start + offset
+
+        for field in _RANGE_FIELDS:
+            self.numbers[field] = np.concatenate(
+                [self.numbers[field], np.full(len(new), np.nan)]
+            )
+        for field in _TEXT_FIELDS:
+            self.codes[field] = np.concatenate(
+                [self.codes[field], np.zeros(len(new), dtype=np.int32)]
+            )
+        for field in _ARRAY_FIELDS:
+            self.lists[field].extend([] for _ in new)
+
+        for row in rows:
+            i = self.personality_index[str(row["id"])]
+            for field in _RANGE_FIELDS:
+                value = row.get(field)
+                self.numbers[field][i] = np.nan if value is None else value
+            for field in _TEXT_FIELDS:
+                vocabulary = self.vocabularies[field]
+                value = row.get(field)
+                if value not in vocabulary:
+                    vocabulary[value] = len(vocabulary)
+                self.codes[field][i] = vocabulary[value]
+            for field in _ARRAY_FIELDS:
+                self.lists[field][i] = list(row.get(field) or [])
+
+        for i, personality_id in list(self.unlinked.items()):
+            if personality_id in self.personality_index:
+                self.personality[i] = self.personality_index[personality_id]
+                del self.unlinked[i]
+
+        self.personalities_updated = _latest(self.personalities_updated, rows)
+
+    def add_ratings(self, rows: List[Dict[str, Any]]):
+        new = [r for r in rows if str(r["id"]) not in self.rating_index]
+        start = len(self.rating_index)
+        for offset, row in enumerate(new):
+            self.rating_index[str(row["id"])] = start + offset
+
+        width = max(
+            [self.emotions.shape[1]]
+            + [len(row.get("emotion_ids") or []) for row in rows]
+        )
+        if width > self.emotions.shape[1]:
+            self.emotions = np.pad(
+                self.emotions, ((0, 0), (0, width - self.emotions.shape[1]))
+            )
+
+        self.ad = np.concatenate([self.ad, np.zeros(len(new), dtype=np.int32)])
+        self.personality = np.concatenate(
+            [self.personality, np.full(len(new), -1, dtype=np.int32)]
+        )
+        self.level = np.concatenate([self.level, np.zeros(len(new), dtype=np.int8)])
+        self.groups = np.concatenate(
+            [self.groups, np.zeros(len(new), dtype=np.int32)]
+        )
+        self.emotions = np.concatenate(
+            [self.emotions, np.zeros((len(new), width), dtype=np.int16)]
+        )
+
+        for row in rows:
+            i = self.rating_index[str(row["id"])]
+            ad_id = str(row["ad_id"])
+            if ad_id not in self.ad_index:
+                self.ad_index[ad_id] = len(self.ad_index)
+            self.ad[i] = self.ad_index[ad_id]
+
+            personality_id = str(row["personality_id"])
+            self.personality[i] = self.personality_index.get(personality_id, -1)
+            if self.personality[i] < 0:
+                self.unlinked[i] = personality_id
+            else:
+                self.unlinked.pop(i, None)
+
+            self.level[i] = row.get("effectiveness_level") or 0
+            self.groups[i] = row.get("emotion_groups") or 0
+            ids = row.get("emotion_ids") or []
+            self.emotions[i] = 0
+            self.emotions[i, : len(ids)] = ids
+
+        self.ratings_updated = _latest(self.ratings_updated, rows)
+
+
+class SegmentAnalytics:
+    """
+    Segment analytics over ratings joined with personality attributes. The
+    ratings and personalities are held in memory as NumPy column arrays
+    and refreshed incrementally from their updated_at, so a query only
+    reads the rows changed since the last one and everything else is
+    vectorized array operations.
+    """
+
+    def __init__(self, db_pool: Pool, max_staleness: float = 5.0):
+        """
+        Initialize the analytics cache. Nothing is loaded until the first
+        query.
+
+        Args:
+            db_pool: Database connection pool
+            max_staleness: Seconds a query may be answered from the cache
+                without checking the database for changes
+        """
+        self.db_pool = db_pool
+        self.max_staleness = max_staleness
+        self.__lock = Lock()
+        self.__snapshot = _Snapshot()
+        self.__loaded = False
+        self.__checked = 0.0
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Bring the cache up to date; a full load the first time, after which
+        only rows updated since the last refresh are read. Deleted rows
+        can't be seen that way, so when the row counts stop matching the
+        cache is loaded again in full.
+
+        Args:
+            force: Check for changes even if the cache is fresher than
+                max_staleness
+        """
+        with self.__lock:
+            if (
+                not force
+                and self.__loaded
+                and time.monotonic() - self.__checked < self.max_staleness
+            ):
+                return
+
+            snapshot = self.__update(self.__snapshot)
+            if snapshot is None:
+                snapshot = self.__update(_Snapshot())
+            if snapshot is None:
+                # Keep answering from the last good snapshot, and load
+                # again on the next query
+                return
+
+            self.__snapshot = snapshot
+            self.__loaded = True
+            self.__checked = time.monotonic()
+
+    def __update(self, snapshot: _Snapshot) -> Optional[_Snapshot]:
+        """
+        Apply the rows changed since a snapshot to a copy of it, or return
+        None if rows have been deleted since. The rows and counts are read
+        in one snapshot of the database, so rows written meanwhile are
+        either both counted and read or neither.
+        """
+        with self.db_pool.get_transaction() as transaction, transaction.atomic(
+            "REPEATABLE READ"
+        ):
+            personalities = self.__changed(
+                transaction, "personality", snapshot.personalities_updated
+            )
+            ratings = self.__changed(
+                transaction, "rating", snapshot.ratings_updated
+            )
+            counts = transaction.query(
+                """
+                    SELECT
+                        (SELECT COUNT(*) FROM personality) AS personalities,
+                        (SELECT COUNT(*) FROM rating) AS ratings
+                """
+            )[0]
+
+        if personalities or ratings:
+            snapshot = snapshot.copy()
+            snapshot.add_personalities(personalities)
+            snapshot.add_ratings(ratings)
+
+        if snapshot.rating_index and (
+            len(snapshot.personality_index) != counts["personalities"]
+            or len(snapshot.rating_index) != counts["ratings"]
+        ):
+            return None
+        return snapshot
+
+    def __changed(
+        self, transaction: Transaction, table: str, since: Optional[datetime]
+    ) -> List[Dict[str, Any]]:
+        if table == "personality":
+            fields = _RANGE_FIELDS + _TEXT_FIELDS + _ARRAY_FIELDS
+            columns = ", ".join(["id", "updated_at"] + [f'"{f}"' for f in fields])
+        else:
+            columns = (
+                "id, ad_id, personality_id, effectiveness_level, "
+                "emotion_groups, emotion_ids, updated_at"
+            )
+
+        query = f"SELECT {columns} FROM {table}"
+        params: Tuple = ()
+        if since is not None:
+            query += " WHERE updated_at >= %s"
+            params = (since - _OVERLAP,)
+        return list(transaction.stream(query, params, chunk_size=10000))
+
+    def __category_members(self, category: str) -> List[str]:
+        with self.db_pool.get_transaction() as transaction:
+            results = transaction.query(
+                """
+                    SELECT a.personality_id
+                    FROM category_assignment a
+                    JOIN category c ON a.category_id = c.id
+                    WHERE c.name = %s
+                """,
+                (category,),
+            )
+        return [str(r["personality_id"]) for r in results]
+
+    def segments(
+        self,
+        segment: Optional[str] = None,
+        group_by: Optional[List[str]] = None,
+        ad_id: Optional[str] = None,
+        category: Optional[str] = None,
+        top_emotions: int = 5,
+    ) -> Dict[str, Any]:
+        """
+        Compare a segment's reaction against everyone else's, optionally
+        broken down by personality attributes.
+
+        Args:
+            segment: Segment definition (see segments.parse_segment); None
+                for every personality
+            group_by: Personality attributes to break the segment down by;
+                numeric attributes are grouped into BANDS
+            ad_id: Only include ratings of this ad
+            category: Only include personalities in this category
+            top_emotions: Number of most reported emotions listed per group
+
+        Returns:
+            Dictionary with the "segment" and "rest" statistics, and the
+            statistics of each of the segment's "groups"
+
+        Raises:
+            ValueError: If the segment or a group_by attribute is invalid
+        """
+        conditions = parse_segment(segment)
+        group_by = group_by or []
+        for field in group_by:
+            if field not in GROUP_FIELDS:
+                raise ValueError(
+                    f"Cannot group by {field}, must be one of "
+                    f"{', '.join(GROUP_FIELDS)}"
+                )
+
+        self.refresh()
+        snapshot = self.__snapshot
+
+        # Everything below is evaluated once per personality, then mapped
+        # onto the ratings through their personality index
+        personality_mask = self.__segment_mask(snapshot, conditions)
+        population = np.ones(len(snapshot.personality_index) + 1, dtype=bool)
+        population[-1] = False
+        if category:
+            members = np.zeros_like(population)
+            members[
+                [
+                    snapshot.personality_index[pid]
+                    for pid in self.__category_members(category)
+                    if pid in snapshot.personality_index
+                ]
+            ] = True
+            population &= members
+
+        rated = population[snapshot.personality]
+        if ad_id:
+            code = snapshot.ad_index.get(str(ad_id).lower(), -1)
+            rated &= snapshot.ad == code
+
+        in_segment = rated & personality_mask[snapshot.personality]
+        rest = rated & ~in_segment
+
+        result = {
+            "segment": self.__stats(snapshot, in_segment, top_emotions),
+            "rest": self.__stats(snapshot, rest, top_emotions),
+            "groups": [],
+        }
+        if group_by:
+            result["groups"] = self.__group_stats(
+                snapshot, in_segment, group_by, top_emotions
+            )
+        return result
+
+    def __segment_mask(
+        self, snapshot: _Snapshot, conditions: List[Tuple[str, str, Any]]
+    ) -> np.ndarray:
+        mask = np.ones(len(snapshot.personality_index) + 1, dtype=bool)
+        mask[-1] = False
+        body = mask[:-1]
+        for field, kind, value in conditions:
+            if kind == "range":
+                low, high = value
+                column = snapshot.numbers[field]
+                if low is not None:
+                    body &= column >= low
+                if high is not None:
+                    body &= column <= high
+            elif kind == "text":
+                code = snapshot.vocabularies[field].get(value, -1)
+                body &= snapshot.codes[field] == code
+            else:
+                body &= np.fromiter(
+                    (value in values for values in snapshot.lists[field]),
+                    dtype=bool,
+                    count=len(body),
+                )
+        return mask
+
+    def __group_codes(
+        self, snapshot: _Snapshot, field: str
+    ) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """Per personality group codes of an attribute, with their labels."""
+        if field in BANDS:
+            values = snapshot.numbers[field]
+            # Code 0 is unknown, then one per band
+            codes = np.where(
+                np.isnan(values),
+                0,
+                np.digitize(np.nan_to_num(values), BANDS[field]) + 1,
+            ).astype(np.int64)
+            labels = [None] + _band_labels(BANDS[field])
+        else:
+            codes = snapshot.codes[field].astype(np.int64)
+            labels = [None] * len(snapshot.vocabularies[field])
+            for value, code in snapshot.vocabularies[field].items():
+                labels[code] = value
+        # Sentinel for ratings whose personality isn't loaded
+        return np.append(codes, 0), labels
+
+    def __stats(
+        self, snapshot: _Snapshot, mask: np.ndarray, top_emotions: int
+    ) -> Dict[str, Any]:
+        inverse = np.zeros(int(mask.sum()), dtype=np.int64)
+        return self.__aggregate(snapshot, mask, inverse, 1, top_emotions)[0]
+
+    def __group_stats(
+        self,
+        snapshot: _Snapshot,
+        mask: np.ndarray,
+        group_by: List[str],
+        top_emotions: int,
+    ) -> List[Dict[str, Any]]:
+        personalities = snapshot.personality[mask]
+
+        keys = np.zeros(len(personalities), dtype=np.int64)
+        all_labels = []
+        for field in group_by:
+            codes, labels = self.__group_codes(snapshot, field)
+            keys = keys * len(labels) + codes[personalities]
+            all_labels.append(labels)
+
+        # The key space is small, so the groups present are found with a
+        # bincount rather than sorting the keys
+        space = int(np.prod([len(labels) for labels in all_labels]))
+        present = np.bincount(keys, minlength=space) > 0
+        unique = np.flatnonzero(present)
+        inverse = (np.cumsum(present) - 1)[keys]
+        stats = self.__aggregate(
+            snapshot, mask, inverse, len(unique), top_emotions
+        )
+
+        groups = []
+        for key, group_stats in zip(unique.tolist(), stats):
+            values = {}
+            for field, labels in reversed(list(zip(group_by, all_labels))):
+                key, code = divmod(key, len(labels))
+                values[field] = labels[code]
+            group = {field: values[field] for field in group_by}
+            groups.append({"group": group, **group_stats})
+
+        groups.sort(key=lambda g: g["ratings"], reverse=True)
+        return groups
+
+    def __aggregate(
+        self,
+        snapshot: _Snapshot,
+        mask: np.ndarray,
+        inverse: np.ndarray,
+        size: int,
+        top_emotions: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Statistics of each group of the masked ratings. Every count is a
+        single bincount over a combined (group, value) key.
+        """
+        levels = np.compress(mask, snapshot.level).astype(np.int64)
+        groups = np.compress(mask, snapshot.groups).astype(np.int64)
+        emotion_ids = np.compress(mask, snapshot.emotions, axis=0)
+
+        # Level 0 is "no level"
+        width = len(EFFECTIVENESS) + 1
+        level_counts = np.bincount(
+            inverse * width + levels, minlength=size * width
+        ).reshape(size, width)
+        ratings = level_counts.sum(axis=1)
+        histogram = level_counts[:, 1:]
+        level_sums = histogram @ np.arange(1, width)
+
+        # An emotion_groups mask has one of 2^len(GROUPS) values; count each
+        # value, then add up the values with each group's bit set
+        width = 1 << len(emotions.GROUPS)
+        mask_counts = np.bincount(
+            inverse * width + groups, minlength=size * width
+        ).reshape(size, width)
+        bits = (np.arange(width)[:, None] >> np.arange(len(emotions.GROUPS))) & 1
+        group_counts = mask_counts @ bits
+
+        width = max(emotions.EMOTIONS) + 1
+        if size == 1:
+            keys = emotion_ids.ravel()
+        else:
+            keys = (inverse[:, None] * width + emotion_ids).ravel()
+        emotion_counts = np.bincount(keys, minlength=size * width).reshape(
+            size, width
+        )
+        emotion_counts[:, 0] = 0  # Padding
+
+        top = np.argsort(-emotion_counts, axis=1, kind="stable")[:, :top_emotions]
+
+        results = []
+        for i in range(size):
+            count = int(ratings[i])
+            level_count = int(histogram[i].sum())
+            results.append({
+                "ratings": count,
+                "mean_effectiveness": (
+                    float(level_sums[i] / level_count) if level_count else None
+                ),
+                "effectiveness": dict(
+                    zip(EFFECTIVENESS, histogram[i].tolist())
+                ),
+                "emotion_groups": {
+                    group: float(group_counts[i, g] / count) if count else 0.0
+                    for g, group in enumerate(emotions.GROUPS)
+                },
+                "top_emotions": [
+                    {
+                        "emotion": emotions.EMOTIONS[e][0],
+                        "share": float(emotion_counts[i, e] / count),
+                    }
+                    for e in top[i].tolist()
+                    if emotion_counts[i, e] > 0 and e in emotions.EMOTIONS
+                ],
+            })
+        return results
+
+
+def bootstrap_means(
+    values: np.ndarray,
+    valid: np.ndarray,
+    resamples: int,
+    rng: np.random.Generator,
+    max_cells: int = 4_000_000,
+) -> np.ndarray:
+    """
+    Bootstrap the mean of each column of values, counting only the valid
+    rows of each column. Each resample is turned into a row of counts of
+    how often it drew each of the n rows, so a block of resamples is one
+    matrix product rather than a loop; blocks are sized to keep the count
+    matrix under max_cells.
+
+    Args:
+        values: (n, k) values
+        valid: (n, k) whether each value counts
+        resamples: Number of bootstrap resamples
+        rng: Random generator to draw the resamples with
+        max_cells: Maximum size of the count matrix of one block
+
+    Returns:
+        (resamples, k) resampled means, NaN where a resample had no valid
+        rows in a column
+    """
+    n = len(values)
+    values = np.where(valid, values, 0.0)
+    valid = valid.astype(np.float64)
+
+    block = max(1, max_cells // max(n, 1))
+    means = []
+    for start in range(0, resamples, block):
+        size = min(block, resamples - start)
+        draws = rng.integers(0, n, size=(size, n))
+        # Offset each resample's draws into its own row of the count matrix
+        draws += (np.arange(size) * n)[:, None]
+        counts = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n)
+        totals = counts @ values
+        sizes = counts @ valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means.append(totals / sizes)
+    return np.concatenate(means)
+
+
+class AdComparer:
+    """
+    Paired comparisons of two ads over the personalities that rated both,
+    with bootstrap confidence intervals. Results are cached until a rating
+    of either ad changes.
+    """
+
+    def __init__(self, rating_store: RatingStore, cache_size: int = 256):
+        """
+        Initialize the comparer.
+
+        Args:
+            rating_store: Store the ratings are read from
+            cache_size: Maximum number of comparisons cached
+        """
+        self.rating_store = rating_store
+        self.cache_size = cache_size
+        self.__lock = Lock()
+        self.__cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+
+    def compare(
+        self,
+        ad_a: str,
+        ad_b: str,
+        segment: Optional[str] = None,
+        resamples: int = 10000,
+        confidence: float = 0.95,
+        seed: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Compare ad b against ad a. Deltas are b minus a, computed per
+        personality that rated both, so each personality is its own
+        control.
+
+        Args:
+            ad_a: ID of the baseline ad
+            ad_b: ID of the ad compared against it
+            segment: Segment definition (see segments.parse_segment) to
+                restrict the personalities to
+            resamples: Number of bootstrap resamples
+            confidence: Confidence level of the intervals
+            seed: Seed of the resampling, so repeated requests agree
+
+        Returns:
+            Dictionary with the number of "pairs", the "effectiveness"
+            means of both ads and their delta, and the same for the share
+            of ratings reporting each of the "emotion_groups"; each delta
+            with its confidence interval "ci"
+
+        Raises:
+            ValueError: If the segment is invalid
+        """
+        watermark = self.rating_store.get_watermark([ad_a, ad_b])
+        key = (ad_a, ad_b, segment, resamples, confidence, seed, watermark)
+        with self.__lock:
+            if key in self.__cache:
+                metrics.CACHE_REQUESTS.labels("ad_comparison", "hit").inc()
+                self.__cache.move_to_end(key)
+                return self.__cache[key]
+        metrics.CACHE_REQUESTS.labels("ad_comparison", "miss").inc()
+
+        rows = self.rating_store.get_paired_ratings(ad_a, ad_b, segment)
+        result = self.__compare(rows, resamples, confidence, seed)
+        result.update({"a": ad_a, "b": ad_b, "segment": segment})
+
+        with self.__lock:
+            self.__cache[key] = result
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+        return result
+
+    def __compare(
+        self,
+        rows: List[Dict[str, Any]],
+        resamples: int,
+        confidence: float,
+        seed: int,
+    ) -> Dict[str, Any]:
+        n = len(rows)
+        levels = np.array(
+            [[r["level_a"] or 0, r["level_b"] or 0] for r in rows], dtype=np.float64
+        ).reshape(n, 2)
+        masks = np.array(
+            [[r["groups_a"] or 0, r["groups_b"] or 0] for r in rows], dtype=np.int64
+        ).reshape(n, 2)
+        bits = np.array([emotions.group_bit(g) for g in emotions.GROUPS])
+
+        # Column 0 is the effectiveness delta, which only counts where both
+        # ratings have a level; then one column per emotion group
+        has_groups = ((masks[:, :, None] & bits) != 0).astype(np.float64)
+        values = np.column_stack(
+            [levels[:, 1] - levels[:, 0], has_groups[:, 1] - has_groups[:, 0]]
+        )
+        valid = np.ones_like(values, dtype=bool)
+        valid[:, 0] = (levels > 0).all(axis=1)
+
+        alpha = (1 - confidence) / 2
+        if n:
+            samples = bootstrap_means(
+                values, valid, resamples, np.random.default_rng(seed)
+            )
+            with np.errstate(invalid="ignore"):
+                low, high = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+        else:
+            low = high = np.full(values.shape[1], np.nan)
+
+        def mean(column: np.ndarray, mask: np.ndarray) -> Optional[float]:
+            return float(column[mask].mean()) if mask.any() else None
+
+        def interval(i: int) -> Optional[List[float]]:
+            if np.isnan(low[i]) or np.isnan(high[i]):
+                return None
+            return [float(low[i]), float(high[i])]
+
+        rated = valid[:, 0]
+        result = {
+            "pairs": n,
+            "resamples": resamples,
+            "confidence": confidence,
+            "effectiveness": {
+                "pairs": int(rated.sum()),
+                "mean_a": mean(levels[:, 0], rated),
+                "mean_b": mean(levels[:, 1], rated),
+                "delta": mean(values[:, 0], rated),
+                "ci": interval(0),
+            },
+            "emotion_groups": {},
+        }
+        everyone = np.ones(n, dtype=bool)
+        for g, group in enumerate(emotions.GROUPS):
+            result["emotion_groups"][group] = {
+                "share_a": mean(has_groups[:, 0, g], everyone),
+                "share_b": mean(has_groups[:, 1, g], everyone),
+                "delta": mean(values[:, g + 1], everyone),
+                "ci": interval(g + 1),
+            }
+        return result
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import io
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import google.generativeai as genai
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from app.backend import metrics
+
+
+# Dimensions of every stored embedding; the vector columns are declared
+# with it, so changing it needs a migration
+DIMENSIONS = 768
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Embedder(ABC):
+    """
+    Maps ad copy, images and other text into a shared vector space in which
+    cosine similarity measures semantic similarity. Vectors are unit length
+    with DIMENSIONS dimensions.
+    """
+
+    name = "embedder"
+
+    @abstractmethod
+    def embed_texts(self, texts: List[str], query: bool = False) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: Texts to embed
+            query: Whether the texts are search queries rather than
+                documents to be searched; some models embed them differently
+
+        Returns:
+            Matrix with one unit length row per text
+        """
+
+    @abstractmethod
+    def embed_ad(
+        self, copy: Optional[str], image: Optional[bytes]
+    ) -> Optional[np.ndarray]:
+        """
+        Embed an ad from its copy and image.
+
+        Args:
+            copy: The ad's copy, if any
+            image: The ad's encoded image, if any
+
+        Returns:
+            Unit length vector, or None if the ad has nothing to embed
+        """
+
+
+class LocalEmbedder(Embedder):
+    """
+    Deterministic embedder that needs no model or network, for tests and
+    offline development. Text is embedded with the hashing trick over words
+    and word pairs, so texts sharing words are similar; images by a fixed
+    random projection of a small colour thumbnail, so similar looking
+    images are similar.
+    """
+
+    name = "local"
+
+    def __init__(self, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        # Projection of the 16x16 RGB thumbnail into the embedding space
+        self.__projection = rng.standard_normal((16 * 16 * 3, DIMENSIONS))
+
+    def __text(self, text: str) -> np.ndarray:
+        vector = np.zeros(DIMENSIONS)
+        words = _TOKEN.findall((text or "").lower())
+        for feature in words + [" ".join(pair) for pair in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % DIMENSIONS] += 1.0 if value >> 63 else -1.0
+        return vector
+
+    def embed_texts(self, texts: List[str], query: bool = False) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, DIMENSIONS))
+        return _normalize(np.stack([self.__text(text) for text in texts]))
+
+    def __image(self, data: bytes) -> Optional[np.ndarray]:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                pixels = np.asarray(
+                    image.convert("RGB").resize((16, 16), Image.Resampling.BOX),
+                    dtype=np.float64,
+                )
+        except (UnidentifiedImageError, OSError, ValueError):
+            return None
+        pixels = pixels.flatten() / 255.0
+        return _normalize((pixels - pixels.mean()) @ self.__projection)
+
+    def embed_ad(
+        self, copy: Optional[str], image: Optional[bytes]
+    ) -> Optional[np.ndarray]:
+        parts = []
+        if copy:
+            parts.append(self.embed_texts([copy])[0])
+        if image:
+            vector = self.__image(image)
+            if vector is not None:
+                parts.append(vector)
+        if not parts:
+            return None
+        return _normalize(np.sum(parts, axis=0))
+
+
+class GeminiEmbedder(Embedder):
+    """
+    Embedder backed by the Gemini API. Images are first described by a
+    vision model, and the description is embedded along with the copy, so
+    ads are compared by what they show and say rather than by pixels.
+    """
+
+    CAPTION_PROMPT = (
+        "Describe this advertisement in two or three sentences: the product, "
+        "the people and setting shown, the visual style, any text, and the "
+        "audience it seems aimed at."
+    )
+
+    def __init__(
+        self,
+        model: str = "models/text-embedding-004",
+        caption_model: str = "gemini-2.0-flash",
+        api_key: Optional[str] = None,
+    ):
+        api_key = (
+            api_key
+            or os.environ.get("GOOGLE_AISTUDIO_API_KEY")
+            or os.environ.get("GOOGLE_API_KEY")
+        )
+        if api_key is None:
+            raise ValueError(
+                "No Google API key found. Please set "
+                "GOOGLE_AISTUDIO_API_KEY or GOOGLE_API_KEY "
+                "environment variable"
+            )
+        genai.configure(api_key=api_key)
+        self.__captioner = genai.GenerativeModel(model_name=caption_model)
+        self.__caption_model = caption_model
+        self.model = model
+        self.name = f"gemini:{model}"
+
+    def embed_texts(self, texts: List[str], query: bool = False) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, DIMENSIONS))
+        vectors = []
+        # The API embeds at most 100 texts per request
+        for start in range(0, len(texts), 100):
+            result = metrics.observe_llm(
+                self.model,
+                lambda: genai.embed_content(
+                    model=self.model,
+                    content=texts[start:start + 100],
+                    task_type="retrieval_query" if query else "retrieval_document",
+                    output_dimensionality=DIMENSIONS,
+                ),
+            )
+            vectors.extend(result["embedding"])
+        return _normalize(np.array(vectors, dtype=np.float64))
+
+    def caption(self, image: bytes) -> Optional[str]:
+        """Describe an image with the vision model, None if it isn't one."""
+        try:
+            with Image.open(io.BytesIO(image)) as opened:
+                mime_type = Image.MIME.get(opened.format, "image/jpeg")
+        except (UnidentifiedImageError, OSError, ValueError):
+            return None
+        response = metrics.observe_llm(
+            self.__caption_model,
+            lambda: self.__captioner.generate_content(
+                [{"mime_type": mime_type, "data": image}, self.CAPTION_PROMPT]
+            ),
+        )
+        return response.text
+
+    def embed_ad(
+        self, copy: Optional[str], image: Optional[bytes]
+    ) -> Optional[np.ndarray]:
+        parts = [copy] if copy else []
+        if image:
+            caption = self.caption(image)
+            if caption:
+                parts.append(caption)
+        if not parts:
+            return None
+        return self.embed_texts(["\n\n".join(parts)])[0]
+
+
+def get_embedder(backend: Optional[str] = None) -> Embedder:
+    """
+    Get the embedder configured by the EMBEDDING_BACKEND environment
+    variable, "gemini" (the default) or "local".
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = backend or os.environ.get("EMBEDDING_BACKEND", "gemini")
+    if backend == "gemini":
+        return GeminiEmbedder()
+    if backend == "local":
+        return LocalEmbedder()
+    raise ValueError(f"Unknown embedding backend {backend}, must be gemini or local")
+
+
+def read_image(path: Optional[str]) -> Optional[bytes]:
+    """
+    Read an ad's uploaded image, given the /uploads path it is served
+    from, relative to the server's working directory; None for remote
+    images and missing files.
+    """
+    if not path or not path.startswith("/uploads/"):
+        return None
+    try:
+        with open(path.lstrip("/"), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def main():
+    """
+    Embed the ads that have no embedding yet, such as those created before
+    embeddings were, and the personalities and ratings whose embedding is
+    missing or stale, against the database configured by the same POSTGRES_*
+    variables as the server. Run from the server's working directory so
+    uploaded images are found.
+
+        python -m app.backend.embeddings backfill [--batch N]
+    """
+    from app.backend.store import Store
+    from app.backend.store.db import Pool
+
+    parser = argparse.ArgumentParser(description=main.__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument(
+        "--batch", type=int, default=100, help="Ads read per query"
+    )
+    args = parser.parse_args()
+
+    embedder = get_embedder()
+    store = Store(
+        Pool(
+            host=os.environ.get("POSTGRES_HOST", "localhost"),
+            port=int(os.environ.get("POSTGRES_PORT", "5432")),
+            dbname=os.environ.get("POSTGRES_DB", "app"),
+            user=os.environ.get("POSTGRES_USER", "postgres"),
+            password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
+        ),
+        embedder,
+    )
+
+    embedded = 0
+    skipped = set()
+    while True:
+        ads = [
+            ad for ad in store.ad.get_unembedded(args.batch + len(skipped))
+            if ad.id not in skipped
+        ]
+        if not ads:
+            break
+        for ad in ads:
+            embedding = embedder.embed_ad(ad.copy, read_image(ad.image))
+            # Ads with nothing to embed, such as a remote image without
+            # copy, are skipped, as are those that fail to save
+            if embedding is not None and store.ad.set_embedding(
+                ad.id, embedding, embedder.name
+            ):
+                embedded += 1
+            else:
+                skipped.add(ad.id)
+    print(f"Embedded {embedded} ads, skipped {len(skipped)}")
+
+    embedded = store.personality.embed_stale(args.batch)
+    print(f"Embedded {embedded} personalities")
+
+    embedded = store.rating.embed_pending(batch_size=args.batch)
+    print(f"Embedded {embedded} ratings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import re
+from difflib import get_close_matches
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# Emotion groups. A group's bit in a rating's emotion_groups mask is
+# 1 << its index here, so never reorder this list; only append to it.
+GROUPS = ["happy", "fear", "anger", "disgust", "sad", "guilt", "surprise"]
+
+# Canonical emotions, keyed by their stable id, with the group each belongs
+# to. The ids are stored on ratings, so an id must never be reused or
+# renumbered; retire an emotion by leaving its id out, add one by taking the
+# next free id. Must match the emotion table seeded in migration 06.
+EMOTIONS: Dict[int, tuple] = {
+    1: ("Happy", "happy"),
+    2: ("Joyful", "happy"),
+    3: ("Excited", "happy"),
+    4: ("Interested", "happy"),
+    5: ("Proud", "happy"),
+    6: ("Accepted", "happy"),
+    7: ("Powerful", "happy"),
+    8: ("Peaceful", "happy"),
+    9: ("Intimate", "happy"),
+    10: ("Loving", "happy"),
+    11: ("Hopeful", "happy"),
+    12: ("Playful", "happy"),
+    13: ("Inspired", "happy"),
+    14: ("Open", "happy"),
+    15: ("Confident", "happy"),
+    16: ("Important", "happy"),
+    17: ("Fulfilled", "happy"),
+    18: ("Respected", "happy"),
+    19: ("Courageous", "happy"),
+    20: ("Provocative", "happy"),
+    21: ("Sensitive", "happy"),
+    22: ("Energetic", "happy"),
+    23: ("Liberated", "happy"),
+    24: ("Ecstatic", "happy"),
+    25: ("Eager", "happy"),
+    26: ("Awe", "surprise"),
+    27: ("Astonished", "surprise"),
+    28: ("Perplexed", "surprise"),
+    29: ("Dismayed", "surprise"),
+    30: ("Shocked", "surprise"),
+    31: ("Terrified", "fear"),
+    32: ("Frightened", "fear"),
+    33: ("Worried", "fear"),
+    34: ("Overwhelmed", "fear"),
+    35: ("Inadequate", "fear"),
+    36: ("Inferior", "fear"),
+    37: ("Worthless", "fear"),
+    38: ("Insignificant", "fear"),
+    39: ("Alienated", "sad"),
+    40: ("Disrespected", "anger"),
+    41: ("Ridiculed", "anger"),
+    42: ("Embarrassed", "guilt"),
+    43: ("Devastated", "sad"),
+    44: ("Resentful", "anger"),
+    45: ("Jealous", "anger"),
+    46: ("Violated", "anger"),
+    47: ("Fear", "fear"),
+    48: ("Scared", "fear"),
+    49: ("Anxious", "fear"),
+    50: ("Insecure", "fear"),
+    51: ("Submissive", "fear"),
+    52: ("Hurt", "fear"),
+    53: ("Humiliated", "fear"),
+    54: ("Threatened", "fear"),
+    55: ("Anger", "anger"),
+    56: ("Mad", "anger"),
+    57: ("Hateful", "anger"),
+    58: ("Aggressive", "anger"),
+    59: ("Frustrated", "anger"),
+    60: ("Hostile", "anger"),
+    61: ("Enraged", "anger"),
+    62: ("Furious", "anger"),
+    63: ("Violent", "anger"),
+    64: ("Irritated", "anger"),
+    65: ("Infuriated", "anger"),
+    66: ("Provoked", "anger"),
+    67: ("Withdrawn", "anger"),
+    68: ("Suspicious", "anger"),
+    69: ("Skeptical", "anger"),
+    70: ("Sarcastic", "anger"),
+    71: ("Judgmental", "anger"),
+    72: ("Disgust", "disgust"),
+    73: ("Critical", "disgust"),
+    74: ("Distant", "disgust"),
+    75: ("Disappointed", "disgust"),
+    76: ("Awful", "disgust"),
+    77: ("Loathing", "disgust"),
+    78: ("Repugnant", "disgust"),
+    79: ("Revolted", "disgust"),
+    80: ("Revulsion", "disgust"),
+    81: ("Detestable", "disgust"),
+    82: ("Aversion", "disgust"),
+    83: ("Sad", "sad"),
+    84: ("Lonely", "sad"),
+    85: ("Bored", "sad"),
+    86: ("Depressed", "sad"),
+    87: ("Despair", "sad"),
+    88: ("Abandoned", "sad"),
+    89: ("Ignored", "sad"),
+    90: ("Victimized", "sad"),
+    91: ("Powerless", "sad"),
+    92: ("Vulnerable", "sad"),
+    93: ("Empty", "sad"),
+    94: ("Isolated", "sad"),
+    95: ("Apathetic", "sad"),
+    96: ("Indifferent", "sad"),
+    97: ("Guilty", "guilt"),
+    98: ("Remorseful", "guilt"),
+    99: ("Ashamed", "guilt"),
+    100: ("Hesitant", "guilt"),
+    101: ("Avoidance", "guilt"),
+    102: ("Surprise", "surprise"),
+    103: ("Startled", "surprise"),
+    104: ("Confused", "surprise"),
+    105: ("Amazed", "surprise"),
+}
+
+# Canonical names in id order; this is the list offered to the LLM
+NAMES: List[str] = [EMOTIONS[i][0] for i in sorted(EMOTIONS)]
+
+# Common words the LLM answers with instead of the canonical name
+SYNONYMS = {
+    "happiness": "Happy",
+    "glad": "Happy",
+    "pleased": "Happy",
+    "satisfied": "Fulfilled",
+    "content": "Peaceful",
+    "calm": "Peaceful",
+    "relaxed": "Peaceful",
+    "joy": "Joyful",
+    "delighted": "Joyful",
+    "excitement": "Excited",
+    "thrilled": "Excited",
+    "enthusiastic": "Eager",
+    "curious": "Interested",
+    "intrigued": "Interested",
+    "interest": "Interested",
+    "engaged": "Interested",
+    "hope": "Hopeful",
+    "optimistic": "Hopeful",
+    "inspiration": "Inspired",
+    "motivated": "Inspired",
+    "love": "Loving",
+    "pride": "Proud",
+    "amused": "Playful",
+    "confidence": "Confident",
+    "fearful": "Fear",
+    "afraid": "Scared",
+    "nervous": "Anxious",
+    "anxiety": "Anxious",
+    "uneasy": "Anxious",
+    "concerned": "Worried",
+    "angry": "Anger",
+    "annoyed": "Irritated",
+    "irritation": "Irritated",
+    "frustration": "Frustrated",
+    "outraged": "Enraged",
+    "distrust": "Suspicious",
+    "distrustful": "Suspicious",
+    "doubtful": "Skeptical",
+    "skepticism": "Skeptical",
+    "cynical": "Skeptical",
+    "disgusted": "Disgust",
+    "repulsed": "Revolted",
+    "disappointment": "Disappointed",
+    "uninterested": "Indifferent",
+    "indifference": "Indifferent",
+    "sadness": "Sad",
+    "unhappy": "Sad",
+    "boredom": "Bored",
+    "excluded": "Alienated",
+    "left out": "Alienated",
+    "guilt": "Guilty",
+    "shame": "Ashamed",
+    "regret": "Remorseful",
+    "surprised": "Surprise",
+    "amazement": "Amazed",
+    "puzzled": "Confused",
+    "confusion": "Confused",
+}
+
+_GROUP_BITS = {group: 1 << index for index, group in enumerate(GROUPS)}
+
+# Lowercased canonical name or synonym -> emotion id
+_LOOKUP: Dict[str, int] = {name.lower(): i for i, (name, _) in EMOTIONS.items()}
+_LOOKUP.update({
+    synonym: _LOOKUP[name.lower()] for synonym, name in SYNONYMS.items()
+})
+_KEYS = list(_LOOKUP)
+
+
+def _key(name: str) -> str:
+    return re.sub(r"[^a-z ]+", "", name.lower()).strip()
+
+
+@lru_cache(maxsize=4096)
+def _fuzzy(key: str) -> Optional[int]:
+    matches = get_close_matches(key, _KEYS, n=1, cutoff=0.85)
+    return _LOOKUP[matches[0]] if matches else None
+
+
+def normalize(name: str) -> Optional[int]:
+    """
+    Map an emotion as written by the LLM to its canonical id. Exact names
+    and synonyms are a single dict lookup regardless of case or
+    punctuation; misspellings fall back to a fuzzy match, whose results
+    are cached.
+
+    Args:
+        name: The emotion to normalize
+
+    Returns:
+        The emotion id, or None if it doesn't resemble any known emotion
+    """
+    key = _key(name)
+    if not key:
+        return None
+    emotion_id = _LOOKUP.get(key)
+    if emotion_id is None:
+        emotion_id = _fuzzy(key)
+    return emotion_id
+
+
+def normalize_all(emotions: Iterable[str]) -> List[int]:
+    """
+    Normalize a list of emotions, or a comma separated string of them,
+    dropping unknown and repeated emotions while keeping their order.
+    """
+    if isinstance(emotions, str):
+        emotions = emotions.split(",")
+
+    ids = []
+    for name in emotions:
+        emotion_id = normalize(name)
+        if emotion_id is not None and emotion_id not in ids:
+            ids.append(emotion_id)
+    return ids
+
+
+def names(ids: Iterable[int]) -> List[str]:
+    """Get the canonical names of the given emotion ids."""
+    return [EMOTIONS[i][0] for i in ids if i in EMOTIONS]
+
+
+def group_of(emotion_id: int) -> str:
+    """Get the group of an emotion id."""
+    return EMOTIONS[emotion_id][1]
+
+
+def group_bit(group: str) -> int:
+    """
+    Get the bit of a group in an emotion_groups mask.
+
+    Raises:
+        ValueError: If the group is unknown
+    """
+    if group not in _GROUP_BITS:
+        raise ValueError(
+            f"Unknown emotion group {group}, must be one of "
+            f"{', '.join(GROUPS)}"
+        )
+    return _GROUP_BITS[group]
+
+
+def group_mask(ids: Iterable[int]) -> int:
+    """Build the emotion_groups mask of a set of emotion ids."""
+    mask = 0
+    for i in ids:
+        if i in EMOTIONS:
+            mask |= _GROUP_BITS[EMOTIONS[i][1]]
+    return mask
+
+
+def groups(mask: int) -> List[str]:
+    """List the groups set in an emotion_groups mask."""
+    return [group for group in GROUPS if mask & _GROUP_BITS[group]]
+
+
+def taxonomy() -> Dict[str, List[Dict[str, Any]]]:
+    """Describe the taxonomy as groups of {"id", "name"} emotions."""
+    result = {group: [] for group in GROUPS}
+    for i in sorted(EMOTIONS):
+        name, group = EMOTIONS[i]
+        result[group].append({"id": i, "name": name})
+    return result
@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Arrow types for the columns of RatingStore.export(). Anything not listed
+# here is exported as a string.
+PARQUET_TYPES = {
+    "created_at": pa.timestamp("us", tz="UTC"),
+    "updated_at": pa.timestamp("us", tz="UTC"),
+    "emotions": pa.list_(pa.string()),
+    "personality_age": pa.int32(),
+    "personality_children": pa.int32(),
+    "personality_income": pa.float64(),
+    "personality_personality_traits": pa.list_(pa.string()),
+    "personality_values": pa.list_(pa.string()),
+    "personality_attitudes": pa.list_(pa.string()),
+    "personality_interests": pa.list_(pa.string()),
+    "personality_lifestyle": pa.list_(pa.string()),
+    "personality_habits": pa.list_(pa.string()),
+    "personality_frustrations": pa.list_(pa.string()),
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _json_default(value: Any) -> Any:
+    """Serialize the non-JSON types psycopg2 hands back."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def encode_ndjson(
+    rows: Iterable[Dict[str, Any]], columns: List[str], chunk_size: int = 1000
+) -> Iterator[bytes]:
+    """
+    Encode rows as newline delimited JSON, yielding one chunk of bytes per
+    chunk_size rows.
+
+    Args:
+        rows: Rows to encode
+        columns: Column order of each encoded object
+        chunk_size: Number of rows per yielded chunk
+
+    Returns:
+        Iterator of encoded byte chunks
+    """
+    buffer = []
+    for row in rows:
+        record = {column: row.get(column) for column in columns}
+        buffer.append(json.dumps(record, default=_json_default))
+        if len(buffer) >= chunk_size:
+            yield ("\n".join(buffer) + "\n").encode("utf-8")
+            buffer = []
+
+    if buffer:
+        yield ("\n".join(buffer) + "\n").encode("utf-8")
+
+
+def encode_csv(
+    rows: Iterable[Dict[str, Any]], columns: List[str], chunk_size: int = 1000
+) -> Iterator[bytes]:
+    """
+    Encode rows as CSV with a header line, yielding one chunk of bytes per
+    chunk_size rows. List values are written as JSON arrays so they survive
+    a round trip.
+
+    Args:
+        rows: Rows to encode
+        columns: Header and column order
+        chunk_size: Number of rows per yielded chunk
+
+    Returns:
+        Iterator of encoded byte chunks
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    count = 0
+    for row in rows:
+        values = []
+        for column in columns:
+            value = row.get(column)
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, default=_json_default)
+            elif isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            values.append(value)
+        writer.writerow(values)
+
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    A write-only file object that buffers whatever is written to it until
+    drained, letting a ParquetWriter feed a streaming response.
+    """
+
+    def __init__(self):
+        self.__chunks = []
+        self.__position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.__chunks.append(data)
+        self.__position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.__position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.__chunks)
+        self.__chunks = []
+        return data
+
+
+def encode_parquet(
+    rows: Iterable[Dict[str, Any]],
+    columns: List[str],
+    row_group_size: int = 10000,
+) -> Iterator[bytes]:
+    """
+    Encode rows as a Parquet file, writing and yielding one row group at a
+    time so at most row_group_size rows are held in memory.
+
+    Args:
+        rows: Rows to encode
+        columns: Column order of the Parquet schema
+        row_group_size: Number of rows per row group
+
+    Returns:
+        Iterator of encoded byte chunks
+    """
+    schema = pa.schema(
+        [(column, PARQUET_TYPES.get(column, pa.string())) for column in columns]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def flush(batch: List[Dict[str, Any]]) -> bytes:
+        for row in batch:
+            for column, value in row.items():
+                if isinstance(value, Decimal):
+                    row[column] = float(value)
+                elif column not in PARQUET_TYPES and value is not None:
+                    if isinstance(value, (list, dict)):
+                        row[column] = json.dumps(value, default=_json_default)
+                    elif not isinstance(value, str):
+                        row[column] = str(value)
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append({column: row.get(column) for column in columns})
+        if len(batch) >= row_group_size:
+            yield flush(batch)
+            batch = []
+
+    if batch:
+        yield flush(batch)
+
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
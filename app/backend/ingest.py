@@ -0,0 +1,259 @@
+import csv
+import json
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from uuid import UUID, uuid4
+
+from app.backend.models.personality import Personality
+from app.backend.store.personality_store import PersonalityStore
+
+
+# Accepted personality fields, mapped to their type and, for strings, the
+# maximum length allowed by the personality table.
+PERSONALITY_FIELDS = {
+    "id": ("uuid", None),
+    "name": ("str", 255),
+    "age": ("int", None),
+    "gender": ("str", 50),
+    "location": ("str", 255),
+    "education_level": ("str", 100),
+    "marital_status": ("str", 50),
+    "children": ("int", None),
+    "occupation": ("str", 255),
+    "job_title": ("str", 255),
+    "industry": ("str", 255),
+    "income": ("float", None),
+    "seniority_level": ("str", 100),
+    "personality_traits": ("list", None),
+    "values": ("list", None),
+    "attitudes": ("list", None),
+    "interests": ("list", None),
+    "lifestyle": ("list", None),
+    "habits": ("list", None),
+    "frustrations": ("list", None),
+    "summary": ("str", None),
+}
+
+FORMATS = ["ndjson", "csv"]
+
+
+def read_ndjson(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    """
+    Read newline delimited JSON records. Lines that fail to parse are
+    yielded as the exception so they can be reported against their row.
+
+    Args:
+        file: Text stream to read
+
+    Returns:
+        Iterator of (line number, record or exception)
+    """
+    for line_number, line in enumerate(file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+
+
+def read_csv(file: TextIO) -> Iterator[Tuple[int, Any]]:
+    """
+    Read CSV records with a header line. Empty cells are treated as
+    missing, and list fields may be either a JSON array or a semicolon
+    separated list.
+
+    Args:
+        file: Text stream to read
+
+    Returns:
+        Iterator of (line number, record)
+    """
+    reader = csv.DictReader(file)
+    for record in reader:
+        values = {}
+        for key, value in record.items():
+            if key is None:
+                values[key] = value
+                continue
+            if value is None or value == "":
+                continue
+            field = PERSONALITY_FIELDS.get(key)
+            if field and field[0] == "list":
+                if value.startswith("["):
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        pass
+                else:
+                    value = [item.strip() for item in value.split(";")]
+            values[key] = value
+        yield reader.line_num, values
+
+
+def validate_personality(record: Any) -> Personality:
+    """
+    Validate and coerce a raw record into a Personality. Records without
+    an id are assigned a new one.
+
+    Args:
+        record: Raw record, as read from the upload
+
+    Returns:
+        The validated Personality
+
+    Raises:
+        ValueError: Listing every problem found with the record
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object")
+
+    errors = []
+    data = {}
+
+    for key, value in record.items():
+        if key not in PERSONALITY_FIELDS:
+            errors.append(f"Unknown field {key}")
+            continue
+        if value is None:
+            data[key] = None
+            continue
+
+        field_type, max_length = PERSONALITY_FIELDS[key]
+        try:
+            if field_type == "uuid":
+                data[key] = str(UUID(str(value)))
+            elif field_type == "str":
+                value = str(value)
+                if max_length and len(value) > max_length:
+                    raise ValueError(f"longer than {max_length} characters")
+                data[key] = value
+            elif field_type == "int":
+                if isinstance(value, bool):
+                    raise ValueError("not an integer")
+                number = float(value)
+                if not math.isfinite(number) or number != int(number):
+                    raise ValueError("not an integer")
+                data[key] = int(number)
+            elif field_type == "float":
+                if isinstance(value, bool):
+                    raise ValueError("not a number")
+                number = float(value)
+                if not math.isfinite(number):
+                    raise ValueError("not a finite number")
+                data[key] = number
+            elif field_type == "list":
+                if not isinstance(value, list) or not all(
+                    isinstance(item, str) for item in value
+                ):
+                    raise ValueError("not a list of strings")
+                data[key] = value
+        except (TypeError, ValueError, OverflowError) as e:
+            errors.append(f"Invalid {key}: {e}")
+
+    if data.get("age") is not None and not 0 <= data["age"] <= 150:
+        errors.append("Invalid age: out of range")
+    if data.get("children") is not None and data["children"] < 0:
+        errors.append("Invalid children: negative")
+
+    if errors:
+        raise ValueError("; ".join(errors))
+
+    if not data.get("id"):
+        data["id"] = str(uuid4())
+
+    return Personality.from_dict(data)
+
+
+def ingest_personalities(
+    records: Iterable[Tuple[int, Any]],
+    personality_store: PersonalityStore,
+    chunk_size: int = 5000,
+    max_errors: int = 1000,
+) -> Dict[str, Any]:
+    """
+    Validate records in chunks and bulk load each valid chunk. Invalid rows
+    are skipped and reported; they do not stop the import.
+
+    Args:
+        records: (row number, record) pairs, as produced by read_ndjson or
+            read_csv
+        personality_store: Store to load the personalities into
+        chunk_size: Number of valid personalities loaded per COPY
+        max_errors: Maximum number of row errors included in the report
+
+    Returns:
+        Report of the import; counts plus the list of row errors
+    """
+    report = {
+        "received": 0,
+        "inserted": 0,
+        "updated": 0,
+        "duplicates": 0,
+        "error_count": 0,
+        "errors": [],
+    }
+
+    def add_error(rows: List[int], error: str):
+        report["error_count"] += len(rows)
+        for row in rows:
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"row": row, "error": error})
+
+    def load(chunk: Dict[str, Tuple[int, Personality]]):
+        try:
+            counts = personality_store.bulk_upsert(
+                [personality for _, personality in chunk.values()]
+            )
+        except Exception as e:
+            add_error([row for row, _ in chunk.values()], str(e))
+            return
+        report["inserted"] += counts["inserted"]
+        report["updated"] += counts["updated"]
+
+    # Keyed by id so a repeated id within a chunk keeps only its last row
+    chunk: Dict[str, Tuple[int, Personality]] = {}
+
+    for row, record in records:
+        report["received"] += 1
+
+        if isinstance(record, Exception):
+            add_error([row], str(record))
+            continue
+
+        try:
+            personality = validate_personality(record)
+        except ValueError as e:
+            add_error([row], str(e))
+            continue
+
+        if personality.id in chunk:
+            report["duplicates"] += 1
+        chunk[personality.id] = (row, personality)
+
+        if len(chunk) >= chunk_size:
+            load(chunk)
+            chunk = {}
+
+    if chunk:
+        load(chunk)
+
+    return report
+
+
+def detect_format(
+    filename: Optional[str], content_type: Optional[str]
+) -> Optional[str]:
+    """Guess the upload format from its filename or content type."""
+    if filename:
+        if filename.endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+        if filename.endswith(".csv"):
+            return "csv"
+    if content_type:
+        if "ndjson" in content_type or "jsonl" in content_type:
+            return "ndjson"
+        if "csv" in content_type:
+            return "csv"
+    return None
@@ -2,7 +2,9 @@ from arkaine.llms.llm import LLM, Prompt
 import google.generativeai as genai
 
 import os
-from typing import Optional
+from typing import Any, Dict, Optional
+
+from app.backend import metrics
 
 
 class MultiModalLLM(LLM):
@@ -33,6 +35,7 @@ class MultiModalLLM(LLM):
 
         genai.configure(api_key=api_key)
         self.__model = genai.GenerativeModel(model_name=model)
+        self.__model_name = model
 
         if context_length:
             self.__context_length = context_length
@@ -49,7 +52,12 @@ class MultiModalLLM(LLM):
     def context_length(self) -> int:
         return self.__context_length
 
-    def completion(self, prompt: Prompt, image_path: Optional[str] = None) -> str:
+    def completion(
+        self,
+        prompt: Prompt,
+        image_path: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
         # Convert the chat format to Gemini's expected format
         history = []
         for message in prompt:
@@ -66,6 +74,14 @@ class MultiModalLLM(LLM):
 
         # Create a chat session and send the entire history
         chat = self.__model.start_chat(history=history[:-1])
+
+        # If a schema is given, constrain the response to JSON matching it
+        generation_config = None
+        if response_schema:
+            generation_config = {
+                "response_mime_type": "application/json",
+                "response_schema": response_schema,
+            }
         
         # Handle the last message which might include an image
         last_message = history[-1]["parts"][0]
@@ -98,18 +114,25 @@ class MultiModalLLM(LLM):
                 ]
                 
                 # Send message with image
-                response = chat.send_message(parts)
+                response = self.__send(chat, parts, generation_config)
             except Exception as e:
                 print(f"Error processing image: {e}")
                 # Fallback to text-only if image processing fails
-                response = chat.send_message(last_message)
+                response = self.__send(chat, last_message, generation_config)
         else:
             # Text-only message
-            response = chat.send_message(last_message)
+            response = self.__send(chat, last_message, generation_config)
 
         print(response.text)
         return response.text
 
+    def __send(self, chat, content, generation_config):
+        """Send a message to the chat, recording the call's metrics."""
+        return metrics.observe_llm(
+            self.__model_name,
+            lambda: chat.send_message(content, generation_config=generation_config),
+        )
+
     def __str__(self) -> str:
         return self.name
 
@@ -118,7 +141,8 @@ class MultiModalLLM(LLM):
 
         with self._init_context_(context, prompt) as ctx:
             image_path = ctx.x["ad_filepath"]
-            result = self.completion(prompt, image_path)
+            response_schema = ctx.x.get("response_schema")
+            result = self.completion(prompt, image_path, response_schema)
 
             if isinstance(result, tuple):
                 response, reasoning = result
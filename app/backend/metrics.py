@@ -0,0 +1,152 @@
+import os
+import time
+from typing import Any, Callable, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Metrics of the server, exposed on /metrics. With several worker
+# processes, set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by
+# them before they start: each worker then writes its metrics there and
+# any of them serves the sum. Gauges count live processes only.
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+T = TypeVar("T")
+
+# Buckets, in seconds, of latencies from a query to an LLM call
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0, 120.0,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+DB_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of a pool",
+    ["pool"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of a pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_WAITING = Gauge(
+    "db_pool_checkouts_waiting",
+    "Threads checking a connection out of a pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_EXHAUSTED = Counter(
+    "db_pool_exhausted_total",
+    "Checkouts refused because every connection of a pool was in use",
+    ["pool"],
+)
+
+LLM_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Latency of LLM calls",
+    ["model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens of LLM calls, as reported by the model",
+    ["model", "kind"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed LLM calls by error class",
+    ["model", "error"],
+)
+
+RATE_SWARM_WIDTH = Histogram(
+    "rate_swarm_width",
+    "Personalities rated by a single rating run",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+RATE_PERSONA_SECONDS = Histogram(
+    "rate_persona_duration_seconds",
+    "Time to rate an ad for one personality and save the rating",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_IN_FLIGHT = Gauge(
+    "rate_in_flight",
+    "Ratings being produced",
+    multiprocess_mode="livesum",
+)
+
+# The hit ratio of a cache is
+# rate(cache_requests_total{result="hit"}) / rate(cache_requests_total)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Lookups of the in-process result caches",
+    ["cache", "result"],
+)
+
+
+def observe_llm(model: str, call: Callable[[], T]) -> T:
+    """
+    Make an LLM call, recording its latency, outcome and, if the response
+    reports them, its tokens.
+
+    Args:
+        model: Name of the model called
+        call: Function making the call
+
+    Returns:
+        The response of the call
+    """
+    start = time.perf_counter()
+    try:
+        response = call()
+    except Exception as e:
+        LLM_SECONDS.labels(model, "error").observe(time.perf_counter() - start)
+        LLM_ERRORS.labels(model, type(e).__name__).inc()
+        raise
+    LLM_SECONDS.labels(model, "ok").observe(time.perf_counter() - start)
+
+    usage: Any = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        LLM_TOKENS.labels(model, "prompt").inc(
+            getattr(usage, "prompt_token_count", 0) or 0
+        )
+        LLM_TOKENS.labels(model, "completion").inc(
+            getattr(usage, "candidates_token_count", 0) or 0
+        )
+    return response
+
+
+def render() -> bytes:
+    """Render every metric, of every worker in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: int):
+    """
+    Drop the live gauges of a worker that exited, in multiprocess mode;
+    call from the process manager, e.g. gunicorn's child_exit hook.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
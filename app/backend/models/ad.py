@@ -12,15 +12,17 @@ class Ad():
         self,
         image: Optional[str] = None,
         copy: Optional[str] = None,
-        id: Optional[str] = str(uuid4()),
+        phash: Optional[int] = None,
+        id: Optional[str] = None,
         created_at: Optional[datetime] = None,
         updated_at: Optional[datetime] = None,
     ):
-        self.id = id
+        self.id = id or str(uuid4())
         if not image and not copy:
             raise ValueError("At least one of image or copy must be provided")
         self.image = image
         self.copy = copy
+        self.phash = phash
         self.created_at = created_at
         self.updated_at = updated_at
 
@@ -29,6 +31,7 @@ class Ad():
             "id": self.id,
             "image": self.image,
             "copy": self.copy,
+            "phash": self.phash,
             "created_at": self.created_at,
             "updated_at": self.updated_at
         }
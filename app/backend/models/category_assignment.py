@@ -8,9 +8,9 @@ class CategoryAssignment():
         self,
         personality: str,
         category: str,
-        id: Optional[str] = str(uuid4()),
+        id: Optional[str] = None,
     ):
-        self.id = id
+        self.id = id or str(uuid4())
         self.personality = personality
         self.category = category
 
@@ -0,0 +1,44 @@
+from uuid import uuid4
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+
+
+class Panel:
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+
+        # Clusters in index order, each a {"cluster", "medoid", "weight"}
+        # dictionary where weight is the number of members
+        clusters: Optional[List[Dict[str, Any]]] = None,
+
+        # Cluster of every member, keyed by personality ID
+        members: Optional[Dict[str, int]] = None,
+
+        id: Optional[str] = None,
+
+        created_at: Optional[datetime] = None,
+    ):
+        self.id = id or str(uuid4())
+        self.name = name
+        self.clusters = clusters or []
+        self.members = members or {}
+        self.created_at = created_at
+
+    @property
+    def medoids(self) -> List[str]:
+        return [cluster["medoid"] for cluster in self.clusters]
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "clusters": self.clusters,
+            "members": self.members,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        return cls(**data)
@@ -33,12 +33,12 @@ class Personality:
         # One sentence summary
         summary: Optional[str] = None,
 
-        id: Optional[str] = str(uuid4()),
+        id: Optional[str] = None,
 
         created_at: Optional[datetime] = None,
         updated_at: Optional[datetime] = None,
     ):
-        self.id = id
+        self.id = id or str(uuid4())
         self.name = name
         self.age = age
         self.gender = gender
@@ -89,6 +89,33 @@ class Personality:
             "updated_at": self.updated_at
         }
     
+    def profile(self) -> str:
+        """
+        Render the personality as the profile raters are prompted with, also
+        what persona search embeds.
+        """
+        profile = f"{self.name}:\n"
+        profile += f"\t - Age: {self.age}\n"
+        profile += f"\t - Gender: {self.gender}\n"
+        profile += f"\t - Location: {self.location}\n"
+        profile += f"\t - Education Level: {self.education_level}\n"
+        profile += f"\t - Marital Status: {self.marital_status}\n"
+        profile += f"\t - Children: {self.children}\n"
+        profile += f"\t - Occupation: {self.occupation}\n"
+        profile += f"\t - Job Title: {self.job_title}\n"
+        profile += f"\t - Industry: {self.industry}\n"
+        profile += f"\t - Income: {self.income}\n"
+        profile += f"\t - Seniority Level: {self.seniority_level}\n"
+        profile += f"\t - Personality Traits: {', '.join(self.personality_traits or [])}\n"
+        profile += f"\t - Values: {', '.join(self.values or [])}\n"
+        profile += f"\t - Attitudes: {', '.join(self.attitudes or [])}\n"
+        profile += f"\t - Interests: {', '.join(self.interests or [])}\n"
+        profile += f"\t - Lifestyle: {', '.join(self.lifestyle or [])}\n"
+        profile += f"\t - Habits: {', '.join(self.habits or [])}\n"
+        profile += f"\t - Frustrations: {', '.join(self.frustrations or [])}\n"
+        profile += f"\t - Summary: {self.summary}\n"
+        return profile
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]):
         return cls(**data)
\ No newline at end of file
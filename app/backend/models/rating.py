@@ -1,9 +1,30 @@
 
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from uuid import uuid4
 from datetime import datetime
 
 
+# The effectiveness scale, from least to most effective. A rating's
+# effectiveness_level is its position here, starting at 1.
+EFFECTIVENESS = [
+    "Not Relevant",
+    "Low Fit",
+    "Neutral/Okay",
+    "Good Fit",
+    "Strong Match"
+]
+
+
+def effectiveness_level(effectiveness: Optional[str]) -> Optional[int]:
+    """Get the 1 based level of an effectiveness, or None if off the scale."""
+    if not effectiveness:
+        return None
+    for level, value in enumerate(EFFECTIVENESS, start=1):
+        if value.lower() == effectiveness.strip().lower():
+            return level
+    return None
+
+
 class Rating():
     
     def __init__(
@@ -12,19 +33,21 @@ class Rating():
         ad: str,
         thought: str,
         emotional_response: str,
-        emotions: str,
+        emotions: List[str],
         effectiveness: str,
-        id: Optional[str] = str(uuid4()),
+        model_version: Optional[str] = None,
+        id: Optional[str] = None,
         created_at: Optional[datetime] = None,
         updated_at: Optional[datetime] = None,
     ):
-        self.id = id
+        self.id = id or str(uuid4())
         self.personality = personality
         self.ad = ad
         self.thought = thought
         self.emotional_response = emotional_response
         self.emotions = emotions
         self.effectiveness = effectiveness
+        self.model_version = model_version
         self.created_at = created_at
         self.updated_at = updated_at
         
@@ -37,6 +60,7 @@ class Rating():
             "emotional_response": self.emotional_response,
             "emotions": self.emotions,
             "effectiveness": self.effectiveness,
+            "model_version": self.model_version,
             "created_at": self.created_at,
             "updated_at": self.updated_at
         }
@@ -0,0 +1,310 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import (
+    MultiLabelBinarizer,
+    OneHotEncoder,
+    StandardScaler,
+    normalize,
+)
+
+from app.backend import emotions
+from app.backend.analytics import GROUP_FIELDS, group_label
+from app.backend.models.panel import Panel
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS, Rating, effectiveness_level
+
+
+# Personality attributes clustering is based on; categorical attributes are
+# one-hot encoded, numeric ones standardized and list attributes multi-hot
+# encoded.
+CATEGORICAL_FIELDS = [
+    "gender",
+    "location",
+    "education_level",
+    "marital_status",
+    "industry",
+    "seniority_level",
+]
+NUMERIC_FIELDS = ["age", "income", "children"]
+MULTI_HOT_FIELDS = ["personality_traits", "values", "interests"]
+
+def _text(value: Any) -> str:
+    return str(value).strip().lower() if value is not None else ""
+
+
+class PersonaFeaturizer:
+    """
+    Encodes personalities as rows of a sparse feature matrix. The encoding
+    (vocabularies, medians and scaling) is learned by fit(), so personalities
+    seen later are encoded the same way; values not seen when fitting are
+    ignored. Each list attribute's multi-hot block is scaled to unit length,
+    so personalities listing many interests don't outweigh those listing
+    few.
+    """
+
+    def fit(self, personalities: List[Personality]) -> "PersonaFeaturizer":
+        """Learn the encoding of a set of personalities."""
+        numbers = self.__numbers(personalities)
+        missing = np.isnan(numbers)
+        # Missing numbers are imputed with the median, which standardizes
+        # to ~0
+        self.medians = np.array([
+            np.median(column[~absent]) if not absent.all() else 0.0
+            for column, absent in zip(numbers.T, missing.T)
+        ])
+        self.scaler = StandardScaler().fit(
+            np.where(missing, self.medians, numbers)
+        )
+
+        self.encoder = OneHotEncoder(
+            sparse_output=True, handle_unknown="ignore"
+        ).fit(self.__categories(personalities))
+
+        self.binarizers = {}
+        for field in MULTI_HOT_FIELDS:
+            labels = self.__labels(personalities, field)
+            if any(labels):
+                self.binarizers[field] = MultiLabelBinarizer(
+                    sparse_output=True
+                ).fit(labels)
+        return self
+
+    def transform(self, personalities: List[Personality]) -> sparse.csr_matrix:
+        """
+        Encode personalities with the fitted encoding.
+
+        Returns:
+            Matrix with one row per personality, in order
+        """
+        numbers = self.__numbers(personalities)
+        numbers = np.where(np.isnan(numbers), self.medians, numbers)
+        blocks = [
+            sparse.csr_matrix(self.scaler.transform(numbers)),
+            self.encoder.transform(self.__categories(personalities)),
+        ]
+
+        for field, binarizer in self.binarizers.items():
+            known = set(binarizer.classes_)
+            labels = [
+                [label for label in row if label in known]
+                for row in self.__labels(personalities, field)
+            ]
+            block = binarizer.transform(labels).astype(np.float64)
+            blocks.append(normalize(block))
+
+        return sparse.hstack(blocks, format="csr")
+
+    def fit_transform(self, personalities: List[Personality]) -> sparse.csr_matrix:
+        return self.fit(personalities).transform(personalities)
+
+    def __numbers(self, personalities: List[Personality]) -> np.ndarray:
+        numbers = np.array(
+            [
+                [
+                    np.nan if getattr(p, field) is None else float(getattr(p, field))
+                    for field in NUMERIC_FIELDS
+                ]
+                for p in personalities
+            ],
+            dtype=np.float64,
+        ).reshape(len(personalities), len(NUMERIC_FIELDS))
+        income = NUMERIC_FIELDS.index("income")
+        numbers[:, income] = np.log1p(np.clip(numbers[:, income], 0, None))
+        return numbers
+
+    def __categories(self, personalities: List[Personality]) -> List[List[str]]:
+        return [
+            [_text(getattr(p, field)) for field in CATEGORICAL_FIELDS]
+            for p in personalities
+        ]
+
+    def __labels(
+        self, personalities: List[Personality], field: str
+    ) -> List[List[str]]:
+        return [
+            sorted({_text(item) for item in getattr(p, field) or []} - {""})
+            for p in personalities
+        ]
+
+
+def featurize(personalities: List[Personality]) -> sparse.csr_matrix:
+    """
+    Encode personalities as rows of a sparse feature matrix, with an
+    encoding learned from the personalities themselves.
+
+    Args:
+        personalities: Personalities to encode
+
+    Returns:
+        Matrix with one row per personality, in order
+    """
+    return PersonaFeaturizer().fit_transform(personalities)
+
+
+def build_panel(
+    personalities: List[Personality],
+    clusters: int,
+    name: Optional[str] = None,
+    seed: int = 0,
+) -> Panel:
+    """
+    Cluster personalities with k-means and pick each cluster's medoid, the
+    member closest to its centroid, to represent it.
+
+    Args:
+        personalities: Personalities to cluster
+        clusters: Number of clusters; capped at the number of personalities
+        name: Optional name of the panel
+        seed: Seed of the clustering, so rebuilding a panel is repeatable
+
+    Returns:
+        The Panel, with clusters weighted by their number of members
+
+    Raises:
+        ValueError: If there are no personalities or clusters is below 1
+    """
+    if not personalities:
+        raise ValueError("No personalities to build a panel from")
+    if clusters < 1:
+        raise ValueError("A panel needs at least one cluster")
+
+    features = featurize(personalities)
+    kmeans = KMeans(
+        n_clusters=min(clusters, len(personalities)),
+        n_init="auto",
+        random_state=seed,
+    )
+    labels = kmeans.fit_predict(features)
+    distances = kmeans.transform(features)[np.arange(len(labels)), labels]
+
+    # Duplicate personalities can leave clusters empty, so the clusters
+    # found are renumbered densely
+    found, labels = np.unique(labels, return_inverse=True)
+    weights = np.bincount(labels, minlength=len(found))
+    # Sorting by (cluster, distance) puts each cluster's medoid first
+    order = np.lexsort((distances, labels))
+    firsts = order[np.searchsorted(labels[order], np.arange(len(found)))]
+
+    return Panel(
+        name=name,
+        clusters=[
+            {
+                "cluster": cluster,
+                "medoid": personalities[int(first)].id,
+                "weight": int(weights[cluster]),
+            }
+            for cluster, first in enumerate(firsts.tolist())
+        ],
+        members={
+            p.id: int(label) for p, label in zip(personalities, labels.tolist())
+        },
+    )
+
+
+def _stats(levels: np.ndarray, masks: np.ndarray) -> Dict[str, Any]:
+    count = len(levels)
+    histogram = np.bincount(levels, minlength=len(EFFECTIVENESS) + 1)[1:]
+    level_count = int(histogram.sum())
+    return {
+        "personalities": count,
+        "mean_effectiveness": (
+            float(histogram @ np.arange(1, len(EFFECTIVENESS) + 1) / level_count)
+            if level_count
+            else None
+        ),
+        "effectiveness": dict(zip(EFFECTIVENESS, histogram.tolist())),
+        "emotion_groups": {
+            group: (
+                float(((masks & emotions.group_bit(group)) != 0).mean())
+                if count
+                else 0.0
+            )
+            for group in emotions.GROUPS
+        },
+    }
+
+
+def extrapolate(
+    panel: Panel,
+    ratings: Dict[str, Rating],
+    personalities: Dict[str, Personality],
+    group_by: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Extrapolate the ratings of a panel's medoids to all of its members;
+    every member is counted as reacting like its cluster's medoid, so each
+    medoid's rating is weighted by its cluster's size.
+
+    Args:
+        panel: The panel the medoids were rated for
+        ratings: Ratings of the medoids, keyed by personality ID; members
+            of clusters whose medoid wasn't rated are left out
+        personalities: Members, keyed by ID, needed to group by their
+            attributes
+        group_by: Attributes to also break the results down by; numeric
+            ones are grouped into analytics.BANDS
+
+    Returns:
+        Dictionary with the number of "medoids" rated, the "personalities"
+        they represent, and the extrapolated "effectiveness" counts,
+        "mean_effectiveness" and "emotion_groups" shares, overall and per
+        group in "groups"
+
+    Raises:
+        ValueError: If a group_by attribute is unknown
+    """
+    group_by = group_by or []
+    for field in group_by:
+        if field not in GROUP_FIELDS:
+            raise ValueError(
+                f"Unknown group_by field {field}, must be one of "
+                f"{', '.join(GROUP_FIELDS)}"
+            )
+
+    # Level and emotion group mask of each cluster's medoid, level 0 being
+    # "no level"
+    rated = {}
+    for cluster in panel.clusters:
+        rating = ratings.get(cluster["medoid"])
+        if rating is not None:
+            rated[cluster["cluster"]] = (
+                effectiveness_level(rating.effectiveness) or 0,
+                emotions.group_mask(emotions.normalize_all(rating.emotions or [])),
+            )
+
+    members = [
+        (personality_id, rated[cluster])
+        for personality_id, cluster in panel.members.items()
+        if cluster in rated
+    ]
+    levels = np.array([r[0] for _, r in members], dtype=np.int64)
+    masks = np.array([r[1] for _, r in members], dtype=np.int64)
+
+    result = {
+        "medoids": len(rated),
+        **_stats(levels, masks),
+        "groups": [],
+    }
+
+    if group_by:
+        indices = defaultdict(list)
+        for i, (personality_id, _) in enumerate(members):
+            personality = personalities.get(personality_id)
+            key = tuple(
+                group_label(personality, field) if personality else None
+                for field in group_by
+            )
+            indices[key].append(i)
+
+        for key, index in indices.items():
+            result["groups"].append({
+                "group": dict(zip(group_by, key)),
+                **_stats(levels[index], masks[index]),
+            })
+        result["groups"].sort(key=lambda g: g["personalities"], reverse=True)
+
+    return result
@@ -0,0 +1,249 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.backend.segments import SEGMENT_FIELDS
+
+
+# Operators each kind of attribute (see segments.SEGMENT_FIELDS) supports.
+# Array operators take a list of values: "contains" matches personalities
+# listing all of them, "overlaps" those listing any.
+OPERATORS = {
+    "range": {"=", "!=", "<", "<=", ">", ">=", "between", "in"},
+    "text": {"=", "!=", "in"},
+    "array": {"contains", "overlaps"},
+}
+
+# Attributes results can be ordered by, besides the segment fields that
+# hold a single value
+ORDER_FIELDS = {"name", "created_at", "updated_at"} | {
+    field for field, kind in SEGMENT_FIELDS.items() if kind != "array"
+}
+
+# Largest page a query returns
+MAX_LIMIT = 1000
+
+
+class PersonaQuery:
+    """
+    A query over personalities built from validated conditions, so field
+    names never reach the SQL unchecked and every value is bound as a
+    parameter. Conditions must all hold. Array conditions are written as
+    @> and &&, which the GIN indexes on the array columns answer, and the
+    others as comparisons the B-tree indexes answer.
+
+        PersonaQuery().where("age", "between", [25, 34]).where(
+            "interests", "overlaps", ["hiking", "cycling"]
+        ).order_by("income", descending=True).page(limit=50)
+    """
+
+    def __init__(self):
+        self.conditions: List[Tuple[str, str, Any]] = []
+        self.order: List[Tuple[str, bool]] = []
+        self.limit: Optional[int] = None
+        self.offset = 0
+
+    def where(self, field: str, operator: str, value: Any) -> "PersonaQuery":
+        """
+        Add a condition.
+
+        Args:
+            field: Personality attribute, one of segments.SEGMENT_FIELDS
+            operator: One of the OPERATORS of the attribute's kind
+            value: A single value, a [low, high] pair for "between" (either
+                may be None for an open end), or a non-empty list for
+                "in", "contains" and "overlaps"
+
+        Returns:
+            The query, to chain calls
+
+        Raises:
+            ValueError: If the field, operator or value is invalid
+        """
+        kind = SEGMENT_FIELDS.get(field)
+        if kind is None:
+            raise ValueError(
+                f"Unknown field {field}, must be one of {', '.join(SEGMENT_FIELDS)}"
+            )
+        if operator not in OPERATORS[kind]:
+            raise ValueError(
+                f"Invalid operator {operator} for {field}, must be one of "
+                f"{', '.join(sorted(OPERATORS[kind]))}"
+            )
+
+        if operator == "between":
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise ValueError(f"between on {field} needs a [low, high] pair")
+            value = tuple(self.__number(field, v) for v in value)
+        elif operator in ("in", "contains", "overlaps"):
+            if not isinstance(value, (list, tuple)) or not value:
+                raise ValueError(f"{operator} on {field} needs a non-empty list")
+            value = [
+                self.__number(field, v) if kind == "range" else str(v)
+                for v in value
+            ]
+        elif value is None:
+            raise ValueError(f"{operator} on {field} needs a value")
+        elif kind == "range":
+            value = self.__number(field, value)
+        else:
+            value = str(value)
+
+        self.conditions.append((field, operator, value))
+        return self
+
+    def order_by(self, field: str, descending: bool = False) -> "PersonaQuery":
+        """
+        Order the results by an attribute; later calls break ties of
+        earlier ones, and the ID breaks any remaining ties so pages are
+        stable.
+
+        Raises:
+            ValueError: If the field can't be ordered by
+        """
+        if field not in ORDER_FIELDS:
+            raise ValueError(
+                f"Cannot order by {field}, must be one of "
+                f"{', '.join(sorted(ORDER_FIELDS))}"
+            )
+        self.order.append((field, descending))
+        return self
+
+    def page(self, limit: Optional[int] = None, offset: int = 0) -> "PersonaQuery":
+        """
+        Return only a page of the results.
+
+        Raises:
+            ValueError: If limit isn't between 1 and MAX_LIMIT or offset is
+                negative
+        """
+        if limit is not None and not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        self.limit = limit
+        self.offset = offset
+        return self
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "PersonaQuery":
+        """
+        Build a query from its JSON form:
+
+            {
+                "where": [
+                    {"field": "age", "op": "between", "value": [25, 34]},
+                    {"field": "interests", "op": "overlaps", "value": ["hiking"]}
+                ],
+                "order_by": [{"field": "income", "descending": true}],
+                "limit": 50,
+                "offset": 0
+            }
+
+        Raises:
+            ValueError: If any part of the query is invalid
+        """
+        if not isinstance(spec, dict):
+            raise ValueError("A query must be an object")
+        unknown = set(spec) - {"where", "order_by", "limit", "offset"}
+        if unknown:
+            raise ValueError(f"Unknown query keys: {', '.join(sorted(unknown))}")
+
+        query = cls()
+        for condition in spec.get("where") or []:
+            if not isinstance(condition, dict) or not {"field", "op"} <= set(condition):
+                raise ValueError("Conditions need a field, an op and a value")
+            query.where(condition["field"], condition["op"], condition.get("value"))
+        for order in spec.get("order_by") or []:
+            if isinstance(order, str):
+                query.order_by(order)
+            elif isinstance(order, dict) and "field" in order:
+                query.order_by(order["field"], bool(order.get("descending")))
+            else:
+                raise ValueError("order_by entries need a field")
+        try:
+            limit = spec.get("limit")
+            return query.page(
+                int(limit) if limit is not None else None,
+                int(spec.get("offset") or 0),
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid limit or offset: {e}")
+
+    def where_sql(self, alias: str = "p") -> Tuple[str, List[Any]]:
+        """
+        Build the SQL condition of the query.
+
+        Args:
+            alias: Alias of the personality table in the query
+
+        Returns:
+            The condition ("TRUE" without conditions) and its parameters
+        """
+        clauses = []
+        params: List[Any] = []
+        for field, operator, value in self.conditions:
+            column = f'{alias}."{field}"'
+            if operator == "between":
+                low, high = value
+                if low is not None:
+                    clauses.append(f"{column} >= %s")
+                    params.append(low)
+                if high is not None:
+                    clauses.append(f"{column} <= %s")
+                    params.append(high)
+            elif operator == "in":
+                clauses.append(f"{column} = ANY(%s)")
+                params.append(value)
+            elif operator == "contains":
+                clauses.append(f"{column} @> %s::text[]")
+                params.append(value)
+            elif operator == "overlaps":
+                clauses.append(f"{column} && %s::text[]")
+                params.append(value)
+            else:
+                clauses.append(f"{column} {operator} %s")
+                params.append(value)
+        return " AND ".join(clauses) if clauses else "TRUE", params
+
+    def to_sql(self, table: str, alias: str = "p") -> Tuple[str, Tuple[Any, ...]]:
+        """
+        Build the query selecting the matching personalities.
+
+        Args:
+            table: Name of the personality table
+            alias: Alias to give it
+
+        Returns:
+            The query and its parameters
+        """
+        where, params = self.where_sql(alias)
+        query = f"""
+            SELECT {alias}.*
+            FROM {table} {alias}
+            WHERE {where}
+        """
+        # Unpaged, unordered results are left unsorted
+        if self.order or self.limit is not None or self.offset:
+            order = [
+                f'{alias}."{field}" {"DESC" if descending else "ASC"}'
+                for field, descending in self.order
+            ]
+            query += f" ORDER BY {', '.join(order + [f'{alias}.id'])}"
+        if self.limit is not None:
+            query += " LIMIT %s"
+            params.append(self.limit)
+        if self.offset:
+            query += " OFFSET %s"
+            params.append(self.offset)
+        return query, tuple(params)
+
+    @staticmethod
+    def __number(field: str, value: Any) -> Optional[float]:
+        if value is None:
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid number {value} for {field}")
+        # Whole numbers are bound as integers; a decimal compared to an
+        # INTEGER column casts the column, which its index can't answer
+        return int(number) if number.is_integer() else number
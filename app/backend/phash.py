@@ -0,0 +1,202 @@
+import io
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from app.backend.store.ad_store import AdStore
+
+
+# Hashes are 64 bit difference hashes, stored as signed BIGINTs
+HASH_SIZE = 8
+_BITS = HASH_SIZE * HASH_SIZE
+_MASK = (1 << _BITS) - 1
+
+
+def dhash(data: bytes) -> Optional[int]:
+    """
+    Compute the difference hash of an image: the image is shrunk to 9x8
+    grayscale pixels and each bit records whether a pixel is brighter than
+    its right neighbour. Re-crops, recompression and small colour changes
+    flip few bits, so near duplicates are a small Hamming distance apart.
+
+    Args:
+        data: Encoded image, in any format Pillow reads
+
+    Returns:
+        The hash as a signed 64 bit integer, or None if the data isn't an
+        image
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            pixels = np.asarray(
+                image.convert("L").resize(
+                    (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS
+                ),
+                dtype=np.int16,
+            )
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = int("".join("1" if bit else "0" for bit in bits), 2)
+    return value - (1 << _BITS) if value >> (_BITS - 1) else value
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of bits two hashes differ in."""
+    return bin((a ^ b) & _MASK).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes under the Hamming distance. Each child
+    is keyed by its distance to its parent, so by the triangle inequality a
+    search within d of a hash only descends into children keyed within d
+    of the node's own distance, skipping most of the tree.
+    """
+
+    def __init__(self):
+        # Nodes are [hash, items, children keyed by distance]
+        self.__root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int, item: str) -> None:
+        """Add an item under its hash; items may share a hash."""
+        self.size += 1
+        if self.__root is None:
+            self.__root = [value, [item], {}]
+            return
+
+        node = self.__root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def remove(self, value: int, item: str) -> bool:
+        """
+        Remove an item from under its hash. Its node stays in the tree, as
+        its children are keyed by their distance to it.
+
+        Returns:
+            True if the item was found
+        """
+        node = self.__root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                if item not in node[1]:
+                    return False
+                node[1].remove(item)
+                self.size -= 1
+                return True
+            node = node[2].get(distance)
+        return False
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        Find the items whose hash is within a distance of a hash.
+
+        Returns:
+            List of (distance, item), nearest first
+        """
+        found = []
+        stack = [self.__root] if self.__root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            for key, child in node[2].items():
+                if distance - max_distance <= key <= distance + max_distance:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class SimilarAds:
+    """
+    Index of the perceptual hashes of all ads, for finding the near
+    duplicates of an image in milliseconds. It is loaded from the database
+    on first use and kept current through add(), update() and discard() as
+    ads are created, changed and deleted.
+    """
+
+    def __init__(self, ad_store: AdStore):
+        """
+        Initialize the index. Nothing is loaded until the first lookup.
+
+        Args:
+            ad_store: Store the ads' hashes are loaded from
+        """
+        self.ad_store = ad_store
+        self.__lock = Lock()
+        self.__tree: Optional[BKTree] = None
+        # The hash each ad is indexed under, to find it again
+        self.__hashes: Dict[str, int] = {}
+
+    def __load(self) -> BKTree:
+        if self.__tree is None:
+            tree = BKTree()
+            hashes = self.ad_store.get_hashes()
+            for ad_id, value in hashes.items():
+                tree.add(value, ad_id)
+            self.__tree = tree
+            self.__hashes = hashes
+        return self.__tree
+
+    def add(self, ad_id: str, value: Optional[int]) -> None:
+        """Index a new ad's hash; ads without a hash are ignored."""
+        self.update(ad_id, value)
+
+    def update(self, ad_id: str, value: Optional[int]) -> None:
+        """
+        Index an ad under its current hash in place of the one it had, as
+        when its image is replaced; None drops the ad from lookups.
+        """
+        with self.__lock:
+            if self.__tree is None:
+                # Picked up by the first load
+                return
+            previous = self.__hashes.pop(ad_id, None)
+            if previous is not None:
+                self.__tree.remove(previous, ad_id)
+            if value is not None:
+                self.__tree.add(value, ad_id)
+                self.__hashes[ad_id] = value
+
+    def discard(self, ad_id: str) -> None:
+        """Drop a deleted ad from lookups."""
+        self.update(ad_id, None)
+
+    def similar(
+        self,
+        value: int,
+        max_distance: int,
+        exclude: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[str, int]]:
+        """
+        Find the ads whose image is within a Hamming distance of a hash.
+
+        Args:
+            value: Hash of the image to match
+            max_distance: Largest number of bits a match may differ in
+            exclude: ID of an ad to leave out, usually the one matched
+            limit: Maximum number of matches
+
+        Returns:
+            List of (ad ID, distance), nearest first
+        """
+        with self.__lock:
+            found = self.__load().search(value, max_distance)
+        matches = [(ad_id, d) for d, ad_id in found if ad_id != exclude]
+        return matches[:limit] if limit is not None else matches
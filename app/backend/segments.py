@@ -0,0 +1,118 @@
+from typing import Any, List, Optional, Tuple
+
+
+# Personality attributes a segment can be defined on, and how each is
+# matched; "range" fields take a number or a lo-hi range (either end may be
+# left open), "text" fields an exact value, and "array" fields a value the
+# list must contain.
+SEGMENT_FIELDS = {
+    "age": "range",
+    "children": "range",
+    "income": "range",
+    "gender": "text",
+    "location": "text",
+    "education_level": "text",
+    "marital_status": "text",
+    "occupation": "text",
+    "job_title": "text",
+    "industry": "text",
+    "seniority_level": "text",
+    "personality_traits": "array",
+    "values": "array",
+    "attitudes": "array",
+    "interests": "array",
+    "lifestyle": "array",
+    "habits": "array",
+    "frustrations": "array",
+}
+
+
+def parse_segment(segment: Optional[str]) -> List[Tuple[str, str, Any]]:
+    """
+    Parse a segment definition; comma separated field:value conditions that
+    must all hold, e.g. "age:25-34,industry:Technology,lifestyle:urban
+    professional".
+
+    Args:
+        segment: The segment definition; empty or None for everyone
+
+    Returns:
+        List of (field, kind, value) conditions, where range values are a
+        (low, high) tuple with None for an open end
+
+    Raises:
+        ValueError: If a condition is malformed or names an unknown field
+    """
+    conditions = []
+    for part in (segment or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        field, separator, value = part.partition(":")
+        field, value = field.strip(), value.strip()
+        if not separator or not value:
+            raise ValueError(
+                f"Invalid segment condition {part}, expected field:value"
+            )
+        if field not in SEGMENT_FIELDS:
+            raise ValueError(
+                f"Unknown segment field {field}, must be one of "
+                f"{', '.join(SEGMENT_FIELDS)}"
+            )
+
+        kind = SEGMENT_FIELDS[field]
+        if kind == "range":
+            low, dash, high = value.partition("-")
+            try:
+                low = float(low) if low.strip() else None
+                high = float(high) if high.strip() else None
+            except ValueError:
+                raise ValueError(f"Invalid range {value} for {field}")
+            if not dash:
+                high = low
+            value = (low, high)
+
+        conditions.append((field, kind, value))
+    return conditions
+
+
+def segment_sql(
+    conditions: List[Tuple[str, str, Any]], alias: str = "p"
+) -> Tuple[str, List[Any]]:
+    """
+    Build the SQL condition selecting a parsed segment's personalities.
+
+    Args:
+        conditions: Conditions from parse_segment
+        alias: Alias of the personality table in the query
+
+    Returns:
+        The condition ("TRUE" for everyone) and its parameters
+    """
+    clauses = []
+    params = []
+    for field, kind, value in conditions:
+        column = f'{alias}."{field}"'
+        if kind == "range":
+            # Whole numbers are bound as integers, as comparing an INTEGER
+            # column to a decimal casts the column and defeats its index
+            low, high = (
+                int(v) if v is not None and float(v).is_integer() else v
+                for v in value
+            )
+            if low is not None:
+                clauses.append(f"{column} >= %s")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"{column} <= %s")
+                params.append(high)
+        elif kind == "array":
+            # Containment, unlike = ANY(), is answered by the GIN index
+            clauses.append(f"{column} @> ARRAY[%s]::text[]")
+            params.append(value)
+        else:
+            clauses.append(f"{column} = %s")
+            params.append(value)
+
+    return " AND ".join(clauses) if clauses else "TRUE", params
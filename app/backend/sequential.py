@@ -0,0 +1,190 @@
+import random
+from collections import defaultdict
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.backend import emotions
+from app.backend.analytics import GROUP_FIELDS, group_label
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS, effectiveness_level
+
+
+def stratified_order(
+    personalities: List[Personality],
+    strata: List[str],
+    seed: Optional[int] = None,
+) -> List[Personality]:
+    """
+    Order personalities randomly within strata, interleaved so that every
+    prefix of the order holds each stratum in close to its share of the
+    whole; stopping anywhere leaves a proportionate sample.
+
+    Args:
+        personalities: Personalities to order
+        strata: Attributes, from analytics.GROUP_FIELDS, whose combinations
+            form the strata
+        seed: Seed of the shuffle
+
+    Returns:
+        The personalities in sampling order
+
+    Raises:
+        ValueError: If a strata attribute is unknown
+    """
+    for field in strata:
+        if field not in GROUP_FIELDS:
+            raise ValueError(
+                f"Cannot stratify by {field}, must be one of "
+                f"{', '.join(GROUP_FIELDS)}"
+            )
+
+    rng = random.Random(seed)
+    members = defaultdict(list)
+    for personality in personalities:
+        members[tuple(group_label(personality, f) for f in strata)].append(
+            personality
+        )
+
+    # The i-th of a stratum's n members is placed at (i + u) / n, with u
+    # one random offset per stratum, so strata are spread evenly
+    keyed = []
+    for stratum in members.values():
+        rng.shuffle(stratum)
+        offset = rng.random()
+        keyed.extend(
+            ((i + offset) / len(stratum), p) for i, p in enumerate(stratum)
+        )
+    keyed.sort(key=lambda pair: pair[0])
+    return [p for _, p in keyed]
+
+
+class SequentialEstimate:
+    """
+    Running estimates of the effectiveness and emotion group distributions
+    of a population from a random sample of its ratings. Proportions get
+    Wilson score intervals and the mean a normal interval, all with a
+    finite population correction, so they shrink to nothing as the sample
+    approaches the whole population.
+    """
+
+    def __init__(self, population: int, confidence: float = 0.95):
+        """
+        Initialize the estimate.
+
+        Args:
+            population: Number of personalities sampled from
+            confidence: Confidence level of the intervals
+        """
+        self.population = population
+        self.confidence = confidence
+        self.__z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self.ratings = 0
+        self.level_counts = np.zeros(len(EFFECTIVENESS), dtype=np.int64)
+        self.group_counts = np.zeros(len(emotions.GROUPS), dtype=np.int64)
+
+    def add(self, rating: Dict[str, Any]) -> None:
+        """Add a rating, as a Rating.to_dict() dictionary, to the sample."""
+        self.ratings += 1
+        level = effectiveness_level(rating.get("effectiveness"))
+        if level:
+            self.level_counts[level - 1] += 1
+        mask = emotions.group_mask(emotions.normalize_all(rating.get("emotions") or []))
+        for g, group in enumerate(emotions.GROUPS):
+            if mask & emotions.group_bit(group):
+                self.group_counts[g] += 1
+
+    def __correction(self, n: int) -> float:
+        """Finite population correction of the variance of a sample of n."""
+        if self.population <= 1:
+            return 0.0
+        return max(self.population - n, 0) / (self.population - 1)
+
+    def __intervals(self, counts: np.ndarray, n: int) -> np.ndarray:
+        """Wilson score intervals of the proportions counts / n."""
+        if n == 0:
+            return np.tile([0.0, 1.0], (len(counts), 1))
+        p = counts / n
+        correction = self.__correction(n)
+        if correction == 0:
+            return np.column_stack([p, p])
+        # The correction shrinks the variance as a larger sample would
+        effective = n / correction
+        z2 = self.__z ** 2
+        denominator = 1 + z2 / effective
+        center = (p + z2 / (2 * effective)) / denominator
+        half = (
+            self.__z
+            * np.sqrt(p * (1 - p) / effective + z2 / (4 * effective ** 2))
+            / denominator
+        )
+        return np.column_stack(
+            [np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)]
+        )
+
+    def precision(self) -> float:
+        """The largest interval half-width of any effectiveness level or
+        emotion group share."""
+        intervals = np.vstack([
+            self.__intervals(self.level_counts, int(self.level_counts.sum())),
+            self.__intervals(self.group_counts, self.ratings),
+        ])
+        return float((intervals[:, 1] - intervals[:, 0]).max() / 2)
+
+    def converged(self, tolerance: float, min_ratings: int = 0) -> bool:
+        """Whether every share is known to within the tolerance, once at
+        least min_ratings ratings were added."""
+        if self.ratings >= self.population:
+            return True
+        return self.ratings >= min_ratings and self.precision() <= tolerance
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Describe the estimate.
+
+        Returns:
+            Dictionary with the number of "ratings" sampled of the
+            "population", the "precision" achieved, the "mean_effectiveness"
+            and the share of each "effectiveness" level and each of the
+            "emotion_groups", each with its confidence interval "ci"
+        """
+        leveled = int(self.level_counts.sum())
+        level_intervals = self.__intervals(self.level_counts, leveled)
+        group_intervals = self.__intervals(self.group_counts, self.ratings)
+
+        mean = None
+        if leveled:
+            values = np.arange(1, len(EFFECTIVENESS) + 1)
+            value = float(self.level_counts @ values / leveled)
+            variance = float(self.level_counts @ (values - value) ** 2 / leveled)
+            half = self.__z * np.sqrt(
+                variance / leveled * self.__correction(leveled)
+            )
+            mean = {"value": value, "ci": [value - half, value + half]}
+
+        return {
+            "ratings": self.ratings,
+            "population": self.population,
+            "confidence": self.confidence,
+            "precision": self.precision(),
+            "mean_effectiveness": mean,
+            "effectiveness": {
+                level: {
+                    "share": float(count / leveled) if leveled else None,
+                    "ci": interval.tolist(),
+                }
+                for level, count, interval in zip(
+                    EFFECTIVENESS, self.level_counts.tolist(), level_intervals
+                )
+            },
+            "emotion_groups": {
+                group: {
+                    "share": float(count / self.ratings) if self.ratings else None,
+                    "ci": interval.tolist(),
+                }
+                for group, count, interval in zip(
+                    emotions.GROUPS, self.group_counts.tolist(), group_intervals
+                )
+            },
+        }
@@ -1,24 +1,50 @@
+import io
+import json
 import os
+import time
 import uuid
+from datetime import datetime
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import BackgroundTasks, FastAPI, HTTPException, File, Request, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
+from app.backend import emotions, metrics
+from app.backend.analytics import GROUP_FIELDS, AdComparer, SegmentAnalytics
+from app.backend.embeddings import get_embedder
 from app.backend.models.ad import Ad
 from app.backend.models.category_assignment import CategoryAssignment
 from app.backend.models.personality import Personality
 from app.backend.models.rating import Rating
-from app.backend.store.db import Pool
+from app.backend.panel import build_panel, extrapolate
+from app.backend.persona_query import PersonaQuery
+from app.backend.phash import SimilarAds, dhash
+from app.backend.sequential import SequentialEstimate, stratified_order
+from app.backend.surrogate import MODEL_PATH, Surrogate, count_summaries
+from app.backend.themes import RatingThemes
+from app.backend.store.archive_store import ArchiveStore
+from app.backend.store.db import Pool, add_query_hook
 from app.backend.store.ad_store import AdStore
 from app.backend.store.category_store import CategoryStore
+from app.backend.store.panel_store import PanelStore
+from app.backend.store.partition_store import PartitionStore
 from app.backend.store.personality_store import PersonalityStore
 from app.backend.store.rating_store import RatingStore
 from app.backend.store.migration import Migration
+from app.backend.store.query_log import SORTS as QUERY_SORTS, QueryLog
 from app.backend.agents.rate import RateAgent
+from app.backend.agents.mass_rate import MassRater
 from app.backend.llm import MultiModalLLM
-from arkaine.flow import ParallelList
+from app.backend.export import ENCODERS, MEDIA_TYPES
+from app.backend.ingest import (
+    FORMATS as INGEST_FORMATS,
+    detect_format,
+    ingest_personalities,
+    read_csv,
+    read_ndjson,
+)
 from app.backend.store import Store
 
 # Configuration for image uploads
@@ -37,6 +63,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time every request, labeled by its route's path template so IDs in
+    paths don't make a series each; streamed responses are timed to their
+    first byte.
+    """
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status)
+        ).observe(time.perf_counter() - start)
+
+
+@app.middleware("http")
+async def read_primary(request: Request, call_next):
+    """
+    Serve every read of a request sent with an X-Read-Primary header from
+    the primary, for clients that must see the writes of their previous
+    requests; reads after a write in the same request always are.
+    """
+    if request.headers.get("x-read-primary", "").lower() in ("1", "true", "yes"):
+        with Pool.primary_only():
+            return await call_next(request)
+    return await call_next(request)
+
+
 # Mount the uploads directory to serve images
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
@@ -46,6 +105,12 @@ db_port = int(os.environ.get("POSTGRES_PORT", "5432"))
 db_name = os.environ.get("POSTGRES_DB", "app")
 db_user = os.environ.get("POSTGRES_USER", "postgres")
 db_password = os.environ.get("POSTGRES_PASSWORD", "postgres")
+# Comma separated connection strings of read replicas, if any
+db_replicas = [
+    replica.strip()
+    for replica in os.environ.get("POSTGRES_REPLICAS", "").split(",")
+    if replica.strip()
+]
 
 db_pool = Pool(
     host=db_host,
@@ -53,21 +118,117 @@ db_pool = Pool(
     dbname=db_name,
     user=db_user,
     password=db_password,
+    replicas=db_replicas,
 )
+# Statements slower than SLOW_QUERY_MS are logged, and explained if
+# SLOW_QUERY_EXPLAIN is set
+query_log = QueryLog(
+    db_pool,
+    slow_threshold=float(os.environ.get("SLOW_QUERY_MS", "500")) / 1000,
+    explain=os.environ.get("SLOW_QUERY_EXPLAIN", "").lower() in ("1", "true", "yes"),
+)
+add_query_hook(query_log.record)
 Migration(db_pool).run_migrations()
-store = Store(db_pool)
+PartitionStore(db_pool).ensure()
+embedder = get_embedder()
+archive = ArchiveStore(db_pool)
+store = Store(db_pool, embedder, archive)
 ad_store = AdStore(db_pool)
 category_store = CategoryStore(db_pool)
-personality_store = PersonalityStore(db_pool)
-rating_store = RatingStore(db_pool)
+personality_store = PersonalityStore(db_pool, embedder)
+rating_store = RatingStore(db_pool, embedder, archive)
+panel_store = PanelStore(db_pool)
+analytics = SegmentAnalytics(
+    db_pool,
+    max_staleness=float(os.environ.get("ANALYTICS_MAX_STALENESS", "5")),
+)
+ad_comparer = AdComparer(rating_store)
+rating_themes = RatingThemes(rating_store)
+similar_ads = SimilarAds(ad_store)
+# Largest Hamming distance between the image hashes of ads looked up as
+# similar, out of 64 bits
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "10"))
+# Trained offline with python -m app.backend.surrogate train
+surrogate = Surrogate.load(MODEL_PATH)
 
 llm = MultiModalLLM(model="gemini-2.5-flash-preview-04-17")
-RateAgent(llm=llm, store=store)
-RatingSwarm = ParallelList(RateAgent)
+rate_agent = RateAgent(
+    llm=llm,
+    store=store,
+    output_mode=os.environ.get("RATING_OUTPUT_MODE", "json"),
+)
+mass_rater = MassRater(
+    rate_agent,
+    store,
+    max_concurrency=int(os.environ.get("RATING_MAX_CONCURRENCY", "16")),
+)
+
+
+async def save_image(image: UploadFile) -> Tuple[str, bytes]:
+    """
+    Save an uploaded image under a unique name and return the path it is
+    served from via the /uploads endpoint, along with its contents.
+    """
+    # Generate a unique filename with UUID
+    file_extension = os.path.splitext(image.filename)[1] if image.filename else ".jpg"
+    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    file_path = IMAGE_UPLOAD_DIR / unique_filename
+
+    # Save the uploaded file
+    contents = await image.read()
+    with open(file_path, "wb") as f:
+        f.write(contents)
+
+    # Store the relative path to be served via the /uploads endpoint
+    return f"/uploads/images/{unique_filename}", contents
+
+
+def embed_ad(ad_id: str, copy: Optional[str], image: Optional[bytes]) -> None:
+    """Embed an ad for similar creative search."""
+    try:
+        embedding = embedder.embed_ad(copy, image)
+        if embedding is not None:
+            ad_store.set_embedding(ad_id, embedding, embedder.name)
+    except Exception as e:
+        print(f"Error embedding ad {ad_id}: {e}")
+
+
+def index_ad(ad: Ad, image: Optional[bytes], background_tasks: BackgroundTasks) -> None:
+    """
+    Index a newly created ad: its image hash immediately, and its embedding
+    once the response has been sent, as embedding may call a model.
+    """
+    similar_ads.add(ad.id, ad.phash)
+    background_tasks.add_task(embed_ad, ad.id, ad.copy, image)
+
+
+def reuse_ratings(
+    ad_id: str, phash: int, personality_ids: List[str], max_distance: int
+) -> List[Dict[str, Any]]:
+    """
+    Copy to a new ad the ratings the given personalities already gave its
+    near duplicates, taking each personality's rating from the nearest
+    duplicate that has one.
+    """
+    reused = []
+    remaining = set(personality_ids)
+    for source_id, distance in similar_ads.similar(phash, max_distance, exclude=ad_id):
+        if not remaining:
+            break
+        copies = rating_store.copy_ratings(source_id, ad_id, list(remaining))
+        if copies:
+            remaining -= {rating.personality for rating in copies}
+            reused.append({"ad_id": source_id, "distance": distance, "ratings": copies})
+    return reused
+
 
 # --- Ad Endpoints ---
 @app.post("/ads", response_model=str)
-async def create_ad(image: Optional[UploadFile] = File(None), copy: Optional[str] = Form(None)):
+async def create_ad(
+    background_tasks: BackgroundTasks,
+    image: Optional[UploadFile] = File(None),
+    copy: Optional[str] = Form(None),
+):
     """
     Create a new ad with multipart form data.
     Example input (multipart form):
@@ -82,39 +243,115 @@ async def create_ad(image: Optional[UploadFile] = File(None), copy: Optional[str
     
     # Process image if provided
     image_path = None
+    contents = None
     if image:
-        # Generate a unique filename with UUID
-        file_extension = os.path.splitext(image.filename)[1] if image.filename else ".jpg"
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = IMAGE_UPLOAD_DIR / unique_filename
-        
-        # Save the uploaded file
-        contents = await image.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Store the relative path to be served via the /uploads endpoint
-        image_path = f"/uploads/images/{unique_filename}"
+        image_path, contents = await save_image(image)
     
     # Create the ad object
-    ad_data = {"image": image_path, "copy": copy}
+    ad_data = {
+        "image": image_path,
+        "copy": copy,
+        "phash": dhash(contents) if contents else None,
+    }
     ad_obj = Ad.from_dict(ad_data)
     
     # Store in database
     ad_id = ad_store.create(ad_obj)
     if not ad_id:
         raise HTTPException(status_code=400, detail="Ad creation failed")
+    index_ad(ad_obj, contents, background_tasks)
     
     return ad_id
 
+def select_personalities(
+    personality_ids: Optional[str] = None,
+    category: Optional[str] = None,
+    **filters: Any,
+) -> Dict[str, Personality]:
+    """
+    Resolve a personality selection from request parameters to the loaded
+    personalities, keyed by ID, raising if any explicitly requested ID
+    doesn't exist or if nothing was selected.
+    """
+    personality_id_list = [pid.strip() for pid in (personality_ids or "").split(",") if pid.strip()]
+    filters = {k: v for k, v in filters.items() if v is not None}
+    if not personality_id_list and not category and not filters:
+        raise HTTPException(status_code=400, detail="No personality IDs, category or filters provided")
+
+    selected, missing = personality_store.select(
+        personality_ids=personality_id_list, category=category, **filters
+    )
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Personalities not found: {', '.join(missing)}")
+    if not selected:
+        raise HTTPException(status_code=400, detail="No personalities match the selection")
+    return selected
+
 @app.post("/rate", response_model=Dict[str, Any])
-async def rate_ad(image: UploadFile = File(...), personality_ids: str = Form(...)):
+async def rate_ad(
+    background_tasks: BackgroundTasks,
+    image: UploadFile = File(...),
+    personality_ids: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    min_age: Optional[int] = Form(None),
+    max_age: Optional[int] = Form(None),
+    gender: Optional[str] = Form(None),
+    location: Optional[str] = Form(None),
+    industry: Optional[str] = Form(None),
+    min_income: Optional[float] = Form(None),
+    max_income: Optional[float] = Form(None),
+    mode: str = Form("full"),
+    panel_id: Optional[str] = Form(None),
+    clusters: int = Form(50),
+    group_by: Optional[str] = Form(None),
+    tolerance: float = Form(0.1),
+    confidence: float = Form(0.95),
+    min_ratings: int = Form(20),
+    strata: str = Form("gender,age"),
+    reuse_distance: Optional[int] = Form(None),
+):
     """
-    Rate an ad for multiple personalities.
+    Rate an ad for multiple personalities. Personalities are selected by
+    explicit IDs and/or a category, optionally narrowed by attribute
+    filters; filters alone select from every personality.
+
+    With mode=representative only the medoids of a panel are rated, and
+    their ratings are extrapolated to every member of the panel. The panel
+    is either an existing one (panel_id) or built, and saved, from the
+    selection with the given number of clusters.
+
+    With mode=sequential the selection is rated in stratified random order
+    and rating stops once every effectiveness level and emotion group
+    share is known to within the tolerance, returning the estimate.
+
+    With reuse_distance, ratings personalities already gave ads whose
+    image is within that Hamming distance of the upload (re-crops,
+    recompressions, small edits) are copied to the new ad, and only the
+    personalities without one are rated.
     
     Example input (multipart form):
     - image: file upload
-    - personality_ids: comma-separated list of personality IDs
+    - personality_ids: comma-separated list of personality IDs (optional)
+    - category: category name (optional)
+    - min_age, max_age, gender, location, industry, min_income, max_income:
+      attribute filters (optional)
+    - mode: "full" (default), "representative" or "sequential"
+    - panel_id: panel to rate the medoids of, in representative mode
+      (optional; replaces the selection)
+    - clusters: clusters of the panel built in representative mode when no
+      panel_id is given (default 50)
+    - group_by: comma-separated attributes to break the extrapolated
+      results down by, in representative mode (optional)
+    - tolerance: confidence interval half-width at which sequential mode
+      stops (default 0.1)
+    - confidence: confidence level of the sequential intervals (default 0.95)
+    - min_ratings: ratings sequential mode takes before it may stop
+      (default 20)
+    - strata: comma-separated attributes sequential mode stratifies the
+      order by (default "gender,age")
+    - reuse_distance: largest image hash distance, out of 64 bits, of a near
+      duplicate whose ratings are reused (optional; nothing is reused by
+      default)
     
     Example output:
     {
@@ -132,83 +369,431 @@ async def rate_ad(image: UploadFile = File(...), personality_ids: str = Form(...
             ...
         ]
     }
+
+    In representative mode the output also has the "panel_id" and the
+    "extrapolated" results:
+    {
+        "medoids": 50,
+        "personalities": 4980,
+        "mean_effectiveness": 3.6,
+        "effectiveness": {"Not Relevant": 410, "Low Fit": 652, ...},
+        "emotion_groups": {"happy": 0.64, "fear": 0.08, ...},
+        "groups": [{"group": {"gender": "Female"}, "personalities": 2511, ...}]
+    }
+
+    When ratings were reused the output also lists the near duplicates
+    they were copied from:
+    "reused": [{"ad_id": "a1b2c3d4-...", "distance": 3, "ratings": 38}]
+
+    In sequential mode the output also has the "estimate":
+    {
+        "ratings": 64,
+        "population": 400,
+        "confidence": 0.95,
+        "precision": 0.098,
+        "converged": true,
+        "mean_effectiveness": {"value": 3.7, "ci": [3.5, 3.9]},
+        "effectiveness": {"Good Fit": {"share": 0.42, "ci": [0.33, 0.51]}, ...},
+        "emotion_groups": {"happy": {"share": 0.7, "ci": [0.61, 0.78]}, ...}
+    }
     """
-    # Validate personality_ids
-    try:
-        personality_id_list = [pid.strip() for pid in personality_ids.split(',')]
-        if not personality_id_list:
-            raise ValueError("No personality IDs provided")
-        
-        # Verify all personalities exist
-        for pid in personality_id_list:
-            personality = personality_store.get(pid)
-            if not personality:
-                raise HTTPException(status_code=404, detail=f"Personality with ID {pid} not found")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid personality_ids format: {str(e)}")
+    if mode not in ("full", "representative", "sequential"):
+        raise HTTPException(status_code=400, detail="mode must be full, representative or sequential")
+    fields = [f.strip() for f in (group_by or "").split(",") if f.strip()]
+    strata_fields = [f.strip() for f in strata.split(",") if f.strip()]
+    unknown = [f for f in fields + strata_fields if f not in GROUP_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by or strata fields: {', '.join(unknown)}")
+    if not 0 < tolerance < 1 or not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="tolerance and confidence must be between 0 and 1")
+    if reuse_distance is not None and not 0 <= reuse_distance <= 64:
+        raise HTTPException(status_code=400, detail="reuse_distance must be between 0 and 64")
+
+    panel = None
+    if mode == "representative" and panel_id:
+        panel = panel_store.get(panel_id)
+        if not panel:
+            raise HTTPException(status_code=404, detail="Panel not found")
+        personalities = personality_store.get_many(list(panel.members))
+    else:
+        # Resolve and validate the personalities in a single query
+        personalities = select_personalities(
+            personality_ids,
+            category,
+            min_age=min_age,
+            max_age=max_age,
+            gender=gender,
+            location=location,
+            industry=industry,
+            min_income=min_income,
+            max_income=max_income,
+        )
+        if mode == "representative":
+            try:
+                panel = build_panel(list(personalities.values()), clusters)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if not panel_store.create(panel):
+                raise HTTPException(status_code=400, detail="Panel creation failed")
+
+    # In representative mode only the medoids are rated
+    raters = personalities
+    if panel is not None:
+        raters = {
+            pid: personalities[pid] for pid in panel.medoids if pid in personalities
+        }
+    # In sequential mode they are rated in stratified random order
+    elif mode == "sequential":
+        raters = {
+            p.id: p for p in stratified_order(list(personalities.values()), strata_fields)
+        }
     
     # Process and save the image
     if not image:
         raise HTTPException(status_code=400, detail="Image is required")
     
-    # Generate a unique filename with UUID
-    file_extension = os.path.splitext(image.filename)[1] if image.filename else ".jpg"
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = IMAGE_UPLOAD_DIR / unique_filename
-    
-    # Save the uploaded file
-    contents = await image.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
-    
-    # Store the relative path to be served via the /uploads endpoint
-    image_path = f"/uploads/images/{unique_filename}"
+    image_path, contents = await save_image(image)
+    phash = dhash(contents)
     
     # Create the ad object with just the image (no copy)
-    ad_data = {"image": image_path, "copy": None}
+    ad_data = {"image": image_path, "copy": None, "phash": phash}
     ad_obj = Ad.from_dict(ad_data)
     
     # Store in database
     ad_id = ad_store.create(ad_obj)
     if not ad_id:
         raise HTTPException(status_code=400, detail="Ad creation failed")
+    index_ad(ad_obj, contents, background_tasks)
+
+    # Ratings of near duplicates are copied instead of generated again
+    reused = []
+    if reuse_distance is not None and phash is not None:
+        reused = reuse_ratings(ad_id, phash, list(raters), reuse_distance)
+    rating_objects = [r.to_dict() for source in reused for r in source["ratings"]]
+    covered = {r["personality"] for r in rating_objects}
     
-    # Use RatingSwarm to generate ratings for all personalities
-    try:
-        # Create a list of arguments for each personality
-        swarm_args = [{
-            "personality": pid,
-            "ad": ad_id
-        } for pid in personality_id_list]
-        
-        # Run the rating swarm in parallel
-        ratings = RatingSwarm(swarm_args)
-        
-        # Save the ratings to the database
-        rating_ids = []
-        for rating in ratings:
-            rating_id = rating_store.create(rating)
-            if rating_id:
-                rating_ids.append(rating_id)
-        
-        # Retrieve the full rating objects to return
-        rating_objects = []
-        for rating_id in rating_ids:
-            rating = rating_store.get(rating_id)
-            if rating:
-                rating_objects.append(rating.to_dict())
-        
-        return {
-            "ad_id": ad_id,
-            "ratings": rating_objects
+    # Rate the ad for every other personality through the shared rating
+    # pool, handing the agents the already loaded personalities and ad
+    pairs = [(ad_id, pid) for pid in raters if pid not in covered]
+    errors = []
+    estimate = None
+    window = None
+    if mode == "sequential":
+        # Only a pool's worth of ratings is in flight, so stopping wastes
+        # at most that many calls
+        estimate = SequentialEstimate(len(personalities), confidence)
+        window = mass_rater.max_concurrency
+        for rating in rating_objects:
+            estimate.add(rating)
+        if estimate.converged(tolerance, min_ratings):
+            pairs = []
+    results = mass_rater.rate(pairs, personalities, {ad_id: ad_obj}, window=window)
+    for result in results:
+        if "error" in result:
+            errors.append(f"{result['personality']}: {result['error']}")
+        else:
+            rating_objects.append(result["rating"])
+            if estimate is not None:
+                estimate.add(result["rating"])
+                if estimate.converged(tolerance, min_ratings):
+                    results.close()
+                    break
+
+    response = {
+        "ad_id": ad_id,
+        "ratings": rating_objects
+    }
+    if reused:
+        response["reused"] = [
+            {**source, "ratings": len(source["ratings"])} for source in reused
+        ]
+    if panel is not None:
+        response["panel_id"] = panel.id
+        response["extrapolated"] = extrapolate(
+            panel,
+            {r["personality"]: Rating.from_dict(r) for r in rating_objects},
+            personalities,
+            group_by=fields,
+        )
+    if estimate is not None:
+        response["estimate"] = {
+            **estimate.to_dict(),
+            "converged": estimate.converged(tolerance, min_ratings),
         }
-    except Exception as e:
+    if errors:
         # If rating fails, still return the ad_id but with an error message
-        return {
-            "ad_id": ad_id,
-            "error": f"Rating generation failed: {str(e)}",
-            "ratings": []
+        response["error"] = f"Rating generation failed: {'; '.join(errors)}"
+    # Embedded for /ads/{ad_id}/themes once the response is sent
+    background_tasks.add_task(rating_store.embed_pending, ad_id)
+    return response
+
+@app.get("/rate/stats", response_model=Dict[str, Any])
+def get_rate_stats():
+    """
+    Get how rating outputs have parsed since startup, per output mode.
+    Example output:
+    {
+        "json": {
+            "calls": 200,
+            "parsed": 198,
+            "fallback": 2,
+            "failed": 0,
+            "failure_rate": 0.01
+        }
+    }
+    """
+    return RateAgent.parse_stats.report()
+
+@app.get("/rate/surrogate", response_model=Dict[str, Any])
+def get_surrogate():
+    """
+    Describe the loaded surrogate model and how it did on the ratings held
+    out when it was trained.
+    Example output:
+    {
+        "version": "surrogate-20250101000000",
+        "trained_at": "2025-01-01T00:00:00+00:00",
+        "rater_version": "gemini:gemini-2.5-flash-preview-04-17/json",
+        "metrics": {"ratings": 2000, "accuracy": 0.71, "triage": [...], ...}
+    }
+    """
+    if surrogate is None:
+        raise HTTPException(status_code=404, detail="No surrogate model has been trained")
+    return {
+        "version": surrogate.version,
+        "trained_at": surrogate.trained_at,
+        "rater_version": surrogate.rater_version,
+        "metrics": surrogate.metrics,
+    }
+
+@app.post("/rate/surrogate/reload", response_model=Dict[str, Any])
+def reload_surrogate():
+    """
+    Load the surrogate model most recently trained offline.
+    Example output: {"version": "surrogate-20250101000000"}
+    """
+    global surrogate
+    loaded = Surrogate.load(MODEL_PATH)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="No surrogate model has been trained")
+    surrogate = loaded
+    return {"version": surrogate.version}
+
+@app.post("/rate/matrix")
+async def rate_matrix(
+    background_tasks: BackgroundTasks,
+    images: Optional[List[UploadFile]] = File(None),
+    ad_ids: Optional[str] = Form(None),
+    personality_ids: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    min_age: Optional[int] = Form(None),
+    max_age: Optional[int] = Form(None),
+    gender: Optional[str] = Form(None),
+    location: Optional[str] = Form(None),
+    industry: Optional[str] = Form(None),
+    min_income: Optional[float] = Form(None),
+    max_income: Optional[float] = Form(None),
+    use_surrogate: bool = Form(False),
+    threshold: float = Form(0.8),
+):
+    """
+    Rate every ad in a set against every personality in a set. Ads are given
+    as existing ad IDs and/or uploaded images; personalities are selected
+    the same way as for /rate. Pairs that already have a rating are
+    skipped, and the rest run through the shared rating pool. Progress is
+    streamed back as newline delimited JSON events.
+
+    With use_surrogate, the trained surrogate model predicts every pair
+    first; pairs it is at least threshold confident about get its
+    prediction, flagged with "surrogate": true and not saved as ratings,
+    and only the rest are rated.
+
+    Example input (multipart form):
+    - images: file uploads (optional)
+    - ad_ids: comma-separated list of ad IDs (optional)
+    - personality_ids: comma-separated list of personality IDs (optional)
+    - category: category name (optional)
+    - min_age, max_age, gender, location, industry, min_income, max_income:
+      attribute filters (optional)
+    - use_surrogate: predict confident pairs instead of rating them
+      (optional, default false)
+    - threshold: confidence a surrogate prediction needs (default 0.8)
+
+    Example output (one JSON object per line):
+    {"event": "plan", "ads": ["b8f7c2e4-..."], "personalities": 40, "pairs": 38, "skipped": 2, "predicted": 0}
+    {"event": "prediction", "ad": "b8f7c2e4-...", "personality": "c1d2e3f4-...", "surrogate": true, "model_version": "surrogate-20250101000000", "effectiveness": "Good Fit", "confidence": 0.91, ...}
+    {"event": "rating", "completed": 1, "total": 38, "ad": "b8f7c2e4-...", "personality": "d8e7c2e4-...", "rating": {...}}
+    {"event": "error", "completed": 2, "total": 38, "ad": "b8f7c2e4-...", "personality": "a1b2c3d4-...", "error": "..."}
+    {"event": "done", "completed": 38, "total": 38, "rated": 37, "failed": 1}
+    """
+    personalities = select_personalities(
+        personality_ids,
+        category,
+        min_age=min_age,
+        max_age=max_age,
+        gender=gender,
+        location=location,
+        industry=industry,
+        min_income=min_income,
+        max_income=max_income,
+    )
+
+    ad_id_list = [aid.strip() for aid in (ad_ids or "").split(",") if aid.strip()]
+    if ad_id_list:
+        found = ad_store.get_many(ad_id_list)
+        missing = [aid for aid in ad_id_list if aid not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Ads not found: {', '.join(missing)}")
+
+    for image in images or []:
+        image_path, contents = await save_image(image)
+        ad_obj = Ad(image=image_path, phash=dhash(contents))
+        ad_id = ad_store.create(ad_obj)
+        if not ad_id:
+            raise HTTPException(status_code=400, detail="Ad creation failed")
+        index_ad(ad_obj, contents, background_tasks)
+        ad_id_list.append(ad_id)
+
+    if not ad_id_list:
+        raise HTTPException(status_code=400, detail="At least one ad ID or image must be provided")
+
+    pairs, skipped = mass_rater.plan(ad_id_list, list(personalities))
+
+    predictions = []
+    if use_surrogate:
+        if surrogate is None:
+            raise HTTPException(status_code=400, detail="No surrogate model has been trained")
+        ads = ad_store.get_many(ad_id_list)
+        counts = count_summaries(rating_store.get_summaries(list(ads)))
+        predictions, pairs = surrogate.triage(pairs, personalities, ads, counts, threshold)
+
+    def events():
+        yield json.dumps({
+            "event": "plan",
+            "ads": list(dict.fromkeys(ad_id_list)),
+            "personalities": len(personalities),
+            "pairs": len(pairs),
+            "skipped": skipped,
+            "predicted": len(predictions),
+        }) + "\n"
+
+        for prediction in predictions:
+            yield json.dumps({"event": "prediction", **prediction}) + "\n"
+
+        completed = 0
+        failed = 0
+        for result in mass_rater.rate(pairs, personalities):
+            completed += 1
+            if "error" in result:
+                failed += 1
+            event = {
+                "event": "error" if "error" in result else "rating",
+                "completed": completed,
+                "total": len(pairs),
+                **result,
+            }
+            yield json.dumps(event, default=str) + "\n"
+
+        yield json.dumps({
+            "event": "done",
+            "completed": completed,
+            "total": len(pairs),
+            "rated": completed - failed,
+            "failed": failed,
+            "predicted": len(predictions),
+        }) + "\n"
+
+    # Background tasks run once the stream ends
+    background_tasks.add_task(rating_store.embed_pending)
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/ads/leaderboard", response_model=List[Dict[str, Any]])
+def get_ad_leaderboard(
+    category: Optional[str] = None,
+    segment: Optional[str] = None,
+    min_ratings: int = 1,
+    limit: int = 50,
+):
+    """
+    Rank ads by mean effectiveness, from 1 (Not Relevant) to 5 (Strong
+    Match), optionally over only the ratings of a category's personalities
+    and/or a segment, e.g. segment=age:25-34,industry:Technology.
+    Example output:
+    [
+        {
+            "ad": "b8f7c2e4-2b8f-4f9c-8a7e-123456789abc",
+            "image": "/uploads/images/ad.png",
+            "copy": "Buy now!",
+            "ratings": 12,
+            "mean_effectiveness": 4.25,
+            "levels": {
+                "Not Relevant": 0,
+                "Low Fit": 1,
+                "Neutral/Okay": 1,
+                "Good Fit": 4,
+                "Strong Match": 6
+            }
+        }
+    ]
+    """
+    try:
+        return rating_store.leaderboard(
+            category=category,
+            segment=segment,
+            min_ratings=min_ratings,
+            limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/ads/compare", response_model=Dict[str, Any])
+def compare_ads(
+    a: str,
+    b: str,
+    segment: Optional[str] = None,
+    resamples: int = 10000,
+    confidence: float = 0.95,
+):
+    """
+    Compare ad b against ad a over the personalities that rated both,
+    optionally only within a segment. Deltas are b minus a, with bootstrap
+    confidence intervals.
+    Example output:
+    {
+        "a": "b8f7c2e4-2b8f-4f9c-8a7e-123456789abc",
+        "b": "c1d2e3f4-2b8f-4f9c-8a7e-123456789abc",
+        "segment": null,
+        "pairs": 48,
+        "resamples": 10000,
+        "confidence": 0.95,
+        "effectiveness": {
+            "pairs": 48,
+            "mean_a": 3.1,
+            "mean_b": 3.8,
+            "delta": 0.7,
+            "ci": [0.35, 1.04]
+        },
+        "emotion_groups": {
+            "happy": {"share_a": 0.5, "share_b": 0.7, "delta": 0.2, "ci": [0.04, 0.35]},
+            ...
         }
+    }
+    """
+    if not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="Confidence must be between 0 and 1")
+    if not 0 < resamples <= 100000:
+        raise HTTPException(status_code=400, detail="Resamples must be between 1 and 100000")
+
+    missing = {a, b} - set(ad_store.get_many([a, b]))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Ads not found: {', '.join(sorted(missing))}")
+
+    try:
+        return ad_comparer.compare(
+            a, b, segment=segment, resamples=resamples, confidence=confidence
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/ads/{ad_id}")
 def get_ad(ad_id: str):
@@ -226,6 +811,137 @@ def get_ad(ad_id: str):
         raise HTTPException(status_code=404, detail="Ad not found")
     return ad.to_dict()
 
+@app.get("/ads/{ad_id}/summary", response_model=Dict[str, Any])
+def get_ad_summary(ad_id: str):
+    """
+    Get the summary of an ad's ratings.
+    Example output:
+    {
+        "ad": "b8f7c2e4-2b8f-4f9c-8a7e-123456789abc",
+        "ratings": 12,
+        "mean_effectiveness": 4.25,
+        "effectiveness": {
+            "Not Relevant": 0,
+            "Low Fit": 1,
+            "Neutral/Okay": 1,
+            "Good Fit": 4,
+            "Strong Match": 6
+        },
+        "emotion_groups": {"happy": 10, "fear": 0, "anger": 2, ...},
+        "last_updated": "2025-05-01T12:00:00+00:00"
+    }
+    """
+    if not ad_store.get(ad_id):
+        raise HTTPException(status_code=404, detail="Ad not found")
+    return rating_store.get_summary(ad_id)
+
+@app.get("/ads/{ad_id}/themes", response_model=Dict[str, Any])
+def get_ad_themes(ad_id: str, clusters: Optional[int] = None, examples: int = 3):
+    """
+    Summarize why personalities reacted to an ad as they did: its ratings
+    are clustered by the meaning of their thoughts and emotional responses,
+    and each theme is described by its size, mean effectiveness, common
+    emotions and most typical ratings. The number of themes is chosen
+    automatically unless clusters is given.
+    Example output:
+    {
+        "ad": "b8f7c2e4-2b8f-4f9c-8a7e-123456789abc",
+        "ratings": 500,
+        "themes": [
+            {
+                "size": 212,
+                "share": 0.424,
+                "mean_effectiveness": 4.1,
+                "emotions": [{"emotion": "Happy", "count": 150}, ...],
+                "exemplar": {"id": "c9e8d7f6-...", "personality": "...", "thought": "...", ...},
+                "examples": [{"id": "c9e8d7f6-...", ...}, ...]
+            }
+        ]
+    }
+    """
+    if not ad_store.get(ad_id):
+        raise HTTPException(status_code=404, detail="Ad not found")
+    if clusters is not None and not 1 <= clusters <= 50:
+        raise HTTPException(status_code=400, detail="clusters must be between 1 and 50")
+    if not 1 <= examples <= 20:
+        raise HTTPException(status_code=400, detail="examples must be between 1 and 20")
+
+    return rating_themes.summarize(ad_id, clusters=clusters, examples=examples)
+
+@app.get("/ads/{ad_id}/similar", response_model=List[Dict[str, Any]])
+def get_similar_ads(
+    ad_id: str,
+    max_distance: int = NEAR_DUPLICATE_DISTANCE,
+    limit: int = 20,
+):
+    """
+    Find the ads whose image is a near duplicate of an ad's, by the Hamming
+    distance between their perceptual hashes (0 to 64 bits, 0 being
+    visually identical).
+    Example output:
+    [
+        {
+            "ad": {"id": "a1b2c3d4-...", "image": "/uploads/images/...", ...},
+            "distance": 3
+        }
+    ]
+    """
+    ad = ad_store.get(ad_id)
+    if not ad:
+        raise HTTPException(status_code=404, detail="Ad not found")
+    if ad.phash is None:
+        raise HTTPException(status_code=400, detail="Ad has no image hash")
+    if not 0 <= max_distance <= 64:
+        raise HTTPException(status_code=400, detail="max_distance must be between 0 and 64")
+
+    matches = similar_ads.similar(ad.phash, max_distance, exclude=ad_id, limit=limit)
+    ads = ad_store.get_many([match_id for match_id, _ in matches])
+    return [
+        {"ad": ads[match_id].to_dict(), "distance": distance}
+        for match_id, distance in matches
+        if match_id in ads
+    ]
+
+@app.get("/ads/{ad_id}/related", response_model=List[Dict[str, Any]])
+def get_related_ads(
+    ad_id: str,
+    k: int = 10,
+    has_image: Optional[bool] = None,
+    has_copy: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+):
+    """
+    Find the ads most similar to an ad in meaning, by the cosine similarity
+    of their embeddings; unlike /ads/{ad_id}/similar these needn't look
+    alike. Results can be limited to ads with or without an image or copy,
+    or created after a time.
+    Example output:
+    [
+        {
+            "ad": {"id": "a1b2c3d4-...", "image": "/uploads/images/...", ...},
+            "similarity": 0.87
+        }
+    ]
+    """
+    if not ad_store.get(ad_id):
+        raise HTTPException(status_code=404, detail="Ad not found")
+    if not 1 <= k <= 1000:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 1000")
+
+    filters = {
+        key: value
+        for key, value in (
+            ("has_image", has_image),
+            ("has_copy", has_copy),
+            ("created_after", created_after),
+        )
+        if value is not None
+    }
+    return [
+        {"ad": ad.to_dict(), "similarity": similarity}
+        for ad, similarity in ad_store.find_similar(ad_id, k, filters)
+    ]
+
 @app.put("/ads/{ad_id}")
 def update_ad(ad_id: str, ad: Dict[str, Any]):
     """
@@ -239,10 +955,15 @@ def update_ad(ad_id: str, ad: Dict[str, Any]):
     {"success": true}
     """
     ad["id"] = ad_id
+    # The image hash is kept unless the image changes
+    existing = ad_store.get(ad_id)
+    if existing and ad.get("image") == existing.image:
+        ad.setdefault("phash", existing.phash)
     ad_obj = Ad.from_dict(ad)
     success = ad_store.update(ad_obj)
     if not success:
         raise HTTPException(status_code=400, detail="Update failed")
+    similar_ads.update(ad_id, ad_obj.phash)
     return {"success": True}
 
 @app.delete("/ads/{ad_id}")
@@ -257,6 +978,7 @@ def delete_ad(ad_id: str):
     success = ad_store.delete(ad_id)
     if not success:
         raise HTTPException(status_code=404, detail="Delete failed")
+    similar_ads.discard(ad_id)
     return {"success": True}
 
 @app.get("/ads", response_model=List[Dict[str, Any]])
@@ -296,6 +1018,118 @@ def create_personality(personality: Dict[str, Any]):
         raise HTTPException(status_code=400, detail="Creation failed")
     return pid
 
+@app.post("/personalities/bulk", response_model=Dict[str, Any])
+def bulk_create_personalities(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+):
+    """
+    Create or update many personalities from an NDJSON or CSV upload.
+    Rows are validated in chunks and loaded with COPY; a row with an
+    existing id replaces that personality. Invalid rows are skipped and
+    reported. The loaded personalities are embedded for search once the
+    response has been sent.
+    Example input (multipart form):
+    - file: personalities.ndjson, one personality object per line
+    - format: "ndjson" or "csv" (optional, guessed from the file name)
+    Example output:
+    {
+        "received": 50000,
+        "inserted": 49990,
+        "updated": 8,
+        "duplicates": 0,
+        "error_count": 2,
+        "errors": [{"row": 17, "error": "Invalid age: not an integer"}]
+    }
+    """
+    format = format or detect_format(file.filename, file.content_type)
+    if format not in INGEST_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format {format}, must be one of {', '.join(INGEST_FORMATS)}",
+        )
+
+    text = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    if format == "csv":
+        records = read_csv(text)
+    else:
+        records = read_ndjson(text)
+
+    report = ingest_personalities(records, personality_store)
+    background_tasks.add_task(personality_store.embed_stale)
+    return report
+
+@app.get("/personalities/search", response_model=List[Dict[str, Any]])
+def search_personalities(q: str, k: int = 10):
+    """
+    Find the personalities whose profiles best match a free text
+    description, by the cosine similarity of their embeddings.
+    Example input (query): ?q=budget-conscious young parent&k=5
+    Example output:
+    [
+        {
+            "personality": {"id": "d8e7c2e4-...", "name": "Alice", "age": 29, ...},
+            "similarity": 0.82
+        }
+    ]
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    if not 1 <= k <= 1000:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 1000")
+    return [
+        {"personality": personality.to_dict(), "similarity": similarity}
+        for personality, similarity in personality_store.search(q, k)
+    ]
+
+@app.post("/personalities/query", response_model=Dict[str, Any])
+def query_personalities(query: Dict[str, Any], debug: bool = False):
+    """
+    Find personalities by their attributes. Numeric attributes (age,
+    children, income) take =, !=, <, <=, >, >=, between and in; text ones
+    =, != and in; list attributes (interests, values, ...) contains, which
+    needs every value listed, and overlaps, which needs any. Results can be
+    ordered and paged. With debug=true the planner's estimate of the query
+    is returned too, to check that it is index-backed.
+    Example input (JSON):
+    {
+        "where": [
+            {"field": "age", "op": "between", "value": [25, 34]},
+            {"field": "industry", "op": "in", "value": ["Technology", "Finance"]},
+            {"field": "interests", "op": "overlaps", "value": ["hiking", "cycling"]}
+        ],
+        "order_by": [{"field": "income", "descending": true}],
+        "limit": 50,
+        "offset": 0
+    }
+    Example output:
+    {
+        "personalities": [{"id": "d8e7c2e4-...", "name": "Alice", "age": 29, ...}],
+        "explain": {
+            "startup_cost": 12.5,
+            "total_cost": 845.2,
+            "rows": 312,
+            "indexes": ["idx_personality_interests", "idx_personality_age"],
+            "nodes": ["Limit", "Sort", "Bitmap Heap Scan", "BitmapAnd", ...],
+            "plan": {...}
+        }
+    }
+    """
+    try:
+        persona_query = PersonaQuery.from_dict(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response = {
+        "personalities": [
+            p.to_dict() for p in personality_store.query(persona_query)
+        ]
+    }
+    if debug:
+        response["explain"] = personality_store.explain(persona_query)
+    return response
+
 @app.get("/personalities/{personality_id}", response_model=Dict[str, Any])
 def get_personality(personality_id: str):
     """
@@ -540,6 +1374,65 @@ def create_rating(rating: Dict[str, Any]):
         raise HTTPException(status_code=404, detail="Not found")
     return obj.to_dict()
 
+@app.get("/ratings/search", response_model=List[Dict[str, Any]])
+def search_ratings(
+    q: str,
+    ad: Optional[str] = None,
+    personality: Optional[str] = None,
+    effectiveness: Optional[str] = None,
+    emotion: Optional[str] = None,
+    model_version: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: int = 50,
+    offset: int = 0,
+):
+    """
+    Search ratings by the words in their thoughts and emotional responses,
+    best match first. The query takes quoted phrases, "or" and a leading
+    "-" to exclude a word; words match in any form ("expensive" matches
+    "expense"). Results can be narrowed by ad, personality, effectiveness,
+    emotion, model version and creation time. Snippets are HTML escaped,
+    with the matches in <b> tags.
+    Example input (query): ?q="too expensive" -shipping&effectiveness=Low Fit
+    Example output:
+    [
+        {
+            "rating": {"id": "r1b2c3d4-...", "thought": "It looks too expensive for me", ...},
+            "rank": 0.1,
+            "snippets": {
+                "thought": "It looks <b>too</b> <b>expensive</b> for me",
+                "emotional_response": "Wary of the price"
+            }
+        }
+    ]
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must not be negative")
+
+    filters = {
+        key: value
+        for key, value in (
+            ("ad", ad),
+            ("personality", personality),
+            ("effectiveness", effectiveness),
+            ("emotion", emotion),
+            ("model_version", model_version),
+            ("created_after", created_after),
+            ("created_before", created_before),
+        )
+        if value is not None
+    }
+    try:
+        results = rating_store.search(q, filters, limit=limit, offset=offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [{**result, "rating": result["rating"].to_dict()} for result in results]
+
 @app.get("/ratings/{rating_id}", response_model=Dict[str, Any])
 def get_rating(rating_id: str):
     """
@@ -642,6 +1535,293 @@ def get_ratings_by_ad(ad_id: str):
     pass
 
 
+# --- Emotion Endpoints ---
+@app.get("/emotions", response_model=Dict[str, Any])
+def get_emotions():
+    """
+    Get the emotion taxonomy; the canonical emotions, with their ids,
+    under each group.
+    Example output:
+    {
+        "happy": [
+            {"id": 1, "name": "Happy"},
+            {"id": 2, "name": "Joyful"},
+            ...
+        ],
+        "fear": [...],
+        ...
+    }
+    """
+    return emotions.taxonomy()
+
+@app.get("/emotions/counts", response_model=Dict[str, Any])
+def get_emotion_counts(ad_id: Optional[str] = None):
+    """
+    Count the ratings reporting each emotion and emotion group, optionally
+    only for one ad.
+    Example output:
+    {
+        "ratings": 40,
+        "groups": {"happy": 31, "fear": 2, "anger": 6, ...},
+        "emotions": {"Interested": 22, "Hopeful": 14, ...}
+    }
+    """
+    return rating_store.get_emotion_counts(ad_id)
+
+@app.get("/emotions/{emotion}/ratings", response_model=List[Dict[str, Any]])
+def get_ratings_by_emotion(emotion: str):
+    """
+    Get all ratings reporting an emotion. Synonyms and near misspellings of
+    an emotion are accepted.
+    Example output:
+    [
+        {
+            "id": "r1b2c3d4-5678-90ab-cdef-1234567890ab",
+            "emotions": ["Interested", "Hopeful"],
+            ...
+        }
+    ]
+    """
+    try:
+        ratings = rating_store.get_ratings_by_emotion(emotion)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return [r.to_dict() for r in ratings]
+
+
+# --- Panel Endpoints ---
+@app.post("/panels", response_model=Dict[str, Any])
+def create_panel(request: Dict[str, Any]):
+    """
+    Build a panel by clustering a selection of personalities, picking the
+    medoid of each cluster to represent it. The selection takes the same
+    personality_ids, category and filters as /rate.
+    Example input:
+    {
+        "name": "US adults",
+        "clusters": 50,
+        "category": "US Adults",
+        "min_age": 18
+    }
+    Example output:
+    {
+        "id": "d1c2b3a4-...",
+        "name": "US adults",
+        "personalities": 4980,
+        "clusters": [{"cluster": 0, "medoid": "personality_id", "weight": 112}, ...]
+    }
+    """
+    filters = {
+        key: request.get(key)
+        for key in ["min_age", "max_age", "gender", "location", "industry", "min_income", "max_income"]
+    }
+    personalities = select_personalities(
+        ",".join(request.get("personality_ids") or []),
+        request.get("category"),
+        **filters,
+    )
+    try:
+        panel = build_panel(
+            list(personalities.values()),
+            int(request.get("clusters", 50)),
+            name=request.get("name"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not panel_store.create(panel):
+        raise HTTPException(status_code=400, detail="Panel creation failed")
+    return {
+        "id": panel.id,
+        "name": panel.name,
+        "personalities": len(panel.members),
+        "clusters": panel.clusters,
+    }
+
+@app.get("/panels/{panel_id}", response_model=Dict[str, Any])
+def get_panel(panel_id: str):
+    """
+    Get a panel with its clusters and the cluster of every member.
+    Example output:
+    {
+        "id": "d1c2b3a4-...",
+        "name": "US adults",
+        "clusters": [{"cluster": 0, "medoid": "personality_id", "weight": 112}, ...],
+        "members": {"personality_id": 0, ...},
+        "created_at": "2025-01-01T00:00:00Z"
+    }
+    """
+    panel = panel_store.get(panel_id)
+    if not panel:
+        raise HTTPException(status_code=404, detail="Panel not found")
+    return panel.to_dict()
+
+@app.delete("/panels/{panel_id}")
+def delete_panel(panel_id: str):
+    """
+    Delete a panel.
+    Example output: {"success": true}
+    """
+    success = panel_store.delete(panel_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Panel not found")
+    return {"success": True}
+
+@app.get("/panels", response_model=List[Dict[str, Any]])
+def list_panels():
+    """
+    List all panels, newest first, without their members.
+    Example output:
+    [
+        {"id": "d1c2b3a4-...", "name": "US adults", "personalities": 4980, "clusters": 50, "created_at": "..."}
+    ]
+    """
+    return panel_store.list_all()
+
+
+# --- Analytics Endpoints ---
+@app.get("/analytics/segments", response_model=Dict[str, Any])
+def get_segment_analytics(
+    segment: Optional[str] = None,
+    group_by: Optional[str] = None,
+    ad_id: Optional[str] = None,
+    category: Optional[str] = None,
+    top_emotions: int = 5,
+):
+    """
+    Compare how a segment of personalities reacted against everyone else,
+    optionally broken down by comma-separated personality attributes.
+    Numeric attributes (age, income, children) are grouped into bands.
+    Example: ?segment=age:25-34,lifestyle:urban professional&group_by=industry
+    Example output:
+    {
+        "segment": {
+            "ratings": 120,
+            "mean_effectiveness": 3.9,
+            "effectiveness": {"Not Relevant": 4, "Low Fit": 10, ...},
+            "emotion_groups": {"happy": 0.72, "fear": 0.05, ...},
+            "top_emotions": [{"emotion": "Interested", "share": 0.61}, ...]
+        },
+        "rest": {...},
+        "groups": [
+            {"group": {"industry": "Technology"}, "ratings": 48, ...},
+            ...
+        ]
+    }
+    """
+    fields = [f.strip() for f in (group_by or "").split(",") if f.strip()]
+    try:
+        return analytics.segments(
+            segment=segment,
+            group_by=fields,
+            ad_id=ad_id,
+            category=category,
+            top_emotions=top_emotions,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# --- Export Endpoints ---
+@app.get("/exports/ratings")
+def export_ratings(
+    format: str = "ndjson",
+    ad_id: Optional[str] = None,
+    personality_id: Optional[str] = None,
+    effectiveness: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+):
+    """
+    Stream every rating matching the filters, joined with its personality
+    and ad, as ndjson, csv or parquet.
+    Example request:
+    GET /exports/ratings?format=csv&ad_id=b8f7c2e4-...&created_after=2025-04-01
+    Example output (ndjson, one object per line):
+    {"id": "r1b2c3d4-...", "personality": "d8e7c2e4-...", "ad": "b8f7c2e4-...",
+     "effectiveness": "Good Fit", "personality_name": "Alice", "personality_age": 30,
+     "ad_image": "/uploads/images/...", ...}
+    """
+    if format not in ENCODERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format {format}, must be one of {', '.join(ENCODERS)}",
+        )
+
+    rows = rating_store.export(
+        ad_id=ad_id,
+        personality_id=personality_id,
+        effectiveness=effectiveness,
+        created_after=created_after,
+        created_before=created_before,
+    )
+    body = ENCODERS[format](rows, rating_store.EXPORT_COLUMNS)
+
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename=ratings.{format}"
+        },
+    )
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics: HTTP request latency per route, database pool
+    checkouts and connections in use, LLM call latency, tokens and
+    errors per model, rating swarm width and per-personality latency, and
+    cache lookups by result. Summed across workers when
+    PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/admin/queries")
+def get_query_stats(sort: str = "total", limit: int = 50):
+    """
+    Timings of the statements run since startup or the last reset, per
+    statement fingerprint, worst first, with the store methods that ran
+    them and the plan of a recent slow run if explaining is enabled.
+    Example request:
+    GET /admin/queries?sort=p95&limit=10
+    Example output:
+    {
+        "since": "2025-04-01T12:00:00+00:00",
+        "slow_threshold_ms": 500.0,
+        "dropped": 0,
+        "queries": [
+            {
+                "id": "3f9a1c2b4d5e6f70",
+                "fingerprint": "SELECT r.id, ... FROM rating r WHERE r.ad_id = ?",
+                "count": 1200, "errors": 0, "slow": 3, "rows": 48000,
+                "total_ms": 5400.2, "mean_ms": 4.5, "max_ms": 812.3,
+                "p50_ms": 5.0, "p95_ms": 10.0, "p99_ms": 50.0,
+                "histogram": [{"le_ms": 1.0, "count": 10}, ...],
+                "callers": {"RatingStore.get_ratings_by_ad": 1200},
+                "explain": {"at": "...", "plan": "Index Scan using ..."}
+            }
+        ]
+    }
+    """
+    if sort not in QUERY_SORTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort {sort}, must be one of {', '.join(QUERY_SORTS)}",
+        )
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    return query_log.snapshot(sort, limit)
+
+
+@app.delete("/admin/queries")
+def reset_query_stats():
+    """Forget the statement timings recorded so far."""
+    query_log.reset()
+    return {"success": True}
+
+
 @app.get("/")
 def root():
     return {"status": "ok"}
@@ -1,7 +1,9 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
 
 from app.backend.models.ad import Ad
-from app.backend.store.db import Pool
+from app.backend.store.db import Pool, to_vector
 
 
 class AdStore:
@@ -18,6 +20,7 @@ class AdStore:
         """
         self.db_pool = db_pool
         self.table_name = "ad"
+        self.embedding_table = "ad_embedding"
 
     def create(self, ad: Ad) -> Optional[str]:
         """
@@ -31,7 +34,9 @@ class AdStore:
         """
         with self.db_pool.get_transaction() as transaction:
             data = ad.to_dict()
-            return transaction.insert(self.table_name, data)
+            if transaction.insert(self.table_name, data):
+                return data["id"]
+            return None
 
     def get(self, ad_id: str) -> Optional[Ad]:
         """
@@ -43,12 +48,155 @@ class AdStore:
         Returns:
             Ad object if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             result = transaction.get_by_id(self.table_name, ad_id)
             if result:
                 return Ad.from_dict(result)
             return None
 
+    def get_many(self, ad_ids: List[str]) -> Dict[str, Ad]:
+        """
+        Get several ads by ID in a single query.
+
+        Args:
+            ad_ids: IDs of the ads to retrieve
+
+        Returns:
+            Dictionary of Ad objects keyed by ID; missing ads are absent
+        """
+        if not ad_ids:
+            return {}
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                f"SELECT * FROM {self.table_name} WHERE id = ANY(%s::uuid[])",
+                (list(ad_ids),),
+            )
+            return {
+                str(result["id"]): Ad.from_dict(result) for result in results
+            }
+
+    def get_hashes(self) -> Dict[str, int]:
+        """
+        Get the perceptual hash of every ad that has one.
+
+        Returns:
+            Dictionary of hashes keyed by ad ID
+        """
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                f"SELECT id, phash FROM {self.table_name} WHERE phash IS NOT NULL"
+            )
+            return {str(result["id"]): result["phash"] for result in results}
+
+    def set_embedding(self, ad_id: str, embedding: np.ndarray, model: str) -> bool:
+        """
+        Store or replace the embedding of an ad.
+
+        Args:
+            ad_id: ID of the ad embedded
+            embedding: Unit length embedding of the ad
+            model: Name of the embedder that produced it
+
+        Returns:
+            True if successful, False otherwise
+        """
+        with self.db_pool.get_transaction() as transaction:
+            return transaction.execute(
+                f"""
+                INSERT INTO {self.embedding_table} (ad_id, model, embedding)
+                VALUES (%s, %s, %s::vector)
+                ON CONFLICT (ad_id) DO UPDATE
+                SET model = EXCLUDED.model, embedding = EXCLUDED.embedding
+                """,
+                (ad_id, model, to_vector(embedding)),
+            )
+
+    def get_unembedded(self, limit: Optional[int] = None) -> List[Ad]:
+        """
+        List the ads that have no embedding yet, oldest first.
+
+        Args:
+            limit: Maximum number of ads
+
+        Returns:
+            List of Ad objects
+        """
+        with self.db_pool.get_transaction() as transaction:
+            results = transaction.query(
+                f"""
+                SELECT a.* FROM {self.table_name} a
+                LEFT JOIN {self.embedding_table} e ON e.ad_id = a.id
+                WHERE e.ad_id IS NULL
+                ORDER BY a.created_at
+                LIMIT %s
+                """,
+                (limit,),
+            )
+            return [Ad.from_dict(result) for result in results]
+
+    def find_similar(
+        self,
+        ad_id: str,
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[Ad, float]]:
+        """
+        Find the ads whose embeddings are nearest an ad's, through the HNSW
+        index.
+
+        Args:
+            ad_id: ID of the ad to find similar ads to
+            k: Maximum number of ads to return
+            filters: Optional conditions on the ads returned: ad columns to
+                match exactly, "has_image" and "has_copy" to require (or
+                exclude) an image or copy, and "created_after" for a
+                minimum created_at
+
+        Returns:
+            List of (Ad, cosine similarity) pairs, most similar first; empty
+            if the ad has no embedding
+        """
+        conditions = ["e.ad_id <> %s"]
+        params: List[Any] = [ad_id]
+        for key, value in (filters or {}).items():
+            if key in ("has_image", "has_copy"):
+                column = "image" if key == "has_image" else "copy"
+                conditions.append(f"a.{column} IS {'NOT ' if value else ''}NULL")
+            elif key == "created_after":
+                conditions.append("a.created_at >= %s")
+                params.append(value)
+            elif key in ("id", "image", "copy", "phash"):
+                conditions.append(f"a.{key} = %s")
+                params.append(value)
+            else:
+                raise ValueError(f"Unknown ad filter {key}")
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            source = transaction.query(
+                f"SELECT embedding::text AS embedding FROM {self.embedding_table} "
+                "WHERE ad_id = %s",
+                (ad_id,),
+            )
+            if not source:
+                return []
+
+            results = transaction.vector_search(
+                f"{self.embedding_table} e JOIN {self.table_name} a ON a.id = e.ad_id",
+                "e.embedding",
+                source[0]["embedding"],
+                limit=k,
+                distance_type="cosine",
+                where_clause=" AND ".join(conditions),
+                where_params=tuple(params),
+                columns="a.*",
+            )
+        similar = []
+        for row in results:
+            distance = row.pop("distance")
+            similar.append((Ad.from_dict(row), 1 - distance))
+        return similar
+
     def update(self, ad: Ad) -> bool:
         """
         Update an existing ad record.
@@ -95,7 +243,7 @@ class AdStore:
         Returns:
             List of Ad objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             results = transaction.query(f"SELECT * FROM {self.table_name}")
             return [Ad.from_dict(result) for result in results]
 
@@ -121,7 +269,7 @@ class AdStore:
                 
         where_clause = " AND ".join(conditions)
         
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"SELECT * FROM {self.table_name} WHERE {where_clause}"
             results = transaction.query(query, tuple(params))
             return [Ad.from_dict(result) for result in results]
@@ -0,0 +1,282 @@
+import argparse
+import os
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from app.backend.store.db import Pool
+from app.backend.store.partition_store import PartitionStore, add_months
+
+
+ARCHIVE_PATH = os.environ.get("RATING_ARCHIVE_PATH", "archive/rating")
+
+# Columns of an archived rating, as named by the rating queries of
+# RatingStore
+ARCHIVE_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("personality", pa.string()),
+    ("ad", pa.string()),
+    ("thought", pa.string()),
+    ("emotional_response", pa.string()),
+    ("emotion_ids", pa.list_(pa.int16())),
+    ("emotion_groups", pa.int32()),
+    ("effectiveness", pa.string()),
+    ("model_version", pa.string()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("updated_at", pa.timestamp("us", tz="UTC")),
+])
+_TIMESTAMP = ARCHIVE_SCHEMA.field("created_at").type
+
+# Archived months are directories named month=YYYY-MM, so reads open only
+# the files of the months a time range touches
+_MONTH = re.compile(r"^month=(\d{4})-(\d{2})$")
+
+
+class ArchiveStore:
+    """
+    Cold storage of old ratings as Parquet files on local disk, one file
+    per month under month=YYYY-MM directories. Archiving moves whole
+    monthly partitions of the rating table out of Postgres; reads scan
+    only the months a time range touches. Each file is sorted by ad,
+    personality and creation time, so reads of an ad or a personality
+    skip the row groups that can't hold its ratings.
+    """
+
+    def __init__(self, db_pool: Pool, path: Union[str, Path] = ARCHIVE_PATH):
+        """
+        Initialize the ArchiveStore.
+
+        Args:
+            db_pool: Database connection pool
+            path: Directory the archive is kept in
+        """
+        self.db_pool = db_pool
+        self.path = Path(path)
+        self.partitions = PartitionStore(db_pool)
+        # The archive directory's modification time and the files of each
+        # month it held then; see __files()
+        self.__listing: Optional[Tuple[Optional[int], Dict[date, List[str]]]] = None
+
+    def __files(self) -> Dict[date, List[str]]:
+        """
+        The Parquet files of each archived month. The directory is listed
+        again only once a month directory is added to it, as by an archive
+        run in another process, not on every read.
+        """
+        try:
+            modified = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if self.__listing is not None and self.__listing[0] == modified:
+            return self.__listing[1]
+
+        files = {}
+        for entry in self.path.iterdir():
+            match = _MONTH.match(entry.name)
+            if not match or not entry.is_dir():
+                continue
+            paths = sorted(str(path) for path in entry.glob("*.parquet"))
+            if paths:
+                files[date(int(match[1]), int(match[2]), 1)] = paths
+            else:
+                # A month still being archived; listed again next time
+                modified = None
+        self.__listing = (modified, files)
+        return files
+
+    def months(self) -> List[date]:
+        """List the archived months, oldest first."""
+        return sorted(self.__files())
+
+    def spans(
+        self,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> bool:
+        """
+        Whether a time range reaches into an archived month, and so
+        whether a query over it has to read the archive.
+        """
+        for month in self.months():
+            start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+            end_month = add_months(month, 1)
+            end = datetime(end_month.year, end_month.month, 1, tzinfo=timezone.utc)
+            if (created_after is None or created_after < end) and (
+                created_before is None or created_before > start
+            ):
+                return True
+        return False
+
+    def archive(self, cutoff: date, chunk_size: int = 10000) -> List[Dict[str, Any]]:
+        """
+        Archive the ratings of the months that end on or before a date.
+        Their partitions are detached (see PartitionStore.detach_before()),
+        streamed into Parquet chunk_size rows at a time, so memory stays
+        bounded however large a month is, and dropped once the file is
+        complete. Partitions detached earlier are archived as well. The
+        pairs they rated stay claimed, so they are not rated again.
+
+        Args:
+            cutoff: Date before which whole months are archived
+            chunk_size: Number of rows fetched and written at a time, and
+                per row group of the files
+
+        Returns:
+            List of dictionaries with the "partition" archived, the "path"
+            of its file and the number of "rows" in it
+        """
+        self.partitions.detach_before(cutoff)
+
+        archived = []
+        for name in self.partitions.list_detached():
+            month = datetime.strptime(name, "rating_%Y%m").date()
+            directory = self.path / f"month={month:%Y-%m}"
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"{name}.parquet"
+            # Written aside and renamed, so a failed run never leaves a
+            # partial file to be read
+            partial = directory / f".{name}.parquet.partial"
+
+            rows = 0
+            writer = pq.ParquetWriter(partial, ARCHIVE_SCHEMA)
+            try:
+                with self.db_pool.get_transaction() as transaction:
+                    batch = []
+                    for row in transaction.stream(
+                        f"""
+                        SELECT
+                            id::text AS id,
+                            personality_id::text AS personality,
+                            ad_id::text AS ad,
+                            thought,
+                            emotional_response,
+                            emotion_ids,
+                            emotion_groups,
+                            effectiveness,
+                            model_version,
+                            created_at,
+                            updated_at
+                        FROM {name}
+                        ORDER BY ad_id, personality_id, created_at
+                        """,
+                        chunk_size=chunk_size,
+                    ):
+                        batch.append(row)
+                        if len(batch) >= chunk_size:
+                            writer.write_table(
+                                pa.Table.from_pylist(batch, schema=ARCHIVE_SCHEMA)
+                            )
+                            rows += len(batch)
+                            batch = []
+                    if batch:
+                        writer.write_table(
+                            pa.Table.from_pylist(batch, schema=ARCHIVE_SCHEMA)
+                        )
+                        rows += len(batch)
+            finally:
+                writer.close()
+            partial.replace(path)
+            # The months are listed again on the next read
+            self.__listing = None
+
+            with self.db_pool.get_transaction() as transaction:
+                transaction.execute(f"DROP TABLE {name}")
+            archived.append({"partition": name, "path": str(path), "rows": rows})
+        return archived
+
+    def read(
+        self,
+        ad_id: Optional[str] = None,
+        personality_id: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Read archived ratings, scanning only the months of the time range.
+
+        Args:
+            ad_id: Only ratings of this ad
+            personality_id: Only ratings by this personality
+            created_after: Only ratings created at or after this time
+            created_before: Only ratings created before this time
+
+        Returns:
+            List of dictionaries with the columns of ARCHIVE_SCHEMA
+        """
+        first = last = None
+        conditions = []
+        if ad_id is not None:
+            conditions.append(ds.field("ad") == str(ad_id))
+        if personality_id is not None:
+            conditions.append(ds.field("personality") == str(personality_id))
+        if created_after is not None:
+            after = created_after.astimezone(timezone.utc)
+            first = date(after.year, after.month, 1)
+            conditions.append(ds.field("created_at") >= pa.scalar(after, _TIMESTAMP))
+        if created_before is not None:
+            before = created_before.astimezone(timezone.utc)
+            last = date(before.year, before.month, 1)
+            conditions.append(ds.field("created_at") < pa.scalar(before, _TIMESTAMP))
+
+        files = [
+            path
+            for month, paths in sorted(self.__files().items())
+            if (first is None or month >= first) and (last is None or month <= last)
+            for path in paths
+        ]
+        if not files:
+            return []
+
+        condition = None
+        for part in conditions:
+            condition = part if condition is None else condition & part
+
+        dataset = ds.dataset(files, schema=ARCHIVE_SCHEMA, format="parquet")
+        table = dataset.to_table(columns=ARCHIVE_SCHEMA.names, filter=condition)
+        return table.to_pylist()
+
+
+def main():
+    """
+    Archive the ratings of months older than some whole months to Parquet,
+    against the database configured by the same POSTGRES_* variables as
+    the server, into RATING_ARCHIVE_PATH. Meant to run regularly, e.g.
+    monthly from cron.
+
+        python -m app.backend.store.archive_store archive --retain-months N [--chunk-size N]
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["archive"])
+    parser.add_argument(
+        "--retain-months",
+        type=int,
+        required=True,
+        help="Whole months before the current one to keep in Postgres",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=10000, help="Rows written at a time"
+    )
+    args = parser.parse_args()
+
+    store = ArchiveStore(
+        Pool(
+            host=os.environ.get("POSTGRES_HOST", "localhost"),
+            port=int(os.environ.get("POSTGRES_PORT", "5432")),
+            dbname=os.environ.get("POSTGRES_DB", "app"),
+            user=os.environ.get("POSTGRES_USER", "postgres"),
+            password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
+        )
+    )
+
+    cutoff = add_months(datetime.now(timezone.utc).date(), -args.retain_months)
+    for result in store.archive(cutoff, args.chunk_size):
+        print(f"Archived {result['rows']} ratings of {result['partition']} to {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,9 @@ class CategoryStore:
                 "name": name,
                 "description": description
             }
-            return transaction.insert(self.category_table, data)
+            if transaction.insert(self.category_table, data):
+                return data["id"]
+            return None
 
     def get_category(self, category_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -51,7 +53,7 @@ class CategoryStore:
         Returns:
             Category data if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             return transaction.get_by_id(self.category_table, category_id)
 
     def get_category_by_name(self, name: str) -> Optional[Dict[str, Any]]:
@@ -64,7 +66,7 @@ class CategoryStore:
         Returns:
             Category data if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             results = transaction.query(
                 f"SELECT * FROM {self.category_table} WHERE name = %s", 
                 (name,)
@@ -122,7 +124,7 @@ class CategoryStore:
         Returns:
             List of category data dictionaries
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             return transaction.query(f"SELECT * FROM {self.category_table}")
 
     # CategoryAssignment CRUD operations
@@ -153,7 +155,9 @@ class CategoryStore:
                 "personality_id": assignment.personality,
                 "category_id": category_id
             }
-            return transaction.insert(self.assignment_table, data)
+            if transaction.insert(self.assignment_table, data):
+                return data["id"]
+            return None
 
     def get_assignment(self, assignment_id: str) -> Optional[CategoryAssignment]:
         """
@@ -165,7 +169,7 @@ class CategoryStore:
         Returns:
             CategoryAssignment object if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT a.id, a.personality_id as personality, c.name as category
                 FROM {self.assignment_table} a
@@ -205,7 +209,7 @@ class CategoryStore:
         Returns:
             List of CategoryAssignment objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT a.id, a.personality_id as personality, c.name as category
                 FROM {self.assignment_table} a
@@ -225,7 +229,7 @@ class CategoryStore:
         Returns:
             List of personality IDs
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT a.personality_id
                 FROM {self.assignment_table} a
@@ -1,12 +1,226 @@
 from __future__ import annotations
 
+import hashlib
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from io import StringIO
 from threading import Lock
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from uuid import uuid4
 
 import psycopg2
 from psycopg2 import pool
 from psycopg2.extras import Json, RealDictCursor
 
+from app.backend import metrics
+
+# List values are stored as JSON unless the column is a native Postgres
+# array, listed here.
+ARRAY_COLUMNS = {
+    "sources",
+    "emotion_ids",
+    "categories",
+    "personality_traits",
+    "values",
+    "attitudes",
+    "interests",
+    "lifestyle",
+    "habits",
+    "frustrations",
+}
+
+# Whether reads in the current context must go to the primary: set for a
+# block by Pool.primary_only(), and once the context writes, so it reads
+# its own writes. Each server request runs in its own context; threads that
+# serve many, like executor workers, must run each task in a copy of one.
+_primary_only: ContextVar[bool] = ContextVar("primary_only", default=False)
+
+
+# Functions called with every statement executed, see add_query_hook()
+_query_hooks: List[Callable[[Dict[str, Any]], None]] = []
+
+_LITERALS = re.compile(
+    r"'(?:[^']|'')*'|%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b|\$\d+"
+)
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+# Random suffixes of generated names, as of copy_upsert()'s staging tables
+_NAME_SUFFIXES = re.compile(r"(?<=_)[0-9a-f]{8,}\b")
+# Statements that only read, unless they are WITH queries or EXPLAINs of
+# statements that modify data
+_READS = re.compile(r"(SELECT|SHOW|SET|VALUES|TABLE|FETCH|WITH|EXPLAIN)\b", re.I)
+_MODIFIES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|ANALYZE)\b", re.I)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a statement so runs of it with different values compare
+    equal: comments are dropped, literals, placeholders and random name
+    suffixes become ?, lists of them (?) and whitespace collapsed.
+    """
+    statement = _COMMENTS.sub(" ", statement)
+    statement = _NAME_SUFFIXES.sub("?", statement)
+    statement = _LITERALS.sub("?", statement)
+    statement = _LISTS.sub("(?)", statement)
+    return " ".join(statement.split())
+
+
+@lru_cache(maxsize=4096)
+def _identify(statement: str) -> Tuple[str, str]:
+    """
+    A statement's fingerprint and a short hash of it, cached since
+    statements are mostly the same few templates.
+    """
+    normalized = fingerprint(statement)
+    return normalized, hashlib.md5(normalized.encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=4096)
+def _writes(statement: str) -> bool:
+    """
+    Whether a statement may write, told from its text alone. Functions a
+    SELECT calls are taken to only read.
+    """
+    normalized = _identify(statement)[0]
+    match = _READS.match(normalized)
+    if match is None:
+        return True
+    if match.group(1).upper() in ("WITH", "EXPLAIN"):
+        return _MODIFIES.search(normalized) is not None
+    return False
+
+
+def add_query_hook(hook: Callable[[Dict[str, Any]], None]):
+    """
+    Call a function with every statement executed through a Transaction,
+    with a dictionary of its "statement", "params", "fingerprint" (see
+    fingerprint()) and its "id", a hash of it, the "duration" in seconds,
+    the number of "rows" returned or affected (-1 if unknown), the
+    "caller", the store method that ran it, and the "error" class, if it
+    failed. Hooks run on the executing thread, so should be quick; errors
+    they raise are printed and ignored.
+    """
+    _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: Callable[[Dict[str, Any]], None]):
+    """Stop calling a function added by add_query_hook()."""
+    if hook in _query_hooks:
+        _query_hooks.remove(hook)
+
+
+def _caller() -> Optional[str]:
+    """
+    The store method that is running the current statement: the first
+    frame out of this module, named by its class if it has one.
+    """
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    code = frame.f_code
+    # Named from the frame's self rather than co_qualname, which only
+    # exists from Python 3.11
+    if code.co_argcount and code.co_varnames[0] == "self":
+        instance = frame.f_locals.get("self")
+        if instance is not None:
+            return f"{type(instance).__name__}.{code.co_name}"
+    return code.co_name
+
+
+class QueryCursor(RealDictCursor):
+    """
+    A RealDictCursor that times each statement and reports it to the
+    query hooks, and records whether any statement it ran may have written
+    (see _writes()).
+    """
+
+    wrote = False
+
+    def execute(self, query, vars=None):
+        if not _query_hooks:
+            super().execute(query, vars)
+        else:
+            self.__timed(
+                query, vars, lambda: RealDictCursor.execute(self, query, vars)
+            )
+        self.__note(query)
+
+    def copy_expert(self, sql, file, size=8192):
+        if not _query_hooks:
+            super().copy_expert(sql, file, size)
+        else:
+            self.__timed(
+                sql, None, lambda: RealDictCursor.copy_expert(self, sql, file, size)
+            )
+        self.__note(sql)
+
+    def __note(self, query: Any):
+        """Record a statement that ran, if it may have written."""
+        if not self.wrote:
+            statement = query if isinstance(query, str) else query.as_string(self)
+            self.wrote = _writes(statement)
+
+    def __timed(self, query: Any, vars: Any, run: Callable[[], Any]):
+        error = None
+        start = time.perf_counter()
+        try:
+            return run()
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            statement = query if isinstance(query, str) else query.as_string(self)
+            normalized, query_id = _identify(statement)
+            event = {
+                "statement": statement,
+                "params": vars,
+                "fingerprint": normalized,
+                "id": query_id,
+                "duration": duration,
+                "rows": self.rowcount,
+                "caller": _caller(),
+                "error": error,
+            }
+            for hook in list(_query_hooks):
+                try:
+                    hook(event)
+                except Exception as e:
+                    print(f"Error in query hook: {e}")
+
+
+def _checkout(connections: pool.ThreadedConnectionPool, name: str):
+    """Check a connection out of a pool, recording the pool's metrics."""
+    waiting = metrics.DB_WAITING.labels(name)
+    waiting.inc()
+    start = time.perf_counter()
+    try:
+        conn = connections.getconn()
+    except pool.PoolError:
+        metrics.DB_EXHAUSTED.labels(name).inc()
+        raise
+    finally:
+        waiting.dec()
+    metrics.DB_CHECKOUT_SECONDS.labels(name).observe(time.perf_counter() - start)
+    metrics.DB_IN_USE.labels(name).inc()
+    return conn
+
+
+class _Replica:
+    """A read replica's connection pool and health."""
+
+    def __init__(self, connection_string: str):
+        self.connection_string = connection_string
+        self.pool: Optional[pool.ThreadedConnectionPool] = None
+        self.down_until = 0.0
+        self.checked_at = 0.0
+
 
 class Pool:
     """
@@ -27,6 +241,9 @@ class Pool:
         password: Optional[str] = None,
         min_connections: int = 1,
         max_connections: int = 10,
+        replicas: Optional[List[str]] = None,
+        health_check_interval: float = 5.0,
+        max_replica_lag: Optional[float] = None,
     ):
         """
         Initialize the PostgreSQL database connection pool.
@@ -36,6 +253,12 @@ class Pool:
                 to use environment variables.
             min_connections: Minimum number of connections to keep in the pool
             max_connections: Maximum number of connections allowed in the pool
+            replicas: Connection strings of read replicas, which read-only
+                transactions are spread over round-robin
+            health_check_interval: Seconds between health checks of a
+                replica, and that a failed replica is skipped for
+            max_replica_lag: Seconds of replication lag past which a
+                replica counts as unhealthy; unchecked if None
         """
         if connection_string is None:
             # Try to build connection string from environment variables
@@ -57,6 +280,16 @@ class Pool:
             min_connections, max_connections, self.__connection_string
         )
 
+        # Replica pools are opened on first use, so a replica that is down
+        # doesn't keep the application from starting
+        self.__min_connections = min_connections
+        self.__max_connections = max_connections
+        self.__replicas = [_Replica(replica) for replica in replicas or []]
+        self.__replica_lock = Lock()
+        self.__next_replica = 0
+        self.health_check_interval = health_check_interval
+        self.max_replica_lag = max_replica_lag
+
     @classmethod
     def get_instance(
         cls,
@@ -68,6 +301,7 @@ class Pool:
         password: Optional[str] = None,
         min_connections: int = 1,
         max_connections: int = 10,
+        replicas: Optional[List[str]] = None,
     ) -> Pool:
         """Get the optional singleton instance of the Pool."""
         if cls.__instance is None:
@@ -82,18 +316,133 @@ class Pool:
                         password=password,
                         min_connections=min_connections,
                         max_connections=max_connections,
+                        replicas=replicas,
                     )
         return cls.__instance
 
     def __get_connection(self):
         """Get a connection from the pool."""
-        return self.__pool.getconn()
+        return _checkout(self.__pool, "primary")
+
+    def get_transaction(self, read_only: bool = False):
+        """
+        Get a new transaction with a dedicated connection from the pool.
+
+        Args:
+            read_only: Whether the transaction only reads, so it can be
+                served by a healthy replica, unless the current context
+                must read from the primary (see primary_only())
+        """
+        if read_only and self.__replicas and not _primary_only.get():
+            for replica in self.__replica_order():
+                conn = self.__get_replica_connection(replica)
+                if conn is not None:
+                    cursor = conn.cursor(cursor_factory=QueryCursor)
+                    return Transaction(
+                        conn,
+                        cursor,
+                        replica.pool,
+                        None,
+                        "replica",
+                        lambda replica=replica: self.__replica_failed(replica),
+                    )
 
-    def get_transaction(self):
-        """Get a new transaction with a dedicated connection from the pool."""
         conn = self.__get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        return Transaction(conn, cursor, self.__pool)
+        cursor = conn.cursor(cursor_factory=QueryCursor)
+        # With replicas, a context that writes reads from the primary from
+        # then on, so it sees its own writes despite replication lag
+        on_write = (
+            self.__read_own_writes
+            if self.__replicas and not _primary_only.get()
+            else None
+        )
+        return Transaction(conn, cursor, self.__pool, on_write, "primary")
+
+    @staticmethod
+    @contextmanager
+    def primary_only():
+        """
+        Send every transaction of the block, in the current context, to the
+        primary; for reads that must see the latest writes.
+        """
+        token = _primary_only.set(True)
+        try:
+            yield
+        finally:
+            _primary_only.reset(token)
+
+    @staticmethod
+    def __read_own_writes():
+        _primary_only.set(True)
+
+    def __replica_order(self) -> List[_Replica]:
+        """The replicas not known to be down, starting from the next one."""
+        now = time.monotonic()
+        with self.__replica_lock:
+            start = self.__next_replica
+            self.__next_replica = (start + 1) % len(self.__replicas)
+        ordered = self.__replicas[start:] + self.__replicas[:start]
+        return [replica for replica in ordered if replica.down_until <= now]
+
+    def __replica_failed(
+        self, replica: _Replica
+    ) -> Tuple[psycopg2.extensions.connection, pool.ThreadedConnectionPool]:
+        """
+        Skip a replica a read failed on for a while, and get a connection
+        to the primary to retry the read on.
+        """
+        replica.down_until = time.monotonic() + self.health_check_interval
+        replica.checked_at = 0.0
+        return self.__get_connection(), self.__pool
+
+    def __get_replica_connection(self, replica: _Replica):
+        """
+        Get a connection to a replica, checking its health if it's due.
+        Returns None, and skips the replica for a while, if it fails.
+        """
+        conn = None
+        try:
+            with self.__replica_lock:
+                if replica.pool is None:
+                    replica.pool = pool.ThreadedConnectionPool(
+                        self.__min_connections,
+                        self.__max_connections,
+                        replica.connection_string,
+                    )
+            conn = _checkout(replica.pool, "replica")
+
+            now = time.monotonic()
+            if now - replica.checked_at >= self.health_check_interval:
+                with conn.cursor() as cursor:
+                    # Lag is how far replay is behind the last transaction
+                    # received; nothing when caught up or not a standby
+                    cursor.execute(
+                        """
+                        SELECT CASE
+                            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                            THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM
+                                NOW() - pg_last_xact_replay_timestamp()), 0)
+                        END
+                        """
+                    )
+                    lag = float(cursor.fetchone()[0])
+                conn.rollback()
+                if self.max_replica_lag is not None and lag > self.max_replica_lag:
+                    raise psycopg2.OperationalError(f"replica is {lag:.1f}s behind")
+                replica.checked_at = now
+            return conn
+        except pool.PoolError:
+            # Busy rather than unhealthy
+            return None
+        except psycopg2.Error as e:
+            print(f"Skipping replica: {e}")
+            if conn is not None and replica.pool is not None:
+                replica.pool.putconn(conn, close=True)
+                metrics.DB_IN_USE.labels("replica").dec()
+            replica.down_until = time.monotonic() + self.health_check_interval
+            replica.checked_at = 0.0
+            return None
 
     def __enter__(self):
         """Context manager support - returns a transaction."""
@@ -116,10 +465,24 @@ class Transaction:
         conn: psycopg2.extensions.connection,
         cursor: psycopg2.extensions.cursor,
         pool_instance: pool.ThreadedConnectionPool,
+        on_write: Optional[Callable[[], None]] = None,
+        pool_name: Optional[str] = None,
+        failover: Optional[
+            Callable[
+                [],
+                Tuple[psycopg2.extensions.connection, pool.ThreadedConnectionPool],
+            ]
+        ] = None,
     ):
         self.__conn = conn
         self.__cursor = cursor
         self.__pool = pool_instance
+        self.__on_write = on_write
+        self.__pool_name = pool_name
+        # Called when a read on a replica fails for the connection to
+        # retry it on (see __fail_over())
+        self.__failover = failover
+        self.__atomic = False
 
     def __enter__(self):
         return self
@@ -127,7 +490,7 @@ class Transaction:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is None:
             # No exception occurred, commit the transaction
-            self.__conn.commit()
+            self.__commit()
         else:
             # An exception occurred, rollback the transaction
             self.__conn.rollback()
@@ -140,10 +503,132 @@ class Transaction:
             self.__pool.putconn(self.__conn)
         else:
             self.__conn.close()
+        if self.__pool_name:
+            metrics.DB_IN_USE.labels(self.__pool_name).dec()
 
         # Don't suppress exceptions
         return False
 
+    def __commit(self):
+        """
+        Commit, first telling the pool if any statement run may have
+        written. Inside atomic() the commit is left to the end of the block.
+        """
+        if self.__atomic:
+            return
+        if self.__on_write is not None and self.__cursor.wrote:
+            self.__on_write()
+            self.__on_write = None
+        self.__conn.commit()
+
+    def __abort(self, e: Exception):
+        """
+        Roll back after a failed statement. Inside atomic() that undoes the
+        whole block, so the error is raised rather than swallowed.
+        """
+        self.__conn.rollback()
+        if self.__atomic:
+            raise e
+
+    def __fail_over(self, e: Exception) -> bool:
+        """
+        Move a replica transaction whose connection failed, as when it was
+        dropped or a read conflicted with recovery, to the primary, once.
+        The replica is skipped until its next health check.
+
+        Returns:
+            True if the failed read should be retried
+        """
+        # An atomic block isn't moved, as its transaction's modes and
+        # earlier statements would be lost
+        if (
+            self.__failover is None
+            or self.__atomic
+            or not isinstance(e, psycopg2.OperationalError)
+        ):
+            return False
+        print(f"Replica read failed, retrying on the primary: {e}")
+        failover, self.__failover = self.__failover, None
+        conn, pool_instance = failover()
+
+        try:
+            self.__cursor.close()
+        except psycopg2.Error:
+            pass
+        self.__pool.putconn(self.__conn, close=True)
+        metrics.DB_IN_USE.labels(self.__pool_name).dec()
+
+        self.__conn = conn
+        self.__pool = pool_instance
+        self.__pool_name = "primary"
+        self.__cursor = conn.cursor(cursor_factory=QueryCursor)
+        return True
+
+    @contextmanager
+    def atomic(
+        self,
+        isolation_level: Optional[str] = None,
+        read_only: bool = False,
+        rollback: bool = False,
+    ):
+        """
+        Run the statements of a block as a single database transaction:
+        they are committed together at the end of the block, and the first
+        one to fail rolls them all back and raises, where it would otherwise
+        return its failure value. Reads before the block are ended first.
+
+            with db_pool.get_transaction() as transaction:
+                with transaction.atomic():
+                    transaction.insert(...)
+                    transaction.copy_upsert(...)
+
+        Args:
+            isolation_level: Isolation level of the transaction, e.g.
+                "REPEATABLE READ" for every read of the block to see the
+                same snapshot; the connection's default (READ COMMITTED)
+                if None
+            read_only: Whether Postgres should refuse every write of the
+                block
+            rollback: Whether to roll the block back even if it succeeds,
+                undoing whatever its statements changed
+
+        Raises:
+            ValueError: If the isolation level isn't one of Postgres'
+        """
+        if self.__atomic:
+            # Nested blocks are part of the outer one
+            yield self
+            return
+        if isolation_level is not None and isolation_level.upper() not in (
+            "SERIALIZABLE",
+            "REPEATABLE READ",
+            "READ COMMITTED",
+            "READ UNCOMMITTED",
+        ):
+            raise ValueError(f"Invalid isolation level {isolation_level}")
+
+        modes = []
+        if isolation_level is not None:
+            modes.append(f"ISOLATION LEVEL {isolation_level.upper()}")
+        if read_only:
+            modes.append("READ ONLY")
+
+        self.__commit()
+        self.__atomic = True
+        try:
+            if modes:
+                self.__cursor.execute(f"SET TRANSACTION {', '.join(modes)}")
+            yield self
+        except BaseException:
+            self.__atomic = False
+            self.__conn.rollback()
+            raise
+        self.__atomic = False
+        if rollback:
+            self.__conn.rollback()
+        else:
+            self.__commit()
+
     def execute(self, query: str, params: Optional[tuple] = None) -> bool:
         """
         Execute a query without returning results.
@@ -157,11 +642,11 @@ class Transaction:
         """
         try:
             self.__cursor.execute(query, params)
-            self.__conn.commit()
+            self.__commit()
             return True
         except Exception as e:
             print(f"Error executing query: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             return False
 
     def query(
@@ -182,10 +667,54 @@ class Transaction:
             results = self.__cursor.fetchall()
             return [dict(row) for row in results]
         except Exception as e:
+            if self.__fail_over(e):
+                return self.query(query, params)
             print(f"Error executing query: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             return []
 
+    def stream(
+        self,
+        query: str,
+        params: Optional[tuple] = None,
+        chunk_size: int = 1000,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Execute a query through a server-side cursor and yield the results
+        one row at a time. Rows are fetched from the server chunk_size at a
+        time, so memory use stays constant regardless of the result size.
+
+        Args:
+            query: SQL query to execute
+            params: Parameters for the query
+            chunk_size: Number of rows to fetch per round trip
+
+        Returns:
+            Iterator of dictionaries representing the query results
+        """
+        cursor = self.__conn.cursor(
+            name=f"stream_{uuid4().hex}", cursor_factory=QueryCursor
+        )
+        cursor.itersize = chunk_size
+
+        streamed = False
+        try:
+            cursor.execute(query, params)
+            for row in cursor:
+                streamed = True
+                yield dict(row)
+        except Exception as e:
+            # Only retried before any row was yielded, not to repeat rows
+            if not streamed and self.__fail_over(e):
+                yield from self.stream(query, params, chunk_size)
+                return
+            print(f"Error streaming query: {e}")
+            self.__conn.rollback()
+            raise e
+        finally:
+            if not cursor.closed:
+                cursor.close()
+
     def insert(self, table: str, data: Dict[str, Any]) -> bool:
         """
         Insert a record into a table.
@@ -200,10 +729,10 @@ class Transaction:
         # Convert any dictionary values to JSONB format
         processed_data = {}
         for k, v in data.items():
-            if isinstance(v, dict) or isinstance(v, list) and k != "sources":
+            if isinstance(v, dict) or isinstance(v, list) and k not in ARRAY_COLUMNS:
                 processed_data[k] = Json(v)
-            elif isinstance(v, list) and k == "sources":
-                # Special handling for sources array
+            elif isinstance(v, list) and k in ARRAY_COLUMNS:
+                # Special handling for native array columns
                 processed_data[k] = v
             else:
                 processed_data[k] = v
@@ -216,11 +745,11 @@ class Transaction:
 
         try:
             self.__cursor.execute(query, values)
-            self.__conn.commit()
+            self.__commit()
             return True
         except Exception as e:
             print(f"Error inserting data: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             raise e
 
     def update(
@@ -245,10 +774,10 @@ class Transaction:
         # Convert any dictionary values to JSONB format
         processed_data = {}
         for k, v in data.items():
-            if isinstance(v, dict) or isinstance(v, list) and k != "sources":
+            if isinstance(v, dict) or isinstance(v, list) and k not in ARRAY_COLUMNS:
                 processed_data[k] = Json(v)
-            elif isinstance(v, list) and k == "sources":
-                # Special handling for sources array
+            elif isinstance(v, list) and k in ARRAY_COLUMNS:
+                # Special handling for native array columns
                 processed_data[k] = v
             else:
                 processed_data[k] = v
@@ -262,11 +791,11 @@ class Transaction:
 
         try:
             self.__cursor.execute(query, values)
-            self.__conn.commit()
+            self.__commit()
             return self.__cursor.rowcount
         except Exception as e:
             print(f"Error executing query: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             return 0
 
     def upsert(
@@ -290,10 +819,10 @@ class Transaction:
         # Convert any dictionary values to JSONB format
         processed_data = {}
         for k, v in data.items():
-            if isinstance(v, dict) or isinstance(v, list) and k != "sources":
+            if isinstance(v, dict) or isinstance(v, list) and k not in ARRAY_COLUMNS:
                 processed_data[k] = Json(v)
-            elif isinstance(v, list) and k == "sources":
-                # Special handling for sources array
+            elif isinstance(v, list) and k in ARRAY_COLUMNS:
+                # Special handling for native array columns
                 processed_data[k] = v
             else:
                 processed_data[k] = v
@@ -315,13 +844,78 @@ class Transaction:
         try:
             self.__cursor.execute(query, values)
             result = self.__cursor.fetchone()
-            self.__conn.commit()
+            self.__commit()
             return result["id"] if result else None
         except Exception as e:
             print(f"Error upserting data: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             return None
 
+    def copy_upsert(
+        self,
+        table: str,
+        columns: List[str],
+        rows: List[Dict[str, Any]],
+        constraint: str,
+    ) -> Dict[str, int]:
+        """
+        Bulk upsert records by COPYing them into a temporary staging table
+        shaped like the target table, then merging the staging table into
+        the target in a single INSERT ... ON CONFLICT statement.
+
+        Args:
+            table: Table name
+            columns: Columns to load; every row is read by these keys
+            rows: Records to load. Lists are written as Postgres arrays.
+            constraint: The unique constraint to use for conflict detection
+                (e.g., "id"). Rows must be unique on it.
+
+        Returns:
+            Dictionary with the number of "inserted" and "updated" records
+        """
+        staging = f"{table}_staging_{uuid4().hex[:8]}"
+        column_list = ", ".join(f'"{col}"' for col in columns)
+
+        buffer = StringIO()
+        for row in rows:
+            buffer.write(
+                ",".join(_copy_value(row.get(col)) for col in columns)
+            )
+            buffer.write("\n")
+        buffer.seek(0)
+
+        update_clause = ", ".join(
+            f'"{col}" = EXCLUDED."{col}"'
+            for col in columns
+            if col != constraint
+        )
+
+        try:
+            self.__cursor.execute(
+                f"CREATE TEMP TABLE {staging} "
+                f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            self.__cursor.copy_expert(
+                f"COPY {staging} ({column_list}) FROM STDIN "
+                f"WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+            self.__cursor.execute(
+                f"INSERT INTO {table} ({column_list}) "
+                f"SELECT {column_list} FROM {staging} "
+                f"ON CONFLICT ({constraint}) DO UPDATE SET {update_clause} "
+                f"RETURNING (xmax = 0) AS inserted"
+            )
+            results = self.__cursor.fetchall()
+            self.__commit()
+        except Exception as e:
+            print(f"Error copying data: {e}")
+            self.__conn.rollback()
+            raise e
+
+        inserted = sum(1 for result in results if result["inserted"])
+        return {"inserted": inserted, "updated": len(results) - inserted}
+
     def delete(self, table: str, condition: str, params: tuple) -> int:
         """
         Delete records from a table.
@@ -338,11 +932,11 @@ class Transaction:
 
         try:
             self.__cursor.execute(query, params)
-            self.__conn.commit()
+            self.__commit()
             return self.__cursor.rowcount
         except Exception as e:
             print(f"Error executing query: {e}")
-            self.__conn.rollback()
+            self.__abort(e)
             return False
 
     def get_by_id(
@@ -365,40 +959,56 @@ class Transaction:
             results = self.__cursor.fetchall()
             return results[0] if results else None
         except Exception as e:
+            if self.__fail_over(e):
+                return self.get_by_id(table, id_value)
             print(f"Error executing query: {e}")
+            self.__abort(e)
             return None
 
     def vector_search(
         self,
         table: str,
         embedding_column: str,
-        query_vector: List[float],
+        query_vector: Union[List[float], str],
         limit: int = 10,
         distance_type: str = "l2",
         where_clause: Optional[str] = None,
         where_params: Optional[tuple] = None,
+        columns: str = "*",
     ) -> List[Dict[str, Any]]:
         """
-        Perform vector similarity search using pgvector.
+        Perform vector similarity search using pgvector. The query orders by
+        the distance to a single bound vector with a bound LIMIT, the shape
+        an HNSW index on the column can answer, as long as the index was
+        built with the operator class of the distance type.
 
         Args:
-            table: Table name
+            table: Table name, or tables joined
             embedding_column: Name of the vector column
-            query_vector: Query vector as a list of floats
+            query_vector: Query vector as a list of floats, or as a pgvector
+                literal
             limit: Maximum number of results to return
             distance_type: Type of distance to use ('l2', 'inner_product', or 'cosine')
             where_clause: Optional WHERE clause for additional filtering
             where_params: Parameters for the WHERE clause
+            columns: Columns to select besides the distance
 
         Returns:
-            List of dictionaries containing the results
+            List of dictionaries containing the results, nearest first,
+            each with its "distance"
         """
         # Convert distance type to operator
         distance_ops = {"l2": "<->", "inner_product": "<#>", "cosine": "<=>"}
         operator = distance_ops.get(distance_type, "<->")
 
+        if not isinstance(query_vector, str):
+            query_vector = to_vector(query_vector)
+
         # Build the query
-        query = f"SELECT *, ({embedding_column} {operator} %s::vector) as distance FROM {table}"
+        query = (
+            f"SELECT {columns}, ({embedding_column} {operator} %s::vector) AS distance "
+            f"FROM {table}"
+        )
         params = [query_vector]
 
         if where_clause:
@@ -406,15 +1016,71 @@ class Transaction:
             if where_params:
                 params.extend(where_params)
 
-        query += f" ORDER BY ({embedding_column} {operator} %s::vector)"
-        params.append(query_vector)  # Add query_vector again for ORDER BY
+        query += " ORDER BY distance"
 
         if limit:
-            query += f" LIMIT {limit}"
+            query += " LIMIT %s"
+            params.append(limit)
 
         try:
+            if limit:
+                # An HNSW scan yields at most ef_search rows before filtering,
+                # so it is widened to the limit, and further when a filter
+                # may discard rows; both settings end with the transaction
+                ef_search = max(limit, 40)
+                if where_clause:
+                    ef_search = max(limit * 4, 100)
+                self.__cursor.execute(
+                    "SELECT set_config('hnsw.ef_search', %s, true)",
+                    (str(min(ef_search, 1000)),),
+                )
             self.__cursor.execute(query, params)
             return [dict(row) for row in self.__cursor.fetchall()]
         except Exception as e:
+            if self.__fail_over(e):
+                return self.vector_search(
+                    table,
+                    embedding_column,
+                    query_vector,
+                    limit,
+                    distance_type,
+                    where_clause,
+                    where_params,
+                    columns,
+                )
             print(f"Error executing vector search: {e}")
+            self.__abort(e)
             return []
+
+
+def to_vector(values: Any) -> str:
+    """Format a sequence of numbers as a pgvector literal, e.g. '[0.1,0.2]'."""
+    return "[" + ",".join(f"{float(x):.7g}" for x in values) + "]"
+
+
+def _copy_value(value: Any) -> str:
+    """
+    Encode a single value as a field of COPY's csv format, using \\N for
+    NULL and always quoting everything else so empty strings survive.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        text = "t" if value else "f"
+    elif isinstance(value, (list, tuple)):
+        text = _array_literal(value)
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _array_literal(values: Union[list, tuple]) -> str:
+    """Encode a list as a Postgres array literal, e.g. {"a","b"}."""
+    elements = []
+    for value in values:
+        if value is None:
+            elements.append("NULL")
+        else:
+            escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            elements.append(f'"{escaped}"')
+    return "{" + ",".join(elements) + "}"
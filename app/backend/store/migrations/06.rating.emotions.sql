@@ -0,0 +1,182 @@
+-- Migration for the emotion taxonomy
+-- Replaces the free-form rating.emotions text with canonical emotion ids and
+-- a bitmask of the emotion groups they belong to. The seeded ids and groups
+-- must match app/backend/emotions.py.
+
+CREATE TABLE IF NOT EXISTS emotion_group (
+    id SMALLINT PRIMARY KEY, -- Position of the group; its bit is 1 << id
+    name VARCHAR(50) NOT NULL, -- Name of the group
+    bit INTEGER NOT NULL -- Bit of the group in rating.emotion_groups
+);
+
+INSERT INTO emotion_group (id, name, bit) VALUES
+    (0, 'happy', 1),
+    (1, 'fear', 2),
+    (2, 'anger', 4),
+    (3, 'disgust', 8),
+    (4, 'sad', 16),
+    (5, 'guilt', 32),
+    (6, 'surprise', 64)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS emotion (
+    id SMALLINT PRIMARY KEY, -- Stable identifier of the emotion
+    name VARCHAR(50) NOT NULL, -- Canonical name of the emotion
+    group_name VARCHAR(50) NOT NULL -- Group the emotion belongs to
+);
+
+INSERT INTO emotion (id, name, group_name) VALUES
+    (1, 'Happy', 'happy'),
+    (2, 'Joyful', 'happy'),
+    (3, 'Excited', 'happy'),
+    (4, 'Interested', 'happy'),
+    (5, 'Proud', 'happy'),
+    (6, 'Accepted', 'happy'),
+    (7, 'Powerful', 'happy'),
+    (8, 'Peaceful', 'happy'),
+    (9, 'Intimate', 'happy'),
+    (10, 'Loving', 'happy'),
+    (11, 'Hopeful', 'happy'),
+    (12, 'Playful', 'happy'),
+    (13, 'Inspired', 'happy'),
+    (14, 'Open', 'happy'),
+    (15, 'Confident', 'happy'),
+    (16, 'Important', 'happy'),
+    (17, 'Fulfilled', 'happy'),
+    (18, 'Respected', 'happy'),
+    (19, 'Courageous', 'happy'),
+    (20, 'Provocative', 'happy'),
+    (21, 'Sensitive', 'happy'),
+    (22, 'Energetic', 'happy'),
+    (23, 'Liberated', 'happy'),
+    (24, 'Ecstatic', 'happy'),
+    (25, 'Eager', 'happy'),
+    (26, 'Awe', 'surprise'),
+    (27, 'Astonished', 'surprise'),
+    (28, 'Perplexed', 'surprise'),
+    (29, 'Dismayed', 'surprise'),
+    (30, 'Shocked', 'surprise'),
+    (31, 'Terrified', 'fear'),
+    (32, 'Frightened', 'fear'),
+    (33, 'Worried', 'fear'),
+    (34, 'Overwhelmed', 'fear'),
+    (35, 'Inadequate', 'fear'),
+    (36, 'Inferior', 'fear'),
+    (37, 'Worthless', 'fear'),
+    (38, 'Insignificant', 'fear'),
+    (39, 'Alienated', 'sad'),
+    (40, 'Disrespected', 'anger'),
+    (41, 'Ridiculed', 'anger'),
+    (42, 'Embarrassed', 'guilt'),
+    (43, 'Devastated', 'sad'),
+    (44, 'Resentful', 'anger'),
+    (45, 'Jealous', 'anger'),
+    (46, 'Violated', 'anger'),
+    (47, 'Fear', 'fear'),
+    (48, 'Scared', 'fear'),
+    (49, 'Anxious', 'fear'),
+    (50, 'Insecure', 'fear'),
+    (51, 'Submissive', 'fear'),
+    (52, 'Hurt', 'fear'),
+    (53, 'Humiliated', 'fear'),
+    (54, 'Threatened', 'fear'),
+    (55, 'Anger', 'anger'),
+    (56, 'Mad', 'anger'),
+    (57, 'Hateful', 'anger'),
+    (58, 'Aggressive', 'anger'),
+    (59, 'Frustrated', 'anger'),
+    (60, 'Hostile', 'anger'),
+    (61, 'Enraged', 'anger'),
+    (62, 'Furious', 'anger'),
+    (63, 'Violent', 'anger'),
+    (64, 'Irritated', 'anger'),
+    (65, 'Infuriated', 'anger'),
+    (66, 'Provoked', 'anger'),
+    (67, 'Withdrawn', 'anger'),
+    (68, 'Suspicious', 'anger'),
+    (69, 'Skeptical', 'anger'),
+    (70, 'Sarcastic', 'anger'),
+    (71, 'Judgmental', 'anger'),
+    (72, 'Disgust', 'disgust'),
+    (73, 'Critical', 'disgust'),
+    (74, 'Distant', 'disgust'),
+    (75, 'Disappointed', 'disgust'),
+    (76, 'Awful', 'disgust'),
+    (77, 'Loathing', 'disgust'),
+    (78, 'Repugnant', 'disgust'),
+    (79, 'Revolted', 'disgust'),
+    (80, 'Revulsion', 'disgust'),
+    (81, 'Detestable', 'disgust'),
+    (82, 'Aversion', 'disgust'),
+    (83, 'Sad', 'sad'),
+    (84, 'Lonely', 'sad'),
+    (85, 'Bored', 'sad'),
+    (86, 'Depressed', 'sad'),
+    (87, 'Despair', 'sad'),
+    (88, 'Abandoned', 'sad'),
+    (89, 'Ignored', 'sad'),
+    (90, 'Victimized', 'sad'),
+    (91, 'Powerless', 'sad'),
+    (92, 'Vulnerable', 'sad'),
+    (93, 'Empty', 'sad'),
+    (94, 'Isolated', 'sad'),
+    (95, 'Apathetic', 'sad'),
+    (96, 'Indifferent', 'sad'),
+    (97, 'Guilty', 'guilt'),
+    (98, 'Remorseful', 'guilt'),
+    (99, 'Ashamed', 'guilt'),
+    (100, 'Hesitant', 'guilt'),
+    (101, 'Avoidance', 'guilt'),
+    (102, 'Surprise', 'surprise'),
+    (103, 'Startled', 'surprise'),
+    (104, 'Confused', 'surprise'),
+    (105, 'Amazed', 'surprise')
+ON CONFLICT (id) DO NOTHING;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_emotion_name ON emotion(LOWER(name));
+
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS emotion_ids SMALLINT[] NOT NULL DEFAULT '{}';
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS emotion_groups INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from the old column, which held either a JSON array or a comma
+-- separated list of names. Only exact (case insensitive) canonical names are
+-- recovered; synonyms and misspellings are resolved by the application for
+-- new ratings only.
+UPDATE rating r
+SET emotion_ids = matched.ids
+FROM (
+    SELECT
+        r.id,
+        ARRAY_AGG(e.id ORDER BY u.position) AS ids
+    FROM rating r
+    CROSS JOIN LATERAL REGEXP_SPLIT_TO_TABLE(
+        TRIM(BOTH '[]' FROM r.emotions), ','
+    ) WITH ORDINALITY AS u(name, position)
+    JOIN emotion e ON LOWER(e.name) = LOWER(TRIM(BOTH ' "' FROM u.name))
+    WHERE r.emotions IS NOT NULL
+    GROUP BY r.id
+) matched
+WHERE r.id = matched.id;
+
+UPDATE rating r
+SET emotion_groups = masks.mask
+FROM (
+    SELECT r.id, BIT_OR(g.bit) AS mask
+    FROM rating r
+    CROSS JOIN LATERAL UNNEST(r.emotion_ids) AS u(emotion_id)
+    JOIN emotion e ON e.id = u.emotion_id
+    JOIN emotion_group g ON g.name = e.group_name
+    GROUP BY r.id
+) masks
+WHERE r.id = masks.id;
+
+ALTER TABLE rating DROP COLUMN IF EXISTS emotions;
+
+-- GIN index for emotion filters (emotion_ids @> / && ARRAY[...])
+CREATE INDEX IF NOT EXISTS idx_rating_emotion_ids ON rating USING GIN(emotion_ids);
+
+COMMENT ON TABLE emotion_group IS 'Groups of the emotion taxonomy';
+COMMENT ON TABLE emotion IS 'Canonical emotions a rating can report';
+COMMENT ON COLUMN emotion.id IS 'Stable identifier of the emotion, stored in rating.emotion_ids';
+COMMENT ON COLUMN rating.emotion_ids IS 'Canonical ids of the emotions experienced when viewing the ad, in the order given';
+COMMENT ON COLUMN rating.emotion_groups IS 'Bitmask of the emotion groups present in emotion_ids';
@@ -0,0 +1,28 @@
+-- Migration for rating effectiveness
+-- Adds the effectiveness column the rating table was missing, along with an
+-- indexed ordinal of it so ads can be ranked with a single aggregate.
+
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS effectiveness TEXT;
+
+-- Position of the effectiveness on the RateAgent.EFFECTIVENESS scale, from
+-- 1 (Not Relevant) to 5 (Strong Match); NULL for values off the scale. Kept
+-- in sync with models/rating.py EFFECTIVENESS.
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS effectiveness_level SMALLINT
+    GENERATED ALWAYS AS (
+        CASE LOWER(TRIM(effectiveness))
+            WHEN 'not relevant' THEN 1
+            WHEN 'low fit' THEN 2
+            WHEN 'neutral/okay' THEN 3
+            WHEN 'good fit' THEN 4
+            WHEN 'strong match' THEN 5
+        END
+    ) STORED;
+
+-- Index for filtering by effectiveness
+CREATE INDEX IF NOT EXISTS idx_rating_effectiveness_level ON rating(effectiveness_level);
+
+-- Index for aggregating effectiveness per ad without reading the rating rows
+CREATE INDEX IF NOT EXISTS idx_rating_ad_effectiveness_level ON rating(ad_id, effectiveness_level);
+
+COMMENT ON COLUMN rating.effectiveness IS 'How effective the ad is for the personality, on the RateAgent.EFFECTIVENESS scale';
+COMMENT ON COLUMN rating.effectiveness_level IS 'Ordinal of effectiveness, 1 (Not Relevant) to 5 (Strong Match)';
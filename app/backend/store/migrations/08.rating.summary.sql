@@ -0,0 +1,120 @@
+-- Migration for rating_summary table
+-- Keeps a per-ad summary of its ratings, maintained by triggers on rating,
+-- so an ad's results can be read without touching its ratings.
+
+CREATE TABLE IF NOT EXISTS rating_summary (
+    ad_id UUID PRIMARY KEY, -- Reference to the ad summarized
+    ratings INTEGER NOT NULL DEFAULT 0, -- Number of ratings of the ad
+    effectiveness_sum INTEGER NOT NULL DEFAULT 0, -- Sum of effectiveness_level over rated levels
+    effectiveness_counts INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0}', -- Ratings at each effectiveness_level, 1 to 5
+    emotion_group_counts INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0,0,0}', -- Ratings with each emotion group, by emotion_group.id + 1
+
+    last_updated TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When a rating of the ad last changed
+
+    CONSTRAINT fk_ad
+        FOREIGN KEY(ad_id)
+        REFERENCES ad(id)
+        ON DELETE CASCADE
+);
+
+-- Add (or with a delta of -1, remove) one rating to its ad's summary
+CREATE OR REPLACE FUNCTION rating_summary_apply(
+    p_ad_id UUID,
+    p_level SMALLINT,
+    p_groups INTEGER,
+    p_delta INTEGER
+) RETURNS VOID AS $$
+BEGIN
+    IF p_delta > 0 THEN
+        INSERT INTO rating_summary (ad_id) VALUES (p_ad_id)
+        ON CONFLICT (ad_id) DO NOTHING;
+    END IF;
+
+    UPDATE rating_summary s
+    SET
+        ratings = s.ratings + p_delta,
+        effectiveness_sum = s.effectiveness_sum + COALESCE(p_level, 0) * p_delta,
+        effectiveness_counts = ARRAY(
+            SELECT u.count + CASE WHEN u.i = p_level THEN p_delta ELSE 0 END
+            FROM UNNEST(s.effectiveness_counts) WITH ORDINALITY AS u(count, i)
+            ORDER BY u.i
+        ),
+        emotion_group_counts = ARRAY(
+            SELECT u.count + CASE
+                WHEN COALESCE(p_groups, 0) & (1 << (u.i - 1)::int) <> 0 THEN p_delta
+                ELSE 0
+            END
+            FROM UNNEST(s.emotion_group_counts) WITH ORDINALITY AS u(count, i)
+            ORDER BY u.i
+        ),
+        last_updated = NOW()
+    WHERE s.ad_id = p_ad_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_rating_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rating_summary_apply(OLD.ad_id, OLD.effectiveness_level, OLD.emotion_groups, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rating_summary_apply(NEW.ad_id, NEW.effectiveness_level, NEW.emotion_groups, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only updates that change what is summarized need to touch the summary
+CREATE TRIGGER update_rating_summary_on_insert_delete
+AFTER INSERT OR DELETE ON rating
+FOR EACH ROW
+EXECUTE FUNCTION update_rating_summary();
+
+CREATE TRIGGER update_rating_summary_on_update
+AFTER UPDATE OF ad_id, effectiveness, emotion_ids, emotion_groups ON rating
+FOR EACH ROW
+WHEN (
+    OLD.ad_id IS DISTINCT FROM NEW.ad_id
+    OR OLD.effectiveness_level IS DISTINCT FROM NEW.effectiveness_level
+    OR OLD.emotion_groups IS DISTINCT FROM NEW.emotion_groups
+)
+EXECUTE FUNCTION update_rating_summary();
+
+-- Summarize the ratings that already exist
+INSERT INTO rating_summary (
+    ad_id,
+    ratings,
+    effectiveness_sum,
+    effectiveness_counts,
+    emotion_group_counts
+)
+SELECT
+    r.ad_id,
+    COUNT(*),
+    COALESCE(SUM(r.effectiveness_level), 0),
+    ARRAY(
+        SELECT COUNT(*) FILTER (WHERE r2.effectiveness_level = level)
+        FROM GENERATE_SERIES(1, 5) AS level
+        LEFT JOIN rating r2 ON r2.ad_id = r.ad_id
+        GROUP BY level
+        ORDER BY level
+    ),
+    ARRAY(
+        SELECT COUNT(*) FILTER (WHERE r2.emotion_groups & (1 << g.id::int) <> 0)
+        FROM emotion_group g
+        LEFT JOIN rating r2 ON r2.ad_id = r.ad_id
+        GROUP BY g.id
+        ORDER BY g.id
+    )
+FROM rating r
+GROUP BY r.ad_id
+ON CONFLICT (ad_id) DO NOTHING;
+
+COMMENT ON TABLE rating_summary IS 'Per-ad summary of its ratings, maintained by triggers on rating';
+COMMENT ON COLUMN rating_summary.ad_id IS 'Reference to the ad summarized';
+COMMENT ON COLUMN rating_summary.ratings IS 'Number of ratings of the ad';
+COMMENT ON COLUMN rating_summary.effectiveness_sum IS 'Sum of effectiveness_level over ratings with a level';
+COMMENT ON COLUMN rating_summary.effectiveness_counts IS 'Number of ratings at each effectiveness_level, 1 to 5';
+COMMENT ON COLUMN rating_summary.emotion_group_counts IS 'Number of ratings reporting each emotion group, indexed by emotion_group.id + 1';
+COMMENT ON COLUMN rating_summary.last_updated IS 'When a rating of the ad was last added, changed or removed';
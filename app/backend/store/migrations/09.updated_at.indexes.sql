@@ -0,0 +1,6 @@
+-- Migration for updated_at indexes
+-- Lets the analytics cache read only the ratings and personalities changed
+-- since its last refresh.
+
+CREATE INDEX IF NOT EXISTS idx_rating_updated_at ON rating(updated_at);
+CREATE INDEX IF NOT EXISTS idx_personality_updated_at ON personality(updated_at);
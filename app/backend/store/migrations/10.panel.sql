@@ -0,0 +1,76 @@
+-- Migration for panel tables
+-- A panel reduces a set of personalities to clusters of similar ones, each
+-- represented by its medoid, so an ad can be rated by the medoids alone and
+-- the results extrapolated to every member.
+
+CREATE TABLE IF NOT EXISTS panel (
+    id UUID PRIMARY KEY, -- Unique identifier for the panel
+    name VARCHAR(255), -- Optional name of the panel
+    personalities INTEGER NOT NULL DEFAULT 0, -- Number of personalities clustered
+    clusters INTEGER NOT NULL DEFAULT 0, -- Number of clusters
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was created
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() -- When the record was last updated
+);
+
+-- Add a trigger to automatically update the updated_at column
+CREATE TRIGGER update_panel_updated_at
+BEFORE UPDATE ON panel
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
+COMMENT ON TABLE panel IS 'Clusterings of personalities rated through representative medoids';
+COMMENT ON COLUMN panel.id IS 'Unique identifier for the panel';
+COMMENT ON COLUMN panel.name IS 'Optional name of the panel';
+COMMENT ON COLUMN panel.personalities IS 'Number of personalities clustered when the panel was built';
+COMMENT ON COLUMN panel.clusters IS 'Number of clusters, and so of medoids';
+
+-- One row per cluster, with the personality representing it
+CREATE TABLE IF NOT EXISTS panel_cluster (
+    panel_id UUID NOT NULL, -- Reference to the panel
+    cluster INTEGER NOT NULL, -- Index of the cluster within the panel
+    medoid_id UUID NOT NULL, -- Member closest to the cluster centroid
+    weight INTEGER NOT NULL, -- Number of members the medoid stands for
+
+    PRIMARY KEY (panel_id, cluster),
+
+    CONSTRAINT fk_panel
+        FOREIGN KEY(panel_id)
+        REFERENCES panel(id)
+        ON DELETE CASCADE,
+
+    CONSTRAINT fk_medoid
+        FOREIGN KEY(medoid_id)
+        REFERENCES personality(id)
+        ON DELETE CASCADE
+);
+
+COMMENT ON TABLE panel_cluster IS 'Clusters of a panel and the medoid representing each';
+COMMENT ON COLUMN panel_cluster.cluster IS 'Index of the cluster within the panel';
+COMMENT ON COLUMN panel_cluster.medoid_id IS 'Member closest to the cluster centroid, rated on behalf of the cluster';
+COMMENT ON COLUMN panel_cluster.weight IS 'Number of members the medoid stands for';
+
+-- Cluster assignment of every personality in a panel
+CREATE TABLE IF NOT EXISTS panel_member (
+    panel_id UUID NOT NULL, -- Reference to the panel
+    personality_id UUID NOT NULL, -- Reference to the personality
+    cluster INTEGER NOT NULL, -- Cluster the personality was assigned to
+
+    PRIMARY KEY (panel_id, personality_id),
+
+    CONSTRAINT fk_panel
+        FOREIGN KEY(panel_id)
+        REFERENCES panel(id)
+        ON DELETE CASCADE,
+
+    CONSTRAINT fk_personality
+        FOREIGN KEY(personality_id)
+        REFERENCES personality(id)
+        ON DELETE CASCADE
+);
+
+-- Index for finding the panels a personality belongs to
+CREATE INDEX IF NOT EXISTS idx_panel_member_personality ON panel_member(personality_id);
+
+COMMENT ON TABLE panel_member IS 'Cluster assignments of the personalities in a panel';
+COMMENT ON COLUMN panel_member.cluster IS 'Cluster the personality was assigned to, see panel_cluster';
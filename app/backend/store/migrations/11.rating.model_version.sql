@@ -0,0 +1,10 @@
+-- Migration for rating model_version
+-- Records which model produced each rating, so models can be compared and
+-- a surrogate can be trained on the ratings of a single rater.
+
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS model_version TEXT;
+
+-- Index for selecting the ratings of a model
+CREATE INDEX IF NOT EXISTS idx_rating_model_version ON rating(model_version);
+
+COMMENT ON COLUMN rating.model_version IS 'Model that produced the rating, e.g. gemini:gemini-2.5-flash-preview-04-17/json; NULL for ratings made before it was recorded';
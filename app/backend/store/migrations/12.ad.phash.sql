@@ -0,0 +1,10 @@
+-- Migration for ad perceptual hashes
+-- The 64 bit difference hash of an ad's image, computed at upload, so near
+-- duplicate creatives can be found. Lookups go through an in-memory
+-- BK-tree; the index serves loading it and exact matches.
+
+ALTER TABLE ad ADD COLUMN IF NOT EXISTS phash BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_ad_phash ON ad(phash) WHERE phash IS NOT NULL;
+
+COMMENT ON COLUMN ad.phash IS 'Difference hash of the image, as a signed 64 bit integer';
@@ -0,0 +1,34 @@
+-- Migration for ad embeddings
+-- Holds an embedding of each ad's copy and image, in its own table so ad
+-- rows stay small, with an HNSW index for approximate nearest neighbour
+-- search by cosine distance. The dimensions match
+-- app/backend/embeddings.py DIMENSIONS.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS ad_embedding (
+    ad_id UUID PRIMARY KEY, -- The ad embedded
+    model TEXT NOT NULL, -- Embedder that produced the embedding
+    embedding vector(768) NOT NULL, -- Unit length embedding
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was created
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was last updated
+
+    CONSTRAINT fk_ad
+        FOREIGN KEY(ad_id)
+        REFERENCES ad(id)
+        ON DELETE CASCADE
+);
+
+-- Trigger to automatically update the updated_at timestamp
+CREATE TRIGGER update_ad_embedding_updated_at
+BEFORE UPDATE ON ad_embedding
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
+-- Index for nearest neighbour search; m and ef_construction are pgvector's
+-- defaults, spelled out as they trade build time for recall
+CREATE INDEX IF NOT EXISTS idx_ad_embedding_hnsw ON ad_embedding
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+COMMENT ON TABLE ad_embedding IS 'Embeddings of ads for similar creative search';
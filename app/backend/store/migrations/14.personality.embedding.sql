@@ -0,0 +1,37 @@
+-- Migration for personality embeddings
+-- Adds the summary column the personality table was missing, and holds an
+-- embedding of each personality's rendered profile (Personality.profile())
+-- with an HNSW index for semantic persona search by cosine distance. An
+-- embedding older than its personality's updated_at is stale.
+
+ALTER TABLE personality ADD COLUMN IF NOT EXISTS summary TEXT;
+
+COMMENT ON COLUMN personality.summary IS 'One sentence summary of the personality';
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS personality_embedding (
+    personality_id UUID PRIMARY KEY, -- The personality embedded
+    model TEXT NOT NULL, -- Embedder that produced the embedding
+    embedding vector(768) NOT NULL, -- Unit length embedding of the profile
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was created
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was last updated
+
+    CONSTRAINT fk_personality
+        FOREIGN KEY(personality_id)
+        REFERENCES personality(id)
+        ON DELETE CASCADE
+);
+
+-- Trigger to automatically update the updated_at timestamp
+CREATE TRIGGER update_personality_embedding_updated_at
+BEFORE UPDATE ON personality_embedding
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
+-- Index for nearest neighbour search
+CREATE INDEX IF NOT EXISTS idx_personality_embedding_hnsw ON personality_embedding
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+COMMENT ON TABLE personality_embedding IS 'Embeddings of personality profiles for semantic persona search';
@@ -0,0 +1,33 @@
+-- Migration for rating embeddings
+-- Holds an embedding of each rating's thought and emotional response, so an
+-- ad's ratings can be clustered into themes. Ratings are embedded in
+-- batches after they are saved; an embedding older than its rating's
+-- updated_at is stale.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS rating_embedding (
+    rating_id UUID PRIMARY KEY, -- The rating embedded
+    model TEXT NOT NULL, -- Embedder that produced the embedding
+    embedding vector(768) NOT NULL, -- Unit length embedding of the text
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was created
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- When the record was last updated
+
+    CONSTRAINT fk_rating
+        FOREIGN KEY(rating_id)
+        REFERENCES rating(id)
+        ON DELETE CASCADE
+);
+
+-- Trigger to automatically update the updated_at timestamp
+CREATE TRIGGER update_rating_embedding_updated_at
+BEFORE UPDATE ON rating_embedding
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
+-- Index for finding ratings that say similar things
+CREATE INDEX IF NOT EXISTS idx_rating_embedding_hnsw ON rating_embedding
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+COMMENT ON TABLE rating_embedding IS 'Embeddings of rating thoughts and emotional responses for theme clustering';
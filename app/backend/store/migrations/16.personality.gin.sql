@@ -0,0 +1,16 @@
+-- Migration for personality array indexes
+-- GIN indexes on the psychographic TEXT[] columns, so containment (@>) and
+-- overlap (&&) conditions, as used by segments and persona queries, are
+-- answered from the index instead of scanning every personality.
+
+CREATE INDEX IF NOT EXISTS idx_personality_personality_traits ON personality USING GIN (personality_traits);
+CREATE INDEX IF NOT EXISTS idx_personality_values ON personality USING GIN ("values");
+CREATE INDEX IF NOT EXISTS idx_personality_attitudes ON personality USING GIN (attitudes);
+CREATE INDEX IF NOT EXISTS idx_personality_interests ON personality USING GIN (interests);
+CREATE INDEX IF NOT EXISTS idx_personality_lifestyle ON personality USING GIN (lifestyle);
+CREATE INDEX IF NOT EXISTS idx_personality_habits ON personality USING GIN (habits);
+CREATE INDEX IF NOT EXISTS idx_personality_frustrations ON personality USING GIN (frustrations);
+
+-- The remaining attributes persona queries filter on
+CREATE INDEX IF NOT EXISTS idx_personality_education_level ON personality(education_level);
+CREATE INDEX IF NOT EXISTS idx_personality_seniority_level ON personality(seniority_level);
@@ -0,0 +1,15 @@
+-- Migration for rating full-text search
+-- A generated tsvector over each rating's thought (weighted A) and
+-- emotional response (weighted B), kept current by Postgres on every
+-- write, and a GIN index so keyword and phrase lookups read only the
+-- matching ratings.
+
+ALTER TABLE rating ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(thought, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(emotional_response, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_rating_search_vector ON rating USING GIN (search_vector);
+
+COMMENT ON COLUMN rating.search_vector IS 'Full-text search document of the thought and emotional response';
@@ -0,0 +1,228 @@
+-- Migration for rating partitioning
+-- Moves rating to monthly range partitions on created_at, so vacuum and
+-- index maintenance only touch recent months, queries over a time range
+-- only read the months in it, and old months can be detached whole.
+-- Future partitions are created by PartitionStore.ensure(); rows outside
+-- every month land in rating_default.
+--
+-- A unique index on a partitioned table must include the partition key,
+-- so one (personality_id, ad_id) pair per rating can no longer be
+-- enforced on rating itself. Pairs are instead claimed in rating_pair, an
+-- unpartitioned table whose primary key enforces it, kept in sync by
+-- triggers; it also outlives detached partitions, so archived ratings
+-- still count as rated. The unused categories column and its GIN index
+-- are dropped.
+
+ALTER TABLE rating RENAME TO rating_unpartitioned;
+ALTER INDEX rating_pkey RENAME TO rating_unpartitioned_pkey;
+ALTER TABLE rating_embedding DROP CONSTRAINT IF EXISTS fk_rating;
+
+CREATE TABLE rating (
+    id UUID NOT NULL, -- Unique identifier for the rating
+    personality_id UUID NOT NULL, -- Reference to the personality
+    ad_id UUID NOT NULL, -- Reference to the ad
+    thought TEXT, -- Thought process about the ad
+    emotional_response TEXT, -- Overall emotional response
+    emotion_ids SMALLINT[] NOT NULL DEFAULT '{}', -- Canonical emotion ids
+    emotion_groups INTEGER NOT NULL DEFAULT 0, -- Bitmask of the emotion groups
+    effectiveness TEXT, -- Effectiveness on the EFFECTIVENESS scale
+    effectiveness_level SMALLINT GENERATED ALWAYS AS (
+        CASE LOWER(TRIM(effectiveness))
+            WHEN 'not relevant' THEN 1
+            WHEN 'low fit' THEN 2
+            WHEN 'neutral/okay' THEN 3
+            WHEN 'good fit' THEN 4
+            WHEN 'strong match' THEN 5
+        END
+    ) STORED,
+    model_version TEXT, -- Model that produced the rating
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(thought, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(emotional_response, '')), 'B')
+    ) STORED,
+
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), -- When the record was created; the partition key
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(), -- When the record was last updated
+
+    CONSTRAINT rating_pkey PRIMARY KEY (id, created_at),
+
+    CONSTRAINT fk_personality
+        FOREIGN KEY(personality_id)
+        REFERENCES personality(id)
+        ON DELETE CASCADE,
+
+    CONSTRAINT fk_ad
+        FOREIGN KEY(ad_id)
+        REFERENCES ad(id)
+        ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+-- Create the partition of the month a date falls in, named rating_YYYYMM,
+-- unless it exists; months are UTC
+CREATE OR REPLACE FUNCTION rating_create_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    v_start DATE := DATE_TRUNC('month', p_month)::DATE;
+    v_name TEXT := 'rating_' || TO_CHAR(v_start, 'YYYYMM');
+BEGIN
+    IF TO_REGCLASS(v_name) IS NULL THEN
+        EXECUTE FORMAT(
+            'CREATE TABLE %I PARTITION OF rating FOR VALUES FROM (%L) TO (%L)',
+            v_name,
+            v_start::TIMESTAMP AT TIME ZONE 'UTC',
+            (v_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+        );
+    END IF;
+    RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE IF NOT EXISTS rating_default PARTITION OF rating DEFAULT;
+
+-- A partition for every month with ratings, through three months ahead.
+-- Ratings saved without timestamps get the time of the migration.
+DO $$
+DECLARE
+    v_month DATE;
+BEGIN
+    SELECT DATE_TRUNC('month', MIN(COALESCE(created_at, updated_at, NOW())) AT TIME ZONE 'UTC')::DATE
+    INTO v_month
+    FROM rating_unpartitioned;
+
+    v_month := LEAST(
+        COALESCE(v_month, CURRENT_DATE),
+        DATE_TRUNC('month', NOW() AT TIME ZONE 'UTC')::DATE
+    );
+    WHILE v_month <= (NOW() AT TIME ZONE 'UTC' + INTERVAL '3 months')::DATE LOOP
+        PERFORM rating_create_partition(v_month);
+        v_month := (v_month + INTERVAL '1 month')::DATE;
+    END LOOP;
+END;
+$$;
+
+INSERT INTO rating (
+    id, personality_id, ad_id, thought, emotional_response, emotion_ids,
+    emotion_groups, effectiveness, model_version, created_at, updated_at
+)
+SELECT
+    id, personality_id, ad_id, thought, emotional_response, emotion_ids,
+    emotion_groups, effectiveness, model_version,
+    COALESCE(created_at, updated_at, NOW()),
+    COALESCE(updated_at, created_at, NOW())
+FROM rating_unpartitioned;
+
+DROP TABLE rating_unpartitioned;
+
+-- Indexes, created on every partition
+CREATE INDEX IF NOT EXISTS idx_rating_personality ON rating(personality_id);
+CREATE INDEX IF NOT EXISTS idx_rating_ad ON rating(ad_id);
+CREATE INDEX IF NOT EXISTS idx_rating_created_at ON rating(created_at);
+CREATE INDEX IF NOT EXISTS idx_rating_updated_at ON rating(updated_at);
+CREATE INDEX IF NOT EXISTS idx_rating_emotion_ids ON rating USING GIN(emotion_ids);
+CREATE INDEX IF NOT EXISTS idx_rating_effectiveness_level ON rating(effectiveness_level);
+CREATE INDEX IF NOT EXISTS idx_rating_ad_effectiveness_level ON rating(ad_id, effectiveness_level);
+CREATE INDEX IF NOT EXISTS idx_rating_model_version ON rating(model_version);
+CREATE INDEX IF NOT EXISTS idx_rating_search_vector ON rating USING GIN(search_vector);
+
+-- The rating of each (personality, ad) pair
+CREATE TABLE IF NOT EXISTS rating_pair (
+    personality_id UUID NOT NULL, -- Reference to the personality
+    ad_id UUID NOT NULL, -- Reference to the ad
+    rating_id UUID NOT NULL, -- The pair's rating
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL, -- When the rating was created, to find its partition
+
+    CONSTRAINT idx_unique_personality_ad PRIMARY KEY (personality_id, ad_id),
+
+    CONSTRAINT fk_personality
+        FOREIGN KEY(personality_id)
+        REFERENCES personality(id)
+        ON DELETE CASCADE,
+
+    CONSTRAINT fk_ad
+        FOREIGN KEY(ad_id)
+        REFERENCES ad(id)
+        ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_rating_pair_ad ON rating_pair(ad_id);
+
+INSERT INTO rating_pair (personality_id, ad_id, rating_id, created_at)
+SELECT personality_id, ad_id, id, created_at FROM rating
+ON CONFLICT DO NOTHING;
+
+-- Claim a rating's pair as it is written, and release it when the rating
+-- is deleted. A pair already claimed by the same rating, as done ahead of
+-- the insert by RatingStore.copy_ratings(), is accepted; one claimed by
+-- another rating is a unique violation, as the index on rating was.
+CREATE OR REPLACE FUNCTION update_rating_pair()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM rating_pair
+        WHERE personality_id = OLD.personality_id
+            AND ad_id = OLD.ad_id
+            AND rating_id = OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO rating_pair (personality_id, ad_id, rating_id, created_at)
+        VALUES (NEW.personality_id, NEW.ad_id, NEW.id, NEW.created_at)
+        ON CONFLICT (personality_id, ad_id) DO NOTHING;
+        IF NOT FOUND AND NOT EXISTS (
+            SELECT 1 FROM rating_pair
+            WHERE personality_id = NEW.personality_id
+                AND ad_id = NEW.ad_id
+                AND rating_id = NEW.id
+        ) THEN
+            RAISE unique_violation USING
+                MESSAGE = 'duplicate key value violates unique constraint "idx_unique_personality_ad"',
+                DETAIL = FORMAT(
+                    'Key (personality_id, ad_id)=(%s, %s) already exists.',
+                    NEW.personality_id, NEW.ad_id
+                );
+        END IF;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM rating_embedding WHERE rating_id = OLD.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_rating_pair_on_insert_delete
+AFTER INSERT OR DELETE ON rating
+FOR EACH ROW
+EXECUTE FUNCTION update_rating_pair();
+
+CREATE TRIGGER update_rating_pair_on_update
+AFTER UPDATE OF personality_id, ad_id ON rating
+FOR EACH ROW
+WHEN (
+    OLD.personality_id IS DISTINCT FROM NEW.personality_id
+    OR OLD.ad_id IS DISTINCT FROM NEW.ad_id
+)
+EXECUTE FUNCTION update_rating_pair();
+
+-- The triggers of the old table, recreated after the copy so the rating
+-- summaries aren't counted twice
+CREATE TRIGGER update_rating_updated_at
+BEFORE UPDATE ON rating
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TRIGGER update_rating_summary_on_insert_delete
+AFTER INSERT OR DELETE ON rating
+FOR EACH ROW
+EXECUTE FUNCTION update_rating_summary();
+
+CREATE TRIGGER update_rating_summary_on_update
+AFTER UPDATE OF ad_id, effectiveness, emotion_ids, emotion_groups ON rating
+FOR EACH ROW
+WHEN (
+    OLD.ad_id IS DISTINCT FROM NEW.ad_id
+    OR OLD.effectiveness_level IS DISTINCT FROM NEW.effectiveness_level
+    OR OLD.emotion_groups IS DISTINCT FROM NEW.emotion_groups
+)
+EXECUTE FUNCTION update_rating_summary();
+
+COMMENT ON TABLE rating IS 'Ratings of ads by personalities, partitioned by month of created_at';
+COMMENT ON TABLE rating_pair IS 'The rating of each (personality, ad) pair, enforcing one per pair across partitions';
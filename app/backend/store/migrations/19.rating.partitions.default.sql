@@ -0,0 +1,63 @@
+-- Migration for ratings in the default partition
+-- A partition can't be created for a month whose ratings already fell
+-- into rating_default, as when partition maintenance fell behind. Such
+-- ratings are now moved into the month's partition as it is created.
+
+-- Create the partition of the month a date falls in, named rating_YYYYMM,
+-- unless it exists; months are UTC. Ratings of the month in the default
+-- partition are moved into it: the default is detached meanwhile, so no
+-- trigger sees the move and the ratings' pairs, embeddings and summaries
+-- are left as they are.
+CREATE OR REPLACE FUNCTION rating_create_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    v_start DATE := DATE_TRUNC('month', p_month)::DATE;
+    v_name TEXT := 'rating_' || TO_CHAR(v_start, 'YYYYMM');
+    v_from TIMESTAMP WITH TIME ZONE := v_start::TIMESTAMP AT TIME ZONE 'UTC';
+    v_to TIMESTAMP WITH TIME ZONE := (v_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC';
+    v_columns TEXT;
+BEGIN
+    IF TO_REGCLASS(v_name) IS NOT NULL THEN
+        RETURN v_name;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM rating_default WHERE created_at >= v_from AND created_at < v_to
+    ) THEN
+        EXECUTE FORMAT(
+            'CREATE TABLE %I PARTITION OF rating FOR VALUES FROM (%L) TO (%L)',
+            v_name, v_from, v_to
+        );
+        RETURN v_name;
+    END IF;
+
+    -- Generated columns are computed again as the rows are inserted
+    SELECT STRING_AGG(QUOTE_IDENT(attname), ', ' ORDER BY attnum)
+    INTO v_columns
+    FROM pg_attribute
+    WHERE attrelid = 'rating'::REGCLASS
+        AND attnum > 0
+        AND NOT attisdropped
+        AND attgenerated = '';
+
+    ALTER TABLE rating DETACH PARTITION rating_default;
+    EXECUTE FORMAT(
+        'CREATE TABLE %I (LIKE rating INCLUDING DEFAULTS INCLUDING GENERATED)',
+        v_name
+    );
+    EXECUTE FORMAT(
+        'WITH moved AS ('
+        '    DELETE FROM rating_default'
+        '    WHERE created_at >= %L AND created_at < %L'
+        '    RETURNING %s'
+        ') INSERT INTO %I (%s) SELECT %s FROM moved',
+        v_from, v_to, v_columns, v_name, v_columns, v_columns
+    );
+    EXECUTE FORMAT(
+        'ALTER TABLE rating ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        v_name, v_from, v_to
+    );
+    ALTER TABLE rating ATTACH PARTITION rating_default DEFAULT;
+    RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
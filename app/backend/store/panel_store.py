@@ -0,0 +1,162 @@
+from typing import Dict, List, Optional, Any
+
+from app.backend.models.panel import Panel
+from app.backend.store.db import Pool
+
+
+class PanelStore:
+    """
+    Store class for handling CRUD operations for Panel objects. A panel is
+    written once when built; its clusters and members are never updated.
+    """
+
+    def __init__(self, db_pool: Pool):
+        """
+        Initialize the PanelStore with a database pool.
+
+        Args:
+            db_pool: Database connection pool
+        """
+        self.db_pool = db_pool
+        self.table_name = "panel"
+        self.cluster_table = "panel_cluster"
+        self.member_table = "panel_member"
+
+    def create(self, panel: Panel) -> Optional[str]:
+        """
+        Create a panel along with its clusters and member assignments.
+        Members are COPYed in, as a panel may cover every personality.
+
+        Args:
+            panel: Panel object to create
+
+        Returns:
+            ID of the created panel if successful, None otherwise
+        """
+        # The panel, its clusters and its members are written together, so
+        # a failure never leaves a panel without them
+        try:
+            with self.db_pool.get_transaction() as transaction:
+                with transaction.atomic():
+                    data = {
+                        "id": panel.id,
+                        "name": panel.name,
+                        "personalities": len(panel.members),
+                        "clusters": len(panel.clusters),
+                    }
+                    transaction.insert(self.table_name, data)
+                    transaction.copy_upsert(
+                        self.cluster_table,
+                        ["panel_id", "cluster", "medoid_id", "weight"],
+                        [
+                            {
+                                "panel_id": panel.id,
+                                "cluster": cluster["cluster"],
+                                "medoid_id": cluster["medoid"],
+                                "weight": cluster["weight"],
+                            }
+                            for cluster in panel.clusters
+                        ],
+                        "panel_id, cluster",
+                    )
+                    transaction.copy_upsert(
+                        self.member_table,
+                        ["panel_id", "personality_id", "cluster"],
+                        [
+                            {
+                                "panel_id": panel.id,
+                                "personality_id": personality_id,
+                                "cluster": cluster,
+                            }
+                            for personality_id, cluster in panel.members.items()
+                        ],
+                        "panel_id, personality_id",
+                    )
+        except Exception as e:
+            print(f"Error creating panel: {e}")
+            return None
+        return panel.id
+
+    def get(self, panel_id: str) -> Optional[Panel]:
+        """
+        Get a panel by ID, with its clusters and members.
+
+        Args:
+            panel_id: ID of the panel to retrieve
+
+        Returns:
+            Panel object if found, None otherwise
+        """
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            result = transaction.get_by_id(self.table_name, panel_id)
+            if not result:
+                return None
+
+            clusters = transaction.query(
+                f"""
+                SELECT cluster, medoid_id, weight
+                FROM {self.cluster_table}
+                WHERE panel_id = %s
+                ORDER BY cluster
+                """,
+                (panel_id,),
+            )
+            members = transaction.query(
+                f"""
+                SELECT personality_id, cluster
+                FROM {self.member_table}
+                WHERE panel_id = %s
+                """,
+                (panel_id,),
+            )
+
+        return Panel(
+            id=str(result["id"]),
+            name=result["name"],
+            clusters=[
+                {
+                    "cluster": row["cluster"],
+                    "medoid": str(row["medoid_id"]),
+                    "weight": row["weight"],
+                }
+                for row in clusters
+            ],
+            members={
+                str(row["personality_id"]): row["cluster"] for row in members
+            },
+            created_at=result["created_at"],
+        )
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        """
+        List all panels, without their clusters and members.
+
+        Returns:
+            List of panel records, newest first
+        """
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            return transaction.query(
+                f"""
+                SELECT id, name, personalities, clusters, created_at
+                FROM {self.table_name}
+                ORDER BY created_at DESC
+                """
+            )
+
+    def delete(self, panel_id: str) -> bool:
+        """
+        Delete a panel; its clusters and members cascade.
+
+        Args:
+            panel_id: ID of the panel to delete
+
+        Returns:
+            True if successful, False otherwise
+        """
+        with self.db_pool.get_transaction() as transaction:
+            rows_affected = transaction.delete(
+                self.table_name,
+                "id = %s",
+                (panel_id,)
+            )
+            return rows_affected > 0
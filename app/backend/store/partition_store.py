@@ -0,0 +1,211 @@
+import argparse
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.backend.store.db import Pool
+
+
+_PARTITION = re.compile(r"^rating_(\d{4})(\d{2})$")
+
+
+def month_start(value: date) -> date:
+    """First day of the month a date falls in."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    """First day of the month some months after (or before) a date's."""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class PartitionStore:
+    """
+    Maintains the monthly partitions of the rating table (see migration
+    18.rating.partitions.sql): creates partitions ahead of the ratings
+    that will land in them, and detaches old ones so they stop weighing on
+    vacuum and the indexes. Months are UTC.
+    """
+
+    def __init__(self, db_pool: Pool):
+        """
+        Initialize the PartitionStore with a database pool.
+
+        Args:
+            db_pool: Database connection pool
+        """
+        self.db_pool = db_pool
+        self.table_name = "rating"
+        self.default_partition = "rating_default"
+        self.embedding_table = "rating_embedding"
+
+    def __month(self, name: str) -> Optional[date]:
+        match = _PARTITION.match(name)
+        return date(int(match[1]), int(match[2]), 1) if match else None
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        """
+        List the monthly partitions attached to the rating table.
+
+        Returns:
+            List of dictionaries with each partition's "name", the "start"
+            and "end" of its month (end exclusive) and the planner's
+            estimate of its "rows", oldest first
+        """
+        with self.db_pool.get_transaction() as transaction:
+            results = transaction.query(
+                """
+                SELECT c.relname AS name, c.reltuples AS rows
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass
+                """,
+                (self.table_name,),
+            )
+
+        partitions = []
+        for result in results:
+            start = self.__month(result["name"])
+            if start is not None:
+                partitions.append({
+                    "name": result["name"],
+                    "start": start,
+                    "end": add_months(start, 1),
+                    # -1 until the partition is first analyzed
+                    "rows": max(int(result["rows"]), 0),
+                })
+        partitions.sort(key=lambda p: p["start"])
+        return partitions
+
+    def list_detached(self) -> List[str]:
+        """
+        List the monthly partitions that were detached and still exist as
+        standalone tables, oldest first.
+        """
+        with self.db_pool.get_transaction() as transaction:
+            results = transaction.query(
+                """
+                SELECT c.relname AS name
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE c.relkind = 'r'
+                    AND n.nspname = current_schema()
+                    AND c.relname ~ '^rating_[0-9]{6}$'
+                    AND NOT c.relispartition
+                ORDER BY c.relname
+                """
+            )
+        return [result["name"] for result in results]
+
+    def ensure(self, months_ahead: int = 3, today: Optional[date] = None) -> List[str]:
+        """
+        Create the partitions of the current month and the next ones,
+        unless they exist. Run at startup and regularly, so ratings never
+        fall through to the default partition; those that did are moved
+        into their month's partition as it is created.
+
+        Args:
+            months_ahead: Number of months after the current one to create
+            today: Date to count from; today (UTC) by default
+
+        Returns:
+            Names of the partitions of those months
+
+        Raises:
+            ValueError: If months_ahead is negative
+            psycopg2.Error: If a partition couldn't be created; none are
+        """
+        if months_ahead < 0:
+            raise ValueError("months_ahead must not be negative")
+        start = month_start(today or datetime.now(timezone.utc).date())
+
+        names = []
+        with self.db_pool.get_transaction() as transaction, transaction.atomic():
+            for offset in range(months_ahead + 1):
+                results = transaction.query(
+                    "SELECT rating_create_partition(%s) AS name",
+                    (add_months(start, offset),),
+                )
+                names.append(results[0]["name"])
+        return names
+
+    def detach_before(self, cutoff: date) -> List[str]:
+        """
+        Detach the partitions of the months that end on or before a date.
+        Their ratings leave the rating table, and the queries and indexes
+        over it, but stay in the standalone partition tables, to archive or
+        drop; the pairs they rated stay claimed in rating_pair, so they are
+        not rated again. Their embeddings are deleted.
+
+        Args:
+            cutoff: Date before which whole months are detached
+
+        Returns:
+            Names of the partitions detached
+        """
+        detached = []
+        for partition in self.list_all():
+            if partition["end"] > cutoff:
+                continue
+            name = partition["name"]
+            with self.db_pool.get_transaction() as transaction:
+                if not transaction.execute(
+                    f"ALTER TABLE {self.table_name} DETACH PARTITION {name}"
+                ):
+                    continue
+                transaction.execute(
+                    f"""
+                    DELETE FROM {self.embedding_table} e
+                    USING {name} r
+                    WHERE e.rating_id = r.id
+                    """
+                )
+            detached.append(name)
+        return detached
+
+
+def main():
+    """
+    Maintain the monthly partitions of the rating table: create those of
+    the coming months and, with --retain-months, detach those older than
+    that many whole months, against the database configured by the same
+    POSTGRES_* variables as the server. Meant to run daily, e.g. from cron.
+
+        python -m app.backend.store.partition_store maintain [--ahead N] [--retain-months N]
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["maintain"])
+    parser.add_argument(
+        "--ahead", type=int, default=3, help="Months ahead to create partitions for"
+    )
+    parser.add_argument(
+        "--retain-months",
+        type=int,
+        default=None,
+        help="Whole months before the current one to keep attached",
+    )
+    args = parser.parse_args()
+
+    store = PartitionStore(
+        Pool(
+            host=os.environ.get("POSTGRES_HOST", "localhost"),
+            port=int(os.environ.get("POSTGRES_PORT", "5432")),
+            dbname=os.environ.get("POSTGRES_DB", "app"),
+            user=os.environ.get("POSTGRES_USER", "postgres"),
+            password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
+        )
+    )
+
+    print(f"Partitions ready: {', '.join(store.ensure(args.ahead))}")
+    if args.retain_months is not None:
+        cutoff = add_months(
+            datetime.now(timezone.utc).date(), -args.retain_months
+        )
+        detached = store.detach_before(cutoff)
+        print(f"Detached {len(detached)} partitions: {', '.join(detached)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from uuid import uuid4
 
+from app.backend.embeddings import Embedder
 from app.backend.models.personality import Personality
-from app.backend.store.db import Pool
+from app.backend.persona_query import PersonaQuery
+from app.backend.store.db import Pool, to_vector
 
 
 class PersonalityStore:
@@ -10,15 +12,46 @@ class PersonalityStore:
     Store class for handling CRUD operations for Personality objects.
     """
 
-    def __init__(self, db_pool: Pool):
+    # Columns written by bulk_upsert(); created_at and updated_at are left
+    # to their defaults.
+    BULK_COLUMNS = [
+        "id",
+        "name",
+        "age",
+        "gender",
+        "location",
+        "education_level",
+        "marital_status",
+        "children",
+        "occupation",
+        "job_title",
+        "industry",
+        "income",
+        "seniority_level",
+        "personality_traits",
+        "values",
+        "attitudes",
+        "interests",
+        "lifestyle",
+        "habits",
+        "frustrations",
+        "summary",
+    ]
+
+    def __init__(self, db_pool: Pool, embedder: Optional[Embedder] = None):
         """
         Initialize the PersonalityStore with a database pool.
 
         Args:
             db_pool: Database connection pool
+            embedder: Embedder of personality profiles; if given, profiles
+                are embedded as personalities are created and updated, and
+                can be searched
         """
         self.db_pool = db_pool
+        self.embedder = embedder
         self.table_name = "personality"
+        self.embedding_table = "personality_embedding"
 
     def create(self, personality: Personality) -> Optional[str]:
         """
@@ -32,7 +65,33 @@ class PersonalityStore:
         """
         with self.db_pool.get_transaction() as transaction:
             data = personality.to_dict()
-            return transaction.insert(self.table_name, data)
+            if not transaction.insert(self.table_name, data):
+                return None
+        if self.embedder:
+            self.embed([personality])
+        return data["id"]
+
+    def bulk_upsert(self, personalities: List[Personality]) -> Dict[str, int]:
+        """
+        Insert or update many personalities at once. The records are loaded
+        with COPY into a staging table and merged on id in one statement,
+        in a single transaction. They aren't embedded; embed_stale() catches
+        up with them.
+
+        Args:
+            personalities: Personality objects to load; ids must be unique
+
+        Returns:
+            Dictionary with the number of "inserted" and "updated" records
+        """
+        if not personalities:
+            return {"inserted": 0, "updated": 0}
+
+        with self.db_pool.get_transaction() as transaction:
+            rows = [personality.to_dict() for personality in personalities]
+            return transaction.copy_upsert(
+                self.table_name, self.BULK_COLUMNS, rows, "id"
+            )
 
     def get(self, personality_id: str) -> Optional[Personality]:
         """
@@ -44,12 +103,36 @@ class PersonalityStore:
         Returns:
             Personality object if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             result = transaction.get_by_id(self.table_name, personality_id)
             if result:
                 return Personality.from_dict(result)
             return None
 
+    def get_many(self, personality_ids: List[str]) -> Dict[str, Personality]:
+        """
+        Get several personalities by ID in a single query.
+
+        Args:
+            personality_ids: IDs of the personalities to retrieve
+
+        Returns:
+            Dictionary of Personality objects keyed by ID; missing
+            personalities are absent
+        """
+        if not personality_ids:
+            return {}
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                f"SELECT * FROM {self.table_name} WHERE id = ANY(%s::uuid[])",
+                (list(personality_ids),),
+            )
+            return {
+                str(result["id"]): Personality.from_dict(result)
+                for result in results
+            }
+
     def update(self, personality: Personality) -> bool:
         """
         Update an existing personality record.
@@ -69,7 +152,115 @@ class PersonalityStore:
                 "id = %s", 
                 (personality_id,)
             )
-            return rows_affected > 0
+        if rows_affected > 0 and self.embedder:
+            self.embed([personality])
+        return rows_affected > 0
+
+    def embed(self, personalities: List[Personality]) -> int:
+        """
+        Embed the profiles of personalities, replacing any earlier
+        embeddings. Failures are reported rather than raised, leaving the
+        personalities for embed_stale() to retry.
+
+        Args:
+            personalities: Personalities to embed
+
+        Returns:
+            Number of personalities embedded
+        """
+        if not personalities:
+            return 0
+        try:
+            vectors = self.embedder.embed_texts([p.profile() for p in personalities])
+        except Exception as e:
+            print(f"Error embedding personalities: {e}")
+            return 0
+
+        rows = [
+            {
+                "personality_id": personality.id,
+                "model": self.embedder.name,
+                "embedding": to_vector(vector),
+            }
+            for personality, vector in zip(personalities, vectors)
+        ]
+        with self.db_pool.get_transaction() as transaction:
+            counts = transaction.copy_upsert(
+                self.embedding_table,
+                ["personality_id", "model", "embedding"],
+                rows,
+                "personality_id",
+            )
+        return counts["inserted"] + counts["updated"]
+
+    def embed_stale(self, batch_size: int = 100) -> int:
+        """
+        Embed every personality whose embedding is missing, older than its
+        last update, or made by another embedder, in batches.
+
+        Args:
+            batch_size: Personalities embedded per batch
+
+        Returns:
+            Number of personalities embedded
+        """
+        embedded = 0
+        while True:
+            with self.db_pool.get_transaction() as transaction:
+                results = transaction.query(
+                    f"""
+                    SELECT p.*
+                    FROM {self.table_name} p
+                    LEFT JOIN {self.embedding_table} e ON e.personality_id = p.id
+                    WHERE e.personality_id IS NULL
+                        OR e.updated_at < p.updated_at
+                        OR e.model <> %s
+                    LIMIT %s
+                    """,
+                    (self.embedder.name, batch_size),
+                )
+            batch = [Personality.from_dict(result) for result in results]
+            count = self.embed(batch)
+            embedded += count
+            # Stop at the end, or when a batch fails rather than retrying it
+            if len(batch) < batch_size or count < len(batch):
+                return embedded
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Personality, float]]:
+        """
+        Find the personalities whose profiles are most similar in meaning to
+        a free text description, through the HNSW index.
+
+        Args:
+            query: Description of the personas sought, e.g. "budget
+                conscious young parent"
+            k: Maximum number of personalities to return
+
+        Returns:
+            List of (Personality, cosine similarity) pairs, most similar
+            first
+
+        Raises:
+            ValueError: If the store has no embedder
+        """
+        if not self.embedder:
+            raise ValueError("Personality search needs an embedder")
+        vector = self.embedder.embed_texts([query], query=True)[0]
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.vector_search(
+                f"{self.embedding_table} e JOIN {self.table_name} p ON p.id = e.personality_id",
+                "e.embedding",
+                vector,
+                limit=k,
+                distance_type="cosine",
+                columns="p.*",
+            )
+        found = []
+        for result in results:
+            distance = result.pop("distance")
+            found.append((Personality.from_dict(result), 1 - distance))
+        return found
 
     def delete(self, personality_id: str) -> bool:
         """
@@ -96,7 +287,7 @@ class PersonalityStore:
         Returns:
             List of Personality objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             results = transaction.query(f"SELECT * FROM {self.table_name}")
             return [Personality.from_dict(result) for result in results]
 
@@ -105,29 +296,170 @@ class PersonalityStore:
         Find personalities matching the given criteria.
 
         Args:
-            criteria: Dictionary of field names and values to match
+            criteria: Dictionary of field names and values to match; list
+                values match array fields containing all of them
 
         Returns:
             List of matching Personality objects
-        """
-        if not criteria:
-            return self.list_all()
 
-        conditions = []
-        params = []
-        
+        Raises:
+            ValueError: If a field is unknown (see segments.SEGMENT_FIELDS)
+                or its value invalid
+        """
+        query = PersonaQuery()
         for key, value in criteria.items():
-            if isinstance(value, list):
-                # Handle array fields
-                conditions.append(f"{key} @> %s")
-                params.append(value)
-            else:
-                conditions.append(f"{key} = %s")
-                params.append(value)
-                
-        where_clause = " AND ".join(conditions)
-        
-        with self.db_pool.get_transaction() as transaction:
-            query = f"SELECT * FROM {self.table_name} WHERE {where_clause}"
-            results = transaction.query(query, tuple(params))
-            return [Personality.from_dict(result) for result in results]
+            query.where(key, "contains" if isinstance(value, list) else "=", value)
+        return self.query(query)
+
+    def query(self, query: PersonaQuery) -> List[Personality]:
+        """
+        Find the personalities matching a query.
+
+        Args:
+            query: The query, with its ordering and page
+
+        Returns:
+            List of matching Personality objects, in the query's order
+        """
+        sql, params = query.to_sql(self.table_name)
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(sql, params)
+        return [Personality.from_dict(result) for result in results]
+
+    def explain(self, query: PersonaQuery) -> Dict[str, Any]:
+        """
+        Get the planner's estimate for a query, without running it, to check
+        that it is index-backed.
+
+        Args:
+            query: The query
+
+        Returns:
+            Dictionary with the plan's "startup_cost" and "total_cost" in
+            planner cost units, the estimated "rows", the "indexes" it
+            reads, its "nodes" in depth-first order and the full "plan"
+        """
+        sql, params = query.to_sql(self.table_name)
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        if not results:
+            return {}
+
+        plan = results[0]["QUERY PLAN"][0]["Plan"]
+        nodes, indexes = [], []
+        stack = [plan]
+        while stack:
+            node = stack.pop()
+            nodes.append(node["Node Type"])
+            if "Index Name" in node and node["Index Name"] not in indexes:
+                indexes.append(node["Index Name"])
+            stack.extend(reversed(node.get("Plans", [])))
+        return {
+            "startup_cost": plan["Startup Cost"],
+            "total_cost": plan["Total Cost"],
+            "rows": plan["Plan Rows"],
+            "indexes": indexes,
+            "nodes": nodes,
+            "plan": plan,
+        }
+
+    def select(
+        self,
+        personality_ids: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        gender: Optional[str] = None,
+        location: Optional[str] = None,
+        industry: Optional[str] = None,
+        min_income: Optional[float] = None,
+        max_income: Optional[float] = None,
+    ) -> Tuple[Dict[str, Personality], List[str]]:
+        """
+        Resolve a personality selection in a single query. The
+        selection is the given IDs plus the members of the given category,
+        narrowed by the attribute filters (which map onto the indexed
+        personality columns). With no IDs and no category, the filters
+        select from every personality.
+
+        Args:
+            personality_ids: Explicit personality IDs to include
+            category: Name of a category whose members to include
+            min_age: Minimum age, inclusive
+            max_age: Maximum age, inclusive
+            gender: Exact gender
+            location: Exact location
+            industry: Exact industry
+            min_income: Minimum income, inclusive
+            max_income: Maximum income, inclusive
+
+        Returns:
+            The selected Personality objects keyed by ID, and any of the
+            explicitly given IDs that do not exist
+        """
+        personality_ids = list(
+            dict.fromkeys(pid.lower() for pid in personality_ids or [])
+        )
+
+        filters = []
+        filter_params = []
+        for condition, value in [
+            ("p.age >= %s", min_age),
+            ("p.age <= %s", max_age),
+            ("p.gender = %s", gender),
+            ("p.location = %s", location),
+            ("p.industry = %s", industry),
+            ("p.income >= %s", min_income),
+            ("p.income <= %s", max_income),
+        ]:
+            if value is not None:
+                filters.append(condition)
+                filter_params.append(value)
+        filter_clause = " AND ".join(filters) if filters else "TRUE"
+
+        sources = []
+        source_params = []
+        if personality_ids:
+            sources.append("p.id = ANY(%s::uuid[])")
+            source_params.append(personality_ids)
+        if category:
+            sources.append(
+                """p.id IN (
+                    SELECT a.personality_id
+                    FROM category_assignment a
+                    JOIN category c ON a.category_id = c.id
+                    WHERE c.name = %s
+                )"""
+            )
+            source_params.append(category)
+
+        if sources:
+            # Filters are evaluated per row rather than in the WHERE clause so
+            # explicitly requested IDs can be told apart from missing ones
+            query = f"""
+                SELECT
+                    p.*,
+                    COALESCE({filter_clause}, FALSE) as selected
+                FROM {self.table_name} p
+                WHERE {" OR ".join(sources)}
+            """
+            params = tuple(filter_params + source_params)
+        else:
+            query = f"""
+                SELECT p.*, TRUE as selected
+                FROM {self.table_name} p
+                WHERE {filter_clause}
+            """
+            params = tuple(filter_params)
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(query, params)
+
+        found = {str(result["id"]) for result in results}
+        missing = [pid for pid in personality_ids if pid not in found]
+
+        selected = {}
+        for result in results:
+            if result.pop("selected"):
+                selected[str(result["id"])] = Personality.from_dict(result)
+        return selected, missing
@@ -0,0 +1,274 @@
+import bisect
+import logging
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from app.backend.store.db import Pool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the duration histograms
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Orders of QueryLog.snapshot(), and the aggregate each sorts by
+SORTS = {
+    "total": "total_ms",
+    "count": "count",
+    "mean": "mean_ms",
+    "max": "max_ms",
+    "p95": "p95_ms",
+    "errors": "errors",
+    "rows": "rows",
+}
+
+# Only statements that look like reads are explained, since EXPLAIN
+# ANALYZE runs them again; in a read-only transaction, rolled back, in
+# case they write after all
+_READ = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+_WRITE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE)\b", re.I
+)
+
+
+class QueryLog:
+    """
+    Aggregates the statements run through the store, as reported by the
+    query hooks of db.Transaction (see db.add_query_hook()), into timing
+    histograms per statement fingerprint, with the store methods that ran
+    them. Statements slower than a threshold are logged, and optionally
+    explained with EXPLAIN (ANALYZE, BUFFERS) in the background, at most
+    once per fingerprint per explain_interval.
+    """
+
+    def __init__(
+        self,
+        db_pool: Optional[Pool] = None,
+        slow_threshold: float = 0.5,
+        explain: bool = False,
+        explain_interval: float = 300.0,
+        max_fingerprints: int = 1000,
+    ):
+        """
+        Initialize the log.
+
+        Args:
+            db_pool: Pool slow statements are explained on; needed to
+                explain them
+            slow_threshold: Seconds past which a statement is logged
+            explain: Whether to explain slow statements
+            explain_interval: Seconds between explanations of the same
+                fingerprint
+            max_fingerprints: Most fingerprints tracked; statements of new
+                ones past that are only counted as dropped
+        """
+        self.db_pool = db_pool
+        self.slow_threshold = slow_threshold
+        self.explain = explain and db_pool is not None
+        self.explain_interval = explain_interval
+        self.max_fingerprints = max_fingerprints
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self.__lock:
+            self.__stats: Dict[str, Dict[str, Any]] = {}
+            self.__dropped = 0
+            self.__since = datetime.now(timezone.utc)
+
+    def record(self, event: Dict[str, Any]):
+        """
+        Record a statement; a hook for db.add_query_hook().
+
+        Args:
+            event: The statement's event, as passed to query hooks
+        """
+        # The log's own explanations aren't recorded
+        if getattr(self.__local, "explaining", False):
+            return
+
+        duration = event["duration"]
+        slow = duration >= self.slow_threshold
+        explain = False
+        with self.__lock:
+            stats = self.__stats.get(event["id"])
+            if stats is None:
+                if len(self.__stats) >= self.max_fingerprints:
+                    self.__dropped += 1
+                    return
+                stats = self.__stats[event["id"]] = {
+                    "fingerprint": event["fingerprint"],
+                    "count": 0,
+                    "errors": 0,
+                    "slow": 0,
+                    "rows": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "buckets": [0] * (len(BUCKETS) + 1),
+                    "callers": Counter(),
+                    "explained_at": None,
+                    "explain": None,
+                }
+
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["buckets"][bisect.bisect_left(BUCKETS, duration)] += 1
+            stats["rows"] += max(event["rows"], 0)
+            stats["callers"][event["caller"] or "unknown"] += 1
+            if event["error"]:
+                stats["errors"] += 1
+            if slow:
+                stats["slow"] += 1
+                if (
+                    self.explain
+                    and not event["error"]
+                    and _READ.match(event["statement"])
+                    and not _WRITE.search(event["statement"])
+                    and (
+                        stats["explained_at"] is None
+                        or monotonic() - stats["explained_at"]
+                        >= self.explain_interval
+                    )
+                ):
+                    stats["explained_at"] = monotonic()
+                    explain = True
+
+        if slow:
+            logger.warning(
+                "Slow query %s took %.1f ms (%d rows) in %s: %s",
+                event["id"],
+                duration * 1000,
+                event["rows"],
+                event["caller"],
+                event["fingerprint"],
+            )
+        if explain:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="query-explain"
+                )
+            self.__executor.submit(
+                self.__explain, event["id"], event["statement"], event["params"]
+            )
+
+    def snapshot(self, sort: str = "total", limit: int = 50) -> Dict[str, Any]:
+        """
+        Aggregates of the statements recorded, worst first.
+
+        Args:
+            sort: What to order by, one of SORTS; "total" time by default
+            limit: Number of fingerprints returned
+
+        Returns:
+            Dictionary with the time recording started ("since"), the
+            "slow_threshold_ms", the number of statements "dropped" and
+            the "queries", each with its "id", "fingerprint", "count",
+            "errors", "slow" count, "rows", "total_ms", "mean_ms", "max_ms",
+            estimated "p50_ms", "p95_ms" and "p99_ms", cumulative
+            "histogram" of durations, "callers" and latest "explain", if any
+
+        Raises:
+            ValueError: If sort isn't one of SORTS
+        """
+        if sort not in SORTS:
+            raise ValueError(
+                f"Invalid sort {sort}, must be one of {', '.join(sorted(SORTS))}"
+            )
+
+        with self.__lock:
+            queries = [
+                self.__summary(query_id, stats)
+                for query_id, stats in self.__stats.items()
+            ]
+            dropped = self.__dropped
+            since = self.__since
+
+        queries.sort(key=lambda query: query[SORTS[sort]], reverse=True)
+        return {
+            "since": since.isoformat(),
+            "slow_threshold_ms": self.slow_threshold * 1000,
+            "dropped": dropped,
+            "queries": queries[:limit],
+        }
+
+    @staticmethod
+    def __summary(query_id: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        count = stats["count"]
+
+        def quantile(q: float) -> float:
+            # The upper bound of the bucket the quantile falls in, or the
+            # slowest run past the last bucket
+            seen = 0
+            for i, bucket in enumerate(stats["buckets"]):
+                seen += bucket
+                if seen >= q * count:
+                    bound = BUCKETS[i] if i < len(BUCKETS) else stats["max"]
+                    return min(bound, stats["max"]) * 1000
+            return stats["max"] * 1000
+
+        histogram = []
+        seen = 0
+        for i, bucket in enumerate(stats["buckets"]):
+            seen += bucket
+            histogram.append({
+                "le_ms": BUCKETS[i] * 1000 if i < len(BUCKETS) else None,
+                "count": seen,
+            })
+
+        return {
+            "id": query_id,
+            "fingerprint": stats["fingerprint"],
+            "count": count,
+            "errors": stats["errors"],
+            "slow": stats["slow"],
+            "rows": stats["rows"],
+            "total_ms": stats["total"] * 1000,
+            "mean_ms": stats["total"] / count * 1000,
+            "max_ms": stats["max"] * 1000,
+            "p50_ms": quantile(0.5),
+            "p95_ms": quantile(0.95),
+            "p99_ms": quantile(0.99),
+            "histogram": histogram,
+            "callers": dict(stats["callers"].most_common()),
+            "explain": stats["explain"],
+        }
+
+    def __explain(self, query_id: str, statement: str, params: Any):
+        """
+        Explain a slow statement, and keep the plan with its stats.
+        EXPLAIN ANALYZE runs the statement, so it runs in a read-only
+        transaction that is always rolled back: a statement that writes
+        after all, e.g. through a function, fails or leaves no trace.
+        """
+        self.__local.explaining = True
+        try:
+            with self.db_pool.get_transaction(read_only=True) as transaction:
+                with transaction.atomic(read_only=True, rollback=True):
+                    results = transaction.query(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {statement}", params
+                    )
+            if not results:
+                raise ValueError("no plan returned")
+            plan = "\n".join(row["QUERY PLAN"] for row in results)
+        except Exception as e:
+            plan = f"Could not explain: {e}"
+        finally:
+            self.__local.explaining = False
+
+        with self.__lock:
+            stats = self.__stats.get(query_id)
+            if stats is not None:
+                stats["explain"] = {
+                    "at": datetime.now(timezone.utc).isoformat(),
+                    "plan": plan,
+                }
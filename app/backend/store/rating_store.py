@@ -1,8 +1,34 @@
-from typing import Dict, List, Optional, Any
+import html
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Any, Set, Tuple
 from uuid import uuid4
 
-from app.backend.models.rating import Rating
-from app.backend.store.db import Pool
+import numpy as np
+
+from app.backend import emotions
+from app.backend.embeddings import Embedder
+from app.backend.models.rating import (
+    EFFECTIVENESS,
+    Rating,
+    effectiveness_level,
+)
+from app.backend.segments import parse_segment, segment_sql
+from app.backend.store.archive_store import ArchiveStore
+from app.backend.store.db import Pool, to_vector
+
+# Markers ts_headline puts around the matches of a search, which can't be
+# confused with the texts' own characters
+_START, _STOP = "\x02", "\x03"
+_MARKS = _START + _STOP
+_HEADLINE_OPTIONS = (
+    f"StartSel={_START}, StopSel={_STOP}, "
+    "MaxFragments=2, MaxWords=20, MinWords=5"
+)
+
+
+def _highlight(snippet: str) -> str:
+    """HTML escape a search snippet, marking its matches with <b> tags."""
+    return html.escape(snippet).replace(_START, "<b>").replace(_STOP, "</b>")
 
 
 class RatingStore:
@@ -10,15 +36,125 @@ class RatingStore:
     Store class for handling CRUD operations for Rating objects.
     """
 
-    def __init__(self, db_pool: Pool):
+    # Columns produced by export(), in output order. Personality and ad
+    # attributes are joined in so consumers don't have to look them up.
+    EXPORT_COLUMNS = [
+        "id",
+        "personality",
+        "ad",
+        "thought",
+        "emotional_response",
+        "emotions",
+        "effectiveness",
+        "model_version",
+        "created_at",
+        "updated_at",
+        "personality_name",
+        "personality_age",
+        "personality_gender",
+        "personality_location",
+        "personality_education_level",
+        "personality_marital_status",
+        "personality_children",
+        "personality_occupation",
+        "personality_job_title",
+        "personality_industry",
+        "personality_income",
+        "personality_seniority_level",
+        "personality_personality_traits",
+        "personality_values",
+        "personality_attitudes",
+        "personality_interests",
+        "personality_lifestyle",
+        "personality_habits",
+        "personality_frustrations",
+        "ad_image",
+        "ad_copy",
+    ]
+
+    def __init__(
+        self,
+        db_pool: Pool,
+        embedder: Optional[Embedder] = None,
+        archive: Optional[ArchiveStore] = None,
+    ):
         """
         Initialize the RatingStore with a database pool.
 
         Args:
             db_pool: Database connection pool
+            embedder: Embedder of rating text, needed by embed_pending()
+            archive: Archive of old ratings that get_ratings_by_ad() and
+                get_ratings_by_personality() read through to
         """
         self.db_pool = db_pool
+        self.embedder = embedder
+        self.archive = archive
         self.table_name = "rating"
+        self.embedding_table = "rating_embedding"
+        self.pair_table = "rating_pair"
+
+    def __emotion_columns(self, names: Any) -> Dict[str, Any]:
+        """Map a rating's emotion names onto the stored id and group columns."""
+        ids = emotions.normalize_all(names or [])
+        return {"emotion_ids": ids, "emotion_groups": emotions.group_mask(ids)}
+
+    def __created_range(
+        self, created_after: Optional[datetime], created_before: Optional[datetime]
+    ) -> Tuple[str, List[Any]]:
+        """
+        Build the conditions of a created_at range, prefixed with AND,
+        which let Postgres prune the partitions outside it.
+        """
+        clauses = []
+        params = []
+        if created_after is not None:
+            clauses.append("AND r.created_at >= %s")
+            params.append(created_after)
+        if created_before is not None:
+            clauses.append("AND r.created_at < %s")
+            params.append(created_before)
+        return " ".join(clauses), params
+
+    def __archived(
+        self,
+        created_after: Optional[datetime],
+        created_before: Optional[datetime],
+        **where: Any,
+    ) -> List[Rating]:
+        """
+        Read the archived ratings of a time range, if it reaches into the
+        archive, as read from the rating table.
+        """
+        if self.archive is None or not self.archive.spans(
+            created_after, created_before
+        ):
+            return []
+        results = self.archive.read(
+            created_after=created_after, created_before=created_before, **where
+        )
+        return [
+            self.__to_rating({
+                column: result[column]
+                for column in (
+                    "id",
+                    "personality",
+                    "ad",
+                    "thought",
+                    "emotional_response",
+                    "emotion_ids",
+                    "effectiveness",
+                    "model_version",
+                )
+            })
+            for result in results
+        ]
+
+    def __to_rating(self, result: Dict[str, Any]) -> Rating:
+        """Build a Rating from a row, naming its stored emotion ids."""
+        result = dict(result)
+        result["emotions"] = emotions.names(result.pop("emotion_ids") or [])
+        return Rating.from_dict(result)
 
     def create(self, rating: Rating) -> Optional[str]:
         """
@@ -36,8 +172,16 @@ class RatingStore:
             # Convert personality and ad fields to their respective IDs
             data["personality_id"] = data.pop("personality")
             data["ad_id"] = data.pop("ad")
+            data.update(self.__emotion_columns(data.pop("emotions")))
+            # Unset timestamps are left to their defaults; created_at is
+            # the partition key, so it can't be NULL
+            for column in ("created_at", "updated_at"):
+                if data[column] is None:
+                    data.pop(column)
             
-            return transaction.insert(self.table_name, data)
+            if transaction.insert(self.table_name, data):
+                return data["id"]
+            return None
 
     def get(self, rating_id: str) -> Optional[Rating]:
         """
@@ -49,7 +193,7 @@ class RatingStore:
         Returns:
             Rating object if found, None otherwise
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT 
                     r.id, 
@@ -57,14 +201,15 @@ class RatingStore:
                     r.ad_id as ad, 
                     r.thought, 
                     r.emotional_response, 
-                    r.emotions, 
-                    r.effectiveness
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
                 FROM {self.table_name} r
                 WHERE r.id = %s
             """
             results = transaction.query(query, (rating_id,))
             if results:
-                return Rating.from_dict(results[0])
+                return self.__to_rating(results[0])
             return None
 
     def update(self, rating: Rating) -> bool:
@@ -84,6 +229,10 @@ class RatingStore:
             # Convert personality and ad fields to their respective IDs
             data["personality_id"] = data.pop("personality")
             data["ad_id"] = data.pop("ad")
+            data.update(self.__emotion_columns(data.pop("emotions")))
+            # Ratings keep their partition; updated_at is set by a trigger
+            data.pop("created_at")
+            data.pop("updated_at")
             
             rows_affected = transaction.update(
                 self.table_name, 
@@ -118,7 +267,7 @@ class RatingStore:
         Returns:
             List of Rating objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT 
                     r.id, 
@@ -126,24 +275,37 @@ class RatingStore:
                     r.ad_id as ad, 
                     r.thought, 
                     r.emotional_response, 
-                    r.emotions, 
-                    r.effectiveness
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
                 FROM {self.table_name} r
             """
             results = transaction.query(query)
-            return [Rating.from_dict(result) for result in results]
+            return [self.__to_rating(result) for result in results]
 
-    def get_ratings_by_personality(self, personality_id: str) -> List[Rating]:
+    def get_ratings_by_personality(
+        self,
+        personality_id: str,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> List[Rating]:
         """
-        Get all ratings for a specific personality.
+        Get all ratings for a specific personality, optionally only those
+        created in a time range; only the partitions of the months in the
+        range are read, and the archive only if the range reaches into it.
 
         Args:
             personality_id: ID of the personality
+            created_after: Only ratings created at or after this time
+            created_before: Only ratings created before this time
 
         Returns:
             List of Rating objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        range_clause, range_params = self.__created_range(
+            created_after, created_before
+        )
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT 
                     r.id, 
@@ -151,24 +313,197 @@ class RatingStore:
                     r.ad_id as ad, 
                     r.thought, 
                     r.emotional_response, 
-                    r.emotions, 
-                    r.effectiveness
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
                 FROM {self.table_name} r
-                WHERE r.personality_id = %s
+                WHERE r.personality_id = %s {range_clause}
             """
-            results = transaction.query(query, (personality_id,))
-            return [Rating.from_dict(result) for result in results]
+            results = transaction.query(query, (personality_id, *range_params))
+        return [self.__to_rating(result) for result in results] + self.__archived(
+            created_after, created_before, personality_id=personality_id
+        )
 
-    def get_ratings_by_ad(self, ad_id: str) -> List[Rating]:
+    def get_ratings_by_ad(
+        self,
+        ad_id: str,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+    ) -> List[Rating]:
         """
-        Get all ratings for a specific ad.
+        Get all ratings for a specific ad, optionally only those created
+        in a time range; only the partitions of the months in the range
+        are read, and the archive only if the range reaches into it.
 
         Args:
             ad_id: ID of the ad
+            created_after: Only ratings created at or after this time
+            created_before: Only ratings created before this time
 
         Returns:
             List of Rating objects
         """
+        range_clause, range_params = self.__created_range(
+            created_after, created_before
+        )
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            query = f"""
+                SELECT 
+                    r.id, 
+                    r.personality_id as personality, 
+                    r.ad_id as ad, 
+                    r.thought, 
+                    r.emotional_response, 
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
+                FROM {self.table_name} r
+                WHERE r.ad_id = %s {range_clause}
+            """
+            results = transaction.query(query, (ad_id, *range_params))
+        return [self.__to_rating(result) for result in results] + self.__archived(
+            created_after, created_before, ad_id=ad_id
+        )
+
+    def copy_ratings(
+        self, source_ad_id: str, ad_id: str, personality_ids: List[str]
+    ) -> List[Rating]:
+        """
+        Copy the ratings some personalities gave one ad to another, in a
+        single statement; for reusing the ratings of a near duplicate ad.
+        Personalities that already rated the target ad are skipped: each
+        copy first claims its pair in rating_pair, and only the pairs
+        claimed are copied.
+
+        Args:
+            source_ad_id: ID of the ad whose ratings are copied
+            ad_id: ID of the ad the copies are for
+            personality_ids: Personalities whose ratings are copied
+
+        Returns:
+            List of the Rating objects created
+        """
+        if not personality_ids:
+            return []
+
+        with self.db_pool.get_transaction() as transaction:
+            query = f"""
+                WITH claimed AS (
+                    INSERT INTO {self.pair_table} (
+                        personality_id, ad_id, rating_id, created_at
+                    )
+                    SELECT r.personality_id, %s, gen_random_uuid(), NOW()
+                    FROM {self.table_name} r
+                    WHERE r.ad_id = %s AND r.personality_id = ANY(%s::uuid[])
+                    ON CONFLICT DO NOTHING
+                    RETURNING personality_id, rating_id, created_at
+                )
+                INSERT INTO {self.table_name} (
+                    id, personality_id, ad_id, thought, emotional_response,
+                    emotion_ids, emotion_groups, effectiveness, model_version,
+                    created_at
+                )
+                SELECT
+                    c.rating_id, r.personality_id, %s, r.thought,
+                    r.emotional_response, r.emotion_ids, r.emotion_groups,
+                    r.effectiveness, r.model_version, c.created_at
+                FROM claimed c
+                JOIN {self.table_name} r ON r.personality_id = c.personality_id
+                WHERE r.ad_id = %s
+                RETURNING
+                    id,
+                    personality_id as personality,
+                    ad_id as ad,
+                    thought,
+                    emotional_response,
+                    emotion_ids,
+                    effectiveness,
+                    model_version
+            """
+            results = transaction.query(
+                query,
+                (ad_id, source_ad_id, list(personality_ids), ad_id, source_ad_id),
+            )
+            return [self.__to_rating(result) for result in results]
+
+    def embed_pending(
+        self, ad_id: Optional[str] = None, batch_size: int = 100
+    ) -> int:
+        """
+        Embed the thought and emotional response of every rating whose
+        embedding is missing, older than the rating, or made by another
+        embedder, in batches; ratings already embedded are left alone, so
+        this is cheap to call after every rating run.
+
+        Args:
+            ad_id: Only embed the ratings of this ad
+            batch_size: Ratings embedded per batch
+
+        Returns:
+            Number of ratings embedded
+        """
+        conditions = [
+            "(e.rating_id IS NULL OR e.updated_at < r.updated_at OR e.model <> %s)"
+        ]
+        params: List[Any] = [self.embedder.name]
+        if ad_id:
+            conditions.append("r.ad_id = %s")
+            params.append(ad_id)
+
+        embedded = 0
+        while True:
+            with self.db_pool.get_transaction() as transaction:
+                results = transaction.query(
+                    f"""
+                    SELECT r.id, r.thought, r.emotional_response
+                    FROM {self.table_name} r
+                    LEFT JOIN {self.embedding_table} e ON e.rating_id = r.id
+                    WHERE {" AND ".join(conditions)}
+                    LIMIT %s
+                    """,
+                    tuple(params + [batch_size]),
+                )
+            if not results:
+                return embedded
+
+            try:
+                vectors = self.embedder.embed_texts([
+                    f"{result['thought'] or ''}\n\n{result['emotional_response'] or ''}"
+                    for result in results
+                ])
+            except Exception as e:
+                print(f"Error embedding ratings: {e}")
+                return embedded
+
+            with self.db_pool.get_transaction() as transaction:
+                transaction.copy_upsert(
+                    self.embedding_table,
+                    ["rating_id", "model", "embedding"],
+                    [
+                        {
+                            "rating_id": result["id"],
+                            "model": self.embedder.name,
+                            "embedding": to_vector(vector),
+                        }
+                        for result, vector in zip(results, vectors)
+                    ],
+                    "rating_id",
+                )
+            embedded += len(results)
+            if len(results) < batch_size:
+                return embedded
+
+    def get_embedded(self, ad_id: str) -> Tuple[List[Rating], np.ndarray]:
+        """
+        Get an ad's ratings that have an embedding, with their embeddings.
+
+        Args:
+            ad_id: ID of the ad
+
+        Returns:
+            The Rating objects, and a matrix with the embedding of each as
+            its rows, in the same order
+        """
         with self.db_pool.get_transaction() as transaction:
             query = f"""
                 SELECT 
@@ -177,17 +512,32 @@ class RatingStore:
                     r.ad_id as ad, 
                     r.thought, 
                     r.emotional_response, 
-                    r.emotions, 
-                    r.effectiveness
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version,
+                    e.embedding::text AS embedding
                 FROM {self.table_name} r
+                JOIN {self.embedding_table} e ON e.rating_id = r.id
                 WHERE r.ad_id = %s
+                ORDER BY r.created_at, r.id
             """
             results = transaction.query(query, (ad_id,))
-            return [Rating.from_dict(result) for result in results]
+
+        # Parsing the text form in NumPy is much faster than as a Python list
+        vectors = [
+            np.fromstring(result.pop("embedding")[1:-1], sep=",") for result in results
+        ]
+        ratings = [self.__to_rating(result) for result in results]
+        if not vectors:
+            return ratings, np.zeros((0, 0))
+        return ratings, np.vstack(vectors)
 
     def get_ratings_by_effectiveness(self, effectiveness: str) -> List[Rating]:
         """
-        Get all ratings with a specific effectiveness value.
+        Get all ratings with a specific effectiveness value. Values on the
+        EFFECTIVENESS scale are matched through the indexed
+        effectiveness_level, case insensitively; anything else is matched
+        exactly.
 
         Args:
             effectiveness: Effectiveness value to search for
@@ -195,7 +545,13 @@ class RatingStore:
         Returns:
             List of Rating objects
         """
-        with self.db_pool.get_transaction() as transaction:
+        level = effectiveness_level(effectiveness)
+        if level is not None:
+            condition, param = "r.effectiveness_level = %s", level
+        else:
+            condition, param = "r.effectiveness = %s", effectiveness
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
             query = f"""
                 SELECT 
                     r.id, 
@@ -203,10 +559,628 @@ class RatingStore:
                     r.ad_id as ad, 
                     r.thought, 
                     r.emotional_response, 
-                    r.emotions, 
-                    r.effectiveness
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
                 FROM {self.table_name} r
-                WHERE r.effectiveness = %s
+                WHERE {condition}
             """
-            results = transaction.query(query, (effectiveness,))
-            return [Rating.from_dict(result) for result in results]
+            results = transaction.query(query, (param,))
+            return [self.__to_rating(result) for result in results]
+
+    def leaderboard(
+        self,
+        category: Optional[str] = None,
+        segment: Optional[str] = None,
+        min_ratings: int = 1,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank ads by their mean effectiveness level, optionally counting only
+        the ratings of a category's personalities and/or a segment. This is
+        a single aggregate over the indexed effectiveness_level; ratings
+        off the effectiveness scale are not counted.
+
+        Args:
+            category: Name of a category whose personalities' ratings count
+            segment: Segment definition (see segments.parse_segment) whose
+                personalities' ratings count
+            min_ratings: Minimum number of counted ratings for an ad to rank
+            limit: Maximum number of ads returned
+
+        Returns:
+            Ads from most to least effective, each with its "ad" ID,
+            "image", "copy", number of "ratings", "mean_effectiveness"
+            (1 to 5) and the count of ratings at each "levels" value
+
+        Raises:
+            ValueError: If the segment is invalid
+        """
+        segment_conditions = parse_segment(segment)
+        segment_clause, params = segment_sql(segment_conditions)
+
+        # Personality attributes are only needed to evaluate a segment
+        personality_join = ""
+        if segment_conditions:
+            personality_join = "JOIN personality p ON p.id = r.personality_id"
+
+        conditions = ["r.effectiveness_level IS NOT NULL", segment_clause]
+        if category:
+            conditions.append(
+                """r.personality_id IN (
+                    SELECT ca.personality_id
+                    FROM category_assignment ca
+                    JOIN category c ON ca.category_id = c.id
+                    WHERE c.name = %s
+                )"""
+            )
+            params.append(category)
+
+        level_counts = ", ".join(
+            f"COUNT(*) FILTER (WHERE r.effectiveness_level = {level}) "
+            f"AS level_{level}"
+            for level in range(1, len(EFFECTIVENESS) + 1)
+        )
+
+        query = f"""
+            SELECT
+                r.ad_id,
+                a.image,
+                a.copy,
+                COUNT(*) AS ratings,
+                AVG(r.effectiveness_level)::float AS mean_effectiveness,
+                {level_counts}
+            FROM {self.table_name} r
+            JOIN ad a ON a.id = r.ad_id
+            {personality_join}
+            WHERE {" AND ".join(conditions)}
+            GROUP BY r.ad_id, a.image, a.copy
+            HAVING COUNT(*) >= %s
+            ORDER BY mean_effectiveness DESC, ratings DESC, r.ad_id
+            LIMIT %s
+        """
+        params.extend([min_ratings, limit])
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(query, tuple(params))
+
+        return [
+            {
+                "ad": str(result["ad_id"]),
+                "image": result["image"],
+                "copy": result["copy"],
+                "ratings": result["ratings"],
+                "mean_effectiveness": result["mean_effectiveness"],
+                "levels": {
+                    value: result[f"level_{level}"]
+                    for level, value in enumerate(EFFECTIVENESS, start=1)
+                },
+            }
+            for result in results
+        ]
+
+    def get_summary(self, ad_id: str) -> Dict[str, Any]:
+        """
+        Get an ad's rating summary. The summary is kept up to date by
+        triggers on the rating table, so this is a single primary key
+        lookup however many ratings the ad has.
+
+        Args:
+            ad_id: ID of the ad
+
+        Returns:
+            Dictionary with the number of "ratings", "mean_effectiveness"
+            (1 to 5, None without any rated levels), the count of ratings
+            at each "effectiveness" value and reporting each
+            "emotion_groups" group, and when it was "last_updated"
+        """
+        return self.get_summaries([ad_id])[ad_id]
+
+    def get_summaries(self, ad_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the rating summaries of several ads in a single query.
+
+        Args:
+            ad_ids: IDs of the ads
+
+        Returns:
+            Dictionary of summaries, as returned by get_summary, keyed by
+            ad ID; ads without ratings get an empty summary
+        """
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                "SELECT * FROM rating_summary WHERE ad_id = ANY(%s::uuid[])",
+                (list(ad_ids),),
+            )
+        found = {str(result["ad_id"]): result for result in results}
+
+        summaries = {}
+        for ad_id in ad_ids:
+            summary = found.get(ad_id) or {
+                "ratings": 0,
+                "effectiveness_sum": 0,
+                "effectiveness_counts": [0] * len(EFFECTIVENESS),
+                "emotion_group_counts": [0] * len(emotions.GROUPS),
+                "last_updated": None,
+            }
+            rated = sum(summary["effectiveness_counts"])
+            summaries[ad_id] = {
+                "ad": ad_id,
+                "ratings": summary["ratings"],
+                "mean_effectiveness": (
+                    summary["effectiveness_sum"] / rated if rated else None
+                ),
+                "effectiveness": dict(
+                    zip(EFFECTIVENESS, summary["effectiveness_counts"])
+                ),
+                "emotion_groups": dict(
+                    zip(emotions.GROUPS, summary["emotion_group_counts"])
+                ),
+                "last_updated": summary["last_updated"],
+            }
+        return summaries
+
+    def get_labels(
+        self,
+        model_version: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the effectiveness level and emotion groups of every rating with
+        a level, for training and evaluating models that predict ratings.
+
+        Args:
+            model_version: Only ratings produced by this model
+            created_after: Only ratings created at or after this time
+
+        Returns:
+            List of dictionaries with the "personality" and "ad" IDs, the
+            effectiveness "level" (1 to 5), the emotion "groups" mask and
+            when the rating was "created_at", oldest first
+        """
+        conditions = ["r.effectiveness_level IS NOT NULL"]
+        params = []
+        if model_version:
+            conditions.append("r.model_version = %s")
+            params.append(model_version)
+        if created_after:
+            conditions.append("r.created_at >= %s")
+            params.append(created_after)
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                f"""
+                SELECT
+                    r.personality_id::text AS personality,
+                    r.ad_id::text AS ad,
+                    r.effectiveness_level AS level,
+                    COALESCE(r.emotion_groups, 0) AS groups,
+                    r.created_at
+                FROM {self.table_name} r
+                WHERE {" AND ".join(conditions)}
+                ORDER BY r.created_at, r.id
+                """,
+                tuple(params),
+            )
+        return [dict(result) for result in results]
+
+    def get_ratings_by_emotion(self, emotion: str) -> List[Rating]:
+        """
+        Get all ratings reporting an emotion. The emotion is normalized the
+        same way rating emotions are, and matched through the emotion_ids
+        GIN index.
+
+        Args:
+            emotion: Emotion to search for
+
+        Returns:
+            List of Rating objects
+
+        Raises:
+            ValueError: If the emotion isn't in the taxonomy
+        """
+        emotion_id = emotions.normalize(emotion)
+        if emotion_id is None:
+            raise ValueError(f"Unknown emotion {emotion}")
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            query = f"""
+                SELECT 
+                    r.id, 
+                    r.personality_id as personality, 
+                    r.ad_id as ad, 
+                    r.thought, 
+                    r.emotional_response, 
+                    r.emotion_ids, 
+                    r.effectiveness,
+                    r.model_version
+                FROM {self.table_name} r
+                WHERE r.emotion_ids @> ARRAY[%s]::smallint[]
+            """
+            results = transaction.query(query, (emotion_id,))
+            return [self.__to_rating(result) for result in results]
+
+    def search(
+        self,
+        text: str,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search the thoughts and emotional responses of ratings through the
+        search_vector GIN index. The text is a web search style query:
+        words must all appear (in any form, "expensive" matching
+        "expense"), quoted phrases in order, "or" separates alternatives
+        and a leading "-" excludes a word. Matches in the thought rank
+        above matches in the emotional response.
+
+        Args:
+            text: The search query
+            filters: Optional conditions on the ratings: "ad", "personality"
+                and "model_version" to match exactly, "effectiveness" for a
+                level of the scale, "emotion" for an emotion reported, and
+                "created_after" and "created_before" for a created_at range
+            limit: Maximum number of results
+            offset: Number of results to skip, for paging
+
+        Returns:
+            List of dictionaries with the "rating", its "rank" and the
+            matches highlighted in "snippets" of the thought and emotional
+            response, HTML escaped with matches marked by <b> tags; best
+            match first
+
+        Raises:
+            ValueError: If a filter is unknown or invalid
+        """
+        conditions = ["r.search_vector @@ q.query"]
+        params: List[Any] = [text]
+        for key, value in (filters or {}).items():
+            if key in ("ad", "personality"):
+                conditions.append(f"r.{key}_id = %s")
+                params.append(value)
+            elif key == "model_version":
+                conditions.append("r.model_version = %s")
+                params.append(value)
+            elif key == "effectiveness":
+                if effectiveness_level(value) is None:
+                    raise ValueError(
+                        f"Invalid effectiveness {value}, must be one of "
+                        f"{', '.join(EFFECTIVENESS)}"
+                    )
+                conditions.append("r.effectiveness = %s")
+                params.append(EFFECTIVENESS[effectiveness_level(value) - 1])
+            elif key == "emotion":
+                emotion_id = emotions.normalize(value)
+                if emotion_id is None:
+                    raise ValueError(f"Unknown emotion {value}")
+                conditions.append("r.emotion_ids @> ARRAY[%s]::smallint[]")
+                params.append(emotion_id)
+            elif key in ("created_after", "created_before"):
+                operator = ">=" if key == "created_after" else "<"
+                conditions.append(f"r.created_at {operator} %s")
+                params.append(value)
+            else:
+                raise ValueError(f"Unknown rating filter {key}")
+
+        # Snippets are only built for the page returned, as ts_headline
+        # re-parses each text. Matches are marked with control characters,
+        # stripped from the texts first, and turned into tags once the
+        # snippets are HTML escaped.
+        query = f"""
+            SELECT
+                m.*,
+                ts_headline(
+                    'english',
+                    TRANSLATE(COALESCE(m.thought, ''), %s, ''),
+                    m.query,
+                    %s
+                ) AS thought_snippet,
+                ts_headline(
+                    'english',
+                    TRANSLATE(COALESCE(m.emotional_response, ''), %s, ''),
+                    m.query,
+                    %s
+                ) AS emotional_response_snippet
+            FROM (
+                SELECT
+                    r.id,
+                    r.personality_id as personality,
+                    r.ad_id as ad,
+                    r.thought,
+                    r.emotional_response,
+                    r.emotion_ids,
+                    r.effectiveness,
+                    r.model_version,
+                    ts_rank_cd(r.search_vector, q.query) AS rank,
+                    q.query
+                FROM {self.table_name} r,
+                    websearch_to_tsquery('english', %s) AS q(query)
+                WHERE {" AND ".join(conditions)}
+                ORDER BY rank DESC, r.id
+                LIMIT %s OFFSET %s
+            ) m
+            ORDER BY m.rank DESC, m.id
+        """
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            results = transaction.query(
+                query,
+                tuple(
+                    [_MARKS, _HEADLINE_OPTIONS] * 2 + params + [limit, offset]
+                ),
+            )
+
+        found = []
+        for result in results:
+            result.pop("query")
+            rank = result.pop("rank")
+            snippets = {
+                "thought": _highlight(result.pop("thought_snippet")),
+                "emotional_response": _highlight(
+                    result.pop("emotional_response_snippet")
+                ),
+            }
+            found.append({
+                "rating": self.__to_rating(result),
+                "rank": rank,
+                "snippets": snippets,
+            })
+        return found
+
+    def get_emotion_counts(self, ad_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Count how many ratings report each emotion and each emotion group.
+        Group counts are bit tests on emotion_groups, computed in the same
+        scan.
+
+        Args:
+            ad_id: Only count ratings of this ad
+
+        Returns:
+            Dictionary with the number of "ratings", and the counts per
+            "group" and per "emotion" name
+        """
+        where_clause = ""
+        params: List[Any] = []
+        if ad_id:
+            where_clause = "WHERE r.ad_id = %s"
+            params.append(ad_id)
+
+        group_counts = ", ".join(
+            f"COUNT(*) FILTER (WHERE r.emotion_groups & "
+            f"{emotions.group_bit(group)} <> 0) AS {group}"
+            for group in emotions.GROUPS
+        )
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            totals = transaction.query(
+                f"""
+                    SELECT COUNT(*) AS ratings, {group_counts}
+                    FROM {self.table_name} r
+                    {where_clause}
+                """,
+                tuple(params),
+            )[0]
+            results = transaction.query(
+                f"""
+                    SELECT u.emotion_id, COUNT(*) AS count
+                    FROM {self.table_name} r
+                    CROSS JOIN LATERAL UNNEST(r.emotion_ids) AS u(emotion_id)
+                    {where_clause}
+                    GROUP BY u.emotion_id
+                    ORDER BY count DESC, u.emotion_id
+                """,
+                tuple(params),
+            )
+
+        return {
+            "ratings": totals["ratings"],
+            "groups": {group: totals[group] for group in emotions.GROUPS},
+            "emotions": {
+                emotions.EMOTIONS[result["emotion_id"]][0]: result["count"]
+                for result in results
+                if result["emotion_id"] in emotions.EMOTIONS
+            },
+        }
+
+    def get_watermark(self, ad_ids: List[str]) -> Tuple[Any, int]:
+        """
+        Get the latest updated_at and the number of the ratings of some
+        ads. Together they change whenever any of those ratings is added,
+        changed or removed, so they can key caches of derived results.
+
+        Args:
+            ad_ids: IDs of the ads
+
+        Returns:
+            The latest updated_at (None without ratings) and rating count
+        """
+        with self.db_pool.get_transaction() as transaction:
+            results = transaction.query(
+                f"""
+                    SELECT MAX(r.updated_at) AS updated_at, COUNT(*) AS count
+                    FROM {self.table_name} r
+                    WHERE r.ad_id = ANY(%s::uuid[])
+                """,
+                (list(ad_ids),),
+            )
+        if not results:
+            return None, 0
+        return results[0]["updated_at"], results[0]["count"]
+
+    def get_paired_ratings(
+        self, ad_a: str, ad_b: str, segment: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the ratings of two ads by the personalities that rated both, in
+        one query, optionally only for personalities in a segment.
+
+        Args:
+            ad_a: ID of the first ad
+            ad_b: ID of the second ad
+            segment: Segment definition (see segments.parse_segment)
+
+        Returns:
+            One row per shared personality with its "personality_id" and
+            the "level_a"/"level_b" effectiveness levels and
+            "groups_a"/"groups_b" emotion group masks of its two ratings
+
+        Raises:
+            ValueError: If the segment is invalid
+        """
+        segment_conditions = parse_segment(segment)
+        segment_clause, segment_params = segment_sql(segment_conditions)
+
+        personality_join = ""
+        if segment_conditions:
+            personality_join = "JOIN personality p ON p.id = a.personality_id"
+
+        query = f"""
+            SELECT
+                a.personality_id,
+                a.effectiveness_level AS level_a,
+                b.effectiveness_level AS level_b,
+                a.emotion_groups AS groups_a,
+                b.emotion_groups AS groups_b
+            FROM {self.table_name} a
+            JOIN {self.table_name} b
+                ON b.personality_id = a.personality_id AND b.ad_id = %s
+            {personality_join}
+            WHERE a.ad_id = %s AND {segment_clause}
+            ORDER BY a.personality_id
+        """
+        with self.db_pool.get_transaction() as transaction:
+            return transaction.query(
+                query, tuple([ad_b, ad_a] + segment_params)
+            )
+
+    def get_rated_pairs(
+        self, ad_ids: List[str], personality_ids: List[str]
+    ) -> Set[Tuple[str, str]]:
+        """
+        Find which (ad, personality) pairs out of the given ads and
+        personalities already have a rating, including archived ones.
+        Served by the primary key of rating_pair in a single query.
+
+        Args:
+            ad_ids: IDs of the ads to check
+            personality_ids: IDs of the personalities to check
+
+        Returns:
+            Set of (ad_id, personality_id) pairs that are already rated
+        """
+        if not ad_ids or not personality_ids:
+            return set()
+
+        with self.db_pool.get_transaction() as transaction:
+            query = f"""
+                SELECT p.ad_id, p.personality_id
+                FROM {self.pair_table} p
+                WHERE p.personality_id = ANY(%s::uuid[])
+                AND p.ad_id = ANY(%s::uuid[])
+            """
+            results = transaction.query(
+                query, (list(personality_ids), list(ad_ids))
+            )
+            return {
+                (str(result["ad_id"]), str(result["personality_id"]))
+                for result in results
+            }
+
+    def export(
+        self,
+        ad_id: Optional[str] = None,
+        personality_id: Optional[str] = None,
+        effectiveness: Optional[str] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None,
+        chunk_size: int = 1000,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream ratings joined with their personality and ad data. This is a
+        single query read through a server-side cursor, so exporting the
+        whole table runs in constant memory.
+
+        Args:
+            ad_id: Only include ratings for this ad
+            personality_id: Only include ratings by this personality
+            effectiveness: Only include ratings with this effectiveness
+            created_after: Only include ratings created at or after this time
+            created_before: Only include ratings created before this time
+            chunk_size: Number of rows fetched from the server at a time
+
+        Returns:
+            Iterator of dictionaries keyed by EXPORT_COLUMNS
+        """
+        conditions = []
+        params = []
+
+        if ad_id:
+            conditions.append("r.ad_id = %s")
+            params.append(ad_id)
+        if personality_id:
+            conditions.append("r.personality_id = %s")
+            params.append(personality_id)
+        if effectiveness:
+            level = effectiveness_level(effectiveness)
+            if level is not None:
+                conditions.append("r.effectiveness_level = %s")
+                params.append(level)
+            else:
+                conditions.append("r.effectiveness = %s")
+                params.append(effectiveness)
+        if created_after:
+            conditions.append("r.created_at >= %s")
+            params.append(created_after)
+        if created_before:
+            conditions.append("r.created_at < %s")
+            params.append(created_before)
+
+        where_clause = ""
+        if conditions:
+            where_clause = "WHERE " + " AND ".join(conditions)
+
+        query = f"""
+            SELECT
+                r.id,
+                r.personality_id as personality,
+                r.ad_id as ad,
+                r.thought,
+                r.emotional_response,
+                r.emotion_ids,
+                r.effectiveness,
+                r.model_version,
+                r.created_at,
+                r.updated_at,
+                p.name as personality_name,
+                p.age as personality_age,
+                p.gender as personality_gender,
+                p.location as personality_location,
+                p.education_level as personality_education_level,
+                p.marital_status as personality_marital_status,
+                p.children as personality_children,
+                p.occupation as personality_occupation,
+                p.job_title as personality_job_title,
+                p.industry as personality_industry,
+                p.income as personality_income,
+                p.seniority_level as personality_seniority_level,
+                p.personality_traits as personality_personality_traits,
+                p.values as personality_values,
+                p.attitudes as personality_attitudes,
+                p.interests as personality_interests,
+                p.lifestyle as personality_lifestyle,
+                p.habits as personality_habits,
+                p.frustrations as personality_frustrations,
+                a.image as ad_image,
+                a.copy as ad_copy
+            FROM {self.table_name} r
+            JOIN personality p ON p.id = r.personality_id
+            JOIN ad a ON a.id = r.ad_id
+            {where_clause}
+            ORDER BY r.created_at, r.id
+        """
+
+        with self.db_pool.get_transaction(read_only=True) as transaction:
+            for row in transaction.stream(query, tuple(params), chunk_size):
+                row["emotions"] = emotions.names(row.pop("emotion_ids") or [])
+                yield row
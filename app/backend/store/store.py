@@ -1,6 +1,12 @@
+from typing import Optional
+
+from app.backend.embeddings import Embedder
+from app.backend.store.archive_store import ArchiveStore
 from app.backend.store.db import Pool
 from app.backend.store.ad_store import AdStore
 from app.backend.store.category_store import CategoryStore
+from app.backend.store.panel_store import PanelStore
+from app.backend.store.partition_store import PartitionStore
 from app.backend.store.personality_store import PersonalityStore
 from app.backend.store.rating_store import RatingStore
 
@@ -11,18 +17,28 @@ class Store:
     This class serves as a facade for all database operations.
     """
 
-    def __init__(self, db_pool: Pool):
+    def __init__(
+        self,
+        db_pool: Pool,
+        embedder: Optional[Embedder] = None,
+        archive: Optional[ArchiveStore] = None,
+    ):
         """
         Initialize the Store with a database pool and create all individual stores.
 
         Args:
             db_pool: Database connection pool
+            embedder: Optional embedder the stores keep embeddings with
+            archive: Optional archive of old ratings the rating store reads
+                through to
         """
         self.db_pool = db_pool
         
         # Initialize all individual stores
         self.ad = AdStore(db_pool)
         self.category = CategoryStore(db_pool)
-        self.personality = PersonalityStore(db_pool)
-        self.rating = RatingStore(db_pool)
+        self.personality = PersonalityStore(db_pool, embedder)
+        self.rating = RatingStore(db_pool, embedder, archive)
+        self.panel = PanelStore(db_pool)
+        self.partitions = PartitionStore(db_pool)
     
\ No newline at end of file
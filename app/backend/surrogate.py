@@ -0,0 +1,514 @@
+import argparse
+import json
+import os
+import pickle
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.model_selection import train_test_split
+
+from app.backend import emotions
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS
+from app.backend.panel import PersonaFeaturizer
+
+
+# Default location of the trained model
+MODEL_PATH = os.environ.get("SURROGATE_MODEL_PATH", "models/surrogate.pkl")
+
+# Classes need this many examples to be calibrated with cross validation
+_FOLDS = 3
+
+# An ad's rating counts: the number of ratings, ratings at each
+# effectiveness level and ratings reporting each emotion group
+AdCounts = Tuple[int, np.ndarray, np.ndarray]
+
+
+def _empty_counts() -> AdCounts:
+    return (
+        0,
+        np.zeros(len(EFFECTIVENESS), dtype=np.int64),
+        np.zeros(len(emotions.GROUPS), dtype=np.int64),
+    )
+
+
+def _group_bits(masks: np.ndarray) -> np.ndarray:
+    """(n, len(GROUPS)) 0/1 matrix of the groups set in emotion_groups masks."""
+    return (np.asarray(masks, dtype=np.int64)[:, None] >> np.arange(len(emotions.GROUPS))) & 1
+
+
+def count_labels(labels: List[Dict[str, Any]]) -> Dict[str, AdCounts]:
+    """Tally rating labels, as from RatingStore.get_labels, per ad."""
+    counts = {}
+    for label in labels:
+        n, levels, groups = counts.get(label["ad"]) or _empty_counts()
+        levels = levels.copy()
+        levels[label["level"] - 1] += 1
+        groups = groups + _group_bits([label["groups"]])[0]
+        counts[label["ad"]] = (n + 1, levels, groups)
+    return counts
+
+
+def count_summaries(summaries: Dict[str, Dict[str, Any]]) -> Dict[str, AdCounts]:
+    """Convert ad summaries, as from RatingStore.get_summaries, to counts."""
+    return {
+        ad_id: (
+            summary["ratings"],
+            np.array([summary["effectiveness"][e] for e in EFFECTIVENESS]),
+            np.array([summary["emotion_groups"][g] for g in emotions.GROUPS]),
+        )
+        for ad_id, summary in summaries.items()
+    }
+
+
+class Surrogate:
+    """
+    A cheap model of RateAgent that predicts a pair's effectiveness and
+    emotion groups, with calibrated probabilities, from the personality's
+    attributes and a representation of the ad: its hashed copy and what
+    its other ratings so far look like. Pairs it is confident about don't
+    need the LLM.
+    """
+
+    def __init__(self, hash_features: int = 64, seed: int = 0):
+        """
+        Initialize an untrained surrogate.
+
+        Args:
+            hash_features: Number of features the ad copy is hashed into
+            seed: Seed of the models, so training is repeatable
+        """
+        self.seed = seed
+        self.vectorizer = HashingVectorizer(
+            n_features=hash_features, alternate_sign=False, norm="l2"
+        )
+        self.personas = PersonaFeaturizer()
+        self.version: Optional[str] = None
+        self.rater_version: Optional[str] = None
+        self.trained_at: Optional[datetime] = None
+        self.metrics: Dict[str, Any] = {}
+
+    def __features(
+        self,
+        pairs: Sequence[Tuple[str, str]],
+        personalities: Dict[str, Personality],
+        ads: Dict[str, Ad],
+        counts: Dict[str, AdCounts],
+        exclude: Optional[List[AdCounts]] = None,
+    ) -> np.ndarray:
+        """
+        Features of (ad_id, personality_id) pairs. If exclude counts are
+        given, one per pair, they are taken out of the pair's ad counts.
+        """
+        personas = self.personas.transform(
+            [personalities[pid] for _, pid in pairs]
+        ).toarray()
+        copies = self.vectorizer.transform(
+            [(ads[aid].copy or "") if aid in ads else "" for aid, _ in pairs]
+        ).toarray()
+
+        n = np.zeros(len(pairs))
+        levels = np.zeros((len(pairs), len(EFFECTIVENESS)))
+        groups = np.zeros((len(pairs), len(emotions.GROUPS)))
+        for i, (aid, _) in enumerate(pairs):
+            n[i], levels[i], groups[i] = counts.get(aid) or _empty_counts()
+        if exclude is not None:
+            for i, (excluded, excluded_levels, excluded_groups) in enumerate(exclude):
+                n[i] -= excluded
+                levels[i] -= excluded_levels
+                groups[i] -= excluded_groups
+
+        leveled = levels.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            level_shares = np.nan_to_num(levels / leveled)
+            group_shares = np.nan_to_num(groups / n[:, None])
+            mean = np.nan_to_num(
+                levels @ np.arange(1, len(EFFECTIVENESS) + 1) / leveled[:, 0]
+            )
+        return np.hstack([
+            personas,
+            copies,
+            np.log1p(n)[:, None],
+            mean[:, None],
+            level_shares,
+            group_shares,
+        ]).astype(np.float32)
+
+    def __classifier(self) -> CalibratedClassifierCV:
+        return CalibratedClassifierCV(
+            # Early stopping keeps the trees from fitting the LLM's noise,
+            # which would leave nothing for calibration to work with
+            HistGradientBoostingClassifier(
+                max_iter=200,
+                early_stopping=True,
+                max_depth=3,
+                min_samples_leaf=40,
+                random_state=self.seed,
+            ),
+            method="isotonic",
+            cv=_FOLDS,
+        )
+
+    def fit(
+        self,
+        labels: List[Dict[str, Any]],
+        personalities: Dict[str, Personality],
+        ads: Dict[str, Ad],
+        counts: Dict[str, AdCounts],
+        rater_version: Optional[str] = None,
+    ) -> "Surrogate":
+        """
+        Train the surrogate on rating labels.
+
+        Args:
+            labels: Labels to train on, as from RatingStore.get_labels;
+                those of unknown personalities are skipped
+            personalities: Personalities, keyed by ID
+            ads: Ads, keyed by ID
+            counts: Rating counts of the ads, as from count_labels
+            rater_version: The model_version of the ratings trained on
+
+        Returns:
+            The trained surrogate
+
+        Raises:
+            ValueError: If there are no labels to train on
+        """
+        labels = [label for label in labels if label["personality"] in personalities]
+        if not labels:
+            raise ValueError("No ratings to train on")
+
+        self.personas.fit(list(personalities.values()))
+        pairs = [(label["ad"], label["personality"]) for label in labels]
+
+        # A label's own rating can't be part of its ad's counts, or the
+        # counts would give it away; nor can just it be left out, since the
+        # counts less one rating still tell which rating it was. So the ad
+        # counts of each fold of labels leave out that whole fold.
+        folds = np.random.default_rng(self.seed).permutation(len(labels)) % _FOLDS
+        fold_counts = [
+            count_labels([label for label, f in zip(labels, folds) if f == fold])
+            for fold in range(_FOLDS)
+        ]
+        exclude = [
+            fold_counts[fold][label["ad"]] for label, fold in zip(labels, folds)
+        ]
+        features = self.__features(pairs, personalities, ads, counts, exclude)
+        levels = np.array([label["level"] for label in labels])
+        groups = _group_bits([label["groups"] for label in labels])
+
+        # Levels too rare to calibrate are left to the other levels
+        present, frequency = np.unique(levels, return_counts=True)
+        kept = np.isin(levels, present[frequency >= _FOLDS])
+        if len(np.unique(levels[kept])) > 1:
+            self.effectiveness = self.__classifier().fit(
+                features[kept], levels[kept]
+            )
+        else:
+            self.effectiveness = None
+        self.prior = np.bincount(levels - 1, minlength=len(EFFECTIVENESS)) / len(levels)
+
+        # A group that is (almost) always or never reported is predicted
+        # from its rate
+        self.groups = []
+        for g in range(len(emotions.GROUPS)):
+            positives = int(groups[:, g].sum())
+            if min(positives, len(labels) - positives) >= _FOLDS:
+                self.groups.append(
+                    self.__classifier().fit(features, groups[:, g])
+                )
+            else:
+                self.groups.append(positives / len(labels))
+
+        self.trained_at = datetime.now(timezone.utc)
+        self.version = f"surrogate-{self.trained_at:%Y%m%d%H%M%S}"
+        self.rater_version = rater_version
+        return self
+
+    def predict_proba(
+        self,
+        pairs: Sequence[Tuple[str, str]],
+        personalities: Dict[str, Personality],
+        ads: Dict[str, Ad],
+        counts: Dict[str, AdCounts],
+        exclude: Optional[List[AdCounts]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict the probabilities of (ad_id, personality_id) pairs.
+
+        Args:
+            pairs: (ad_id, personality_id) pairs
+            personalities: Personalities, keyed by ID
+            ads: Ads, keyed by ID
+            counts: Rating counts of the ads
+            exclude: Counts to take out of each pair's ad counts
+
+        Returns:
+            (n, len(EFFECTIVENESS)) probabilities of each effectiveness
+            level, and (n, len(GROUPS)) probabilities of each emotion group
+        """
+        features = self.__features(pairs, personalities, ads, counts, exclude)
+
+        levels = np.tile(self.prior, (len(pairs), 1))
+        if self.effectiveness is not None:
+            levels[:] = 0
+            levels[:, self.effectiveness.classes_ - 1] = (
+                self.effectiveness.predict_proba(features)
+            )
+
+        groups = np.empty((len(pairs), len(emotions.GROUPS)))
+        for g, model in enumerate(self.groups):
+            if isinstance(model, float):
+                groups[:, g] = model
+            else:
+                groups[:, g] = model.predict_proba(features)[:, 1]
+        return levels, groups
+
+    @staticmethod
+    def confidence(levels: np.ndarray, groups: np.ndarray) -> np.ndarray:
+        """
+        Confidence of each prediction: the probability of its most likely
+        effectiveness level or of its least certain emotion group call,
+        whichever is lower.
+        """
+        return np.minimum(
+            levels.max(axis=1), np.maximum(groups, 1 - groups).min(axis=1)
+        )
+
+    def triage(
+        self,
+        pairs: Sequence[Tuple[str, str]],
+        personalities: Dict[str, Personality],
+        ads: Dict[str, Ad],
+        counts: Dict[str, AdCounts],
+        threshold: float = 0.8,
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+        """
+        Split pairs into those the surrogate is confident about, which get
+        its prediction, and those that need rating.
+
+        Args:
+            pairs: (ad_id, personality_id) pairs
+            personalities: Personalities, keyed by ID
+            ads: Ads, keyed by ID
+            counts: Rating counts of the ads, as from count_summaries
+            threshold: Confidence a prediction needs to be used
+
+        Returns:
+            Predictions of the confident pairs, flagged with "surrogate",
+            and the pairs still needing rating
+        """
+        known = [pair for pair in pairs if pair[1] in personalities]
+        uncertain = [pair for pair in pairs if pair[1] not in personalities]
+        if not known:
+            return [], uncertain
+
+        levels, groups = self.predict_proba(known, personalities, ads, counts)
+        confidence = self.confidence(levels, groups)
+
+        predictions = []
+        for i, (ad_id, personality_id) in enumerate(known):
+            if confidence[i] < threshold:
+                uncertain.append((ad_id, personality_id))
+                continue
+            predictions.append({
+                "ad": ad_id,
+                "personality": personality_id,
+                "surrogate": True,
+                "model_version": self.version,
+                "effectiveness": EFFECTIVENESS[int(levels[i].argmax())],
+                "effectiveness_probabilities": dict(
+                    zip(EFFECTIVENESS, levels[i].round(4).tolist())
+                ),
+                "emotion_groups": dict(
+                    zip(emotions.GROUPS, groups[i].round(4).tolist())
+                ),
+                "confidence": float(confidence[i]),
+            })
+        return predictions, uncertain
+
+    def evaluate(
+        self,
+        labels: List[Dict[str, Any]],
+        personalities: Dict[str, Personality],
+        ads: Dict[str, Ad],
+        counts: Dict[str, AdCounts],
+        thresholds: Sequence[float] = (0.5, 0.6, 0.7, 0.8, 0.9),
+    ) -> Dict[str, Any]:
+        """
+        Evaluate the surrogate against rating labels it wasn't trained on.
+        Each label is left out of its ad's counts, as its rating wouldn't
+        exist yet when predicting.
+
+        Returns:
+            Dictionary with the number of "ratings", effectiveness
+            "accuracy", "log_loss" and "calibration_error" (expected
+            calibration error of the top level, over 10 bins) against the
+            "baseline_accuracy" of always predicting the most common level,
+            the "brier" score of each of the "emotion_groups", and per
+            confidence threshold the share of pairs that would skip the LLM
+            and the accuracy on them in "triage"
+        """
+        labels = [label for label in labels if label["personality"] in personalities]
+        if not labels:
+            return {"ratings": 0}
+
+        pairs = [(label["ad"], label["personality"]) for label in labels]
+        levels, groups = self.predict_proba(
+            pairs,
+            personalities,
+            ads,
+            counts,
+            [count_labels([label])[label["ad"]] for label in labels],
+        )
+        truth = np.array([label["level"] for label in labels]) - 1
+        truth_groups = _group_bits([label["groups"] for label in labels])
+
+        predicted = levels.argmax(axis=1)
+        top = levels.max(axis=1)
+        correct = predicted == truth
+        bins = np.minimum((top * 10).astype(int), 9)
+        calibration = sum(
+            abs(correct[bins == b].mean() - top[bins == b].mean()) * (bins == b).mean()
+            for b in np.unique(bins)
+        )
+        group_correct = ((groups >= 0.5) == truth_groups).all(axis=1)
+        confidence = self.confidence(levels, groups)
+
+        return {
+            "ratings": len(labels),
+            "accuracy": float(correct.mean()),
+            "baseline_accuracy": float(np.bincount(truth).max() / len(truth)),
+            "log_loss": float(
+                -np.log(np.clip(levels[np.arange(len(truth)), truth], 1e-15, 1)).mean()
+            ),
+            "calibration_error": float(calibration),
+            "emotion_groups": {
+                group: {"brier": float(((groups[:, g] - truth_groups[:, g]) ** 2).mean())}
+                for g, group in enumerate(emotions.GROUPS)
+            },
+            "triage": [
+                {
+                    "threshold": threshold,
+                    "confident_share": float((confidence >= threshold).mean()),
+                    "accuracy": (
+                        float(correct[confidence >= threshold].mean())
+                        if (confidence >= threshold).any()
+                        else None
+                    ),
+                    "emotion_group_accuracy": (
+                        float(group_correct[confidence >= threshold].mean())
+                        if (confidence >= threshold).any()
+                        else None
+                    ),
+                }
+                for threshold in thresholds
+            ],
+        }
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        """Save the trained surrogate."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> Optional["Surrogate"]:
+        """Load a saved surrogate, or None if there isn't one."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def _load(store, labels: List[Dict[str, Any]]):
+    personalities = store.personality.get_many(
+        list({label["personality"] for label in labels})
+    )
+    ads = store.ad.get_many(list({label["ad"] for label in labels}))
+    return personalities, ads
+
+
+def main():
+    """
+    Train or evaluate the surrogate offline, against the database
+    configured by the same POSTGRES_* variables as the server.
+
+        python -m app.backend.surrogate train [--rater-version V]
+        python -m app.backend.surrogate evaluate [--all]
+    """
+    from app.backend.store import Store
+    from app.backend.store.db import Pool
+
+    parser = argparse.ArgumentParser(description=main.__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--model", default=MODEL_PATH, help="Model file")
+    parser.add_argument(
+        "--rater-version",
+        help="Train only on ratings with this model_version",
+    )
+    parser.add_argument(
+        "--test-size",
+        type=float,
+        default=0.2,
+        help="Share of ratings held out to evaluate the trained model",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Evaluate on every rating, not only those newer than the model",
+    )
+    args = parser.parse_args()
+
+    store = Store(Pool(
+        host=os.environ.get("POSTGRES_HOST", "localhost"),
+        port=int(os.environ.get("POSTGRES_PORT", "5432")),
+        dbname=os.environ.get("POSTGRES_DB", "app"),
+        user=os.environ.get("POSTGRES_USER", "postgres"),
+        password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
+    ))
+
+    if args.command == "train":
+        labels = store.rating.get_labels(model_version=args.rater_version)
+        personalities, ads = _load(store, labels)
+        counts = count_labels(labels)
+        train, test = train_test_split(
+            labels, test_size=args.test_size, random_state=0
+        )
+        surrogate = Surrogate().fit(
+            train, personalities, ads, counts, rater_version=args.rater_version
+        )
+        surrogate.metrics = surrogate.evaluate(test, personalities, ads, counts)
+        surrogate.save(args.model)
+        print(json.dumps(
+            {"version": surrogate.version, "trained_on": len(train), **surrogate.metrics},
+            indent=2,
+        ))
+    else:
+        surrogate = Surrogate.load(args.model)
+        if surrogate is None:
+            parser.error(f"No model at {args.model}")
+        labels = store.rating.get_labels(
+            model_version=surrogate.rater_version,
+            created_after=None if args.all else surrogate.trained_at,
+        )
+        personalities, ads = _load(store, labels)
+        counts = count_labels(
+            store.rating.get_labels(model_version=surrogate.rater_version)
+        )
+        print(json.dumps(
+            {
+                "version": surrogate.version,
+                **surrogate.evaluate(labels, personalities, ads, counts),
+            },
+            indent=2,
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+from collections import Counter, OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import normalize
+
+from app.backend import metrics
+from app.backend.models.rating import Rating, effectiveness_level
+from app.backend.store.rating_store import RatingStore
+
+
+# Most themes chosen automatically; more rarely reads as a summary
+MAX_CLUSTERS = 8
+# Dimensions the embeddings are reduced to before clustering, which keeps
+# k-means and the silhouette fast without changing which ratings group
+REDUCED_DIMENSIONS = 32
+
+
+def cluster_themes(
+    ratings: List[Rating],
+    vectors: np.ndarray,
+    clusters: Optional[int] = None,
+    examples: int = 3,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Group ratings into themes by clustering the embeddings of their
+    thoughts and emotional responses with k-means, and describe each theme
+    by its most typical ratings, those nearest its centroid.
+
+    Args:
+        ratings: Ratings to group
+        vectors: Embedding of each rating, as the rows of a matrix in the
+            same order
+        clusters: Number of themes; chosen by the best cosine silhouette
+            between 2 and MAX_CLUSTERS if not given, and capped at the
+            number of distinct ratings
+        examples: Number of example ratings per theme
+        seed: Seed of the clustering, so repeated requests agree
+
+    Returns:
+        List of themes, largest first, each with its number of ratings
+        ("size") and their "share", "mean_effectiveness" and most common
+        "emotions", the "exemplar" nearest the centroid and the nearest
+        "examples", exemplar included
+
+    Raises:
+        ValueError: If clusters is below 1
+    """
+    if clusters is not None and clusters < 1:
+        raise ValueError("clusters must be at least 1")
+    n = len(ratings)
+    if n == 0:
+        return []
+
+    # On unit vectors Euclidean k-means orders by cosine distance
+    points = normalize(vectors)
+    if n > REDUCED_DIMENSIONS and points.shape[1] > REDUCED_DIMENSIONS:
+        points = normalize(
+            PCA(n_components=REDUCED_DIMENSIONS, random_state=seed).fit_transform(
+                points
+            )
+        )
+
+    # Identical ratings can't be told apart, so there are at most as many
+    # themes as distinct embeddings
+    distinct = len(np.unique(points, axis=0))
+    if clusters is not None or distinct < 3:
+        kmeans = KMeans(
+            n_clusters=min(clusters or 1, distinct), n_init="auto", random_state=seed
+        ).fit(points)
+    else:
+        best = None
+        for k in range(2, min(MAX_CLUSTERS, distinct - 1) + 1):
+            fitted = KMeans(n_clusters=k, n_init="auto", random_state=seed).fit(
+                points
+            )
+            score = silhouette_score(points, fitted.labels_, metric="cosine")
+            if best is None or score > best[0]:
+                best = (score, fitted)
+        kmeans = best[1]
+
+    labels = kmeans.labels_
+    distances = kmeans.transform(points)[np.arange(n), labels]
+
+    themes = []
+    for cluster in np.unique(labels):
+        members = np.flatnonzero(labels == cluster)
+        nearest = members[np.argsort(distances[members], kind="stable")]
+        levels = [
+            level
+            for level in (
+                effectiveness_level(ratings[i].effectiveness) for i in members
+            )
+            if level is not None
+        ]
+        emotion_counts = Counter(
+            emotion for i in members for emotion in ratings[i].emotions or []
+        )
+        themes.append({
+            "size": len(members),
+            "share": len(members) / n,
+            "mean_effectiveness": (
+                float(np.mean(levels)) if levels else None
+            ),
+            "emotions": [
+                {"emotion": emotion, "count": count}
+                for emotion, count in emotion_counts.most_common(5)
+            ],
+            "exemplar": _example(ratings[nearest[0]]),
+            "examples": [_example(ratings[i]) for i in nearest[:max(examples, 1)]],
+        })
+    themes.sort(key=lambda theme: theme["size"], reverse=True)
+    return themes
+
+
+def _example(rating: Rating) -> Dict[str, Any]:
+    return {
+        "id": rating.id,
+        "personality": rating.personality,
+        "thought": rating.thought,
+        "emotional_response": rating.emotional_response,
+        "effectiveness": rating.effectiveness,
+    }
+
+
+class RatingThemes:
+    """
+    Summaries of why personalities reacted to an ad as they did, as themes
+    of similar ratings. Ratings are embedded as they are added, so only
+    new ones are embedded when a summary is requested; results are cached
+    until a rating of the ad changes.
+    """
+
+    def __init__(self, rating_store: RatingStore, cache_size: int = 256):
+        """
+        Initialize the summarizer.
+
+        Args:
+            rating_store: Store the ratings and their embeddings are read
+                from; it needs an embedder
+            cache_size: Maximum number of summaries cached
+        """
+        self.rating_store = rating_store
+        self.cache_size = cache_size
+        self.__lock = Lock()
+        self.__cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+
+    def summarize(
+        self,
+        ad_id: str,
+        clusters: Optional[int] = None,
+        examples: int = 3,
+        seed: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Summarize the ratings of an ad as themes; see cluster_themes().
+
+        Args:
+            ad_id: ID of the ad
+            clusters: Number of themes, chosen automatically if not given
+            examples: Number of example ratings per theme
+            seed: Seed of the clustering
+
+        Returns:
+            Dictionary with the "ad", the number of "ratings" summarized and
+            the "themes"
+
+        Raises:
+            ValueError: If clusters is below 1
+        """
+        self.rating_store.embed_pending(ad_id)
+
+        watermark = self.rating_store.get_watermark([ad_id])
+        key = (ad_id, clusters, examples, seed, watermark)
+        with self.__lock:
+            if key in self.__cache:
+                metrics.CACHE_REQUESTS.labels("rating_themes", "hit").inc()
+                self.__cache.move_to_end(key)
+                return self.__cache[key]
+        metrics.CACHE_REQUESTS.labels("rating_themes", "miss").inc()
+
+        ratings, vectors = self.rating_store.get_embedded(ad_id)
+        result = {
+            "ad": ad_id,
+            "ratings": len(ratings),
+            "themes": cluster_themes(ratings, vectors, clusters, examples, seed),
+        }
+
+        # Summaries missing ratings that failed to embed aren't kept
+        if len(ratings) == watermark[1]:
+            with self.__lock:
+                self.__cache[key] = result
+                while len(self.__cache) > self.cache_size:
+                    self.__cache.popitem(last=False)
+        return result
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from uuid import uuid4
 
@@ -140,3 +141,61 @@ def test_ad_find_by_criteria(store: Store):
     
     assert len(results) >= 1
     assert any(ad.image == f"https://example.com/{test_id}-image3.jpg" for ad in results)
+
+
+def test_ad_get_many(store: Store):
+    """Test getting several ads in one call"""
+    ads = [Ad(copy=f"Get many ad {i}") for i in range(3)]
+    ad_ids = [store.ad.create(ad) for ad in ads]
+
+    missing_id = str(uuid4())
+    found = store.ad.get_many(ad_ids + [missing_id])
+
+    assert set(found.keys()) == set(ad_ids)
+    assert found[ad_ids[1]].copy == "Get many ad 1"
+    assert store.ad.get_many([]) == {}
+
+
+def test_ad_hashes(store: Store):
+    """Test perceptual hashes round trip and are listed for the index"""
+    hashed = Ad(image="https://example.com/hashed.jpg", phash=-(1 << 62) + 5)
+    unhashed = Ad(copy="No image to hash")
+    hashed_id = store.ad.create(hashed)
+    unhashed_id = store.ad.create(unhashed)
+
+    assert store.ad.get(hashed_id).phash == -(1 << 62) + 5
+    assert store.ad.get(unhashed_id).phash is None
+
+    hashes = store.ad.get_hashes()
+    assert hashes[hashed_id] == -(1 << 62) + 5
+    assert unhashed_id not in hashes
+
+
+def test_ad_find_similar(store: Store):
+    """Test nearest neighbour search over ad embeddings"""
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal(768)
+    ads = [Ad(copy=f"Similar ad {i}") for i in range(4)] + [
+        Ad(image="https://example.com/similar.jpg")
+    ]
+    ad_ids = [store.ad.create(ad) for ad in ads]
+    # Each ad is further from the first than the one before it
+    for i, ad_id in enumerate(ad_ids):
+        vector = base + i * rng.standard_normal(768)
+        assert store.ad.set_embedding(ad_id, vector / np.linalg.norm(vector), "test")
+
+    similar = store.ad.find_similar(ad_ids[0], k=3)
+    assert [ad.id for ad, _ in similar] == ad_ids[1:4]
+    similarities = [similarity for _, similarity in similar]
+    assert similarities == sorted(similarities, reverse=True)
+
+    similar = store.ad.find_similar(ad_ids[0], k=10, filters={"has_image": True})
+    assert [ad.id for ad, _ in similar] == [ad_ids[4]]
+
+    assert store.ad.find_similar(str(uuid4())) == []
+    unembedded_id = store.ad.create(Ad(copy="Not embedded yet"))
+    unembedded = [ad.id for ad in store.ad.get_unembedded()]
+    assert unembedded_id in unembedded
+    assert not set(ad_ids) & set(unembedded)
+    with pytest.raises(ValueError):
+        store.ad.find_similar(ad_ids[0], filters={"unknown": 1})
@@ -0,0 +1,102 @@
+from datetime import date, datetime, timezone
+
+import pyarrow.parquet as pq
+
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import Rating
+from app.backend.store import Store
+from app.backend.store.archive_store import ArchiveStore
+from app.backend.store.rating_store import RatingStore
+
+
+def test_archive_and_read_through(store: Store, tmp_path):
+    """Test old months move to Parquet and are still read through"""
+    archive = ArchiveStore(store.db_pool, tmp_path)
+    ratings = RatingStore(store.db_pool, archive=archive)
+
+    # A month long past, so no other test writes to its partition
+    store.partitions.ensure(months_ahead=0, today=date(2001, 5, 1))
+    ad_id = store.ad.create(
+        Ad(image="https://example.com/archive-test.jpg", copy="Archive test ad")
+    )
+    old_ids = []
+    for i in range(3):
+        personality_id = store.personality.create(
+            Personality(name=f"Archive Old Person {i}")
+        )
+        old_ids.append(
+            store.rating.create(
+                Rating(
+                    personality=personality_id,
+                    ad=ad_id,
+                    thought=f"Old thought {i}",
+                    emotional_response="Nostalgic",
+                    emotions=["Happy"],
+                    effectiveness="Good fit",
+                    created_at=datetime(2001, 5, 10 + i, tzinfo=timezone.utc),
+                )
+            )
+        )
+    new_personality = store.personality.create(Personality(name="Archive New Person"))
+    new_id = store.rating.create(
+        Rating(
+            personality=new_personality,
+            ad=ad_id,
+            thought="New thought",
+            emotional_response="Curious",
+            emotions=[],
+            effectiveness="Neutral/okay",
+        )
+    )
+    assert not archive.spans()
+
+    # Written two rows at a time, so in several row groups
+    archived = archive.archive(date(2001, 6, 1), chunk_size=2)
+    assert [(a["partition"], a["rows"]) for a in archived] == [("rating_200105", 3)]
+    assert pq.ParquetFile(archived[0]["path"]).metadata.num_row_groups == 2
+    assert archive.months() == [date(2001, 5, 1)]
+    # Sorted by ad and personality, for reads to skip row groups by them
+    table = pq.read_table(archived[0]["path"]).to_pylist()
+    keys = [(row["ad"], row["personality"]) for row in table]
+    assert keys == sorted(keys)
+    assert "rating_200105" not in store.partitions.list_detached()
+
+    # The hot table only keeps the new rating
+    assert [r.id for r in store.rating.get_ratings_by_ad(ad_id)] == [new_id]
+
+    # Reads spanning archived time include the archived ratings
+    everything = ratings.get_ratings_by_ad(ad_id)
+    assert sorted(r.id for r in everything) == sorted(old_ids + [new_id])
+    old = {r.id: r for r in everything}[old_ids[0]]
+    assert old.thought == "Old thought 0"
+    assert old.emotions == ["Happy"]
+    assert old.effectiveness == "Good fit"
+
+    ranged = ratings.get_ratings_by_ad(
+        ad_id,
+        created_after=datetime(2001, 5, 11, tzinfo=timezone.utc),
+        created_before=datetime(2001, 6, 1, tzinfo=timezone.utc),
+    )
+    assert sorted(r.id for r in ranged) == sorted(old_ids[1:])
+
+    # Reads after the archive don't touch it
+    assert not archive.spans(created_after=datetime(2001, 6, 1, tzinfo=timezone.utc))
+    recent = ratings.get_ratings_by_ad(
+        ad_id, created_after=datetime(2001, 6, 1, tzinfo=timezone.utc)
+    )
+    assert [r.id for r in recent] == [new_id]
+
+    by_personality = ratings.get_ratings_by_personality(new_personality)
+    assert [r.id for r in by_personality] == [new_id]
+
+    # Months archived by another process are seen
+    (tmp_path / "month=2001-04").mkdir()
+    pq.write_table(
+        pq.read_table(archived[0]["path"]).slice(0, 0),
+        tmp_path / "month=2001-04" / "rating_200104.parquet",
+    )
+    assert archive.months() == [date(2001, 4, 1), date(2001, 5, 1)]
+
+    # Archived pairs stay rated
+    assert len(store.rating.get_rated_pairs([ad_id], [everything[0].personality])) == 1
@@ -0,0 +1,194 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
+
+from app.backend.models.ad import Ad
+from app.backend.store import Store
+from app.backend.store.db import Pool, add_query_hook, remove_query_hook
+
+
+def test_pool_routes_reads_to_replicas(postgres_container):
+    """Test read-only transactions are spread over the healthy replicas"""
+    _, config = postgres_container
+
+    def dsn(name: str) -> str:
+        return (
+            f"host={config['host']} port={config['port']} "
+            f"dbname={config['dbname']} user={config['user']} "
+            f"password={config['password']} application_name={name}"
+        )
+
+    # The test database stands in for the primary and two replicas, told
+    # apart by their application names; the third replica is down
+    pool = Pool(
+        connection_string=dsn("primary"),
+        replicas=[
+            dsn("replica1"),
+            "host=localhost port=1 dbname=down connect_timeout=1",
+            dsn("replica2"),
+        ],
+        health_check_interval=60,
+    )
+
+    def served(read_only: bool) -> str:
+        with pool.get_transaction(read_only=read_only) as transaction:
+            return transaction.query(
+                "SELECT current_setting('application_name') AS name"
+            )[0]["name"]
+
+    assert served(False) == "primary"
+    assert sorted(served(True) for _ in range(4)) == [
+        "replica1",
+        "replica1",
+        "replica2",
+        "replica2",
+    ]
+
+    with Pool.primary_only():
+        assert served(True) == "primary"
+    assert served(True).startswith("replica")
+
+    def read_after_write() -> str:
+        with pool.get_transaction() as transaction:
+            transaction.execute("CREATE TEMPORARY TABLE replica_test (id INT)")
+        return served(True)
+
+    def read_after_read() -> str:
+        served(False)
+        return served(True)
+
+    # A context that wrote reads its writes from the primary; others don't
+    assert contextvars.copy_context().run(read_after_write) == "primary"
+    assert contextvars.copy_context().run(read_after_read).startswith("replica")
+    assert served(True).startswith("replica")
+
+    def write() -> str:
+        with pool.get_transaction() as transaction:
+            transaction.execute(
+                "CREATE TEMPORARY TABLE IF NOT EXISTS replica_test (id INT)"
+            )
+        return served(True)
+
+    # A worker thread that runs each task in a copy of the context, as
+    # MassRater does, reads from the replicas again after a task wrote
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(contextvars.copy_context().run, write).result() == (
+            "primary"
+        )
+        assert executor.submit(served, True).result().startswith("replica")
+        assert executor.submit(served, True).result().startswith("replica")
+
+
+def test_pool_retries_failed_replica_reads_on_primary(postgres_container):
+    """Test a read that fails on a replica is retried on the primary"""
+    _, config = postgres_container
+
+    def dsn(name: str) -> str:
+        return (
+            f"host={config['host']} port={config['port']} "
+            f"dbname={config['dbname']} user={config['user']} "
+            f"password={config['password']} application_name={name}"
+        )
+
+    name = "SELECT current_setting('application_name') AS name"
+
+    def drop_replica_connections(pool: Pool):
+        with pool.get_transaction() as transaction:
+            transaction.query(
+                """
+                SELECT pg_terminate_backend(pid) FROM pg_stat_activity
+                WHERE application_name = 'replica'
+                """
+            )
+
+    for read in (
+        lambda transaction: transaction.query(name)[0]["name"],
+        lambda transaction: next(transaction.stream(name))["name"],
+    ):
+        pool = Pool(
+            connection_string=dsn("primary"),
+            replicas=[dsn("replica")],
+            health_check_interval=60,
+        )
+        with pool.get_transaction(read_only=True) as transaction:
+            assert transaction.query(name)[0]["name"] == "replica"
+            drop_replica_connections(pool)
+            assert read(transaction) == "primary"
+
+        # The replica is skipped until its next health check
+        with pool.get_transaction(read_only=True) as transaction:
+            assert transaction.query(name)[0]["name"] == "primary"
+
+    # Errors of the statement itself are reported, not retried
+    pool = Pool(connection_string=dsn("primary"), replicas=[dsn("replica")])
+    with pool.get_transaction(read_only=True) as transaction:
+        assert transaction.query("SELECT * FROM no_such_table") == []
+        assert transaction.query(name)[0]["name"] == "replica"
+
+
+def test_query_hooks_time_statements(store: Store):
+    """Test statements are reported to query hooks with their caller"""
+    events = []
+    add_query_hook(events.append)
+    try:
+        ad_id = store.ad.create(
+            Ad(image="https://example.com/hook.jpg", copy="Hook ad")
+        )
+        store.ad.get(ad_id)
+        with store.db_pool.get_transaction() as transaction:
+            transaction.query("SELECT * FROM no_such_table")
+    finally:
+        remove_query_hook(events.append)
+
+    gets = [e for e in events if e["caller"] == "AdStore.get"]
+    assert len(gets) == 1
+    assert gets[0]["rows"] == 1
+    assert gets[0]["duration"] > 0
+    assert gets[0]["params"] == (ad_id,)
+    assert "?" in gets[0]["fingerprint"] and ad_id not in gets[0]["fingerprint"]
+    assert any(e["caller"] == "AdStore.create" for e in events)
+
+    failed = [e for e in events if "no_such_table" in e["statement"]]
+    assert failed[0]["error"] == "UndefinedTable"
+
+    # Removed hooks aren't called
+    store.ad.get(ad_id)
+    assert len([e for e in events if e["caller"] == "AdStore.get"]) == 1
+
+
+def test_transaction_atomic(store: Store):
+    """Test an atomic block commits together and fails as a whole"""
+    first = Ad(image="https://example.com/atomic-1.jpg", copy="Atomic 1")
+    second = Ad(image="https://example.com/atomic-2.jpg", copy="Atomic 2")
+
+    with store.db_pool.get_transaction() as transaction:
+        with pytest.raises(psycopg2.Error):
+            with transaction.atomic():
+                assert transaction.insert("ad", first.to_dict())
+                transaction.insert("ad", {"id": second.id, "no_such_column": 1})
+        # Outside a block failures are swallowed again
+        assert not transaction.execute("UPDATE ad SET no_such_column = 1")
+    assert store.ad.get(first.id) is None
+
+    with store.db_pool.get_transaction() as transaction:
+        with transaction.atomic():
+            transaction.insert("ad", first.to_dict())
+            transaction.insert("ad", second.to_dict())
+    assert store.ad.get(first.id) is not None
+    assert store.ad.get(second.id) is not None
+
+    # Reads of a repeatable read block share a snapshot
+    count = "SELECT COUNT(*) AS ads FROM ad"
+    with store.db_pool.get_transaction() as transaction:
+        with transaction.atomic("REPEATABLE READ"):
+            before = transaction.query(count)[0]["ads"]
+            store.ad.create(Ad(image="https://example.com/atomic-3.jpg"))
+            assert transaction.query(count)[0]["ads"] == before
+        assert transaction.query(count)[0]["ads"] == before + 1
+
+    with store.db_pool.get_transaction() as transaction:
+        with pytest.raises(ValueError):
+            with transaction.atomic("READ SOMETIMES"):
+                pass
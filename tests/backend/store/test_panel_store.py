@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+from app.backend.models.personality import Personality
+from app.backend.panel import build_panel
+from app.backend.store import Store
+
+
+def test_panel_create_get_and_delete(store: Store):
+    """Test a panel round trips with its clusters and members"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personalities = [
+        Personality(
+            name=f"{test_id} Panel Person {i}",
+            age=25 + 20 * (i % 2),
+            gender=["Female", "Male"][i % 2],
+            interests=[["cooking"], ["cycling"]][i % 2],
+        )
+        for i in range(6)
+    ]
+    for personality in personalities:
+        store.personality.create(personality)
+
+    panel = build_panel(personalities, clusters=2, name=f"{test_id} Panel")
+    panel_id = store.panel.create(panel)
+    assert panel_id == panel.id
+
+    saved = store.panel.get(panel_id)
+    assert saved is not None
+    assert saved.name == panel.name
+    assert saved.clusters == panel.clusters
+    assert saved.members == panel.members
+
+    listed = [p for p in store.panel.list_all() if str(p["id"]) == panel_id]
+    assert listed[0]["personalities"] == 6
+    assert listed[0]["clusters"] == 2
+
+    # Deleting a medoid's personality removes its cluster
+    store.personality.delete(panel.clusters[0]["medoid"])
+    saved = store.panel.get(panel_id)
+    assert [c["cluster"] for c in saved.clusters] == [1]
+
+    assert store.panel.delete(panel_id)
+    assert store.panel.get(panel_id) is None
+
+
+def test_panel_create_is_atomic(store: Store):
+    """Test a panel whose members fail to save isn't saved at all"""
+    test_id = str(uuid4())[:8]
+
+    personalities = [
+        Personality(name=f"{test_id} Atomic Person {i}", age=30 + i)
+        for i in range(3)
+    ]
+    for personality in personalities:
+        store.personality.create(personality)
+
+    panel = build_panel(personalities, clusters=1, name=f"{test_id} Panel")
+    # A member that doesn't exist violates the members' foreign key
+    panel.members[str(uuid4())] = 0
+    assert store.panel.create(panel) is None
+    assert store.panel.get(panel.id) is None
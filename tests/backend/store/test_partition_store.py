@@ -0,0 +1,148 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import Rating
+from app.backend.store import Store
+from app.backend.store.partition_store import add_months
+
+
+def test_partition_month_helpers():
+    """Test months are counted across years"""
+    assert add_months(date(2024, 11, 20), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 5), -1) == date(2023, 12, 1)
+
+
+def test_partitions_ensure_query_and_detach(store: Store):
+    """Test ratings land in monthly partitions that can be detached"""
+    # A month long past, so no other test writes to its partition
+    assert store.partitions.ensure(months_ahead=0, today=date(2001, 3, 15)) == [
+        "rating_200103"
+    ]
+    # Ensuring again is a no-op
+    assert store.partitions.ensure(months_ahead=0, today=date(2001, 3, 1)) == [
+        "rating_200103"
+    ]
+    listed = {p["name"]: p for p in store.partitions.list_all()}
+    assert listed["rating_200103"]["start"] == date(2001, 3, 1)
+    assert listed["rating_200103"]["end"] == date(2001, 4, 1)
+    # The current month is always ready
+    current = datetime.now(timezone.utc).strftime("rating_%Y%m")
+    assert current in listed
+
+    ad_id = store.ad.create(
+        Ad(image="https://example.com/partition-test.jpg", copy="Partition test ad")
+    )
+    old_personality = store.personality.create(Personality(name="Partition Old Person"))
+    new_personality = store.personality.create(Personality(name="Partition New Person"))
+
+    old_id = store.rating.create(
+        Rating(
+            personality=old_personality,
+            ad=ad_id,
+            thought="Seen a long time ago",
+            emotional_response="Indifferent",
+            emotions=[],
+            effectiveness="Good fit",
+            created_at=datetime(2001, 3, 10, tzinfo=timezone.utc),
+        )
+    )
+    new_id = store.rating.create(
+        Rating(
+            personality=new_personality,
+            ad=ad_id,
+            thought="Seen today",
+            emotional_response="Curious",
+            emotions=[],
+            effectiveness="Neutral/okay",
+        )
+    )
+    assert store.rating.get(old_id) is not None
+
+    # Time ranges only return the ratings in them
+    old = store.rating.get_ratings_by_ad(
+        ad_id, created_before=datetime(2001, 4, 1, tzinfo=timezone.utc)
+    )
+    assert [r.id for r in old] == [old_id]
+    recent = store.rating.get_ratings_by_ad(
+        ad_id, created_after=datetime(2001, 4, 1, tzinfo=timezone.utc)
+    )
+    assert [r.id for r in recent] == [new_id]
+
+    # A pair is still rated once, across partitions
+    with pytest.raises(Exception, match="idx_unique_personality_ad"):
+        store.rating.create(
+            Rating(
+                personality=old_personality,
+                ad=ad_id,
+                thought="Seen again",
+                emotional_response="Bored",
+                emotions=[],
+                effectiveness="Low fit",
+            )
+        )
+
+    try:
+        assert "rating_200103" in store.partitions.detach_before(date(2001, 4, 1))
+        assert "rating_200103" in store.partitions.list_detached()
+        assert "rating_200103" not in {p["name"] for p in store.partitions.list_all()}
+
+        # Detached ratings leave the table, but their pair stays rated
+        assert [r.id for r in store.rating.get_ratings_by_ad(ad_id)] == [new_id]
+        assert store.rating.get_rated_pairs([ad_id], [old_personality]) == {
+            (ad_id, old_personality)
+        }
+    finally:
+        with store.db_pool.get_transaction() as transaction:
+            transaction.execute("DROP TABLE IF EXISTS rating_200103")
+
+
+def test_partitions_ensure_moves_default_rows(store: Store):
+    """Test a month's ratings in the default partition move to its partition"""
+    ad_id = store.ad.create(Ad(image="https://example.com/default-partition.jpg"))
+    personality_id = store.personality.create(Personality(name="Default Person"))
+    # A month far ahead, whose partition doesn't exist yet
+    rating_id = store.rating.create(
+        Rating(
+            personality=personality_id,
+            ad=ad_id,
+            thought="Rated before its month was ready",
+            emotional_response="Curious",
+            emotions=["Interested"],
+            effectiveness="Good fit",
+            created_at=datetime(2098, 2, 10, tzinfo=timezone.utc),
+        )
+    )
+
+    def partition() -> str:
+        with store.db_pool.get_transaction() as transaction:
+            return transaction.query(
+                "SELECT tableoid::regclass::text AS name FROM rating WHERE id = %s",
+                (rating_id,),
+            )[0]["name"]
+
+    assert partition() == "rating_default"
+    summary = store.rating.get_summary(ad_id)
+
+    try:
+        assert store.partitions.ensure(months_ahead=0, today=date(2098, 2, 1)) == [
+            "rating_209802"
+        ]
+        assert partition() == "rating_209802"
+        assert "rating_default" not in store.partitions.list_detached()
+
+        # The move is invisible to the rating's pair and summary
+        assert store.rating.get(rating_id).thought == "Rated before its month was ready"
+        assert store.rating.get_summary(ad_id) == summary
+        assert store.rating.get_rated_pairs([ad_id], [personality_id]) == {
+            (ad_id, personality_id)
+        }
+
+        # The moved partition has the table's triggers
+        store.rating.delete(rating_id)
+        assert store.rating.get_rated_pairs([ad_id], [personality_id]) == set()
+    finally:
+        with store.db_pool.get_transaction() as transaction:
+            transaction.execute("DROP TABLE IF EXISTS rating_209802")
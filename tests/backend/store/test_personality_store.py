@@ -1,8 +1,12 @@
 import pytest
 from uuid import uuid4
 
+from app.backend.embeddings import LocalEmbedder
+from app.backend.models.category_assignment import CategoryAssignment
 from app.backend.models.personality import Personality
+from app.backend.persona_query import PersonaQuery
 from app.backend.store import Store
+from app.backend.store.personality_store import PersonalityStore
 
 
 def test_personality_create(store: Store):
@@ -159,3 +163,164 @@ def test_personality_find_by_criteria(store: Store):
     results = store.personality.find_by_criteria({"age": 30})
     assert len(results) >= 1
     assert all(p.age == 30 for p in results)
+
+
+def test_personality_query(store: Store):
+    """Test querying personalities with ranges, lists, ordering and paging"""
+    tag = str(uuid4())[:8]
+    for i, (age, interests) in enumerate([
+        (22, ["hiking", "music"]),
+        (28, ["hiking"]),
+        (31, ["cooking", "music"]),
+        (45, ["cycling"]),
+    ]):
+        store.personality.create(Personality(
+            name=f"Query {i}",
+            age=age,
+            industry=tag,
+            interests=interests,
+        ))
+
+    def names(query):
+        return [p.name for p in store.personality.query(query)]
+
+    base = lambda: PersonaQuery().where("industry", "=", tag).order_by("age")
+    assert names(base().where("age", "between", [25, 40])) == ["Query 1", "Query 2"]
+    assert names(base().where("interests", "overlaps", ["music", "cycling"])) == [
+        "Query 0", "Query 2", "Query 3"
+    ]
+    assert names(base().where("interests", "contains", ["hiking", "music"])) == [
+        "Query 0"
+    ]
+    assert names(base().where("age", "in", [22, 45])) == ["Query 0", "Query 3"]
+    assert names(
+        PersonaQuery().where("industry", "in", [tag]).order_by("age", True).page(2, 1)
+    ) == ["Query 2", "Query 1"]
+
+    explain = store.personality.explain(
+        base().where("interests", "contains", ["hiking"])
+    )
+    assert explain["total_cost"] > 0
+    assert "Sort" in explain["nodes"]
+
+
+def test_personality_bulk_upsert(store: Store):
+    """Test loading many personalities at once"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personalities = [
+        Personality(
+            id=str(uuid4()),
+            name=f"{test_id} Bulk Person {i}",
+            age=20 + i,
+            values=["Family", 'Quoted "value"', "Comma, separated"]
+        )
+        for i in range(3)
+    ]
+
+    counts = store.personality.bulk_upsert(personalities)
+    assert counts == {"inserted": 3, "updated": 0}
+
+    retrieved = store.personality.get(personalities[0].id)
+    assert retrieved.name == f"{test_id} Bulk Person 0"
+    assert retrieved.values == ["Family", 'Quoted "value"', "Comma, separated"]
+
+    # Loading an existing id updates it in place
+    personalities[0].name = f"{test_id} Bulk Person Updated"
+    counts = store.personality.bulk_upsert([personalities[0]])
+    assert counts == {"inserted": 0, "updated": 1}
+    assert store.personality.get(personalities[0].id).name == f"{test_id} Bulk Person Updated"
+
+
+def test_personality_select(store: Store):
+    """Test resolving a personality selection in one query"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+    category = f"{test_id} Select Category"
+
+    young = Personality(name=f"{test_id} Young", age=22, industry=f"{test_id} Tech")
+    older = Personality(name=f"{test_id} Older", age=52, industry=f"{test_id} Tech")
+    young_id = store.personality.create(young)
+    older_id = store.personality.create(older)
+
+    for personality_id in [young_id, older_id]:
+        store.category.create_assignment(
+            CategoryAssignment(personality=personality_id, category=category)
+        )
+
+    # Category members, narrowed by filters
+    selected, missing = store.personality.select(category=category)
+    assert set(selected.keys()) == {young_id, older_id}
+    assert selected[young_id].name == f"{test_id} Young"
+    assert missing == []
+
+    selected, missing = store.personality.select(category=category, max_age=30)
+    assert list(selected.keys()) == [young_id]
+
+    # Filters alone select from every personality
+    selected, missing = store.personality.select(industry=f"{test_id} Tech", min_age=50)
+    assert list(selected.keys()) == [older_id]
+
+    # Explicit IDs that don't exist are reported as missing
+    missing_id = str(uuid4())
+    selected, missing = store.personality.select(personality_ids=[young_id, missing_id])
+    assert list(selected.keys()) == [young_id]
+    assert missing == [missing_id]
+
+
+def test_personality_get_many(store: Store):
+    """Test getting several personalities in one call"""
+    personalities = [Personality(name=f"Get Many Person {i}") for i in range(3)]
+    personality_ids = [store.personality.create(p) for p in personalities]
+
+    missing_id = str(uuid4())
+    found = store.personality.get_many(personality_ids + [missing_id])
+
+    assert set(found.keys()) == set(personality_ids)
+    assert found[personality_ids[2]].name == "Get Many Person 2"
+    assert store.personality.get_many([]) == {}
+
+
+def test_personality_search(store: Store):
+    """Test semantic search over embedded personality profiles"""
+    personality_store = PersonalityStore(store.db_pool, LocalEmbedder())
+
+    parent = Personality(
+        name="Search Parent",
+        age=29,
+        children=2,
+        values=["Saving money", "Family"],
+        interests=["Budget cooking", "Coupons"],
+        summary="A budget conscious young parent",
+    )
+    executive = Personality(
+        name="Search Executive",
+        age=58,
+        interests=["Golf", "Luxury travel"],
+        summary="A wealthy executive who enjoys luxury",
+    )
+    personality_store.create(parent)
+    personality_store.create(executive)
+
+    results = personality_store.search("budget conscious young parent", k=2)
+    assert [p.id for p, _ in results][:1] == [parent.id]
+    assert results[0][1] > results[1][1]
+
+    # Updating a profile re-embeds it
+    executive.summary = "A budget conscious young parent on a tight budget"
+    executive.interests = ["Coupons", "Budget cooking"]
+    personality_store.update(executive)
+    results = personality_store.search("budget conscious young parent on a tight budget", k=2)
+    assert results[0][0].id == executive.id
+
+    # Bulk loaded personalities are picked up by embed_stale
+    bulk = Personality(name="Search Bulk", summary="A retired gardener")
+    personality_store.bulk_upsert([bulk])
+    assert personality_store.embed_stale() >= 1
+    assert personality_store.embed_stale() == 0
+    results = personality_store.search("retired gardener", k=1)
+    assert results[0][0].id == bulk.id
+
+    with pytest.raises(ValueError):
+        store.personality.search("anyone")
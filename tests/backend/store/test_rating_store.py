@@ -1,10 +1,12 @@
 import pytest
 from uuid import uuid4
 
+from app.backend.embeddings import LocalEmbedder
 from app.backend.models.ad import Ad
 from app.backend.models.personality import Personality
 from app.backend.models.rating import Rating
 from app.backend.store import Store
+from app.backend.store.rating_store import RatingStore
 
 
 def test_rating_create(store: Store):
@@ -22,7 +24,7 @@ def test_rating_create(store: Store):
         ad=ad_id,
         thought="This ad makes me think about quality products",
         emotional_response="Positive",
-        emotions="Happy, Satisfied",
+        emotions=["Happy", "Satisfied"],
         effectiveness="High"
     )
     
@@ -39,7 +41,8 @@ def test_rating_create(store: Store):
     assert retrieved.ad == ad_id
     assert retrieved.thought == "This ad makes me think about quality products"
     assert retrieved.emotional_response == "Positive"
-    assert retrieved.emotions == "Happy, Satisfied"
+    # Synonyms are stored as their canonical emotion
+    assert retrieved.emotions == ["Happy", "Fulfilled"]
     assert retrieved.effectiveness == "High"
 
 
@@ -58,7 +61,7 @@ def test_rating_update(store: Store):
         ad=ad_id,
         thought="Initial thought",
         emotional_response="Neutral",
-        emotions="None",
+        emotions=[],
         effectiveness="Low"
     )
     
@@ -69,7 +72,7 @@ def test_rating_update(store: Store):
     retrieved = store.rating.get(rating_id)
     retrieved.thought = "Updated thought"
     retrieved.emotional_response = "Positive"
-    retrieved.emotions = "Happy"
+    retrieved.emotions = ["Happy"]
     retrieved.effectiveness = "Medium"
     
     # Update in database
@@ -80,7 +83,7 @@ def test_rating_update(store: Store):
     updated = store.rating.get(rating_id)
     assert updated.thought == "Updated thought"
     assert updated.emotional_response == "Positive"
-    assert updated.emotions == "Happy"
+    assert updated.emotions == ["Happy"]
     assert updated.effectiveness == "Medium"
 
 
@@ -99,7 +102,7 @@ def test_rating_delete(store: Store):
         ad=ad_id,
         thought="Delete test thought",
         emotional_response="Neutral",
-        emotions="None",
+        emotions=[],
         effectiveness="Low"
     )
     
@@ -136,7 +139,7 @@ def test_rating_list_all(store: Store):
             ad=ad_id,
             thought=f"{test_id} Rating thought 1",
             emotional_response="Positive",
-            emotions="Happy",
+            emotions=["Happy"],
             categories=["Test", "List1"]
         ),
         Rating(
@@ -144,7 +147,7 @@ def test_rating_list_all(store: Store):
             ad=ad_id,
             thought=f"{test_id} Rating thought 2",
             emotional_response="Neutral",
-            emotions="Calm",
+            emotions=["Calm"],
             categories=["Test", "List2"]
         ),
         Rating(
@@ -152,7 +155,7 @@ def test_rating_list_all(store: Store):
             ad=ad_id,
             thought=f"{test_id} Rating thought 3",
             emotional_response="Negative",
-            emotions="Sad",
+            emotions=["Sad"],
             categories=["Test", "List3"]
         )
     ]
@@ -194,7 +197,7 @@ def test_get_ratings_by_personality(store: Store):
             ad=ad_id,
             thought=f"{test_id} Personality rating 1",
             emotional_response="Positive",
-            emotions="Happy",
+            emotions=["Happy"],
             categories=["Test"]
         ),
         Rating(
@@ -202,7 +205,7 @@ def test_get_ratings_by_personality(store: Store):
             ad=ad_id,
             thought=f"{test_id} Personality rating 2",
             emotional_response="Neutral",
-            emotions="Calm",
+            emotions=["Calm"],
             categories=["Test"]
         )
     ]
@@ -248,7 +251,7 @@ def test_get_ratings_by_ad(store: Store):
             ad=ad_id,
             thought=f"{test_id} Ad rating 1",
             emotional_response="Positive",
-            emotions="Happy",
+            emotions=["Happy"],
             categories=["Test"]
         ),
         Rating(
@@ -256,7 +259,7 @@ def test_get_ratings_by_ad(store: Store):
             ad=ad_id,
             thought=f"{test_id} Ad rating 2",
             emotional_response="Negative",
-            emotions="Disappointed",
+            emotions=["Disappointed"],
             categories=["Test"]
         )
     ]
@@ -302,7 +305,7 @@ def test_get_ratings_by_effectiveness(store: Store):
             ad=ad_id,
             thought=f"{test_id} High effectiveness",
             emotional_response="Positive",
-            emotions="Happy",
+            emotions=["Happy"],
             effectiveness=test_effectiveness
         ),
         Rating(
@@ -310,7 +313,7 @@ def test_get_ratings_by_effectiveness(store: Store):
             ad=ad_id,
             thought=f"{test_id} Low effectiveness",
             emotional_response="Neutral",
-            emotions="Calm",
+            emotions=["Calm"],
             effectiveness="Low"
         )
     ]
@@ -326,3 +329,430 @@ def test_get_ratings_by_effectiveness(store: Store):
     assert len(effectiveness_ratings) >= 1
     assert any(r.thought == f"{test_id} High effectiveness" for r in effectiveness_ratings)
     assert not any(r.thought == f"{test_id} Low effectiveness" for r in effectiveness_ratings)
+
+
+def test_export_ratings(store: Store):
+    """Test streaming ratings joined with personality and ad data"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personality = Personality(name=f"{test_id} Export Person", age=41)
+    personality_id = store.personality.create(personality)
+
+    ad = Ad(image=f"https://example.com/{test_id}-export.jpg", copy=f"{test_id} Export ad")
+    ad_id = store.ad.create(ad)
+
+    rating = Rating(
+        personality=personality_id,
+        ad=ad_id,
+        thought=f"{test_id} Export thought",
+        emotional_response="Positive",
+        emotions=["Happy"],
+        effectiveness="Good Fit"
+    )
+    store.rating.create(rating)
+
+    # Export only this ad's ratings
+    rows = list(store.rating.export(ad_id=ad_id, chunk_size=1))
+
+    assert len(rows) == 1
+    assert set(rows[0].keys()) == set(store.rating.EXPORT_COLUMNS)
+    assert rows[0]["thought"] == f"{test_id} Export thought"
+    assert rows[0]["personality_name"] == f"{test_id} Export Person"
+    assert rows[0]["personality_age"] == 41
+    assert rows[0]["ad_copy"] == f"{test_id} Export ad"
+
+    # Filters that exclude the rating return nothing
+    assert list(store.rating.export(ad_id=ad_id, effectiveness="Low Fit")) == []
+
+
+def test_get_rated_pairs(store: Store):
+    """Test finding which ad/personality pairs already have ratings"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personality_ids = [
+        store.personality.create(Personality(name=f"{test_id} Pair Person {i}"))
+        for i in range(2)
+    ]
+    ad_ids = [
+        store.ad.create(Ad(copy=f"{test_id} Pair ad {i}"))
+        for i in range(2)
+    ]
+
+    # Rate only the first ad with the first personality
+    store.rating.create(Rating(
+        personality=personality_ids[0],
+        ad=ad_ids[0],
+        thought=f"{test_id} Pair thought",
+        emotional_response="Positive",
+        emotions=["Happy"],
+        effectiveness="Good Fit"
+    ))
+
+    rated = store.rating.get_rated_pairs(ad_ids, personality_ids)
+    assert rated == {(ad_ids[0], personality_ids[0])}
+
+    assert store.rating.get_rated_pairs([], personality_ids) == set()
+
+
+def test_ratings_by_emotion(store: Store):
+    """Test filtering and counting ratings by canonical emotion"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personality_ids = [
+        store.personality.create(Personality(name=f"{test_id} Emotion Person {i}"))
+        for i in range(2)
+    ]
+    ad_id = store.ad.create(Ad(copy=f"{test_id} Emotion ad"))
+
+    store.rating.create(Rating(
+        personality=personality_ids[0],
+        ad=ad_id,
+        thought=f"{test_id} Emotion thought 1",
+        emotional_response="Positive",
+        emotions=["happy", "Curious"],
+        effectiveness="Good Fit"
+    ))
+    store.rating.create(Rating(
+        personality=personality_ids[1],
+        ad=ad_id,
+        thought=f"{test_id} Emotion thought 2",
+        emotional_response="Negative",
+        emotions=["Frustrated", "Dissapointed"],
+        effectiveness="Low Fit"
+    ))
+
+    # Synonyms and misspellings match their canonical emotion
+    ratings = store.rating.get_ratings_by_emotion("interested")
+    thoughts = {r.thought for r in ratings}
+    assert f"{test_id} Emotion thought 1" in thoughts
+    assert f"{test_id} Emotion thought 2" not in thoughts
+
+    ratings = store.rating.get_ratings_by_ad(ad_id)
+    emotions = {r.thought: r.emotions for r in ratings}
+    assert emotions[f"{test_id} Emotion thought 1"] == ["Happy", "Interested"]
+    assert emotions[f"{test_id} Emotion thought 2"] == ["Frustrated", "Disappointed"]
+
+    counts = store.rating.get_emotion_counts(ad_id)
+    assert counts["ratings"] == 2
+    assert counts["groups"]["happy"] == 1
+    assert counts["groups"]["anger"] == 1
+    assert counts["groups"]["disgust"] == 1
+    assert counts["groups"]["fear"] == 0
+    assert counts["emotions"]["Interested"] == 1
+
+    with pytest.raises(ValueError):
+        store.rating.get_ratings_by_emotion("Not an emotion")
+
+
+def test_emotion_table_matches_taxonomy(store: Store):
+    """Test the seeded emotion table matches the taxonomy module"""
+    from app.backend import emotions
+
+    with store.rating.db_pool.get_transaction() as transaction:
+        rows = transaction.query("SELECT id, name, group_name FROM emotion")
+        groups = transaction.query("SELECT id, name, bit FROM emotion_group")
+
+    assert {r["id"]: (r["name"], r["group_name"]) for r in rows} == emotions.EMOTIONS
+    assert {g["name"]: g["bit"] for g in groups} == {
+        group: emotions.group_bit(group) for group in emotions.GROUPS
+    }
+
+
+def test_leaderboard(store: Store):
+    """Test ranking ads by mean effectiveness"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    industry = f"{test_id} Industry"
+    personality_ids = [
+        store.personality.create(Personality(
+            name=f"{test_id} Leaderboard Person {i}",
+            age=30 + i * 10,
+            industry=industry,
+        ))
+        for i in range(2)
+    ]
+    ad_ids = [
+        store.ad.create(Ad(copy=f"{test_id} Leaderboard ad {i}"))
+        for i in range(2)
+    ]
+
+    # The first ad fits both personalities better than the second
+    for ad_id, levels in zip(ad_ids, [["Strong Match", "Good Fit"], ["Low Fit", "good fit"]]):
+        for personality_id, effectiveness in zip(personality_ids, levels):
+            store.rating.create(Rating(
+                personality=personality_id,
+                ad=ad_id,
+                thought=f"{test_id} Leaderboard thought",
+                emotional_response="Positive",
+                emotions=["Happy"],
+                effectiveness=effectiveness
+            ))
+
+    board = store.rating.leaderboard(segment=f"industry:{industry}")
+    assert [entry["ad"] for entry in board] == ad_ids
+    assert board[0]["ratings"] == 2
+    assert board[0]["mean_effectiveness"] == 4.5
+    assert board[0]["levels"]["Strong Match"] == 1
+    assert board[1]["mean_effectiveness"] == 3.0
+
+    # Only the older personality's ratings
+    board = store.rating.leaderboard(segment=f"industry:{industry},age:35-")
+    assert [entry["mean_effectiveness"] for entry in board] == [4.0, 4.0]
+
+    assert len(store.rating.get_ratings_by_effectiveness("Good Fit")) >= 2
+
+    with pytest.raises(ValueError):
+        store.rating.leaderboard(segment="shoe_size:9")
+
+
+def test_rating_summary(store: Store):
+    """Test the per-ad summary follows rating changes"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personality_ids = [
+        store.personality.create(Personality(name=f"{test_id} Summary Person {i}"))
+        for i in range(2)
+    ]
+    ad_id = store.ad.create(Ad(copy=f"{test_id} Summary ad"))
+
+    summary = store.rating.get_summary(ad_id)
+    assert summary["ratings"] == 0
+    assert summary["mean_effectiveness"] is None
+
+    rating_ids = [
+        store.rating.create(Rating(
+            personality=personality_id,
+            ad=ad_id,
+            thought=f"{test_id} Summary thought",
+            emotional_response="Mixed",
+            emotions=emotions,
+            effectiveness=effectiveness
+        ))
+        for personality_id, emotions, effectiveness in zip(
+            personality_ids,
+            [["Happy", "Hopeful"], ["Frustrated"]],
+            ["Strong Match", "Low Fit"],
+        )
+    ]
+
+    summary = store.rating.get_summary(ad_id)
+    assert summary["ratings"] == 2
+    assert summary["mean_effectiveness"] == 3.5
+    assert summary["effectiveness"]["Strong Match"] == 1
+    assert summary["effectiveness"]["Low Fit"] == 1
+    assert summary["emotion_groups"]["happy"] == 1
+    assert summary["emotion_groups"]["anger"] == 1
+    assert summary["last_updated"] is not None
+
+    # Updating a rating moves it between buckets
+    rating = store.rating.get(rating_ids[1])
+    rating.effectiveness = "Good Fit"
+    rating.emotions = ["Joyful"]
+    store.rating.update(rating)
+
+    summary = store.rating.get_summary(ad_id)
+    assert summary["ratings"] == 2
+    assert summary["mean_effectiveness"] == 4.5
+    assert summary["effectiveness"]["Low Fit"] == 0
+    assert summary["emotion_groups"]["happy"] == 2
+    assert summary["emotion_groups"]["anger"] == 0
+
+    store.rating.delete(rating_ids[0])
+
+    summary = store.rating.get_summary(ad_id)
+    assert summary["ratings"] == 1
+    assert summary["mean_effectiveness"] == 4.0
+
+
+def test_get_labels(store: Store):
+    """Test getting training labels, filtered by the model that rated"""
+    # Model versions are unique, as other tests' ratings share the database
+    version = str(uuid4())[:8]
+    personality_id = store.personality.create(Personality(name="Label Person"))
+    ad_id = store.ad.create(Ad(image="https://example.com/labels.jpg", copy="Labels"))
+    other_ad_id = store.ad.create(Ad(image="https://example.com/other.jpg", copy="Other"))
+
+    rating_id = store.rating.create(Rating(
+        personality=personality_id,
+        ad=ad_id,
+        thought="Cheerful",
+        emotional_response="Positive",
+        emotions=["Happy"],
+        effectiveness="Good Fit",
+        model_version=f"test-model-{version}/json",
+    ))
+    store.rating.create(Rating(
+        personality=personality_id,
+        ad=other_ad_id,
+        thought="Dull",
+        emotional_response="Negative",
+        emotions=[],
+        effectiveness="Low Fit",
+        model_version=f"other-model-{version}/text",
+    ))
+
+    labels = store.rating.get_labels(model_version=f"test-model-{version}/json")
+    assert len(labels) == 1
+    assert labels[0]["personality"] == personality_id
+    assert labels[0]["ad"] == ad_id
+    assert labels[0]["level"] == 4
+    assert labels[0]["groups"] != 0
+
+    pairs = {(label["personality"], label["ad"]) for label in store.rating.get_labels()}
+    assert {(personality_id, ad_id), (personality_id, other_ad_id)} <= pairs
+    assert store.rating.get(rating_id).model_version == f"test-model-{version}/json"
+
+
+def test_copy_ratings(store: Store):
+    """Test copying a near duplicate ad's ratings to a new ad"""
+    first = store.personality.create(Personality(name="Copy Person 1"))
+    second = store.personality.create(Personality(name="Copy Person 2"))
+    source_id = store.ad.create(Ad(image="https://example.com/original.jpg"))
+    ad_id = store.ad.create(Ad(image="https://example.com/recropped.jpg"))
+
+    for personality_id in (first, second):
+        store.rating.create(Rating(
+            personality=personality_id,
+            ad=source_id,
+            thought="Looks familiar",
+            emotional_response="Positive",
+            emotions=["Happy"],
+            effectiveness="Strong Match",
+            model_version="test-model/json",
+        ))
+
+    copies = store.rating.copy_ratings(source_id, ad_id, [first])
+    assert len(copies) == 1
+    assert copies[0].personality == first
+    assert copies[0].ad == ad_id
+    assert copies[0].emotions == ["Happy"]
+    assert copies[0].model_version == "test-model/json"
+    assert store.rating.get_summary(ad_id)["ratings"] == 1
+
+    # Personalities that already rated the ad are skipped
+    copies = store.rating.copy_ratings(source_id, ad_id, [first, second])
+    assert [rating.personality for rating in copies] == [second]
+    assert store.rating.copy_ratings(source_id, ad_id, []) == []
+
+
+def test_embed_pending(store: Store):
+    """Test embedding only the ratings without a current embedding"""
+    rating_store = RatingStore(store.db_pool, LocalEmbedder())
+    ad_id = store.ad.create(Ad(image="https://example.com/themes.jpg"))
+    other_id = store.ad.create(Ad(image="https://example.com/other.jpg"))
+
+    ratings = []
+    for i, thought in enumerate(["Too expensive for me", "Love the colours"]):
+        personality_id = store.personality.create(Personality(name=f"Embed {i}"))
+        rating = Rating(
+            personality=personality_id,
+            ad=ad_id,
+            thought=thought,
+            emotional_response="Mixed",
+            emotions=["Happy"],
+            effectiveness="Good Fit",
+        )
+        store.rating.create(rating)
+        ratings.append(rating)
+    store.rating.create(Rating(
+        personality=ratings[0].personality,
+        ad=other_id,
+        thought="Not for me",
+        emotional_response="Indifferent",
+        emotions=["Neutral"],
+        effectiveness="Low Fit",
+    ))
+
+    assert rating_store.get_embedded(ad_id)[0] == []
+    assert rating_store.embed_pending(ad_id, batch_size=1) == 2
+    assert rating_store.embed_pending(ad_id) == 0
+
+    embedded, vectors = rating_store.get_embedded(ad_id)
+    assert {rating.id for rating in embedded} == {rating.id for rating in ratings}
+    assert vectors.shape == (2, 768)
+    expected = LocalEmbedder().embed_texts([
+        f"{rating.thought}\n\n{rating.emotional_response}" for rating in embedded
+    ])
+    assert abs(vectors - expected).max() < 1e-5
+
+    # Changed ratings are embedded again
+    ratings[0].thought = "Fair price after all"
+    store.rating.update(ratings[0])
+    assert rating_store.embed_pending(ad_id) == 1
+    assert rating_store.get_embedded(other_id)[0] == []
+    # Without an ad every pending rating is embedded, the other ad's too
+    assert rating_store.embed_pending() >= 1
+    assert len(rating_store.get_embedded(other_id)[0]) == 1
+    assert rating_store.embed_pending() == 0
+
+
+def test_rating_search(store: Store):
+    """Test full-text search over thoughts and emotional responses"""
+    ad_id = store.ad.create(Ad(image="https://example.com/search.jpg"))
+    texts = [
+        ("This looks far too expensive for what it is", "Put off by the price", "Low Fit"),
+        ("Great colours, but the expense worries me", "Hesitant", "Neutral/Okay"),
+        ("Exactly what I need for my morning run, worth the price", "Excited", "Strong Match"),
+    ]
+    ratings = []
+    for i, (thought, response, effectiveness) in enumerate(texts):
+        personality_id = store.personality.create(Personality(name=f"Search {i}"))
+        rating = Rating(
+            personality=personality_id,
+            ad=ad_id,
+            thought=thought,
+            emotional_response=response,
+            emotions=["Anxious"] if i < 2 else ["Excited"],
+            effectiveness=effectiveness,
+        )
+        store.rating.create(rating)
+        ratings.append(rating)
+
+    # Words match in any form
+    results = {
+        r["rating"].id: r for r in store.rating.search("expensive", {"ad": ad_id})
+    }
+    assert set(results) == {ratings[0].id, ratings[1].id}
+    assert "<b>expensive</b>" in results[ratings[0].id]["snippets"]["thought"]
+    assert "<b>expense</b>" in results[ratings[1].id]["snippets"]["thought"]
+
+    # Matches in the thought rank above those in the emotional response
+    results = store.rating.search("price", {"ad": ad_id})
+    assert [r["rating"].id for r in results] == [ratings[2].id, ratings[0].id]
+    assert results[0]["rank"] > results[1]["rank"] > 0
+
+    # Phrases, exclusions and alternatives
+    assert [r["rating"].id for r in store.rating.search('"far too expensive"', {"ad": ad_id})] == [ratings[0].id]
+    assert [r["rating"].id for r in store.rating.search("expensive -colours", {"ad": ad_id})] == [ratings[0].id]
+    assert len(store.rating.search("price or run", {"ad": ad_id})) == 2
+
+    # Filters and paging
+    assert [
+        r["rating"].id
+        for r in store.rating.search("expensive", {"ad": ad_id, "effectiveness": "neutral/okay"})
+    ] == [ratings[1].id]
+    assert store.rating.search("expensive", {"ad": ad_id, "emotion": "Excited"}) == []
+    assert len(store.rating.search("expensive", {"ad": ad_id}, limit=1, offset=1)) == 1
+
+    # Edited ratings are searched by their new text
+    ratings[2].thought = "Too pricey for a running shoe"
+    store.rating.update(ratings[2])
+    assert [r["rating"].id for r in store.rating.search("pricey", {"ad": ad_id})] == [ratings[2].id]
+
+    # Snippets are HTML escaped, with only the matches tagged
+    ratings[2].thought = 'Pricey <img src=x onerror="alert(1)"> at 5 < 6 & <b>loud</b>'
+    store.rating.update(ratings[2])
+    snippet = store.rating.search("pricey", {"ad": ad_id})[0]["snippets"]["thought"]
+    assert snippet.startswith("<b>Pricey</b>")
+    assert "5 &lt; 6 &amp;" in snippet
+    assert "<img" not in snippet and "<b>loud" not in snippet
+
+    with pytest.raises(ValueError):
+        store.rating.search("expensive", {"colour": "red"})
+    with pytest.raises(ValueError):
+        store.rating.search("expensive", {"effectiveness": "Great"})
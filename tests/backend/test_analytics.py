@@ -0,0 +1,150 @@
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from app.backend.analytics import AdComparer, SegmentAnalytics, bootstrap_means
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import EFFECTIVENESS, Rating
+from app.backend.store import Store
+
+
+def test_segment_analytics(store: Store):
+    """Test segment statistics computed from the cached columns"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+    industry = f"{test_id} Industry"
+
+    analytics = SegmentAnalytics(store.rating.db_pool, max_staleness=0)
+
+    personality_ids = [
+        store.personality.create(Personality(
+            name=f"{test_id} Analytics Person {i}",
+            age=age,
+            gender=gender,
+            industry=industry,
+            lifestyle=["urban professional"] if i < 2 else ["rural"],
+        ))
+        for i, (age, gender) in enumerate([(28, "Female"), (31, "Male"), (52, "Female")])
+    ]
+    ad_id = store.ad.create(Ad(copy=f"{test_id} Analytics ad"))
+
+    def rate(personality_id, emotions, effectiveness):
+        return store.rating.create(Rating(
+            personality=personality_id,
+            ad=ad_id,
+            thought=f"{test_id} Analytics thought",
+            emotional_response="Mixed",
+            emotions=emotions,
+            effectiveness=effectiveness
+        ))
+
+    rate(personality_ids[0], ["Happy", "Interested"], "Strong Match")
+    rate(personality_ids[1], ["Interested"], "Good Fit")
+
+    result = analytics.segments(
+        segment=f"industry:{industry},age:25-34", group_by=["gender"], ad_id=ad_id
+    )
+    assert result["segment"]["ratings"] == 2
+    assert result["segment"]["mean_effectiveness"] == 4.5
+    assert result["segment"]["emotion_groups"]["happy"] == 1.0
+    assert result["segment"]["top_emotions"][0] == {"emotion": "Interested", "share": 1.0}
+    assert result["rest"]["ratings"] == 0
+    groups = {g["group"]["gender"]: g for g in result["groups"]}
+    assert groups["Female"]["mean_effectiveness"] == 5.0
+    assert groups["Male"]["mean_effectiveness"] == 4.0
+
+    # New ratings are picked up incrementally
+    rate(personality_ids[2], ["Bored"], "Not Relevant")
+
+    result = analytics.segments(
+        segment=f"industry:{industry},lifestyle:urban professional", ad_id=ad_id
+    )
+    assert result["segment"]["ratings"] == 2
+    assert result["rest"]["ratings"] == 1
+    assert result["rest"]["mean_effectiveness"] == 1.0
+    assert result["rest"]["emotion_groups"]["sad"] == 1.0
+
+    result = analytics.segments(
+        segment=f"industry:{industry}", group_by=["age"], ad_id=ad_id
+    )
+    ages = {g["group"]["age"]: g["ratings"] for g in result["groups"]}
+    assert ages == {"25-34": 2, "45-54": 1}
+
+    # Deleted ratings drop out
+    store.rating.delete(
+        store.rating.get_ratings_by_personality(personality_ids[2])[0].id
+    )
+    result = analytics.segments(segment=f"industry:{industry}", ad_id=ad_id)
+    assert result["segment"]["ratings"] == 2
+
+    # A refresh that can't load keeps answering from the last snapshot
+    update = analytics._SegmentAnalytics__update
+    analytics._SegmentAnalytics__update = lambda snapshot: None
+    result = analytics.segments(segment=f"industry:{industry}", ad_id=ad_id)
+    assert result["segment"]["ratings"] == 2
+    analytics._SegmentAnalytics__update = update
+
+    with pytest.raises(ValueError):
+        analytics.segments(group_by=["lifestyle"])
+
+
+def test_compare_ads(store: Store):
+    """Test paired comparison of two ads with bootstrap intervals"""
+    # Create a unique identifier for this test
+    test_id = str(uuid4())[:8]
+
+    personality_ids = [
+        store.personality.create(Personality(name=f"{test_id} Compare Person {i}"))
+        for i in range(6)
+    ]
+    ad_a = store.ad.create(Ad(copy=f"{test_id} Compare ad A"))
+    ad_b = store.ad.create(Ad(copy=f"{test_id} Compare ad B"))
+
+    # Ad B is rated one level higher by everyone but the last personality,
+    # who only rated ad A
+    for i, personality_id in enumerate(personality_ids):
+        for ad_id, level in [(ad_a, 2), (ad_b, 3)]:
+            if ad_id == ad_b and i == 5:
+                continue
+            store.rating.create(Rating(
+                personality=personality_id,
+                ad=ad_id,
+                thought=f"{test_id} Compare thought",
+                emotional_response="Mixed",
+                emotions=["Happy"] if ad_id == ad_b else ["Bored"],
+                effectiveness=EFFECTIVENESS[level - 1]
+            ))
+
+    comparer = AdComparer(store.rating)
+    result = comparer.compare(ad_a, ad_b, resamples=2000)
+
+    assert result["pairs"] == 5
+    assert result["effectiveness"]["mean_a"] == 2.0
+    assert result["effectiveness"]["mean_b"] == 3.0
+    assert result["effectiveness"]["delta"] == 1.0
+    assert result["effectiveness"]["ci"] == [1.0, 1.0]
+    assert result["emotion_groups"]["happy"]["delta"] == 1.0
+    assert result["emotion_groups"]["sad"]["delta"] == -1.0
+
+    # Unchanged ratings are served from the cache
+    assert comparer.compare(ad_a, ad_b, resamples=2000) is result
+
+    store.rating.delete(store.rating.get_ratings_by_ad(ad_b)[0].id)
+    result = comparer.compare(ad_a, ad_b, resamples=2000)
+    assert result["pairs"] == 4
+
+
+def test_bootstrap_means():
+    """Test resampled means are centered on the sample mean"""
+    rng = np.random.default_rng(1)
+    values = rng.normal(5.0, 1.0, size=(200, 1))
+    valid = np.ones_like(values, dtype=bool)
+
+    samples = bootstrap_means(values, valid, 5000, rng, max_cells=100000)
+
+    assert samples.shape == (5000, 1)
+    assert abs(samples.mean() - values.mean()) < 0.01
+    # Standard error of the mean is about 1 / sqrt(200)
+    assert 0.05 < samples.std() < 0.09
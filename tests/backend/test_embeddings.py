@@ -0,0 +1,50 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.backend.embeddings import DIMENSIONS, Embedder, LocalEmbedder
+
+
+def _image(seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(blocks).resize((64, 64)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_local_embedder():
+    """Test the local embedder is deterministic and ranks by overlap"""
+    embedder = LocalEmbedder()
+    texts = [
+        "Summer sale on running shoes",
+        "Running shoes on sale this summer",
+        "Retirement planning for seniors",
+    ]
+    vectors = embedder.embed_texts(texts)
+    assert vectors.shape == (3, DIMENSIONS)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+    assert np.allclose(LocalEmbedder().embed_texts(texts), vectors)
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+
+    image = embedder.embed_ad(None, _image(1))
+    both = embedder.embed_ad("Summer sale", _image(1))
+    assert image.shape == (DIMENSIONS,)
+    assert np.isclose(np.linalg.norm(both), 1)
+    assert image @ embedder.embed_ad(None, _image(1)) > 0.999
+    assert image @ embedder.embed_ad(None, _image(2)) < 0.9
+    assert embedder.embed_ad(None, b"not an image") is None
+    assert embedder.embed_ad(None, None) is None
+
+
+def test_incomplete_embedder_cannot_be_constructed():
+    """Test an embedder missing a method fails when it is constructed"""
+
+    class TextOnly(Embedder):
+        def embed_texts(self, texts, query=False):
+            return np.zeros((len(texts), DIMENSIONS))
+
+    with pytest.raises(TypeError):
+        TextOnly()
@@ -0,0 +1,127 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from app.backend import emotions
+
+MIGRATION = (
+    Path(__file__).parents[2]
+    / "app"
+    / "backend"
+    / "store"
+    / "migrations"
+    / "06.rating.emotions.sql"
+)
+
+
+def test_names_are_unique():
+    """Test emotions listed twice in the old free-form list appear once"""
+    assert len(emotions.NAMES) == len(set(emotions.NAMES))
+    assert emotions.NAMES.count("Excited") == 1
+    assert emotions.NAMES.count("Inferior") == 1
+    assert emotions.normalize_all(["Excited", "Inferior", "excited", "INFERIOR"]) == [
+        3,
+        36,
+    ]
+
+
+def test_taxonomy_matches_migration():
+    """Test the ids and groups seeded in the database match the module"""
+    sql = MIGRATION.read_text()
+    seeded = {
+        int(i): (name, group)
+        for i, name, group in re.findall(r"\((\d+), '(\w+)', '(\w+)'\)", sql)
+    }
+    assert seeded == emotions.EMOTIONS
+
+    seeded_groups = re.findall(r"\((\d+), '(\w+)', (\d+)\)", sql)
+    assert [
+        (int(i), group, int(bit)) for i, group, bit in seeded_groups
+    ] == [
+        (i, group, emotions.group_bit(group))
+        for i, group in enumerate(emotions.GROUPS)
+    ]
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("Happy", "Happy"),
+        ("happy", "Happy"),
+        ("  EXCITED!! ", "Excited"),
+        ("excited.", "Excited"),
+        ("Left-Out", "Alienated"),
+        ("curious", "Interested"),
+        ("Thrilled", "Excited"),
+    ],
+)
+def test_normalize_case_and_punctuation(name, expected):
+    """Test names and synonyms match regardless of case and punctuation"""
+    assert emotions.names([emotions.normalize(name)]) == [expected]
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("Hapy", "Happy"),
+        ("Excitd", "Excited"),
+        ("Frustated", "Frustrated"),
+        ("Disapointed", "Disappointed"),
+        ("Inferrior", "Inferior"),
+        ("Hopefull", "Hopeful"),
+        ("Anxius", "Anxious"),
+    ],
+)
+def test_normalize_misspellings(name, expected):
+    """Test close misspellings fuzzy match their emotion"""
+    assert emotions.names([emotions.normalize(name)]) == [expected]
+
+
+@pytest.mark.parametrize(
+    "name", ["Bad", "Cold", "Tired", "Neutral", "Lovely", "Happily", "", " ?! "]
+)
+def test_normalize_unknown(name):
+    """Test words that only loosely resemble an emotion aren't matched"""
+    assert emotions.normalize(name) is None
+
+
+def test_normalize_all():
+    """Test unknown and repeated emotions are dropped, keeping the order"""
+    ids = emotions.normalize_all("Sad, teleported, happy , SAD, glad, ")
+    assert emotions.names(ids) == ["Sad", "Happy"]
+    assert emotions.normalize_all([]) == []
+    assert emotions.names([1, 9999, 105]) == ["Happy", "Amazed"]
+
+
+def test_names_order():
+    """Test names are offered in id order, and kept in the order given"""
+    assert emotions.NAMES[0] == "Happy"
+    assert emotions.NAMES[-1] == "Amazed"
+    assert emotions.NAMES == [
+        emotions.EMOTIONS[i][0] for i in sorted(emotions.EMOTIONS)
+    ]
+    assert emotions.names([105, 1, 36]) == ["Amazed", "Happy", "Inferior"]
+
+
+def test_group_bits_and_masks():
+    """Test every group has its own bit, and masks combine them"""
+    bits = [emotions.group_bit(group) for group in emotions.GROUPS]
+    assert bits == [1, 2, 4, 8, 16, 32, 64]
+    assert len(emotions.GROUPS) == 7
+    with pytest.raises(ValueError):
+        emotions.group_bit("bliss")
+
+    # One emotion of each group sets every bit
+    first_of_group = {}
+    for i in sorted(emotions.EMOTIONS):
+        first_of_group.setdefault(emotions.group_of(i), i)
+    assert sorted(first_of_group) == sorted(emotions.GROUPS)
+    mask = emotions.group_mask(first_of_group.values())
+    assert mask == 0b1111111
+    assert emotions.groups(mask) == emotions.GROUPS
+
+    # Repeated groups and unknown ids add nothing
+    assert emotions.group_mask([1, 2, 3, 9999]) == emotions.group_bit("happy")
+    assert emotions.groups(emotions.group_mask([83, 31])) == ["fear", "sad"]
+    assert emotions.group_mask([]) == 0
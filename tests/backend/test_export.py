@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from uuid import uuid4
+
+import pyarrow.parquet as pq
+
+from app.backend.export import encode_csv, encode_ndjson, encode_parquet
+
+COLUMNS = ["id", "thought", "emotions", "personality_income", "created_at"]
+
+
+def _rows(count: int):
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    return [
+        {
+            "id": uuid4(),
+            "thought": f"Thought {i}",
+            "emotions": ["Happy", "Curious"] if i % 2 == 0 else [],
+            "personality_income": Decimal("52000.50") if i % 3 else None,
+            "created_at": created_at,
+            # Columns not asked for are left out
+            "extra": "ignored",
+        }
+        for i in range(count)
+    ]
+
+
+def test_encode_ndjson():
+    """Test rows encode as one JSON object per line, in chunks"""
+    rows = _rows(5)
+    chunks = list(encode_ndjson(rows, COLUMNS, chunk_size=2))
+    assert len(chunks) == 3
+
+    lines = b"".join(chunks).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 5
+    assert list(records[0]) == COLUMNS
+    assert records[0]["id"] == str(rows[0]["id"])
+    assert records[0]["emotions"] == ["Happy", "Curious"]
+    assert records[1]["emotions"] == []
+    assert records[0]["personality_income"] is None
+    assert records[1]["personality_income"] == 52000.5
+    assert records[0]["created_at"] == "2024-05-01T12:30:00+00:00"
+    assert list(encode_ndjson([], COLUMNS)) == []
+
+
+def test_encode_csv():
+    """Test rows encode as CSV with a header, quoting where needed"""
+    rows = _rows(3)
+    rows[1]["thought"] = 'Cheap, but "loud"\nand bright'
+    chunks = list(encode_csv(rows, COLUMNS, chunk_size=2))
+    assert len(chunks) == 2
+
+    text = b"".join(chunks).decode()
+    assert '"Cheap, but ""loud""\nand bright"' in text
+
+    records = list(csv.reader(io.StringIO(text)))
+    assert records[0] == COLUMNS
+    assert len(records) == 4
+    assert records[1] == [
+        str(rows[0]["id"]),
+        "Thought 0",
+        '["Happy", "Curious"]',
+        "",
+        "2024-05-01T12:30:00+00:00",
+    ]
+    assert records[2][1] == 'Cheap, but "loud"\nand bright'
+    assert records[2][2] == "[]"
+    assert records[2][3] == "52000.50"
+    # The header alone for no rows
+    assert b"".join(encode_csv([], COLUMNS)).decode().strip() == ",".join(COLUMNS)
+
+
+def test_encode_parquet_row_groups():
+    """Test Parquet output is written one row group at a time"""
+    rows = _rows(25)
+    chunks = list(encode_parquet(rows, COLUMNS, row_group_size=10))
+    # One chunk per row group, and the footer
+    assert len(chunks) == 4
+
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    assert parquet.metadata.num_rows == 25
+    assert parquet.num_row_groups == 3
+    assert parquet.metadata.row_group(2).num_rows == 5
+
+    table = parquet.read()
+    assert table.column_names == COLUMNS
+    records = table.to_pylist()
+    assert records[0]["id"] == str(rows[0]["id"])
+    assert records[0]["emotions"] == ["Happy", "Curious"]
+    assert records[1]["emotions"] == []
+    assert records[0]["personality_income"] is None
+    assert records[1]["personality_income"] == 52000.5
+    assert records[24]["created_at"] == rows[24]["created_at"]
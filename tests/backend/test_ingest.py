@@ -0,0 +1,163 @@
+import io
+from uuid import uuid4
+
+import pytest
+
+from app.backend.ingest import (
+    detect_format,
+    ingest_personalities,
+    read_csv,
+    read_ndjson,
+    validate_personality,
+)
+
+
+class _Store:
+    """Records the personalities bulk loaded, failing on request"""
+
+    def __init__(self, fail: bool = False):
+        self.loaded = []
+        self.fail = fail
+
+    def bulk_upsert(self, personalities):
+        if self.fail:
+            raise RuntimeError("COPY failed")
+        self.loaded.append(personalities)
+        return {"inserted": len(personalities), "updated": 0}
+
+
+def test_validate_personality():
+    """Test records are coerced to their field types"""
+    personality_id = str(uuid4())
+    personality = validate_personality({
+        "id": personality_id.upper(),
+        "name": "Ada",
+        "age": "34",
+        "children": 2.0,
+        "income": "52000.5",
+        "interests": ["chess", "cycling"],
+        "location": None,
+    })
+    assert personality.id == personality_id
+    assert personality.age == 34
+    assert personality.children == 2
+    assert personality.income == 52000.5
+    assert personality.interests == ["chess", "cycling"]
+
+    # Records without an id get one
+    assert validate_personality({"name": "Bo"}).id
+
+
+@pytest.mark.parametrize(
+    "record, error",
+    [
+        ("Ada", "Record must be an object"),
+        ({"nickname": "Ada"}, "Unknown field nickname"),
+        ({"id": "not-a-uuid"}, "Invalid id"),
+        ({"name": "x" * 256}, "Invalid name: longer than 255"),
+        ({"age": "34.5"}, "Invalid age: not an integer"),
+        ({"age": True}, "Invalid age"),
+        ({"age": 151}, "Invalid age: out of range"),
+        ({"children": -1}, "Invalid children: negative"),
+        ({"income": "lots"}, "Invalid income"),
+        ({"interests": "chess"}, "Invalid interests: not a list of strings"),
+        # Non-finite and overflowing numbers
+        ({"age": "inf"}, "Invalid age"),
+        ({"age": "1e400"}, "Invalid age"),
+        ({"age": 10**400}, "Invalid age"),
+        ({"income": "nan"}, "Invalid income"),
+        ({"income": "-inf"}, "Invalid income"),
+        ({"income": 10**400}, "Invalid income"),
+    ],
+)
+def test_validate_personality_rejects(record, error):
+    """Test invalid records raise a ValueError naming the problem"""
+    with pytest.raises(ValueError, match=error):
+        validate_personality(record)
+
+
+def test_validate_personality_lists_every_error():
+    """Test every problem of a record is reported at once"""
+    with pytest.raises(ValueError) as e:
+        validate_personality({"age": "old", "income": "nan", "colour": "red"})
+    assert str(e.value).count(";") == 2
+
+
+def test_detect_format():
+    """Test the format is guessed from the filename, then content type"""
+    assert detect_format("people.ndjson", None) == "ndjson"
+    assert detect_format("people.jsonl", "text/csv") == "ndjson"
+    assert detect_format("people.csv", None) == "csv"
+    assert detect_format(None, "application/x-ndjson") == "ndjson"
+    assert detect_format("upload", "text/csv; charset=utf-8") == "csv"
+    assert detect_format("people.json", "application/json") is None
+    assert detect_format(None, None) is None
+
+
+def test_read_ndjson():
+    """Test NDJSON lines are numbered, skipping blanks and keeping errors"""
+    records = list(read_ndjson(io.StringIO('{"name": "Ada"}\n\n{"name": \n')))
+    assert records[0] == (1, {"name": "Ada"})
+    assert records[1][0] == 3
+    assert isinstance(records[1][1], ValueError)
+    assert "Invalid JSON" in str(records[1][1])
+
+
+def test_read_csv():
+    """Test CSV cells are read as fields, with lists in either form"""
+    text = (
+        "name,age,interests,values\n"
+        'Ada,34,"[""chess"", ""cycling""]",honesty; family\n'
+        "Bo,,,\n"
+    )
+    records = list(read_csv(io.StringIO(text)))
+    assert records[0] == (
+        2,
+        {
+            "name": "Ada",
+            "age": "34",
+            "interests": ["chess", "cycling"],
+            "values": ["honesty", "family"],
+        },
+    )
+    # Empty cells are missing
+    assert records[1] == (3, {"name": "Bo"})
+
+
+def test_ingest_reports_row_errors():
+    """Test invalid rows are reported by row without stopping the import"""
+    duplicate = str(uuid4())
+    records = list(read_ndjson(io.StringIO("\n".join([
+        '{"name": "Ada", "age": 34}',
+        '{"name": "Bo", "age": "inf"}',
+        "not json",
+        f'{{"id": "{duplicate}", "name": "Cy"}}',
+        f'{{"id": "{duplicate}", "name": "Cy again", "income": "nan"}}',
+        f'{{"id": "{duplicate}", "name": "Cy again"}}',
+        '{"name": "Di", "income": 1e400}',
+    ]))))
+
+    store = _Store()
+    report = ingest_personalities(records, store)
+    assert report["received"] == 7
+    assert report["inserted"] == 2
+    assert report["duplicates"] == 1
+    assert report["error_count"] == 4
+    assert [error["row"] for error in report["errors"]] == [2, 3, 5, 7]
+    assert "Invalid age" in report["errors"][0]["error"]
+    assert [p.name for chunk in store.loaded for p in chunk] == ["Ada", "Cy again"]
+
+    # A chunk that fails to load is reported against each of its rows
+    report = ingest_personalities(records[:1] + records[3:4], _Store(fail=True))
+    assert report["error_count"] == 2
+    assert report["errors"] == [
+        {"row": 1, "error": "COPY failed"},
+        {"row": 4, "error": "COPY failed"},
+    ]
+
+    # Ids are only de-duplicated within a chunk
+    report = ingest_personalities(records, _Store(), chunk_size=1, max_errors=1)
+    assert report["inserted"] == 3
+    assert report["duplicates"] == 0
+    assert report["error_count"] == 4
+    assert len(report["errors"]) == 1
@@ -0,0 +1,195 @@
+import contextvars
+import threading
+from types import SimpleNamespace
+
+from app.backend.agents.mass_rate import MassRater
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.models.rating import Rating
+
+_marked = contextvars.ContextVar("marked", default=False)
+
+
+class _Agent:
+    """
+    Rates every pair, unless told to fail, to block after the first calls
+    or to mark its context
+    """
+
+    def __init__(self, fail=(), block=None, free=0, mark=False):
+        self.fail = set(fail)
+        self.block = block
+        self.free = free
+        self.mark = mark
+        self.calls = []
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, personality: Personality, ad: Ad) -> Rating:
+        with self.lock:
+            self.calls.append((ad.id, personality.id))
+            blocked = self.block is not None and len(self.calls) > self.free
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            if blocked:
+                self.block.wait(5)
+            if (ad.id, personality.id) in self.fail:
+                raise RuntimeError("LLM unavailable")
+            if self.mark:
+                # Seen by a later call on the same thread if it leaked
+                assert not _marked.get()
+                _marked.set(True)
+            return Rating(
+                personality=personality.id,
+                ad=ad.id,
+                thought="Fine",
+                emotional_response="Calm",
+                emotions=["Peaceful"],
+                effectiveness="Neutral/Okay",
+            )
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def _store(ads, personalities, rated=()):
+    saved = []
+
+    def create(rating):
+        saved.append(rating)
+        return rating.id
+
+    store = SimpleNamespace(
+        ad=SimpleNamespace(
+            get_many=lambda ids: {i: ads[i] for i in ids if i in ads}
+        ),
+        personality=SimpleNamespace(
+            get_many=lambda ids: {
+                i: personalities[i] for i in ids if i in personalities
+            }
+        ),
+        rating=SimpleNamespace(
+            get_rated_pairs=lambda ad_ids, personality_ids: {
+                pair
+                for pair in rated
+                if pair[0] in ad_ids and pair[1] in personality_ids
+            },
+            create=create,
+        ),
+    )
+    return store, saved
+
+
+def _fixtures(ad_count: int, personality_count: int):
+    ads = {}
+    for i in range(ad_count):
+        ad = Ad(image=f"https://example.com/{i}.jpg", copy=f"Ad {i}")
+        ads[ad.id] = ad
+    personalities = {}
+    for i in range(personality_count):
+        personality = Personality(name=f"Person {i}")
+        personalities[personality.id] = personality
+    return ads, personalities
+
+
+def test_plan_skips_rated_pairs():
+    """Test the plan is the cross product without duplicates or rated pairs"""
+    ads, personalities = _fixtures(2, 2)
+    (a1, a2), (p1, p2) = list(ads), list(personalities)
+    store, _ = _store(ads, personalities, rated={(a1, p2)})
+    rater = MassRater(_Agent(), store)
+
+    pairs, skipped = rater.plan([a1, a2, a1], [p1, p2, p2])
+    assert pairs == [(a1, p1), (a2, p1), (a2, p2)]
+    assert skipped == 1
+
+
+def test_rate_saves_each_rating():
+    """Test every pair is rated and saved, and missing ones reported"""
+    ads, personalities = _fixtures(2, 3)
+    store, saved = _store(ads, personalities)
+    agent = _Agent()
+    rater = MassRater(agent, store, max_concurrency=4)
+
+    pairs = [(a, p) for a in ads for p in personalities]
+    pairs.append(("no-such-ad", next(iter(personalities))))
+    results = list(rater.rate(pairs))
+
+    assert results[0] == {
+        "ad": "no-such-ad",
+        "personality": next(iter(personalities)),
+        "error": "Ad no-such-ad not found",
+    }
+    rated = {(r["ad"], r["personality"]): r["rating"] for r in results[1:]}
+    assert sorted(rated) == sorted(pairs[:-1])
+    assert rated[pairs[0]]["effectiveness"] == "Neutral/Okay"
+    assert sorted((r.ad, r.personality) for r in saved) == sorted(pairs[:-1])
+
+
+def test_rate_window_bounds_in_flight():
+    """Test at most window pairs are ever being rated at once"""
+    ads, personalities = _fixtures(1, 12)
+    store, _ = _store(ads, personalities)
+    agent = _Agent()
+    rater = MassRater(agent, store, max_concurrency=8)
+
+    pairs = [(a, p) for a in ads for p in personalities]
+    results = rater.rate(pairs, window=3)
+    next(results)
+    # Each completed pair only lets the next one start
+    assert len(agent.calls) <= 4
+    assert len(list(results)) == 11
+    assert agent.most_in_flight <= 3
+    assert len(agent.calls) == 12
+
+
+def test_rate_close_cancels_pending():
+    """Test pairs not started yet are cancelled when the consumer stops"""
+    ads, personalities = _fixtures(1, 6)
+    store, saved = _store(ads, personalities)
+    release = threading.Event()
+    agent = _Agent(block=release, free=1)
+    rater = MassRater(agent, store, max_concurrency=1)
+
+    results = rater.rate([(a, p) for a in ads for p in personalities])
+    next(results)
+    results.close()
+    release.set()
+    rater._MassRater__executor.shutdown(wait=True)
+
+    # Only the pair already running when it closed finishes
+    assert len(agent.calls) <= 2
+    assert len(saved) == len(agent.calls)
+
+
+def test_rate_reports_failures():
+    """Test a failing pair is reported without stopping the others"""
+    ads, personalities = _fixtures(1, 4)
+    store, saved = _store(ads, personalities)
+    pairs = [(a, p) for a in ads for p in personalities]
+    agent = _Agent(fail=[pairs[1]])
+    rater = MassRater(agent, store, max_concurrency=2)
+
+    results = {(r["ad"], r["personality"]): r for r in rater.rate(pairs, window=2)}
+    assert results[pairs[1]]["error"] == "LLM unavailable"
+    assert "rating" not in results[pairs[1]]
+    assert all("rating" in results[pair] for pair in pairs if pair != pairs[1])
+    assert len(saved) == 3
+
+    # As is a rating that couldn't be saved
+    store.rating.create = lambda rating: None
+    result = next(rater.rate(pairs[:1]))
+    assert result["error"] == "Failed to save rating"
+
+
+def test_rate_runs_each_pair_in_its_own_context():
+    """Test what one rating sets in its context isn't seen by the next"""
+    ads, personalities = _fixtures(1, 4)
+    store, saved = _store(ads, personalities)
+    rater = MassRater(_Agent(mark=True), store, max_concurrency=1)
+
+    results = list(rater.rate([(a, p) for a in ads for p in personalities]))
+    assert [r.get("error") for r in results] == [None] * 4
+    assert len(saved) == 4
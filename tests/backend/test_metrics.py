@@ -0,0 +1,66 @@
+import pytest
+
+from app.backend import metrics
+
+
+class _Usage:
+    prompt_token_count = 12
+    candidates_token_count = 5
+
+
+class _Response:
+    usage_metadata = _Usage()
+
+
+def _value(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_observe_llm_records_latency_tokens_and_errors():
+    """Test LLM calls are timed by outcome, with their tokens and errors"""
+    model = "test-model"
+    ok = _value("llm_request_duration_seconds_count", model=model, outcome="ok")
+    prompt = _value("llm_tokens_total", model=model, kind="prompt")
+    completion = _value("llm_tokens_total", model=model, kind="completion")
+
+    response = _Response()
+    assert metrics.observe_llm(model, lambda: response) is response
+    assert _value(
+        "llm_request_duration_seconds_count", model=model, outcome="ok"
+    ) == ok + 1
+    assert _value("llm_tokens_total", model=model, kind="prompt") == prompt + 12
+    assert (
+        _value("llm_tokens_total", model=model, kind="completion")
+        == completion + 5
+    )
+
+    errors = _value("llm_errors_total", model=model, error="TimeoutError")
+
+    def fail():
+        raise TimeoutError("deadline exceeded")
+
+    with pytest.raises(TimeoutError):
+        metrics.observe_llm(model, fail)
+    assert (
+        _value("llm_errors_total", model=model, error="TimeoutError")
+        == errors + 1
+    )
+    assert _value(
+        "llm_request_duration_seconds_count", model=model, outcome="error"
+    ) >= 1
+
+
+def test_render_exposes_metrics():
+    """Test the rendered metrics name every family in the text format"""
+    metrics.CACHE_REQUESTS.labels("test", "hit").inc()
+    text = metrics.render().decode()
+    for name in (
+        "http_request_duration_seconds",
+        "db_pool_checkout_seconds",
+        "db_pool_connections_in_use",
+        "llm_request_duration_seconds",
+        "rate_swarm_width",
+        "rate_persona_duration_seconds",
+    ):
+        assert f"# TYPE {name} " in text
+    assert 'cache_requests_total{cache="test",result="hit"}' in text
@@ -0,0 +1,92 @@
+from uuid import uuid4
+
+import pytest
+
+from app.backend.models.personality import Personality
+from app.backend.models.rating import Rating
+from app.backend.panel import build_panel, extrapolate, featurize
+
+
+def _personalities():
+    young = [
+        Personality(
+            name=f"Young {i}",
+            age=24 + i,
+            gender="Female",
+            industry="Technology",
+            interests=["gaming", "travel"],
+            values=["innovation"],
+        )
+        for i in range(4)
+    ]
+    old = [
+        Personality(
+            name=f"Old {i}",
+            age=66 + i,
+            gender="Male",
+            industry="Agriculture",
+            interests=["gardening"],
+            values=["tradition", "family"],
+        )
+        for i in range(2)
+    ]
+    return young + old
+
+
+def test_featurize():
+    """Test personalities are encoded one row each"""
+    personalities = _personalities() + [Personality(name="Blank")]
+    features = featurize(personalities)
+    assert features.shape[0] == len(personalities)
+    # The blank personality's numbers are imputed, not NaN
+    assert not any(v != v for v in features.toarray().ravel())
+
+
+def test_build_panel_and_extrapolate():
+    """Test medoids represent their clusters and are weighted by size"""
+    personalities = _personalities()
+    panel = build_panel(personalities, clusters=2, name="Test Panel")
+
+    assert len(panel.clusters) == 2
+    assert sorted(c["weight"] for c in panel.clusters) == [2, 4]
+    assert len(panel.members) == len(personalities)
+    for cluster in panel.clusters:
+        # Every medoid is a member of the cluster it represents
+        assert panel.members[cluster["medoid"]] == cluster["cluster"]
+    # Similar personalities share a cluster
+    young, old = personalities[:4], personalities[4:]
+    assert len({panel.members[p.id] for p in young}) == 1
+    assert len({panel.members[p.id] for p in old}) == 1
+
+    by_id = {p.id: p for p in personalities}
+    ratings = {}
+    for medoid in panel.medoids:
+        is_young = by_id[medoid].age < 60
+        ratings[medoid] = Rating(
+            personality=medoid,
+            ad=str(uuid4()),
+            thought="",
+            emotional_response="",
+            emotions=["Excited"] if is_young else ["Bored"],
+            effectiveness="Strong Match" if is_young else "Low Fit",
+        )
+
+    result = extrapolate(panel, ratings, by_id, group_by=["gender", "age"])
+    assert result["medoids"] == 2
+    assert result["personalities"] == 6
+    assert result["mean_effectiveness"] == pytest.approx((4 * 5 + 2 * 2) / 6)
+    assert result["effectiveness"]["Strong Match"] == 4
+    assert result["emotion_groups"]["happy"] == pytest.approx(4 / 6)
+    groups = {g["group"]["gender"]: g for g in result["groups"]}
+    assert groups["Female"]["mean_effectiveness"] == 5.0
+    assert groups["Male"]["group"]["age"] == "65+"
+
+    # Members of clusters whose medoid wasn't rated are left out
+    old_medoid = next(m for m in panel.medoids if by_id[m].age > 60)
+    del ratings[old_medoid]
+    result = extrapolate(panel, ratings, by_id)
+    assert result["personalities"] == 4
+    assert result["mean_effectiveness"] == 5.0
+
+    with pytest.raises(ValueError):
+        extrapolate(panel, ratings, by_id, group_by=["unknown"])
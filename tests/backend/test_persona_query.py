@@ -0,0 +1,88 @@
+import pytest
+
+from app.backend.persona_query import PersonaQuery
+
+
+def test_persona_query_sql():
+    """Test conditions, ordering and paging are built with bound values"""
+    query = (
+        PersonaQuery()
+        .where("age", "between", [25, 34])
+        .where("income", ">=", "50000.5")
+        .where("industry", "in", ["Technology", "Finance"])
+        .where("interests", "overlaps", ["hiking"])
+        .where("values", "contains", ["family", "career"])
+        .order_by("income", descending=True)
+        .page(limit=50, offset=100)
+    )
+    sql, params = query.to_sql("personality")
+    assert 'p."age" >= %s AND p."age" <= %s' in sql
+    assert 'p."income" >= %s' in sql
+    assert 'p."industry" = ANY(%s)' in sql
+    assert 'p."interests" && %s::text[]' in sql
+    assert 'p."values" @> %s::text[]' in sql
+    assert 'ORDER BY p."income" DESC, p.id' in sql
+    assert sql.rstrip().endswith("LIMIT %s OFFSET %s")
+    assert params == (
+        25, 34, 50000.5, ["Technology", "Finance"], ["hiking"],
+        ["family", "career"], 50, 100,
+    )
+    # Whole numbers are bound as integers, so integer columns stay indexed
+    assert all(type(p) is int for p in params[:2])
+
+    # Open ended ranges only bound one side, and unpaged queries aren't sorted
+    sql, params = PersonaQuery().where("age", "between", [None, 30]).to_sql("personality")
+    assert 'p."age" <= %s' in sql and ">=" not in sql
+    assert "ORDER BY" not in sql
+    assert params == (30,)
+    assert PersonaQuery().where_sql() == ("TRUE", [])
+
+
+def test_persona_query_validation():
+    """Test unknown fields, operators and malformed values are rejected"""
+    with pytest.raises(ValueError):
+        PersonaQuery().where("age; DROP TABLE personality", "=", 1)
+    with pytest.raises(ValueError):
+        PersonaQuery().where("interests", "=", "hiking")
+    with pytest.raises(ValueError):
+        PersonaQuery().where("gender", "<", "Female")
+    with pytest.raises(ValueError):
+        PersonaQuery().where("age", "between", [1, 2, 3])
+    with pytest.raises(ValueError):
+        PersonaQuery().where("age", ">", "old")
+    with pytest.raises(ValueError):
+        PersonaQuery().where("industry", "in", [])
+    with pytest.raises(ValueError):
+        PersonaQuery().where("gender", "=", None)
+    with pytest.raises(ValueError):
+        PersonaQuery().order_by("interests")
+    with pytest.raises(ValueError):
+        PersonaQuery().page(limit=0)
+
+
+def test_persona_query_from_dict():
+    """Test building a query from its JSON form"""
+    query = PersonaQuery.from_dict({
+        "where": [
+            {"field": "age", "op": ">=", "value": 18},
+            {"field": "lifestyle", "op": "contains", "value": ["urban"]},
+        ],
+        "order_by": ["age", {"field": "name", "descending": True}],
+        "limit": 10,
+    })
+    assert query.conditions == [
+        ("age", ">=", 18),
+        ("lifestyle", "contains", ["urban"]),
+    ]
+    assert query.order == [("age", False), ("name", True)]
+    assert (query.limit, query.offset) == (10, 0)
+
+    for spec in (
+        [],
+        {"select": "*"},
+        {"where": [{"field": "age"}]},
+        {"order_by": [{"descending": True}]},
+        {"limit": "many"},
+    ):
+        with pytest.raises(ValueError):
+            PersonaQuery.from_dict(spec)
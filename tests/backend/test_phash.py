@@ -0,0 +1,99 @@
+import io
+import random
+
+import numpy as np
+from PIL import Image
+
+from app.backend.phash import BKTree, SimilarAds, dhash, hamming
+
+
+def _encode(image: Image.Image, format: str = "PNG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def _creative(seed: int) -> Image.Image:
+    """A random blocky image, smooth enough to survive resizing"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(blocks).resize((320, 240), Image.Resampling.BILINEAR)
+
+
+def test_dhash_near_duplicates():
+    """Test edits of a creative hash close together and other creatives far"""
+    original = _creative(1)
+    value = dhash(_encode(original))
+    assert value is not None
+    assert -(1 << 63) <= value < (1 << 63)
+
+    recompressed = dhash(_encode(original.convert("RGB"), "JPEG", quality=40))
+    cropped = dhash(_encode(original.crop((4, 3, 316, 237))))
+    resized = dhash(_encode(original.resize((640, 480))))
+    for edit in (recompressed, cropped, resized):
+        assert hamming(value, edit) <= 6
+
+    others = [dhash(_encode(_creative(seed))) for seed in range(2, 12)]
+    assert min(hamming(value, other) for other in others) > 12
+
+    assert dhash(b"not an image") is None
+
+
+def test_bk_tree_matches_brute_force():
+    """Test BK-tree searches find exactly the hashes within the distance"""
+    rng = random.Random(0)
+    hashes = {f"ad-{i}": rng.getrandbits(64) - (1 << 63) for i in range(500)}
+    # Near duplicates of the first few, and an exact duplicate
+    base = list(hashes.items())[:5]
+    for i, (_, value) in enumerate(base):
+        hashes[f"dup-{i}"] = value ^ (1 << i) ^ (1 << (i + 20))
+    hashes["same"] = base[0][1]
+
+    tree = BKTree()
+    for item, value in hashes.items():
+        tree.add(value, item)
+    assert tree.size == len(hashes)
+
+    for _, query in base:
+        for distance in (0, 2, 20):
+            expected = sorted(
+                (hamming(query, value), item)
+                for item, value in hashes.items()
+                if hamming(query, value) <= distance
+            )
+            assert tree.search(query, distance) == expected
+
+    assert [item for _, item in tree.search(base[0][1], 0)] == ["ad-0", "same"]
+    assert BKTree().search(0, 10) == []
+
+
+def test_similar_ads_follow_replaced_images():
+    """Test an ad whose image changes is matched by its new hash only"""
+    old, new = 0x0F0F0F0F0F0F0F0F, -0x0F0F0F0F0F0F0F10
+
+    class Ads:
+        def get_hashes(self):
+            return {"ad": old, "other": old ^ 1}
+
+    similar_ads = SimilarAds(Ads())
+    assert similar_ads.similar(old, 2) == [("ad", 0), ("other", 1)]
+
+    similar_ads.update("ad", new)
+    assert similar_ads.similar(old, 2) == [("other", 1)]
+    assert similar_ads.similar(new, 0) == [("ad", 0)]
+
+    # Ads without a hash, or deleted, drop out
+    similar_ads.update("ad", None)
+    assert similar_ads.similar(new, 0) == []
+    similar_ads.discard("other")
+    assert similar_ads.similar(old, 2) == []
+
+    similar_ads.add("ad", old)
+    assert similar_ads.similar(old, 0) == [("ad", 0)]
+
+    tree = BKTree()
+    tree.add(old, "a")
+    tree.add(old ^ 1, "b")
+    assert tree.remove(old, "a") and not tree.remove(old, "a")
+    assert tree.search(old, 2) == [(1, "b")]
+    assert tree.size == 1
@@ -0,0 +1,115 @@
+import time
+from datetime import date
+
+import pytest
+
+from app.backend.store import Store
+from app.backend.store.db import fingerprint
+from app.backend.store.query_log import QueryLog
+
+
+def _event(
+    statement, duration, caller="RatingStore.get", rows=1, error=None, params=None
+):
+    normalized = fingerprint(statement)
+    return {
+        "statement": statement,
+        "params": params,
+        "fingerprint": normalized,
+        "id": normalized,
+        "duration": duration,
+        "rows": rows,
+        "caller": caller,
+        "error": error,
+    }
+
+
+def test_fingerprint_normalizes_values():
+    """Test runs of a statement with different values share a fingerprint"""
+    statement = (
+        "SELECT * FROM rating r -- by ad\n"
+        " WHERE r.ad_id = %s AND r.x IN (1, 2, 'a''b') LIMIT 50"
+    )
+    assert fingerprint(statement) == (
+        "SELECT * FROM rating r WHERE r.ad_id = ? AND r.x IN (?) LIMIT ?"
+    )
+    assert fingerprint("CREATE TABLE ad_staging_1a2b3c4d (LIKE ad)") == (
+        fingerprint("CREATE TABLE ad_staging_9f8e7d6c (LIKE ad)")
+    )
+    # Names with numbers, as of partitions, are kept
+    assert "rating_202501" in fingerprint("SELECT 1 FROM rating_202501")
+
+
+def test_query_log_aggregates(caplog):
+    """Test timings aggregate per fingerprint and slow ones are logged"""
+    log = QueryLog(slow_threshold=0.5)
+    for i in range(98):
+        log.record(_event(f"SELECT * FROM ad WHERE id = {i}", 0.002, rows=1))
+    log.record(_event("SELECT * FROM ad WHERE id = 1", 0.8, caller="AdStore.get"))
+    log.record(
+        _event("SELECT * FROM ad WHERE id = 2", 0.003, rows=-1, error="QueryCanceled")
+    )
+    log.record(_event("DELETE FROM ad WHERE id = 1", 0.01, caller="AdStore.delete"))
+
+    assert "Slow query" in caplog.text and "AdStore.get" in caplog.text
+
+    snapshot = log.snapshot()
+    select, delete = snapshot["queries"]
+    assert select["fingerprint"] == "SELECT * FROM ad WHERE id = ?"
+    assert select["count"] == 100
+    assert select["errors"] == 1
+    assert select["slow"] == 1
+    assert select["rows"] == 99
+    assert select["max_ms"] == pytest.approx(800)
+    assert select["p50_ms"] == pytest.approx(2.5)
+    assert select["p99_ms"] == pytest.approx(5)
+    assert select["histogram"][-1] == {"le_ms": None, "count": 100}
+    assert select["callers"] == {"RatingStore.get": 99, "AdStore.get": 1}
+    assert delete["count"] == 1
+
+    by_count = log.snapshot(sort="count", limit=1)["queries"]
+    assert [q["fingerprint"] for q in by_count] == [select["fingerprint"]]
+    with pytest.raises(ValueError):
+        log.snapshot(sort="nope")
+
+    log.reset()
+    assert log.snapshot()["queries"] == []
+
+
+def test_query_log_bounds_fingerprints():
+    """Test fingerprints past the limit are only counted"""
+    log = QueryLog(max_fingerprints=2)
+    for table in ("ad", "rating", "personality"):
+        log.record(_event(f"SELECT * FROM {table}", 0.001))
+    snapshot = log.snapshot()
+    assert len(snapshot["queries"]) == 2
+    assert snapshot["dropped"] == 1
+
+
+def test_query_log_explains_without_side_effects(store: Store):
+    """Test slow statements are explained read-only, and never written"""
+    log = QueryLog(store.db_pool, slow_threshold=0.1, explain=True)
+    # Reads, as far as the statement shows, but creates a partition
+    log.record(
+        _event(
+            "SELECT rating_create_partition(%s) AS name",
+            0.2,
+            params=(date(2097, 1, 1),),
+        )
+    )
+    log.record(_event("SELECT COUNT(*) FROM ad", 0.2))
+
+    def explained():
+        return {q["fingerprint"]: q["explain"] for q in log.snapshot()["queries"]}
+
+    for _ in range(100):
+        if all(explained().values()):
+            break
+        time.sleep(0.05)
+
+    plans = explained()
+    assert plans["SELECT rating_create_partition(?) AS name"]["plan"].startswith(
+        "Could not explain"
+    )
+    assert "Aggregate" in plans["SELECT COUNT(*) FROM ad"]["plan"]
+    assert "rating_209701" not in [p["name"] for p in store.partitions.list_all()]
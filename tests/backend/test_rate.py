@@ -0,0 +1,174 @@
+import json
+
+import pytest
+from arkaine.llms.llm import LLM
+from arkaine.tools.context import Context
+
+from app.backend.agents.rate import ParseStats, RateAgent
+from app.backend.llm import MultiModalLLM
+
+TEXT_OUTPUT = """THOUGHT: Stylish shoes, but more than I would spend.
+EMOTIONALRESPONSE: Tempted, though wary of the price.
+EMOTIONS: interested,  skeptical, Excited, Teleported
+EFFECTIVENESS: Neutral/Okay
+"""
+
+
+class _LLM(LLM):
+    """An LLM the agent is never run against, only parses output for"""
+
+    def __init__(self):
+        super().__init__(name="stub")
+
+    @property
+    def context_length(self) -> int:
+        return 1000
+
+    def completion(self, prompt) -> str:
+        raise NotImplementedError
+
+
+def _agent(output_mode: str):
+    agent = RateAgent(_LLM(), None, output_mode=output_mode)
+    # Counted apart from the counts shared by every agent
+    agent.parse_stats = ParseStats()
+    context = Context(agent)
+    context.x["personality"] = "personality-1"
+    context.x["ad"] = "ad-1"
+    return agent, context
+
+
+def _json_output(**values) -> str:
+    return json.dumps({
+        "thought": "Stylish shoes, but more than I would spend.",
+        "emotional_response": "Tempted, though wary of the price.",
+        "emotions": ["interested", "Skeptical", "Teleported"],
+        "effectiveness": "Good Fit",
+        **values,
+    })
+
+
+def test_extract_json():
+    """Test structured output decodes into a rating"""
+    agent, context = _agent("json")
+    rating = agent.extract_result(context, _json_output())
+    assert rating.personality == "personality-1"
+    assert rating.ad == "ad-1"
+    assert rating.thought == "Stylish shoes, but more than I would spend."
+    assert rating.emotional_response == "Tempted, though wary of the price."
+    # Normalized onto the taxonomy, dropping unknown emotions
+    assert rating.emotions == ["Interested", "Skeptical"]
+    assert rating.effectiveness == "Good Fit"
+    assert rating.model_version == "stub/json"
+    assert agent.parse_stats.report()["json"]["parsed"] == 1
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        _json_output(effectiveness="Pretty good"),
+        _json_output()[:-1],
+        json.dumps({"thought": "No other fields"}),
+    ],
+)
+def test_extract_json_falls_back_to_text(output):
+    """Test structured output that fails to decode is parsed as text"""
+    agent, context = _agent("json")
+    with pytest.raises(ValueError):
+        agent.extract_result(context, output)
+
+    rating = agent.extract_result(context, TEXT_OUTPUT)
+    assert rating.emotions == ["Interested", "Skeptical", "Excited"]
+    assert rating.effectiveness == "Neutral/Okay"
+    counts = agent.parse_stats.report()["json"]
+    assert (counts["parsed"], counts["fallback"], counts["failed"]) == (0, 1, 1)
+
+
+def test_extract_text():
+    """Test labeled lines parse into a rating"""
+    agent, context = _agent("text")
+    rating = agent.extract_result(context, TEXT_OUTPUT)
+    assert rating.thought == "Stylish shoes, but more than I would spend."
+    assert rating.emotional_response == "Tempted, though wary of the price."
+    assert rating.emotions == ["Interested", "Skeptical", "Excited"]
+    assert rating.model_version == "stub/text"
+
+    # Output missing its labels fails rather than making an empty rating
+    with pytest.raises(ValueError):
+        agent.extract_result(context, "I like it.")
+    with pytest.raises(ValueError):
+        agent.extract_result(context, TEXT_OUTPUT.split("EFFECTIVENESS")[0])
+    assert agent.parse_stats.report() == {
+        "text": {
+            "calls": 3,
+            "parsed": 1,
+            "fallback": 0,
+            "failed": 2,
+            "failure_rate": 2 / 3,
+        }
+    }
+
+
+def test_parse_stats_report():
+    """Test failure rates count fallbacks as failures of structured output"""
+    stats = ParseStats()
+    assert stats.report() == {}
+
+    for outcome in ["parsed", "parsed", "fallback", "failed"]:
+        stats.record("json", outcome)
+    stats.record("text", "parsed")
+
+    report = stats.report()
+    assert report["json"] == {
+        "calls": 4,
+        "parsed": 2,
+        "fallback": 1,
+        "failed": 1,
+        "failure_rate": 0.5,
+    }
+    assert report["text"]["failure_rate"] == 0.0
+
+
+class _Chat:
+    def __init__(self, sent):
+        self.sent = sent
+
+    def send_message(self, content, generation_config=None):
+        self.sent.append((content, generation_config))
+
+        class Response:
+            text = "{}"
+
+        return Response()
+
+
+class _Model:
+    def __init__(self):
+        self.sent = []
+
+    def start_chat(self, history):
+        return _Chat(self.sent)
+
+
+def test_llm_generation_config():
+    """Test responses are constrained to JSON only when given a schema"""
+    llm = MultiModalLLM("gemini-2.0-flash-001", api_key="test")
+    model = _Model()
+    llm._MultiModalLLM__model = model
+    prompt = [
+        {"role": "system", "content": "Rate the ad."},
+        {"role": "user", "content": "Go."},
+    ]
+
+    llm.completion(prompt)
+    llm.completion(prompt, response_schema=RateAgent.RESPONSE_SCHEMA)
+    assert model.sent == [
+        ("Go.", None),
+        (
+            "Go.",
+            {
+                "response_mime_type": "application/json",
+                "response_schema": RateAgent.RESPONSE_SCHEMA,
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from app.backend.models.personality import Personality
+from app.backend.sequential import SequentialEstimate, stratified_order
+
+
+def test_stratified_order():
+    """Test every prefix of the order is close to proportionate"""
+    personalities = [
+        Personality(name=f"Person {i}", gender="Female" if i % 4 else "Male")
+        for i in range(100)
+    ]
+    order = stratified_order(personalities, ["gender"], seed=1)
+    assert sorted(p.id for p in order) == sorted(p.id for p in personalities)
+    for size in (4, 20, 50):
+        males = sum(p.gender == "Male" for p in order[:size])
+        assert abs(males - size / 4) <= 1
+
+    # The same seed gives the same order
+    assert [p.id for p in stratified_order(personalities, ["gender"], seed=1)] == [
+        p.id for p in order
+    ]
+
+    with pytest.raises(ValueError):
+        stratified_order(personalities, ["unknown"])
+
+
+def test_sequential_estimate():
+    """Test intervals narrow with the sample and stop at the tolerance"""
+    rng = random.Random(0)
+    population = [
+        {
+            "effectiveness": "Good Fit" if rng.random() < 0.7 else "Low Fit",
+            "emotions": ["Happy"] if rng.random() < 0.6 else ["Bored"],
+        }
+        for _ in range(500)
+    ]
+
+    estimate = SequentialEstimate(len(population))
+    assert estimate.precision() == 0.5
+    assert not estimate.converged(0.1)
+
+    precisions = []
+    for rating in population:
+        estimate.add(rating)
+        precisions.append(estimate.precision())
+        if estimate.converged(0.1, min_ratings=20):
+            break
+
+    assert 20 <= estimate.ratings < len(population)
+    assert precisions[-1] <= 0.1 < precisions[-2]
+    result = estimate.to_dict()
+    assert result["ratings"] == estimate.ratings
+    assert result["effectiveness"]["Good Fit"]["share"] == pytest.approx(0.7, abs=0.1)
+    low, high = result["emotion_groups"]["happy"]["ci"]
+    assert low < 0.6 < high
+    assert result["mean_effectiveness"]["ci"][0] < result["mean_effectiveness"]["value"]
+
+    # The whole population leaves nothing uncertain
+    estimate = SequentialEstimate(3)
+    for rating in population[:3]:
+        estimate.add(rating)
+    assert estimate.precision() == 0.0
+    assert estimate.converged(0.01, min_ratings=20)
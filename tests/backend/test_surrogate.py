@@ -0,0 +1,80 @@
+import random
+
+from app.backend.models.ad import Ad
+from app.backend.models.personality import Personality
+from app.backend.surrogate import Surrogate, count_labels
+
+
+def _data(seed: int = 0):
+    """Ratings where men love the first ad and everyone else is lukewarm."""
+    rng = random.Random(seed)
+    personalities = {
+        p.id: p
+        for p in (
+            Personality(
+                name=f"Person {i}",
+                age=rng.randint(18, 70),
+                gender="Male" if i % 2 else "Female",
+                interests=[rng.choice(["cars", "cooking", "travel"])],
+            )
+            for i in range(200)
+        )
+    }
+    ads = {ad.id: ad for ad in (Ad(copy=f"Ad number {i}") for i in range(4))}
+    labels = []
+    for ad_index, ad_id in enumerate(ads):
+        for personality in personalities.values():
+            loves = ad_index == 0 and personality.gender == "Male"
+            labels.append({
+                "personality": personality.id,
+                "ad": ad_id,
+                "level": 5 if loves else rng.choice([2, 3]),
+                "groups": 1 if loves else rng.choice([0, 2]),
+            })
+    return personalities, ads, labels
+
+
+def test_surrogate_train_triage_and_evaluate():
+    """Test confident pairs are predicted and uncertain ones are sent on"""
+    personalities, ads, labels = _data()
+    rng = random.Random(1)
+    rng.shuffle(labels)
+    train, test = labels[:600], labels[600:]
+    counts = count_labels(labels)
+
+    surrogate = Surrogate().fit(train, personalities, ads, counts)
+    assert surrogate.version.startswith("surrogate-")
+
+    metrics = surrogate.evaluate(test, personalities, ads, counts)
+    assert metrics["ratings"] == len(test)
+    assert metrics["accuracy"] > metrics["baseline_accuracy"]
+    assert metrics["calibration_error"] < 0.2
+    shares = [t["confident_share"] for t in metrics["triage"]]
+    assert shares == sorted(shares, reverse=True)
+
+    pairs = [(label["ad"], label["personality"]) for label in test]
+    predictions, uncertain = surrogate.triage(
+        pairs, personalities, ads, counts, threshold=0.9
+    )
+    assert len(predictions) + len(uncertain) == len(pairs)
+    # Only the men rating the first ad are predictable, not the coin flips
+    first_ad = next(iter(ads))
+    for prediction in predictions:
+        assert prediction["surrogate"] is True
+        assert prediction["model_version"] == surrogate.version
+        assert prediction["confidence"] >= 0.9
+        assert prediction["ad"] == first_ad
+        assert personalities[prediction["personality"]].gender == "Male"
+        assert prediction["effectiveness"] == "Strong Match"
+    # ...and most of them are confidently predicted
+    predictable = [
+        pair for pair in pairs
+        if pair[0] == first_ad and personalities[pair[1]].gender == "Male"
+    ]
+    assert len(predictions) >= len(predictable) / 2
+
+    # Unknown personalities always need rating
+    predictions, uncertain = surrogate.triage(
+        [(first_ad, "missing")], personalities, ads, counts
+    )
+    assert predictions == [] and uncertain == [(first_ad, "missing")]
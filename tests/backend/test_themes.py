@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from app.backend.models.rating import Rating
+from app.backend.themes import cluster_themes
+
+
+def _ratings(count, thought, effectiveness, emotions):
+    return [
+        Rating(
+            personality=f"{thought}-{i}",
+            ad="ad",
+            thought=thought,
+            emotional_response="",
+            emotions=emotions,
+            effectiveness=effectiveness,
+        )
+        for i in range(count)
+    ]
+
+
+def _themes(sizes, dimensions=64, seed=0):
+    """Ratings in well separated groups, with noisy embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((len(sizes), dimensions)) * 5
+    ratings, vectors = [], []
+    for group, size in enumerate(sizes):
+        ratings += _ratings(
+            size,
+            f"theme {group}",
+            "Strong Match" if group == 0 else "Low Fit",
+            ["Happy"] if group == 0 else ["Anger", "Fear"],
+        )
+        vectors.append(centers[group] + rng.standard_normal((size, dimensions)))
+    return ratings, np.vstack(vectors)
+
+
+def test_cluster_themes_finds_groups():
+    ratings, vectors = _themes([30, 20, 10])
+    themes = cluster_themes(ratings, vectors, examples=2)
+
+    assert [theme["size"] for theme in themes] == [30, 20, 10]
+    assert themes[0]["share"] == 0.5
+    assert themes[0]["mean_effectiveness"] == 5.0
+    assert themes[1]["mean_effectiveness"] == 2.0
+    assert themes[0]["emotions"] == [{"emotion": "Happy", "count": 30}]
+    for group, theme in enumerate(themes):
+        assert len(theme["examples"]) == 2
+        assert theme["examples"][0] == theme["exemplar"]
+        assert all(
+            example["thought"] == f"theme {group}" for example in theme["examples"]
+        )
+
+
+def test_cluster_themes_fixed_clusters():
+    ratings, vectors = _themes([30, 20, 10])
+    assert len(cluster_themes(ratings, vectors, clusters=2)) == 2
+    assert len(cluster_themes(ratings, vectors, clusters=1)) == 1
+    # Capped at the number of ratings
+    assert len(cluster_themes(ratings[:2], vectors[:2], clusters=5)) == 2
+    with pytest.raises(ValueError):
+        cluster_themes(ratings, vectors, clusters=0)
+
+
+def test_cluster_themes_few_ratings():
+    assert cluster_themes([], np.zeros((0, 0))) == []
+    ratings, vectors = _themes([1])
+    themes = cluster_themes(ratings, vectors)
+    assert len(themes) == 1
+    assert themes[0]["size"] == 1
+    # Identical ratings form a single theme
+    ratings, _ = _themes([4])
+    themes = cluster_themes(ratings, np.ones((4, 8)))
+    assert [theme["size"] for theme in themes] == [4]